@@ -1,31 +1,124 @@
 from django.contrib import admin
-from .models import Room, Tenant, Bill, Payment, ElectricityReading
+from .models import (
+    Room, Tenant, Bill, Payment, TenantPayment, ElectricityReading, BillingJob, ArchivedBill, JournalEntry, Property, OutboxEvent,
+    BankStatement, BankStatementLine, NotificationLog, LedgerEntry, RoomMeterReading, RoomMeterAllocation,
+)
+from .allocation import allocate_payments
+from .archive import restore_archived_bills
+from .forms import BankStatementLineForm
+from .balances import get_balance_summaries, get_balance_summary
+from .journal import journal_batch
+from .reconciliation import confirm_line
+from .search import search_queryset
 from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .views import financial_summary_report, occupancy_report
+from .views import (
+    financial_summary_report, occupancy_report, cashflow_forecast_report, enqueue_billing_job, tenant_statement, room_availability,
+    room_availability_api, select_property, import_tenants, upload_bank_statement, tenant_ledger,
+)
 
-# Basic registration for models that don't have a custom admin yet or are simple
-admin.site.register(Room) # Can be enhanced later if needed
+class JournalBatchMixin:
+    """Records every Bill/Payment change made by one admin request (e.g. a whole
+    list_editable submission) as a single journal batch attributed to the user."""
+
+    def changelist_view(self, request, extra_context=None):
+        with journal_batch(request.user):
+            return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        with journal_batch(request.user):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with journal_batch(request.user):
+            return super().delete_view(request, object_id, extra_context)
+
+
+class FullTextSearchMixin:
+    """Answers changelist searches and autocomplete lookups (which go through the
+    related model's get_search_results) from the full-text index in billing.search,
+    falling back to the regular search_fields scan where there is no index.
+
+    With the index, each search term matches the start of a word ("cru" finds "Ana
+    Cruz", "ruz" does not), where search_fields matched anywhere inside the text."""
+
+    def get_search_results(self, request, queryset, search_term):
+        results = search_queryset(queryset, search_term) if search_term else None
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        return results, False
+
+
+@admin.register(Property)
+class PropertyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'database', 'select_link')
+    search_fields = ('name', 'code')
+    prepopulated_fields = {'code': ('name',)}
+
+    @admin.display(description='Admin')
+    def select_link(self, obj):
+        url = reverse('admin:billing_property_select', args=[obj.pk])
+        return format_html('<a href="{}">Work on this property</a>', url)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('select/<int:property_id>/', self.admin_site.admin_view(select_property), name='billing_property_select'),
+        ]
+        return custom_urls + urls
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('room_number', 'property_display', 'base_rent', 'meter_split')
+    list_filter = ('property',)
+    # Properties live in the catalog database and can't be joined from a property
+    # database; they are attached to the page in get_changelist_instance instead.
+    list_select_related = ()
+    search_fields = ('room_number',) # Required by TenantAdmin.autocomplete_fields
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        properties = Property.objects.in_bulk({room.property_id for room in changelist.result_list})
+        for room in changelist.result_list:
+            room.property = properties[room.property_id]
+        return changelist
+
+    @admin.display(description='Property', ordering='property_id')
+    def property_display(self, obj):
+        return obj.property.name
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('availability/', self.admin_site.admin_view(room_availability), name='billing_room_availability'),
+            path('availability/api/', self.admin_site.admin_view(room_availability_api), name='billing_room_availability_api'),
+        ]
+        return custom_urls + urls
 
 @admin.register(Tenant)
-class TenantAdmin(admin.ModelAdmin):
-    list_display = ('full_name', 'room_display', 'lease_start_date', 'lease_end_date', 'is_active', 'fixed_water_charge', 'fixed_wifi_charge')
-    list_filter = ('is_active', 'room__room_number') # Filter by room number
+class TenantAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = (
+        'full_name', 'room_display', 'lease_start_date', 'lease_end_date', 'is_active', 'fixed_water_charge', 'fixed_wifi_charge',
+        'outstanding_balance', 'oldest_overdue', 'last_payment', 'statement_link',
+    )
+    list_filter = ('is_active', 'property', 'room__room_number') # Filter by room number
     search_fields = ('full_name', 'email', 'phone_number', 'room__room_number')
+    list_select_related = ('room',) # For room_display
     autocomplete_fields = ['room'] # Autocomplete for room selection
     fieldsets = (
         (None, {
-            'fields': ('full_name', 'user', 'room', 'is_active')
+            'fields': ('full_name', 'user', 'property', 'room', 'is_active')
         }),
         ('Fixed Charges', {
             'fields': ('fixed_water_charge', 'fixed_wifi_charge'),
         }),
         ('Contact Information', {
-            'fields': ('phone_number', 'email'),
+            'fields': ('phone_number', 'email', 'notification_channel'),
             'classes': ('collapse',)
         }),
         ('Lease Details', {
-            'fields': ('lease_start_date', 'lease_end_date'),
+            'fields': ('lease_start_date', 'lease_end_date', 'meter_share'),
             'classes': ('collapse',)
         }),
     )
@@ -36,9 +129,52 @@ class TenantAdmin(admin.ModelAdmin):
     room_display.short_description = 'Room'
     room_display.admin_order_field = 'room__room_number'
 
+    def get_changelist_instance(self, request):
+        # Load the balance summaries of the whole page with one cache round trip.
+        changelist = super().get_changelist_instance(request)
+        summaries = get_balance_summaries([tenant.pk for tenant in changelist.result_list])
+        for tenant in changelist.result_list:
+            tenant.balance_summary = summaries[tenant.pk]
+        return changelist
+
+    def _balance_summary(self, obj):
+        if not hasattr(obj, 'balance_summary'):
+            obj.balance_summary = get_balance_summary(obj.pk)
+        return obj.balance_summary
+
+    def outstanding_balance(self, obj):
+        return self._balance_summary(obj)['outstanding']
+    outstanding_balance.short_description = 'Outstanding'
+
+    def oldest_overdue(self, obj):
+        return self._balance_summary(obj)['oldest_overdue_date'] or "-"
+    oldest_overdue.short_description = 'Oldest overdue'
+
+    def last_payment(self, obj):
+        summary = self._balance_summary(obj)
+        if summary['last_payment_date'] is None:
+            return "-"
+        return f"{summary['last_payment_amount']} on {summary['last_payment_date']}"
+    last_payment.short_description = 'Last payment'
+
+    def statement_link(self, obj):
+        link = reverse("admin:billing_tenant_statement", args=[obj.pk])
+        ledger_link = reverse("admin:billing_tenant_ledger", args=[obj.pk])
+        return format_html('<a href="{}">Statement</a> | <a href="{}">Ledger</a>', link, ledger_link)
+    statement_link.short_description = 'Statement'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<int:tenant_id>/statement/', self.admin_site.admin_view(tenant_statement), name='billing_tenant_statement'),
+            path('<int:tenant_id>/ledger/', self.admin_site.admin_view(tenant_ledger), name='billing_tenant_ledger'),
+            path('import/', self.admin_site.admin_view(import_tenants), name='billing_tenant_import'),
+        ]
+        return custom_urls + urls
+
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(FullTextSearchMixin, JournalBatchMixin, admin.ModelAdmin):
     list_display = ('bill_summary_link', 'tenant_name_link', 'amount_paid', 'payment_date', 'payment_method')
     list_filter = ('payment_date', 'payment_method', 'tenant__full_name')
     search_fields = ('bill__id', 'bill__description', 'tenant__full_name', 'notes') # Search by bill ID
@@ -63,10 +199,60 @@ class PaymentAdmin(admin.ModelAdmin):
     tenant_name_link.admin_order_field = 'tenant'
 
 
+class AllocationInline(admin.TabularInline):
+    model = Payment
+    fk_name = 'tenant_payment'
+    fields = ('bill', 'amount_paid', 'payment_date')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name = 'Allocation'
+    verbose_name_plural = 'Allocations'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TenantPayment)
+class TenantPaymentAdmin(JournalBatchMixin, admin.ModelAdmin):
+    list_display = ('tenant_name_link', 'amount', 'unallocated_amount', 'payment_date', 'payment_method')
+    list_filter = ('payment_date', 'payment_method')
+    search_fields = ('tenant__full_name', 'notes')
+    autocomplete_fields = ['tenant']
+    date_hierarchy = 'payment_date'
+    readonly_fields = ('unallocated_amount', 'date_recorded')
+    inlines = [AllocationInline]
+    actions = ['allocate_selected']
+
+    def tenant_name_link(self, obj):
+        link = reverse("admin:billing_tenant_change", args=[obj.tenant_id])
+        return format_html('<a href="{}">{}</a>', link, obj.tenant.full_name)
+    tenant_name_link.short_description = 'Tenant'
+    tenant_name_link.admin_order_field = 'tenant'
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj: # The amount may already be spread over bills
+            return self.readonly_fields + ('tenant', 'amount')
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            result = allocate_payments([obj.pk])
+            self.message_user(request, f"Allocated {result['amount_allocated']} to {result['allocations']} bill(s); "
+                                       f"{result['credit_remaining']} kept as credit.")
+
+    @admin.action(description='Allocate unallocated credit to open bills')
+    def allocate_selected(self, request, queryset):
+        result = allocate_payments(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Allocated {result['amount_allocated']} to {result['allocations']} bill(s); "
+                                   f"{result['credit_remaining']} kept as credit.")
+
+
 @admin.register(ElectricityReading)
 class ElectricityReadingAdmin(admin.ModelAdmin):
-    list_display = ('tenant_link', 'reading_date', 'reading_value', 'previous_reading_value', 'consumption', 'unit_price', 'is_billed')
-    list_filter = ('tenant__full_name', 'reading_date', 'is_billed')
+    list_display = ('tenant_link', 'reading_date', 'reading_value', 'previous_reading_value', 'consumption', 'unit_price', 'is_billed', 'is_estimate')
+    list_filter = ('tenant__full_name', 'reading_date', 'is_billed', 'is_estimate')
     search_fields = ('tenant__full_name', 'reading_value')
     autocomplete_fields = ['tenant']
     date_hierarchy = 'reading_date'
@@ -80,8 +266,36 @@ class ElectricityReadingAdmin(admin.ModelAdmin):
     tenant_link.admin_order_field = 'tenant'
 
 
+class RoomMeterAllocationInline(admin.TabularInline):
+    model = RoomMeterAllocation
+    fields = ('tenant', 'weight', 'consumption', 'amount', 'bill')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name = 'Split'
+    verbose_name_plural = 'Split between tenants'
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(RoomMeterReading)
+class RoomMeterReadingAdmin(admin.ModelAdmin):
+    list_display = ('room', 'reading_date', 'reading_value', 'previous_reading_value', 'consumption', 'unit_price', 'is_billed')
+    list_filter = ('reading_date', 'is_billed')
+    search_fields = ('room__room_number',)
+    autocomplete_fields = ['room']
+    date_hierarchy = 'reading_date'
+    inlines = [RoomMeterAllocationInline]
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj and obj.is_billed: # Already split into bills; `manage.py bill_room_meters` owns these fields
+            return ('room', 'reading_date', 'reading_value', 'previous_reading_value', 'consumption', 'unit_price', 'is_billed')
+        return ('previous_reading_value', 'consumption', 'is_billed')
+
+
 @admin.register(Bill)
-class BillAdmin(admin.ModelAdmin):
+class BillAdmin(FullTextSearchMixin, JournalBatchMixin, admin.ModelAdmin):
     list_display = ('id','__str__', 'tenant_link', 'bill_type', 'amount', 'due_date', 'is_paid', 'date_created')
     list_filter = ('is_paid', 'bill_type', 'due_date', 'tenant__full_name')
     search_fields = ['id', 'description', 'tenant__full_name', 'tenant__room__room_number']
@@ -92,13 +306,14 @@ class BillAdmin(admin.ModelAdmin):
 
     fieldsets = (
         (None, {
-            'fields': ('tenant', 'bill_type', 'amount', 'description')
+            'fields': ('tenant', 'bill_type', 'amount', 'description', 'parent_bill')
         }),
         ('Status & Dates', {
             'fields': ('is_paid', 'due_date', 'date_created', 'date_updated'), # Added date_created, date_updated
         }),
     )
     readonly_fields = ('date_created', 'date_updated')
+    raw_id_fields = ('parent_bill',)
 
     def tenant_link(self, obj):
         if obj.tenant_id: # Use tenant_id for efficiency, avoids loading tenant object if not needed
@@ -113,5 +328,234 @@ class BillAdmin(admin.ModelAdmin):
         custom_urls = [
             path('reports/financial-summary/', self.admin_site.admin_view(financial_summary_report), name='billing_financial_summary'),
             path('reports/occupancy/', self.admin_site.admin_view(occupancy_report), name='billing_occupancy_report'),
+            path('reports/forecast/', self.admin_site.admin_view(cashflow_forecast_report), name='billing_cashflow_forecast'),
         ]
         return custom_urls + urls
+
+
+@admin.register(BillingJob)
+class BillingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'job_type', 'status', 'attempts', 'progress', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'job_type')
+    readonly_fields = ('job_type', 'options', 'status', 'attempts', 'max_attempts', 'run_after', 'worker_id',
+                       'progress', 'output', 'last_error', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+    actions = ['requeue_jobs']
+
+    def has_add_permission(self, request):
+        return False # Jobs are queued through the "Queue billing job" page
+
+    @admin.action(description='Requeue selected finished jobs')
+    def requeue_jobs(self, request, queryset):
+        updated = queryset.exclude(status=BillingJob.STATUS_RUNNING).update(
+            status=BillingJob.STATUS_QUEUED, attempts=0, run_after=timezone.now(), worker_id='', last_error=''
+        )
+        self.message_user(request, f"Requeued {updated} job(s).")
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('enqueue/', self.admin_site.admin_view(enqueue_billing_job), name='billing_billingjob_enqueue'),
+        ]
+        return custom_urls + urls
+
+
+@admin.register(ArchivedBill)
+class ArchivedBillAdmin(JournalBatchMixin, admin.ModelAdmin):
+    list_display = ('id', 'tenant', 'bill_type', 'amount', 'due_date', 'archived_at')
+    list_filter = ('bill_type', 'archived_at')
+    search_fields = ['id', 'description', 'tenant__full_name']
+    date_hierarchy = 'due_date'
+    list_select_related = ('tenant',)
+    actions = ['restore_selected']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Restore selected bills (and their payments) from the archive')
+    def restore_selected(self, request, queryset):
+        bills, payments = restore_archived_bills(queryset)
+        self.message_user(request, f"Restored {bills} bill(s) and {payments} payment(s).")
+
+
+@admin.register(JournalEntry)
+class JournalEntryAdmin(admin.ModelAdmin):
+    list_display = ('recorded_at', 'model_name', 'object_id', 'action', 'changes', 'changed_by', 'batch_id')
+    list_filter = ('model_name', 'action')
+    search_fields = ('=object_id', '=batch_id', 'changed_by')
+    date_hierarchy = 'recorded_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'destination', 'bill_id', 'tenant_id', 'created_at', 'attempts', 'next_attempt_at', 'delivered_at')
+    list_filter = ('destination', 'event_type', ('delivered_at', admin.EmptyFieldListFilter))
+    search_fields = ('=bill_id', '=tenant_id', '=event_id')
+    readonly_fields = ('event_id', 'destination', 'event_type', 'tenant_id', 'bill_id', 'payload', 'created_at',
+                       'attempts', 'next_attempt_at', 'last_error', 'delivered_at')
+    actions = ['retry_now']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry selected undelivered events now')
+    def retry_now(self, request, queryset):
+        updated = queryset.filter(delivered_at__isnull=True).update(next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} event(s) will be sent on the dispatcher's next pass.")
+
+
+@admin.register(BankStatement)
+class BankStatementAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'imported_at', 'imported_by', 'line_count', 'matched_count', 'review_link')
+    readonly_fields = ('filename', 'imported_at', 'imported_by', 'line_count', 'matched_count')
+    date_hierarchy = 'imported_at'
+
+    def has_add_permission(self, request):
+        return False # Statements are uploaded, see get_urls
+
+    def review_link(self, obj):
+        link = reverse("admin:billing_bankstatementline_changelist")
+        return format_html('<a href="{}?statement__id__exact={}&status__exact=review">Lines to review</a>', link, obj.pk)
+    review_link.short_description = 'Review'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('upload/', self.admin_site.admin_view(upload_bank_statement), name='billing_bankstatement_upload'),
+        ]
+        return custom_urls + urls
+
+
+@admin.register(BankStatementLine)
+class BankStatementLineAdmin(JournalBatchMixin, admin.ModelAdmin):
+    form = BankStatementLineForm
+    list_display = ('line_number', 'statement', 'transaction_date', 'amount', 'payer', 'memo', 'status', 'score', 'best_candidate', 'payment_link')
+    list_filter = ('status', 'statement')
+    list_select_related = ('statement',)
+    search_fields = ('payer', 'memo', '=amount')
+    date_hierarchy = 'transaction_date'
+    readonly_fields = ('statement', 'line_number', 'transaction_date', 'amount', 'payer', 'memo', 'score', 'candidate_list', 'payment_link')
+    fields = readonly_fields[:-2] + ('candidate_list', 'status', 'pay_bill', 'payment_link')
+    actions = ['pay_best_candidate', 'mark_ignored']
+
+    def has_add_permission(self, request):
+        return False
+
+    def _bill_link(self, candidate):
+        link = reverse("admin:billing_bill_change", args=[candidate['bill_id']])
+        return format_html(
+            '<a href="{}">Bill ID {}</a> (tenant {}, score {}: {})', link, candidate['bill_id'], candidate['tenant_id'],
+            candidate['score'], ', '.join(candidate['reasons']),
+        )
+
+    def best_candidate(self, obj):
+        if obj.payment_id or not obj.candidates:
+            return "-"
+        return self._bill_link(obj.candidates[0])
+    best_candidate.short_description = 'Best candidate'
+
+    def candidate_list(self, obj):
+        if not obj.candidates:
+            return "-"
+        return format_html('<br>'.join(['{}'] * len(obj.candidates)), *[self._bill_link(c) for c in obj.candidates])
+    candidate_list.short_description = 'Candidates'
+
+    def payment_link(self, obj):
+        if obj.payment_id:
+            link = reverse("admin:billing_payment_change", args=[obj.payment_id])
+            return format_html('<a href="{}">Payment {}</a>', link, obj.payment_id)
+        return "-"
+    payment_link.short_description = 'Payment'
+    payment_link.admin_order_field = 'payment'
+
+    def save_model(self, request, obj, form, change):
+        bill = form.cleaned_data.get('pay_bill')
+        if bill is None:
+            super().save_model(request, obj, form, change)
+            return
+        confirm_line(obj, bill)
+        self.message_user(request, f"Recorded {obj.amount} as payment {obj.payment_id} of bill {bill.pk}.")
+
+    @admin.action(description='Pay the best candidate bill of the selected lines')
+    def pay_best_candidate(self, request, queryset):
+        lines = queryset.filter(payment__isnull=True).exclude(status=BankStatementLine.STATUS_IGNORED).exclude(amount__lte=0)
+        lines = [line for line in lines.select_related('statement') if line.candidates]
+        bills = Bill.objects.in_bulk([line.candidates[0]['bill_id'] for line in lines])
+        paid = 0
+        for line in lines:
+            bill = bills.get(line.candidates[0]['bill_id'])
+            if bill is not None:
+                confirm_line(line, bill)
+                paid += 1
+        self.message_user(request, f"Recorded {paid} payment(s); lines without candidates or already paid were skipped.")
+
+    @admin.action(description='Mark selected lines as ignored')
+    def mark_ignored(self, request, queryset):
+        updated = queryset.filter(payment__isnull=True).update(status=BankStatementLine.STATUS_IGNORED)
+        self.message_user(request, f"{updated} line(s) marked as ignored.")
+
+
+@admin.register(NotificationLog)
+class NotificationLogAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'channel', 'tenant', 'recipient', 'bill_id', 'status', 'sent_at', 'error')
+    list_filter = ('status', 'channel', 'kind')
+    list_select_related = ('tenant',)
+    search_fields = ('recipient', 'tenant__full_name', '=bill__id', '=provider_message_id')
+    date_hierarchy = 'created_at'
+    readonly_fields = ('tenant', 'bill', 'kind', 'channel', 'recipient', 'subject', 'body', 'status',
+                       'provider_message_id', 'error', 'created_at', 'sent_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    """Entries mirroring bills and payments are read-only here; adjustments are added,
+    changed and deleted by hand."""
+    list_display = ('entry_date', 'tenant', 'kind', 'description', 'debit', 'credit', 'source', 'source_id')
+    list_filter = ('kind', 'source')
+    list_select_related = ('tenant',)
+    search_fields = ('tenant__full_name', 'description', '=source_id')
+    autocomplete_fields = ['tenant']
+    date_hierarchy = 'entry_date'
+    fields = ('tenant', 'entry_date', 'debit', 'credit', 'description')
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.source != LedgerEntry.SOURCE_MANUAL:
+            return ('tenant', 'entry_date', 'kind', 'debit', 'credit', 'description', 'source', 'source_id')
+        return ()
+
+    def get_fields(self, request, obj=None):
+        if obj is not None and obj.source != LedgerEntry.SOURCE_MANUAL:
+            return self.get_readonly_fields(request, obj)
+        return self.fields
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.source != LedgerEntry.SOURCE_MANUAL:
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.kind, obj.source = LedgerEntry.KIND_ADJUSTMENT, LedgerEntry.SOURCE_MANUAL
+        super().save_model(request, obj, form, change)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None) # Would delete mirrored entries too
+        return actions
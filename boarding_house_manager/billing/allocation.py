@@ -0,0 +1,129 @@
+# billing/allocation.py
+# Spreads tenant-level (lump-sum) payments over the tenant's open bills: oldest due
+# date first, or by bill type priority when one is configured. Whatever is left
+# over stays on TenantPayment.unallocated_amount as credit for future bills.
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Bill, Payment, Tenant, TenantPayment
+from .outbox import record_bill_events
+
+ZERO = Decimal('0.00')
+
+
+def get_allocation_priority():
+    """Bill types in the order they should be paid, e.g. ['Rent', 'Electricity']. None means pure FIFO."""
+    return getattr(settings, 'BILLING_ALLOCATION_PRIORITY', None)
+
+
+def _bill_sort_key(priority):
+    if not priority:
+        return lambda bill: (bill.due_date, bill.id)
+    rank = {bill_type: index for index, bill_type in enumerate(priority)}
+    return lambda bill: (rank.get(bill.bill_type, len(rank)), bill.due_date, bill.id)
+
+
+def load_open_bills(tenant_ids, priority=None):
+    """Unpaid bills for the given tenants with their outstanding amount, in one query.
+
+    Returns {tenant_id: [bill, ...]} in allocation order; each bill has an `outstanding` attribute.
+    """
+    bills = Bill.objects.filter(tenant_id__in=tenant_ids, is_paid=False).annotate(
+        already_paid=Coalesce(Sum('payment__amount_paid'), Value(ZERO), output_field=DecimalField(max_digits=10, decimal_places=2))
+    )
+    open_bills = {}
+    for bill in bills:
+        bill.outstanding = bill.amount - bill.already_paid
+        if bill.outstanding > ZERO:
+            open_bills.setdefault(bill.tenant_id, []).append(bill)
+    sort_key = _bill_sort_key(priority)
+    for tenant_bills in open_bills.values():
+        tenant_bills.sort(key=sort_key)
+    return open_bills
+
+
+def save_allocated_payments(new_payments, paid_bills):
+    """Bulk-write allocation results. bulk_create skips the Payment signals, so
+    bills that became fully paid are flagged, and their bill.paid events recorded, here
+    directly. Call it inside a transaction."""
+    Payment.objects.bulk_create(new_payments, batch_size=500)
+    if paid_bills:
+        now = timezone.now()
+        for bill in paid_bills:
+            bill.is_paid = True
+            bill.date_updated = now
+        Bill.objects.bulk_update(paid_bills, ['is_paid', 'date_updated'], batch_size=500)
+        tenants = Tenant.objects.in_bulk({bill.tenant_id for bill in paid_bills})
+        for bill in paid_bills:
+            bill.tenant = tenants[bill.tenant_id]
+        record_bill_events('bill.paid', paid_bills)
+
+
+def allocate_payments(tenant_payment_ids, priority=None):
+    """Allocate the unallocated part of each given TenantPayment, oldest payment first.
+
+    Runs in one transaction with a single read of the tenants' open bills and bulk writes.
+    Returns a summary dict.
+    """
+    if priority is None:
+        priority = get_allocation_priority()
+
+    with transaction.atomic(using=router.db_for_write(Payment)):
+        tenant_payments = list(
+            TenantPayment.objects.select_for_update()
+            .filter(pk__in=tenant_payment_ids, unallocated_amount__gt=ZERO)
+            .order_by('payment_date', 'id')
+        )
+        if not tenant_payments:
+            return {'payments': 0, 'allocations': 0, 'bills_paid': 0, 'amount_allocated': ZERO, 'credit_remaining': ZERO}
+
+        open_bills = load_open_bills({tp.tenant_id for tp in tenant_payments}, priority)
+        new_payments = []
+        paid_bills = []
+        amount_allocated = ZERO
+
+        for tenant_payment in tenant_payments:
+            for bill in open_bills.get(tenant_payment.tenant_id, []):
+                if tenant_payment.unallocated_amount <= ZERO:
+                    break
+                if bill.outstanding <= ZERO:
+                    continue
+                applied = min(bill.outstanding, tenant_payment.unallocated_amount)
+                new_payments.append(Payment(
+                    bill=bill,
+                    tenant_id=tenant_payment.tenant_id,
+                    amount_paid=applied,
+                    payment_date=tenant_payment.payment_date,
+                    payment_method=tenant_payment.payment_method,
+                    notes=f"Allocated from tenant payment #{tenant_payment.pk}.",
+                    tenant_payment=tenant_payment,
+                ))
+                bill.outstanding -= applied
+                tenant_payment.unallocated_amount -= applied
+                amount_allocated += applied
+                if bill.outstanding <= ZERO:
+                    paid_bills.append(bill)
+
+        save_allocated_payments(new_payments, paid_bills)
+        TenantPayment.objects.bulk_update(tenant_payments, ['unallocated_amount'], batch_size=500)
+
+    return {
+        'payments': len(tenant_payments),
+        'allocations': len(new_payments),
+        'bills_paid': len(paid_bills),
+        'amount_allocated': amount_allocated,
+        'credit_remaining': sum((tp.unallocated_amount for tp in tenant_payments), ZERO),
+    }
+
+
+def allocate_month(year, month, priority=None):
+    """Bulk mode: allocate every tenant's unallocated payments received in the month in one pass."""
+    tenant_payment_ids = TenantPayment.objects.filter(
+        payment_date__year=year, payment_date__month=month, unallocated_amount__gt=ZERO
+    ).values_list('id', flat=True)
+    return allocate_payments(list(tenant_payment_ids), priority)
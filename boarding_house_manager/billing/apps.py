@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BillingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'billing'
+
+    def ready(self):
+        from . import journal # noqa: F401 -- connects the change journal signal handlers
+        from . import search # noqa: F401 -- connects the search index signal handlers
+        from . import availability # noqa: F401 -- keeps LeasePeriod in sync with tenants
+        from . import balances # noqa: F401 -- invalidates cached tenant balances
+        from . import ledger # noqa: F401 -- keeps the tenant ledger in step with bills and payments
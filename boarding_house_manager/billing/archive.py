@@ -0,0 +1,159 @@
+# billing/archive.py
+# Moves settled bills (and their payments) between the hot Bill/Payment tables and
+# the ArchivedBill/ArchivedPayment tables, and reads both when full history is needed.
+from django.db import router, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from .balances import invalidate_tenants
+from .journal import record_archive
+from .models import ArchivedBill, ArchivedPayment, BankStatementLine, Bill, NotificationLog, Payment, RoomMeterAllocation
+from .search import remove_documents
+
+BILL_FIELDS = ('id', 'tenant_id', 'bill_type', 'amount', 'due_date', 'is_paid', 'description',
+               'date_created', 'date_updated', 'parent_bill_id')
+PAYMENT_FIELDS = ('id', 'bill_id', 'tenant_id', 'amount_paid', 'payment_date', 'payment_method', 'notes',
+                  'date_recorded', 'tenant_payment_id')
+# Nullable (on_delete=SET_NULL) links to bills and payments from other tables, as (model,
+# field). The raw deletes skip Django's on_delete handling, so they are cleared first.
+BILL_REFERENCES = ((NotificationLog, 'bill'), (RoomMeterAllocation, 'bill'))
+PAYMENT_REFERENCES = ((BankStatementLine, 'payment'),)
+
+
+def archivable_bills(cutoff):
+    """Paid bills due before `cutoff` whose late fees (if any) are archivable too, and
+    late fees whose parent bill is archivable: a fee stays while its bill may still accrue."""
+    return (
+        Bill.objects.filter(is_paid=True, due_date__lt=cutoff)
+        .exclude(late_fees__is_paid=False)
+        .exclude(late_fees__due_date__gte=cutoff)
+        .exclude(parent_bill__is_paid=False)
+        .exclude(parent_bill__due_date__gte=cutoff)
+        .exclude(parent_bill__late_fees__is_paid=False)
+        .exclude(parent_bill__late_fees__due_date__gte=cutoff)
+    )
+
+
+def _copy_fields(source, target_class, fields, **extra):
+    return target_class(**{field: getattr(source, field) for field in fields}, **extra)
+
+
+def _clear_references(references, ids):
+    for model, field in references:
+        model.objects.filter(**{f"{field}__in": ids}).update(**{field: None})
+
+
+def archive_settled_bills(cutoff, chunk_size=1000, progress=None):
+    """Move archivable bills and their payments to the archive, `chunk_size` bills per transaction.
+
+    Chunks go from the newest id down, so late fee bills (always newer than the bill
+    they were charged on) leave the hot table before their parent. Returns
+    (bills_archived, payments_archived).
+    """
+    candidates = archivable_bills(cutoff).order_by('-id')
+    bills_archived = payments_archived = 0
+    last_id = None
+    while True:
+        chunk = candidates if last_id is None else candidates.filter(id__lt=last_id)
+        ids = list(chunk.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        with transaction.atomic(using=router.db_for_write(Bill)):
+            bills = list(Bill.objects.select_for_update().filter(pk__in=ids, is_paid=True))
+            bill_ids = [bill.pk for bill in bills]
+            payments = list(Payment.objects.filter(bill_id__in=bill_ids))
+            archived_at = timezone.now()
+
+            ArchivedBill.objects.bulk_create(
+                [_copy_fields(bill, ArchivedBill, BILL_FIELDS, archived_at=archived_at) for bill in bills]
+            )
+            ArchivedPayment.objects.bulk_create(
+                [_copy_fields(payment, ArchivedPayment, PAYMENT_FIELDS, archived_at=archived_at) for payment in payments]
+            )
+            # Raw deletes on purpose: the Payment post_delete handlers would recompute
+            # is_paid for bills that are being removed in the same statement batch.
+            _clear_references(PAYMENT_REFERENCES, [payment.pk for payment in payments])
+            _clear_references(BILL_REFERENCES, bill_ids)
+            Payment.objects.filter(pk__in=[payment.pk for payment in payments])._raw_delete(Payment.objects.db)
+            Bill.objects.filter(pk__in=bill_ids)._raw_delete(Bill.objects.db)
+            record_archive(Payment, [payment.pk for payment in payments])
+            record_archive(Bill, bill_ids)
+            remove_documents(Payment, [payment.pk for payment in payments])
+            remove_documents(Bill, bill_ids)
+            invalidate_tenants({bill.tenant_id for bill in bills} | {payment.tenant_id for payment in payments})
+
+        bills_archived += len(bills)
+        payments_archived += len(payments)
+        if progress:
+            progress(bills_archived, payments_archived)
+    return bills_archived, payments_archived
+
+
+def restore_archived_bills(archived_bills, chunk_size=1000, progress=None):
+    """Move archived bills (an ArchivedBill queryset) and their payments back to the hot tables.
+
+    Parents of restored late fees are restored too, and chunks go from the oldest id up,
+    so a fee never comes back before the bill it belongs to. Returns (bills, payments).
+    """
+    ids = set(archived_bills.values_list('id', flat=True))
+    parent_ids = set(
+        ArchivedBill.objects.filter(pk__in=ids, parent_bill_id__isnull=False).values_list('parent_bill_id', flat=True)
+    )
+    ids |= set(ArchivedBill.objects.filter(pk__in=parent_ids).values_list('id', flat=True))
+    ordered_ids = sorted(ids)
+
+    bills_restored = payments_restored = 0
+    for start in range(0, len(ordered_ids), chunk_size):
+        chunk_ids = ordered_ids[start:start + chunk_size]
+        with transaction.atomic(using=router.db_for_write(ArchivedBill)):
+            archived = list(ArchivedBill.objects.filter(pk__in=chunk_ids).order_by('id'))
+            archived_payments = list(ArchivedPayment.objects.filter(bill_id__in=chunk_ids))
+
+            bills = [_copy_fields(bill, Bill, BILL_FIELDS) for bill in archived]
+            payments = [_copy_fields(payment, Payment, PAYMENT_FIELDS) for payment in archived_payments]
+            Bill.objects.bulk_create(bills)
+            Payment.objects.bulk_create(payments)
+            # bulk_create stamps auto_now/auto_now_add fields with the current time; put the originals back.
+            for bill, original in zip(bills, archived):
+                bill.date_created, bill.date_updated = original.date_created, original.date_updated
+            for payment, original in zip(payments, archived_payments):
+                payment.date_recorded = original.date_recorded
+            Bill.objects.bulk_update(bills, ['date_created', 'date_updated'])
+            Payment.objects.bulk_update(payments, ['date_recorded'])
+
+            ArchivedPayment.objects.filter(bill_id__in=chunk_ids).delete()
+            ArchivedBill.objects.filter(pk__in=chunk_ids).delete()
+
+        bills_restored += len(bills)
+        payments_restored += len(payments)
+        if progress:
+            progress(bills_restored, payments_restored)
+    return bills_restored, payments_restored
+
+
+def bills_with_archive(**filters):
+    """Hot and archived bills matching `filters` as one UNION ALL query of dicts.
+
+    Each row has the Bill fields plus `is_archived`. Filter here: a union can only be
+    ordered or sliced afterwards.
+    """
+    hot = Bill.objects.filter(**filters).order_by().values(*BILL_FIELDS).annotate(
+        is_archived=Value(False, output_field=BooleanField())
+    )
+    archived = ArchivedBill.objects.filter(**filters).order_by().values(*BILL_FIELDS).annotate(
+        is_archived=Value(True, output_field=BooleanField())
+    )
+    return hot.union(archived, all=True)
+
+
+def payments_with_archive(**filters):
+    """Hot and archived payments matching `filters`; see bills_with_archive()."""
+    hot = Payment.objects.filter(**filters).order_by().values(*PAYMENT_FIELDS).annotate(
+        is_archived=Value(False, output_field=BooleanField())
+    )
+    archived = ArchivedPayment.objects.filter(**filters).order_by().values(*PAYMENT_FIELDS).annotate(
+        is_archived=Value(True, output_field=BooleanField())
+    )
+    return hot.union(archived, all=True)
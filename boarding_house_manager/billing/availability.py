@@ -0,0 +1,178 @@
+# billing/availability.py
+# Room availability over date ranges. Each tenant's lease is mirrored into a LeasePeriod
+# row (kept current by the signal handler below), and AvailabilityIndex reads those rows
+# in one ordered query into per-room lists of merged, sorted intervals. Free/occupied
+# checks and next-vacancy lookups are then binary searches instead of a scan over every
+# tenant. All dates are inclusive: a lease ending on the 31st frees the room on the 1st.
+import bisect
+import datetime
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import LeasePeriod, Room, Tenant
+
+ONE_DAY = datetime.timedelta(days=1)
+OPEN_END = datetime.date.max # End of open-ended leases inside the index
+
+LEASE_FIELDS = {'room', 'room_id', 'lease_start_date', 'lease_end_date', 'is_active'}
+
+
+def lease_values(tenant):
+    """(room_id, start_date, end_date) of the tenant's lease, or None if it occupies no room.
+    An inactive tenant without an end date has moved out at an unknown date and is not counted."""
+    if tenant.room_id is None or (not tenant.is_active and tenant.lease_end_date is None):
+        return None
+    return tenant.room_id, tenant.lease_start_date, tenant.lease_end_date
+
+
+def sync_lease_period(tenant):
+    """Bring the tenant's LeasePeriod in line with the tenant. Call this after bulk tenant
+    updates, which do not send post_save."""
+    values = lease_values(tenant)
+    if values is None:
+        LeasePeriod.objects.filter(tenant_id=tenant.pk).delete()
+        return
+    room_id, start_date, end_date = values
+    LeasePeriod.objects.update_or_create(
+        tenant_id=tenant.pk, defaults={'room_id': room_id, 'start_date': start_date, 'end_date': end_date},
+    )
+
+
+def sync_lease_periods(tenants):
+    """sync_lease_period for many tenants at once: one delete and one bulk insert."""
+    tenants = list(tenants)
+    LeasePeriod.objects.filter(tenant_id__in=[tenant.pk for tenant in tenants]).delete()
+    periods = []
+    for tenant in tenants:
+        values = lease_values(tenant)
+        if values is not None:
+            room_id, start_date, end_date = values
+            periods.append(LeasePeriod(tenant_id=tenant.pk, room_id=room_id, start_date=start_date, end_date=end_date))
+    LeasePeriod.objects.bulk_create(periods, batch_size=500)
+
+
+@receiver(post_save, sender=Tenant)
+def tenant_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not LEASE_FIELDS & set(update_fields):
+        return
+    sync_lease_period(instance)
+
+
+class RoomIntervals:
+    """Occupied intervals of one room, merged (overlapping or back-to-back leases become
+    one interval) and sorted by start date."""
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in intervals:
+            self.add(start, end)
+
+    def add(self, start, end):
+        """Add an interval. Intervals must arrive ordered by start date, as the index query returns them."""
+        end = end or OPEN_END
+        if self.ends and (self.ends[-1] == OPEN_END or start <= self.ends[-1] + ONE_DAY):
+            self.ends[-1] = max(self.ends[-1], end)
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def _covering(self, day):
+        """Index of the interval containing `day`, or None."""
+        i = bisect.bisect_right(self.starts, day) - 1
+        if i >= 0 and self.ends[i] >= day:
+            return i
+        return None
+
+    def is_free(self, start, end):
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i < 0 or self.ends[i] < start
+
+    def occupied(self, start, end):
+        """Occupied intervals overlapping [start, end], clipped to it."""
+        i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        ranges = []
+        while i < len(self.starts) and self.starts[i] <= end:
+            if self.ends[i] >= start:
+                ranges.append((max(self.starts[i], start), min(self.ends[i], end)))
+            i += 1
+        return ranges
+
+    def free(self, start, end):
+        """Free intervals within [start, end]."""
+        ranges = []
+        cursor = start
+        for occupied_start, occupied_end in self.occupied(start, end):
+            if occupied_start > cursor:
+                ranges.append((cursor, occupied_start - ONE_DAY))
+            if occupied_end == OPEN_END:
+                return ranges
+            cursor = occupied_end + ONE_DAY
+        if cursor <= end:
+            ranges.append((cursor, end))
+        return ranges
+
+    def next_vacancy(self, day):
+        """First free day on or after `day`; None if the room is taken by an open-ended lease."""
+        i = self._covering(day)
+        if i is None:
+            return day
+        if self.ends[i] == OPEN_END:
+            return None
+        return self.ends[i] + ONE_DAY # Merged intervals never touch, so the next day is free
+
+
+class AvailabilityIndex:
+    """Occupied intervals of every room, built from LeasePeriod in one ordered query.
+
+    Only leases still running on or after `since` are loaded, which is all that is needed
+    to answer queries about dates from `since` on.
+    """
+
+    def __init__(self, since=None, rooms=None):
+        self.since = since
+        self.rooms = list(rooms if rooms is not None else Room.objects.order_by('room_number'))
+        self.intervals = {room.pk: RoomIntervals() for room in self.rooms}
+
+        periods = LeasePeriod.objects.all() if rooms is None else LeasePeriod.objects.filter(room_id__in=self.intervals.keys())
+        if since is not None:
+            periods = periods.exclude(end_date__lt=since)
+        for room_id, start_date, end_date in periods.order_by('room_id', 'start_date').values_list(
+            'room_id', 'start_date', 'end_date'
+        ).iterator(chunk_size=5000):
+            self.intervals[room_id].add(start_date, end_date)
+
+    def _check_range(self, start):
+        if self.since is not None and start < self.since:
+            raise ValueError(f"This index only covers dates from {self.since}; got {start}.")
+
+    def is_free(self, room_id, start, end):
+        self._check_range(start)
+        return self.intervals[room_id].is_free(start, end)
+
+    def free_rooms(self, start, end):
+        self._check_range(start)
+        return [room for room in self.rooms if self.intervals[room.pk].is_free(start, end)]
+
+    def next_vacancy(self, room_id, day):
+        self._check_range(day)
+        return self.intervals[room_id].next_vacancy(day)
+
+    def summary(self, start, end):
+        """One row per room for [start, end]: whether it is free for the whole range, its
+        occupied and free sub-ranges, and the next vacancy from `start`."""
+        self._check_range(start)
+        rows = []
+        for room in self.rooms:
+            intervals = self.intervals[room.pk]
+            rows.append({
+                'room': room,
+                'is_free': intervals.is_free(start, end),
+                'occupied': intervals.occupied(start, end),
+                'free': intervals.free(start, end),
+                'next_vacancy': intervals.next_vacancy(start),
+            })
+        return rows
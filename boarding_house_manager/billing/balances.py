@@ -0,0 +1,221 @@
+# billing/balances.py
+# Cached per-tenant balance summaries: outstanding total, outstanding per bill type, oldest
+# unpaid due date and last payment.
+#
+# Keys are versioned: each tenant has a version key in the shared cache, and summaries are
+# stored under a key that includes it. Any change to a tenant's bills or payments writes a
+# new version (signal handlers below, JournaledQuerySet for bulk writes, billing.archive),
+# so stale summaries are never read again and simply expire. Versions are fresh
+# timestamps rather than counters, so a version key lost to eviction can never bring an
+# old summary back. A small in-process LRU sits in front of the shared cache; it can
+# hold summaries safely because the version lookup always goes to the shared cache.
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Bill, Payment
+
+ZERO = Decimal('0.00')
+CENTS = Decimal('0.01')
+CHUNK_SIZE = 500
+# Tenant ids are only unique within one database, so keys include the database alias.
+VERSION_KEY = 'billing:balance-version:{}:{}'
+SUMMARY_KEY = 'billing:balance:{}:{}:{}'
+
+
+class _LRU:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_lru = _LRU(getattr(settings, 'BILLING_BALANCE_LRU_SIZE', 2048))
+
+
+def _cache():
+    return caches[getattr(settings, 'BILLING_BALANCE_CACHE', 'default')]
+
+
+def _versions(tenant_ids):
+    """Current version of each tenant, creating missing ones."""
+    cache = _cache()
+    alias = router.db_for_read(Bill)
+    keys = {tenant_id: VERSION_KEY.format(alias, tenant_id) for tenant_id in tenant_ids}
+    found = cache.get_many(keys.values())
+    versions = {}
+    missing = {}
+    for tenant_id, key in keys.items():
+        if key in found:
+            versions[tenant_id] = found[key]
+        else:
+            missing[key] = tenant_id
+    if missing:
+        new_version = time.time_ns()
+        for key, tenant_id in missing.items():
+            cache.add(key, new_version, timeout=None)
+        found = cache.get_many(missing.keys()) # Another process may have won the add()
+        for key, tenant_id in missing.items():
+            versions[tenant_id] = found.get(key, new_version)
+    return versions
+
+
+def _bump(alias, tenant_ids):
+    _cache().set_many({VERSION_KEY.format(alias, tenant_id): time.time_ns() for tenant_id in tenant_ids}, timeout=None)
+
+
+def invalidate_tenants(tenant_ids):
+    """Mark the summaries of these tenants stale. The version is written again once the
+    surrounding transaction commits, so a summary rebuilt from not-yet-committed data in
+    between is not kept either."""
+    tenant_ids = {tenant_id for tenant_id in tenant_ids if tenant_id is not None}
+    if not tenant_ids:
+        return
+    alias = router.db_for_write(Bill)
+    _bump(alias, tenant_ids)
+    transaction.on_commit(lambda: _bump(alias, tenant_ids), using=alias)
+
+
+def compute_summaries(tenant_ids):
+    """Build summaries from the database for the given tenants, in three queries per chunk."""
+    summaries = {
+        tenant_id: {
+            'outstanding': ZERO,
+            'outstanding_by_type': {},
+            'oldest_unpaid_due_date': None,
+            'last_payment_date': None,
+            'last_payment_amount': ZERO,
+        }
+        for tenant_id in tenant_ids
+    }
+    tenant_ids = list(tenant_ids)
+    for start in range(0, len(tenant_ids), CHUNK_SIZE):
+        chunk = tenant_ids[start:start + CHUNK_SIZE]
+        unpaid = (
+            Bill.objects.filter(tenant_id__in=chunk, is_paid=False)
+            .values('tenant_id', 'bill_type')
+            .annotate(amount=Sum('amount'), oldest=Min('due_date'))
+        )
+        for row in unpaid:
+            summary = summaries[row['tenant_id']]
+            summary['outstanding_by_type'][row['bill_type']] = row['amount']
+            if summary['oldest_unpaid_due_date'] is None or row['oldest'] < summary['oldest_unpaid_due_date']:
+                summary['oldest_unpaid_due_date'] = row['oldest']
+
+        partly_paid = (
+            Payment.objects.filter(bill__tenant_id__in=chunk, bill__is_paid=False)
+            .values('bill__tenant_id', 'bill__bill_type')
+            .annotate(paid=Sum('amount_paid'))
+        )
+        for row in partly_paid:
+            by_type = summaries[row['bill__tenant_id']]['outstanding_by_type']
+            by_type[row['bill__bill_type']] = by_type.get(row['bill__bill_type'], ZERO) - row['paid']
+
+        latest_date = Payment.objects.filter(tenant_id=OuterRef('tenant_id')).order_by('-payment_date').values('payment_date')[:1]
+        last_payments = (
+            Payment.objects.filter(tenant_id__in=chunk, payment_date=Subquery(latest_date))
+            .values('tenant_id')
+            .annotate(payment_date=Max('payment_date'), amount=Sum('amount_paid'))
+        )
+        for row in last_payments:
+            summary = summaries[row['tenant_id']]
+            summary['last_payment_date'] = row['payment_date']
+            summary['last_payment_amount'] = row['amount']
+
+    for summary in summaries.values():
+        # SQLite returns sums of DecimalFields without their scale; keep cents throughout.
+        summary['outstanding_by_type'] = {
+            bill_type: amount.quantize(CENTS) for bill_type, amount in summary['outstanding_by_type'].items()
+        }
+        summary['outstanding'] = sum(summary['outstanding_by_type'].values(), ZERO)
+        summary['last_payment_amount'] = summary['last_payment_amount'].quantize(CENTS)
+    return summaries
+
+
+def _with_overdue(summary, today):
+    # Only the oldest unpaid due date is cached; whether it is overdue depends on the day it is read.
+    oldest = summary['oldest_unpaid_due_date']
+    return {**summary, 'oldest_overdue_date': oldest if oldest is not None and oldest < today else None}
+
+
+def get_balance_summaries(tenant_ids):
+    """{tenant_id: summary} for the given tenants: one get_many for the versions, then the
+    in-process LRU, one get_many on the shared cache for the rest, and the database only
+    for tenants found in neither."""
+    tenant_ids = list(dict.fromkeys(tenant_ids))
+    if not tenant_ids:
+        return {}
+    cache = _cache()
+    versions = _versions(tenant_ids)
+    alias = router.db_for_read(Bill)
+    keys = {tenant_id: SUMMARY_KEY.format(alias, tenant_id, versions[tenant_id]) for tenant_id in tenant_ids}
+
+    found = _lru.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        shared = cache.get_many(missing)
+        _lru.set_many(shared)
+        found.update(shared)
+
+    to_compute = [tenant_id for tenant_id, key in keys.items() if key not in found]
+    if to_compute:
+        computed = {keys[tenant_id]: summary for tenant_id, summary in compute_summaries(to_compute).items()}
+        cache.set_many(computed)
+        _lru.set_many(computed)
+        found.update(computed)
+
+    today = timezone.localdate()
+    return {tenant_id: _with_overdue(found[key], today) for tenant_id, key in keys.items()}
+
+
+def get_balance_summary(tenant_id):
+    return get_balance_summaries([tenant_id])[tenant_id]
+
+
+@receiver(pre_save, sender=Bill)
+@receiver(pre_save, sender=Payment)
+def remember_previous_tenant(sender, instance, raw=False, **kwargs):
+    # A bill or payment moved to another tenant changes the old tenant's balance too.
+    loaded = getattr(instance, '_loaded_values', None)
+    instance._balance_previous_tenant_id = loaded.get('tenant_id') if loaded else None
+
+
+@receiver(post_save, sender=Bill)
+@receiver(post_save, sender=Payment)
+def invalidate_saved(sender, instance, **kwargs):
+    tenant_ids = {instance.tenant_id, getattr(instance, '_balance_previous_tenant_id', None)}
+    if sender is Payment and Payment.bill.is_cached(instance):
+        tenant_ids.add(instance.bill.tenant_id)
+    invalidate_tenants(tenant_ids)
+
+
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=Payment)
+def invalidate_deleted(sender, instance, **kwargs):
+    invalidate_tenants([instance.tenant_id])
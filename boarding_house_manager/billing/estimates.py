@@ -0,0 +1,264 @@
+# billing/estimates.py
+# Estimated electricity readings. When a tenant's meter isn't read for a billing period,
+# `manage.py estimate_electricity_readings` adds an ElectricityReading flagged is_estimate
+# at the end of the period and bills it like an actual reading, so a missed month is
+# charged in its own month instead of together with the next one.
+#
+# The estimate extends the tenant's latest reading by their average daily use, taken from
+# the first and last actual readings in a lookback window (estimates never feed further
+# estimates). Gaps are found for all tenants with one grouped query and the averages are
+# computed for all of them at once in integer units (billing.money).
+#
+# The next actual reading is billed against the estimate as its previous reading, which
+# trues the estimate up: an under-estimate leaves the difference on that bill; an
+# over-estimate becomes a credit (a TenantPayment) applied to the tenant's open bills,
+# each kWh credited at the price of the estimate that charged it. An actual reading is
+# never accepted below the last actual reading the estimates extended.
+import datetime
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from . import money
+from .allocation import allocate_payments
+from .models import Bill, ElectricityReading, Tenant, TenantPayment
+from .outbox import record_bill_events
+
+KWH_PLACES = 2
+PRICE_PLACES = 3
+DEFAULT_LOOKBACK_DAYS = 180
+DEFAULT_DUE_DAYS = 15
+TRUE_UP_METHOD = 'Estimate true-up'
+
+
+class Estimate:
+    """The estimated reading of one tenant at the end of a period without a reading."""
+
+    def __init__(self, tenant_id, last_date, last_value, billed_value, unit_price):
+        self.tenant_id = tenant_id
+        self.last_date = last_date       # Latest reading, actual or estimated
+        self.last_value = last_value
+        self.billed_value = billed_value # Latest billed reading, which the bill is charged against
+        self.unit_price = unit_price
+        self.daily_use = None            # kWh per day, None without enough history
+        self.history_days = 0
+        self.reading = None
+        self.bill = None
+        self.skipped = ''
+
+
+def find_gaps(period_start, period_end, tenants=None):
+    """Estimates (not computed yet) for the active tenants with a meter (at least one
+    reading) who have no reading from `period_start` on. One grouped query."""
+    if tenants is None:
+        tenants = Tenant.objects.all()
+    latest = ElectricityReading.objects.filter(tenant_id=OuterRef('tenant_id')).order_by('-reading_date', '-created_at')
+    rows = (
+        ElectricityReading.objects.filter(tenant__in=tenants.filter(is_active=True))
+        .values('tenant_id')
+        .annotate(
+            last_date=Max('reading_date'),
+            last_value=Subquery(latest.values('reading_value')[:1]),
+            unit_price=Subquery(latest.values('unit_price')[:1]),
+            billed_value=Subquery(latest.filter(is_billed=True).values('reading_value')[:1]),
+        )
+        .filter(last_date__lt=period_start)
+        .order_by('tenant_id')
+    )
+    return [
+        Estimate(row['tenant_id'], row['last_date'], row['last_value'], row['billed_value'], row['unit_price'])
+        for row in rows
+    ]
+
+
+def daily_use(tenant_ids, before, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """{tenant_id: (kWh used in hundredths, days)} between each tenant's first and last actual
+    reading in the `lookback_days` before `before`. Tenants with fewer than two such readings,
+    or whose meter went backwards, are left out. One query, then one pass over arrays."""
+    rows = list(
+        ElectricityReading.objects.filter(
+            tenant_id__in=tenant_ids, is_estimate=False,
+            reading_date__gte=before - datetime.timedelta(days=lookback_days), reading_date__lt=before,
+        ).order_by('tenant_id', 'reading_date').values_list('tenant_id', 'reading_date', 'reading_value')
+    )
+    if not rows:
+        return {}
+    tenants = [row[0] for row in rows]
+    days = [row[1].toordinal() for row in rows]
+    values = money.to_minor([row[2] for row in rows], KWH_PLACES)
+
+    np = money.np
+    if np is None:
+        firsts = [i for i in range(len(rows)) if i == 0 or tenants[i] != tenants[i - 1]]
+        lasts = [i - 1 for i in firsts[1:]] + [len(rows) - 1]
+        used = [values[last] - values[first] for first, last in zip(firsts, lasts)]
+        spans = [days[last] - days[first] for first, last in zip(firsts, lasts)]
+        keep = [span > 0 and use >= 0 for use, span in zip(used, spans)]
+    else:
+        tenants, days = np.asarray(tenants), np.asarray(days, dtype=np.int64)
+        firsts = np.flatnonzero(np.r_[True, tenants[1:] != tenants[:-1]])
+        lasts = np.r_[firsts[1:] - 1, len(rows) - 1]
+        used = values[lasts] - values[firsts]
+        spans = days[lasts] - days[firsts]
+        keep = (spans > 0) & (used >= 0)
+    return {
+        int(tenants[first]): (int(use), int(span))
+        for first, use, span, kept in zip(firsts, used, spans, keep) if kept
+    }
+
+
+def compute(estimates, period_end, unit_price=None, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """Fill in each estimate's reading and consumption at `period_end`; estimates that can't
+    be computed get a `skipped` reason. Returns the estimates that can be billed."""
+    history = daily_use([estimate.tenant_id for estimate in estimates], period_end, lookback_days)
+    ready = []
+    for estimate in estimates:
+        if estimate.billed_value is None:
+            estimate.skipped = 'no billed reading to charge the estimate against'
+        elif estimate.tenant_id not in history:
+            estimate.skipped = f'fewer than two actual readings in the last {lookback_days} days'
+        else:
+            ready.append(estimate)
+    if not ready:
+        return []
+
+    # Use over the gap = used * gap days / history days, rounded half up to hundredths of a kWh.
+    used = [history[estimate.tenant_id][0] for estimate in ready]
+    spans = [history[estimate.tenant_id][1] for estimate in ready]
+    gaps = [(period_end - estimate.last_date).days for estimate in ready]
+    np = money.np
+    if np is not None:
+        used, spans, gaps = (np.asarray(values, dtype=np.int64) for values in (used, spans, gaps))
+        extra = (2 * used * gaps + spans) // (2 * spans)
+    else:
+        extra = [(2 * use * gap + span) // (2 * span) for use, gap, span in zip(used, gaps, spans)]
+    values = [money.minor_units(estimate.last_value, KWH_PLACES) + int(units) for estimate, units in zip(ready, extra)]
+    consumption = [value - money.minor_units(estimate.billed_value, KWH_PLACES) for estimate, value in zip(ready, values)]
+    prices = [unit_price if unit_price is not None else estimate.unit_price for estimate in ready]
+    amounts = money.multiply(consumption, KWH_PLACES, money.to_minor(prices, PRICE_PLACES), PRICE_PLACES)
+
+    for estimate, value, use, span, kwh, price, amount in zip(ready, values, used, spans, consumption, prices, amounts):
+        if kwh < 0:
+            estimate.skipped = 'the latest reading is below the last billed one; bill it first'
+            continue
+        estimate.daily_use = money.quantize(Decimal(int(use)) / int(span) / 100, KWH_PLACES)
+        estimate.history_days = int(span)
+        estimate.reading = ElectricityReading(
+            tenant_id=estimate.tenant_id,
+            reading_date=period_end,
+            reading_value=money.from_minor_units(value, KWH_PLACES),
+            previous_reading_value=estimate.billed_value,
+            consumption=money.from_minor_units(kwh, KWH_PLACES),
+            unit_price=price,
+            is_billed=True,
+            is_estimate=True,
+            notes=(
+                f"Estimated: {estimate.daily_use} kWh/day (actual readings over {estimate.history_days} days) "
+                f"for the {(period_end - estimate.last_date).days} days since the reading of {estimate.last_date}."
+            ),
+        )
+        estimate.bill = Bill(
+            tenant_id=estimate.tenant_id,
+            bill_type='Electricity',
+            amount=money.from_minor_units(amount),
+            description=(
+                f"Electricity charge for period ending {period_end} (estimated, no meter reading). "
+                f"Estimated reading: {estimate.reading.reading_value} kWh, "
+                f"Previous reading: {estimate.billed_value} kWh. "
+                f"Consumption: {estimate.reading.consumption} kWh @ {price}/kWh. "
+                f"Adjusted on the bill for the next actual reading."
+            ),
+            is_paid=False,
+        )
+    return [estimate for estimate in ready if estimate.bill is not None]
+
+
+def estimate_readings(period_start, period_end, tenants=None, unit_price=None,
+                      lookback_days=DEFAULT_LOOKBACK_DAYS, due_days=DEFAULT_DUE_DAYS, dry_run=False):
+    """Estimate and bill the readings missing between `period_start` and `period_end`.
+
+    Returns every Estimate found; the billed ones have their `reading` and `bill` saved
+    (unsaved when `dry_run`), the others a `skipped` reason. Readings, bills and their
+    outbox events are written in one transaction with bulk inserts.
+    """
+    estimates = find_gaps(period_start, period_end, tenants)
+    ready = compute(estimates, period_end, unit_price, lookback_days)
+    for estimate in ready:
+        estimate.bill.due_date = period_end + datetime.timedelta(days=due_days)
+    if dry_run or not ready:
+        return estimates
+
+    with transaction.atomic(using=router.db_for_write(Bill)):
+        tenant_ids = [estimate.tenant_id for estimate in ready]
+        # Unbilled readings before the gap are covered by the estimate's bill.
+        ElectricityReading.objects.filter(
+            tenant_id__in=tenant_ids, is_billed=False, reading_date__lt=period_start
+        ).update(is_billed=True)
+        ElectricityReading.objects.bulk_create([estimate.reading for estimate in ready], batch_size=500)
+        bills = Bill.objects.bulk_create([estimate.bill for estimate in ready], batch_size=500)
+        tenants_by_id = Tenant.objects.in_bulk(tenant_ids)
+        for bill in bills:
+            bill.tenant = tenants_by_id[bill.tenant_id]
+        record_bill_events('bill.created', bills)
+    return estimates
+
+
+def true_up_description(estimated_reading):
+    return (
+        f"True-up of the estimated reading of {estimated_reading.reading_date} "
+        f"({estimated_reading.reading_value} kWh). "
+    )
+
+
+def _estimate_chain(estimated_reading):
+    """The estimates billed since the last actual reading before `estimated_reading` (up to
+    and including it), and that actual reading's value (None if there is none)."""
+    readings = ElectricityReading.objects.filter(
+        tenant_id=estimated_reading.tenant_id, is_billed=True, reading_date__lte=estimated_reading.reading_date
+    )
+    last_actual = readings.filter(
+        is_estimate=False, reading_date__lt=estimated_reading.reading_date
+    ).order_by('-reading_date', '-created_at').first()
+    chain = readings.filter(is_estimate=True)
+    if last_actual is not None:
+        chain = chain.filter(reading_date__gt=last_actual.reading_date)
+    return list(chain), last_actual.reading_value if last_actual is not None else None
+
+
+def true_up_floor(estimated_reading):
+    """The lowest actual reading that can be billed against `estimated_reading`: the last
+    actual reading the estimates extended (the first estimate's starting value without one)."""
+    chain, last_actual = _estimate_chain(estimated_reading)
+    if last_actual is not None:
+        return last_actual
+    return min((reading.previous_reading_value for reading in chain if reading.previous_reading_value is not None),
+               default=estimated_reading.previous_reading_value)
+
+
+def credit_overestimate(tenant, reading, estimated_reading):
+    """Credit the tenant for the kWh the estimates up to `estimated_reading` charged beyond
+    the actual `reading` (saved, with its negative consumption), each at the price it was
+    estimated at, and apply the credit to their open bills. Call it inside the transaction
+    that saves the reading, after checking the reading against true_up_floor(). Returns
+    the TenantPayment."""
+    chain, _ = _estimate_chain(estimated_reading)
+    charged = [
+        (estimate, max(estimate.reading_value - max(reading.reading_value, estimate.previous_reading_value), 0))
+        for estimate in chain
+    ]
+    credit = money.quantize(sum((kwh * estimate.unit_price for estimate, kwh in charged), Decimal('0')))
+    prices = ', '.join(sorted({f"{estimate.unit_price}/kWh" for estimate, kwh in charged if kwh > 0}))
+    tenant_payment = TenantPayment.objects.create(
+        tenant=tenant,
+        amount=credit,
+        payment_date=reading.reading_date,
+        payment_method=TRUE_UP_METHOD,
+        notes=(
+            f"{true_up_description(estimated_reading)}Actual reading on {reading.reading_date}: "
+            f"{reading.reading_value} kWh, {-reading.consumption} kWh over-estimated @ {prices}."
+        ),
+    )
+    if credit > 0:
+        allocate_payments([tenant_payment.pk])
+    return tenant_payment
@@ -0,0 +1,198 @@
+# billing/forecast.py
+# Cash-flow forecast: the income expected in each of the coming months (the first full
+# month onwards), projected from what is known today:
+#   - rent (Room.base_rent) and fixed water/WiFi charges of every active tenant, for the
+#     months their lease covers on the 1st, the way the monthly bill generators bill them;
+#   - electricity at each tenant's average monthly electricity bills of the last six months;
+#   - rooms that are vacant, or become vacant when a lease ends, re-let at the room's base
+#     rent for `occupancy_rate` percent of the time (default: today's occupancy rate);
+#   - collections shifted by each tenant's late-payment rate over the last year (the share
+#     of their bills paid after the due date or still unpaid): that share of a month's
+#     bills is collected in the following month instead. Re-let rooms get the average rate.
+# Scenario parameters scale rent, fixed charges and electricity by a percentage.
+#
+# Every input is read once per property database with a handful of queries; the forecast
+# itself is one computation over (tenant + room) x month matrices in float cents. Results
+# are projections and are only rounded to cents at the end. Results are cached per
+# database and parameter set in the billing cache for BILLING_FORECAST_CACHE_TIMEOUT
+# seconds (an hour by default), so changing scenarios back and forth is instant.
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from . import money
+from .models import Bill, Room, Tenant
+
+DEFAULT_MONTHS = 12
+ELECTRICITY_MONTHS = 6 # History the electricity average is taken over
+LATE_PAYMENT_MONTHS = 12
+CACHE_KEY = 'billing:forecast:{}:{}:{}'
+COMPONENTS = ('rent', 'fixed_charges', 'electricity', 'relet')
+
+
+class ForecastError(Exception):
+    """The forecast can't be computed here."""
+
+
+class Scenario:
+    """Parameters of one forecast. Percentages are Decimals; `occupancy_rate` None means today's rate."""
+
+    def __init__(self, months=DEFAULT_MONTHS, occupancy_rate=None, rent_change=0, fixed_charge_change=0, electricity_change=0):
+        self.months = int(months)
+        self.occupancy_rate = None if occupancy_rate is None else Decimal(occupancy_rate)
+        self.rent_change = Decimal(rent_change)
+        self.fixed_charge_change = Decimal(fixed_charge_change)
+        self.electricity_change = Decimal(electricity_change)
+
+    def key(self):
+        values = [self.months, self.occupancy_rate, self.rent_change, self.fixed_charge_change, self.electricity_change]
+        return hashlib.sha1(json.dumps([str(value) for value in values]).encode()).hexdigest()[:16]
+
+
+def _add_months(date, months):
+    month = date.month - 1 + months
+    return datetime.date(date.year + month // 12, month % 12 + 1, 1)
+
+
+def _ordinals(dates, default):
+    return [(date or default).toordinal() for date in dates]
+
+
+def load_inputs(start):
+    """Everything the forecast of the current database needs, read once: tenants with their
+    lease, rent and charges, rooms, electricity averages and late-payment rates."""
+    tenants = list(
+        Tenant.objects.filter(is_active=True).order_by('pk').values_list(
+            'pk', 'property_id', 'room_id', 'room__base_rent', 'lease_start_date', 'lease_end_date',
+            'fixed_water_charge', 'fixed_wifi_charge',
+        )
+    )
+    rooms = list(Room.objects.order_by('pk').values_list('pk', 'property_id', 'base_rent'))
+
+    electricity_since = _add_months(start, -ELECTRICITY_MONTHS)
+    electricity = dict(
+        Bill.objects.filter(bill_type='Electricity', due_date__gte=electricity_since, due_date__lt=start)
+        .values_list('tenant_id').annotate(total=Sum('amount')).order_by()
+    )
+
+    # Bills due in the last year: how many, and how many were paid after the due date or not at all.
+    late_since = _add_months(start, -LATE_PAYMENT_MONTHS)
+    late_rates = {
+        row['tenant_id']: (row['late'], row['bills'])
+        for row in Bill.objects.filter(due_date__gte=late_since, due_date__lt=timezone.localdate())
+        .values('tenant_id')
+        .annotate(
+            bills=Count('id', distinct=True),
+            late=Count('id', distinct=True, filter=Q(is_paid=False) | Q(payment__payment_date__gt=F('due_date'))),
+        )
+        .order_by()
+    }
+    return {'tenants': tenants, 'rooms': rooms, 'electricity': electricity, 'late_rates': late_rates}
+
+
+def _cents(values):
+    # SQLite returns sums of DecimalFields without their scale; round them to cents first.
+    return [float(money.minor_units(money.quantize(value or 0))) for value in values]
+
+
+def _factor(change):
+    return 1.0 + float(change) / 100
+
+
+def project(inputs, start, scenario):
+    """The forecast of `scenario` from the month `start` on, from load_inputs(start):
+    {'months', 'occupancy_rate', 'late_rate', 'tenants', 'rooms', 'properties': {property_id:
+    {component: [Decimal per month], 'billed': [...], 'expected': [...]}}}."""
+    np = money.np
+    if np is None:
+        raise ForecastError("The forecast needs NumPy; install it with `pip install numpy`.")
+    tenants, rooms = inputs['tenants'], inputs['rooms']
+    # Column 0 is the current month: its late collections fall into the first forecast month.
+    months = [_add_months(start, offset) for offset in range(-1, scenario.months)]
+    firsts = np.array([month.toordinal() for month in months], dtype=np.int64)
+
+    lease_starts = np.array(_ordinals([tenant[4] for tenant in tenants], datetime.date.max), dtype=np.int64)
+    lease_ends = np.array(_ordinals([tenant[5] for tenant in tenants], datetime.date.max), dtype=np.int64)
+    active = (lease_starts[:, None] <= firsts) & (lease_ends[:, None] >= firsts) # tenants x months
+
+    rent = np.array(_cents([tenant[3] if tenant[2] else 0 for tenant in tenants])) * _factor(scenario.rent_change)
+    fixed = (
+        np.array(_cents([tenant[6] for tenant in tenants])) + np.array(_cents([tenant[7] for tenant in tenants]))
+    ) * _factor(scenario.fixed_charge_change)
+    electricity = np.array(_cents([inputs['electricity'].get(tenant[0]) for tenant in tenants])) / ELECTRICITY_MONTHS
+    electricity *= _factor(scenario.electricity_change)
+    components = {
+        'rent': active * rent[:, None],
+        'fixed_charges': active * fixed[:, None],
+        'electricity': active * electricity[:, None],
+    }
+
+    # Rooms without a tenant in a month are re-let for occupancy_rate of the time.
+    room_index = {room[0]: index for index, room in enumerate(rooms)}
+    in_room = np.array([tenant[2] in room_index for tenant in tenants], dtype=bool)
+    occupied = np.zeros((len(rooms), len(months)), dtype=bool)
+    np.logical_or.at(occupied, np.array([room_index[tenant[2]] for tenant in tenants if tenant[2] in room_index], dtype=np.int64), active[in_room])
+    occupancy_rate = scenario.occupancy_rate
+    if occupancy_rate is None:
+        occupancy_rate = Decimal(occupied[:, 0].mean() * 100 if len(rooms) else 0).quantize(Decimal('0.1'))
+    room_rent = np.array(_cents([room[2] for room in rooms])) * _factor(scenario.rent_change)
+    components['relet'] = ~occupied * (room_rent * float(occupancy_rate) / 100)[:, None]
+
+    # Late-payment rates; tenants without history and re-let rooms get the average.
+    late = np.array([inputs['late_rates'].get(tenant[0], (0, 0))[0] for tenant in tenants], dtype=np.float64)
+    counted = np.array([inputs['late_rates'].get(tenant[0], (0, 0))[1] for tenant in tenants], dtype=np.float64)
+    late_rate = float(late.sum() / counted.sum()) if counted.sum() else 0.0
+    rates = np.concatenate([np.where(counted > 0, late / np.maximum(counted, 1), late_rate), np.full(len(rooms), late_rate)])
+
+    # One row per tenant and per room; expected collections lag by the late share.
+    billed = np.vstack([
+        components['rent'] + components['fixed_charges'] + components['electricity'],
+        components['relet'],
+    ]) if len(tenants) + len(rooms) else np.zeros((0, len(months)))
+    expected = billed[:, 1:] * (1 - rates)[:, None] + billed[:, :-1] * rates[:, None]
+
+    owners = np.array([tenant[1] for tenant in tenants] + [room[1] for room in rooms], dtype=np.int64)
+    property_ids, owner_index = np.unique(owners, return_inverse=True)
+    tenant_rows = owner_index[:len(tenants)]
+    room_rows = owner_index[len(tenants):]
+    totals = {}
+    for name, matrix, rows in (
+        ('rent', components['rent'], tenant_rows), ('fixed_charges', components['fixed_charges'], tenant_rows),
+        ('electricity', components['electricity'], tenant_rows), ('relet', components['relet'], room_rows),
+        ('billed', billed, owner_index), ('expected', expected, owner_index),
+    ):
+        summed = np.zeros((len(property_ids), matrix.shape[1]))
+        np.add.at(summed, rows, matrix)
+        totals[name] = np.rint(summed[:, -scenario.months:]).astype(np.int64)
+
+    return {
+        'months': months[1:],
+        'occupancy_rate': occupancy_rate,
+        'late_rate': Decimal(late_rate * 100).quantize(Decimal('0.1')),
+        'tenants': len(tenants),
+        'rooms': len(rooms),
+        'properties': {
+            int(property_id): {name: money.from_minor(totals[name][index]) for name in totals}
+            for index, property_id in enumerate(property_ids)
+        },
+    }
+
+
+def forecast(scenario, start=None, refresh=False):
+    """project() for the current database, from the cache when the same scenario was
+    computed recently (unless `refresh`)."""
+    start = start or _add_months(timezone.localdate(), 1)
+    cache = caches[getattr(settings, 'BILLING_FORECAST_CACHE', 'default')]
+    key = CACHE_KEY.format(router.db_for_read(Bill), start.isoformat(), scenario.key())
+    result = None if refresh else cache.get(key)
+    if result is None:
+        result = project(load_inputs(start), start, scenario)
+        cache.set(key, result, getattr(settings, 'BILLING_FORECAST_CACHE_TIMEOUT', 60 * 60))
+    return result
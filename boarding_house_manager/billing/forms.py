@@ -0,0 +1,87 @@
+# billing/forms.py
+from django import forms
+from .models import BankStatementLine, Bill, BillingJob, Property
+
+
+class EnqueueBillingJobForm(forms.Form):
+    job_type = forms.ChoiceField(choices=BillingJob.JOB_TYPE_CHOICES)
+    month = forms.IntegerField(required=False, min_value=1, max_value=12, help_text="Generators only. Defaults to the current month.")
+    year = forms.IntegerField(required=False, min_value=2000, help_text="Generators only. Defaults to the current year.")
+    due_days = forms.IntegerField(required=False, min_value=1, help_text="Generators only. Leave blank for the command default.")
+    force = forms.BooleanField(required=False, help_text="Generators only. Create bills even if one exists for the period.")
+    upcoming_days = forms.IntegerField(required=False, min_value=0, help_text="Reminders only. Defaults to 3.")
+    dry_run = forms.BooleanField(required=False, help_text="Reminders only. Log reminders without sending emails.")
+    property = forms.ModelChoiceField(
+        queryset=Property.objects.all(), required=False, to_field_name='code',
+        help_text="Only this property. Leave blank for all tenants on the default database."
+    )
+    max_attempts = forms.IntegerField(initial=3, min_value=1, max_value=10)
+
+    def clean_property(self):
+        current_property = self.cleaned_data.get('property')
+        return current_property.code if current_property else None
+
+
+class RoomAvailabilityForm(forms.Form):
+    start_date = forms.DateField(help_text="First day of the stay (YYYY-MM-DD).")
+    end_date = forms.DateField(help_text="Last day of the stay (YYYY-MM-DD).")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date and end_date < start_date:
+            raise forms.ValidationError("The end date must not be before the start date.")
+        return cleaned_data
+
+
+class CashFlowForecastForm(forms.Form):
+    months = forms.IntegerField(initial=12, min_value=1, max_value=36, help_text="Months to project, from next month on.")
+    occupancy_rate = forms.DecimalField(
+        required=False, min_value=0, max_value=100, decimal_places=1,
+        help_text="Percent of the time vacant rooms are let, at their base rent. Blank: today's occupancy rate."
+    )
+    rent_change = forms.DecimalField(initial=0, min_value=-100, max_value=1000, decimal_places=1, help_text="Percent change of all rents.")
+    fixed_charge_change = forms.DecimalField(
+        initial=0, min_value=-100, max_value=1000, decimal_places=1, help_text="Percent change of fixed water and WiFi charges."
+    )
+    electricity_change = forms.DecimalField(
+        initial=0, min_value=-100, max_value=1000, decimal_places=1, help_text="Percent change of electricity charges."
+    )
+
+
+class TenantImportForm(forms.Form):
+    file = forms.FileField(help_text="A .csv or .xlsx file with a header row; see the column list below.")
+    property = forms.ModelChoiceField(queryset=Property.objects.all(), help_text="The property the tenants belong to.")
+    dry_run = forms.BooleanField(required=False, initial=True, help_text="Only show what would change. Untick to import.")
+    create_users = forms.BooleanField(required=False, help_text="Create a login (without a password) for each tenant that has none.")
+    skip_invalid = forms.BooleanField(required=False, help_text="Import the valid rows even if other rows have errors.")
+
+
+class BankStatementUploadForm(forms.Form):
+    file = forms.FileField(help_text="A CSV export with a header row naming the date, amount, payer and memo columns.")
+    property = forms.ModelChoiceField(queryset=Property.objects.all(), help_text="The property whose open bills the payments are for.")
+    dry_run = forms.BooleanField(required=False, initial=True, help_text="Only count the matches. Untick to record the payments.")
+
+
+class BankStatementLineForm(forms.ModelForm):
+    pay_bill = forms.IntegerField(
+        required=False, min_value=1, label="Pay bill ID",
+        help_text="Record this line as a payment of the bill with this ID (e.g. one of the candidates).",
+    )
+
+    class Meta:
+        model = BankStatementLine
+        fields = ('status',)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        bill_id = cleaned_data.get('pay_bill')
+        if bill_id is None:
+            return cleaned_data
+        if self.instance.payment_id:
+            raise forms.ValidationError("This line has already been recorded as a payment.")
+        try:
+            cleaned_data['pay_bill'] = Bill.objects.get(pk=bill_id)
+        except Bill.DoesNotExist:
+            self.add_error('pay_bill', f"There is no bill {bill_id}.")
+        return cleaned_data
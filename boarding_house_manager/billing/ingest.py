@@ -0,0 +1,307 @@
+# billing/ingest.py
+# Meter readings pushed by smart sub-meters (POST /api/meter-readings/, see
+# views.ingest_meter_readings). Requests only validate the readings and add them to an
+# in-memory buffer per process; the buffer is written to ElectricityReading with one
+# bulk_create per database once it holds FLUSH_SIZE readings or its oldest reading has
+# waited FLUSH_INTERVAL seconds. Inserts ignore conflicts with the (tenant, reading_date)
+# unique constraint, so a meter resending a day keeps the reading stored first. A reading
+# for a day that already has an estimated reading (billing.estimates, always on a month's
+# last day) is rejected in the response instead, as it can't be stored or trued up.
+#
+# Readings are stored unbilled; `manage.py bill_meter_readings` turns them into bills.
+#
+# A reading is acknowledged (HTTP 202) before it is written. Readings still buffered
+# when a process dies are lost, so meters should resend recent days; the buffer is
+# also flushed when the process exits normally.
+import asyncio
+import atexit
+import datetime
+import hmac
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, router, transaction
+
+from . import money
+from .models import ElectricityReading, Property, Tenant
+from .sharding import use_shard
+
+FLUSH_SIZE = 2000
+FLUSH_INTERVAL = 1.0 # Seconds
+MAX_READINGS_PER_REQUEST = 10000
+TENANT_REFRESH_SECONDS = 5.0 # Unknown tenant ids reload the tenant list at most this often
+SOURCE_REFRESH_SECONDS = 60.0
+MAX_READING_VALUE = Decimal('99999999.99') # ElectricityReading.reading_value has 10 digits
+
+
+class ReadingError(ValueError):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# --- Authentication -------------------------------------------------------------------
+
+_sources = {} # property code -> (loaded_at, (database alias, property id or None))
+
+
+def _cached_source(code):
+    if not code:
+        return DEFAULT_DB_ALIAS, None
+    cached = _sources.get(code)
+    if cached and time.monotonic() - cached[0] < SOURCE_REFRESH_SECONDS:
+        return cached[1]
+    return None
+
+
+def _load_source(code):
+    try:
+        current_property = Property.objects.get(code=code)
+    except Property.DoesNotExist:
+        raise ReadingError(f"The token's property '{code}' does not exist.")
+    source = (current_property.database, current_property.pk)
+    _sources[code] = (time.monotonic(), source)
+    return source
+
+
+def authenticate(authorization):
+    """Property code (or None for the default database) of the meter token in an
+    'Authorization: Bearer <token>' header, from settings.BILLING_METER_TOKENS.
+    Returns False if the token is missing or unknown."""
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    found = False
+    for known_token, code in _setting('BILLING_METER_TOKENS', {}).items():
+        if hmac.compare_digest(known_token.encode(), token.strip().encode()):
+            found = code or None
+    return found
+
+
+# --- Validation -----------------------------------------------------------------------
+
+_tenants = {} # (database alias, property id) -> (loaded_at, set of tenant ids)
+
+
+def _load_tenants(alias, property_id):
+    with use_shard(alias):
+        tenants = Tenant.objects.all()
+        if property_id is not None:
+            tenants = tenants.filter(property_id=property_id)
+        ids = set(tenants.values_list('pk', flat=True))
+    _tenants[(alias, property_id)] = (time.monotonic(), ids)
+    return ids
+
+
+def _cached_tenants(alias, property_id, tenant_ids):
+    """Tenant ids of the property from the per-process cache, or None when the cache
+    misses one of `tenant_ids` and may be reloaded (at most every TENANT_REFRESH_SECONDS)."""
+    loaded_at, ids = _tenants.get((alias, property_id), (None, set()))
+    if not tenant_ids <= ids and (loaded_at is None or time.monotonic() - loaded_at >= TENANT_REFRESH_SECONDS):
+        return None
+    return ids
+
+
+def _estimated_days(alias, days):
+    """The (tenant_id, reading_date) pairs of `days` that have an estimated reading."""
+    with use_shard(alias):
+        estimated = ElectricityReading.objects.filter(
+            is_estimate=True, tenant_id__in={tenant_id for tenant_id, day in days}, reading_date__in={day for tenant_id, day in days},
+        ).values_list('tenant_id', 'reading_date')
+        return set(estimated) & days
+
+
+def _decimal(value, name):
+    if isinstance(value, bool) or not isinstance(value, (str, int, Decimal)):
+        raise ReadingError(f"'{name}' must be a number.")
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        raise ReadingError(f"'{name}' must be a number.")
+    if not value.is_finite() or value < 0:
+        raise ReadingError(f"'{name}' must be a non-negative number.")
+    return value
+
+
+def parse_reading(item, default_unit_price):
+    """(tenant_id, reading_date, reading_value, unit_price) of one pushed reading, e.g.
+    {"tenant_id": 12, "reading_date": "2024-05-31", "reading_value": 1834.25}. Values
+    are rounded half up to the model's decimal places. Raises ReadingError."""
+    if not isinstance(item, dict):
+        raise ReadingError("Each reading must be an object.")
+    tenant_id = item.get('tenant_id')
+    if isinstance(tenant_id, bool) or not isinstance(tenant_id, int):
+        raise ReadingError("'tenant_id' must be an integer.")
+    try:
+        reading_date = datetime.date.fromisoformat(item.get('reading_date') or '')
+    except (TypeError, ValueError):
+        raise ReadingError("'reading_date' must be a date (YYYY-MM-DD).")
+    reading_value = money.quantize(_decimal(item.get('reading_value'), 'reading_value'))
+    if reading_value > MAX_READING_VALUE:
+        raise ReadingError("'reading_value' is too large.")
+    unit_price = item.get('unit_price', default_unit_price)
+    if unit_price is None:
+        raise ReadingError("'unit_price' is required (settings.BILLING_METER_UNIT_PRICE is not set).")
+    unit_price = money.quantize(_decimal(unit_price, 'unit_price'), places=3)
+    if unit_price >= 1000:
+        raise ReadingError("'unit_price' is too large.")
+    return tenant_id, reading_date, reading_value, unit_price
+
+
+# --- Buffer ---------------------------------------------------------------------------
+
+class ReadingBuffer:
+    """Readings waiting to be written, per database alias. add() and take() may be called
+    from any thread or event loop; writes are serialised by write()."""
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = defaultdict(list)
+        self._count = 0
+        self._oldest = None
+        self._timer = None
+
+    def add(self, alias, readings):
+        """Buffer `readings` (unsaved ElectricityReading instances) for `alias`. Returns
+        True when the buffer should be flushed now."""
+        with self._lock:
+            self._pending[alias].extend(readings)
+            self._count += len(readings)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            return self._due()
+
+    def _due(self):
+        return self._count >= self.flush_size or (
+            self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def take(self):
+        """Remove and return everything buffered, as {alias: [readings]}."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._count, self._oldest = 0, None
+        return pending
+
+    def write(self, pending):
+        """Insert taken readings (the database skips (tenant, reading_date) pairs it already
+        has) and return how many were submitted. Blocks; use aflush() from async code."""
+        with self._write_lock: # One writer at a time, so SQLite databases aren't locked against each other
+            return sum(self._write_alias(alias, readings) for alias, readings in pending.items() if readings)
+
+    def _write_alias(self, alias, readings):
+        with use_shard(alias):
+            using = router.db_for_write(ElectricityReading)
+            try:
+                with transaction.atomic(using=using):
+                    ElectricityReading.objects.bulk_create(readings, batch_size=500, ignore_conflicts=True)
+            except IntegrityError:
+                # A tenant was deleted after its readings were accepted; drop those and retry.
+                valid = set(Tenant.objects.filter(pk__in={r.tenant_id for r in readings}).values_list('pk', flat=True))
+                with transaction.atomic(using=using):
+                    ElectricityReading.objects.bulk_create(
+                        [r for r in readings if r.tenant_id in valid], batch_size=500, ignore_conflicts=True
+                    )
+        return len(readings)
+
+    def flush(self):
+        return self.write(self.take())
+
+    async def aflush(self):
+        pending = self.take()
+        if not pending:
+            return 0
+        return await sync_to_async(self.write, thread_sensitive=False)(pending)
+
+    def ensure_timer(self):
+        """Start the task flushing the buffer every flush_interval on the running event loop
+        (under ASGI one loop serves all requests). Requests also flush a buffer that is due,
+        so readings are written even where the loop ends with the request (WSGI)."""
+        loop = asyncio.get_running_loop()
+        if self._timer is None or self._timer.done() or self._timer.get_loop() is not loop:
+            self._timer = loop.create_task(self._run_timer())
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            with self._lock:
+                due = self._due()
+            if due:
+                await self.aflush()
+
+
+reading_buffer = ReadingBuffer(
+    flush_size=_setting('BILLING_METER_FLUSH_SIZE', FLUSH_SIZE),
+    flush_interval=_setting('BILLING_METER_FLUSH_INTERVAL', FLUSH_INTERVAL),
+)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        reading_buffer.flush()
+    except Exception: # The process is going away; nothing else can be done with them
+        pass
+
+
+def parse_readings(items):
+    """Validate pushed readings. Returns ([(index, (tenant_id, reading_date, reading_value,
+    unit_price))], [{'index', 'error'}])."""
+    default_unit_price = _setting('BILLING_METER_UNIT_PRICE', None)
+    parsed, rejected = [], []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, parse_reading(item, default_unit_price)))
+        except ReadingError as e:
+            rejected.append({'index': index, 'error': str(e)})
+    return parsed, rejected
+
+
+async def accept_readings(items, code):
+    """Validate `items` pushed with a token for property `code` and buffer the valid ones.
+    Returns (number accepted, [{'index', 'error'}] for the rejected ones)."""
+    source = _cached_source(code) or await sync_to_async(_load_source)(code)
+    alias, property_id = source
+    parsed, rejected = parse_readings(items)
+    tenant_ids = {values[0] for _, values in parsed}
+    tenants = _cached_tenants(alias, property_id, tenant_ids)
+    if tenants is None:
+        tenants = await sync_to_async(_load_tenants)(alias, property_id)
+
+    known = []
+    for index, values in parsed:
+        if values[0] not in tenants:
+            rejected.append({'index': index, 'error': f"Unknown tenant {values[0]}."})
+        else:
+            known.append((index, values))
+    # Estimates are only ever dated on the last day of a month; only those days need a query.
+    month_ends = {(values[0], values[1]) for _, values in known if (values[1] + datetime.timedelta(days=1)).day == 1}
+    estimated = await sync_to_async(_estimated_days)(alias, month_ends) if month_ends else set()
+
+    readings = []
+    for index, (tenant_id, reading_date, reading_value, unit_price) in known:
+        if (tenant_id, reading_date) in estimated:
+            rejected.append({
+                'index': index,
+                'error': f"Tenant {tenant_id} has an estimated reading billed for {reading_date}; send the reading for another day.",
+            })
+            continue
+        readings.append(ElectricityReading(
+            tenant_id=tenant_id, reading_date=reading_date, reading_value=reading_value,
+            unit_price=unit_price, is_billed=False, notes='Pushed by meter',
+        ))
+    rejected.sort(key=lambda row: row['index'])
+
+    if readings and reading_buffer.add(alias, readings):
+        await reading_buffer.aflush() # The request that fills the buffer waits for the write
+    reading_buffer.ensure_timer()
+    return len(readings), rejected
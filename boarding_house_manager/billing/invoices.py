@@ -0,0 +1,138 @@
+# billing/invoices.py
+# Data loading and rendering helpers for the `render_invoices` command. Rendering
+# happens in worker processes, so everything handed to them is plain, picklable data.
+import hashlib
+import json
+import os
+from decimal import Decimal
+
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+from .models import Bill
+from .pdf import render_text_pdf
+
+TEMPLATES = {
+    'html': 'billing/invoice/invoice.html',
+    'pdf': 'billing/invoice/invoice.txt', # PDFs are laid out from the plain-text template
+}
+
+CENTS = Decimal('0.01')
+
+_worker_template = None
+
+
+def load_invoice_payloads(year, month, tenant_ids=None):
+    """All bills due in the month with their tenant and room, grouped per tenant, in one query."""
+    bills = (
+        Bill.objects.filter(due_date__year=year, due_date__month=month)
+        .select_related('tenant', 'tenant__room')
+        .annotate(amount_paid=Coalesce(
+            Sum('payment__amount_paid'), Value(Decimal('0.00')), output_field=DecimalField(max_digits=10, decimal_places=2)
+        ))
+        .order_by('tenant_id', 'due_date', 'id')
+    )
+    if tenant_ids:
+        bills = bills.filter(tenant_id__in=tenant_ids)
+
+    payloads = {}
+    for bill in bills:
+        amount_paid = bill.amount_paid.quantize(CENTS) # SQLite returns a bare 0 for the COALESCE default
+        tenant = bill.tenant
+        payload = payloads.get(tenant.id)
+        if payload is None:
+            payload = payloads[tenant.id] = {
+                'tenant': {
+                    'id': tenant.id,
+                    'full_name': tenant.full_name,
+                    'email': tenant.email,
+                    'phone_number': tenant.phone_number,
+                    'room_number': tenant.room.room_number if tenant.room else '',
+                },
+                'year': year,
+                'month': month,
+                'bills': [],
+                'total_amount': Decimal('0.00'),
+                'total_paid': Decimal('0.00'),
+            }
+        payload['bills'].append({
+            'id': bill.id,
+            'bill_type': bill.bill_type,
+            'description': bill.description,
+            'amount': bill.amount,
+            'amount_paid': amount_paid,
+            'due_date': bill.due_date,
+            'is_paid': bill.is_paid,
+        })
+        payload['total_amount'] += bill.amount
+        payload['total_paid'] += amount_paid
+
+    for payload in payloads.values():
+        payload['balance_due'] = payload['total_amount'] - payload['total_paid']
+    return list(payloads.values())
+
+
+def referenced_templates(template):
+    """Names of the templates `template` extends or includes by a literal name. Names that
+    come from a variable are only known at render time and are not returned."""
+    names = []
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        expression = node.parent_name if isinstance(node, ExtendsNode) else node.template
+        if isinstance(expression.var, str) and not expression.filters:
+            names.append(expression.var)
+    return names
+
+
+def template_fingerprint(fmt):
+    """Hash of the invoice template and of every template it extends or includes, so that
+    editing a base template or a partial re-renders the invoices too."""
+    digest = hashlib.sha256()
+    pending, seen = [TEMPLATES[fmt]], set()
+    while pending:
+        name = pending.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        template = get_template(name).template
+        digest.update(f"{name}\0{template.source}\0".encode('utf-8'))
+        pending.extend(referenced_templates(template))
+    return digest.hexdigest()
+
+
+def payload_hash(payload, fmt, fingerprint):
+    """Hash of everything that determines the rendered document, used to skip unchanged invoices."""
+    document = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(f"{fmt}:{fingerprint}:{document}".encode('utf-8')).hexdigest()
+
+
+def invoice_filename(payload, fmt):
+    return f"invoice-{payload['year']}{payload['month']:02d}-tenant{payload['tenant']['id']}.{fmt}"
+
+
+def init_render_worker(fmt):
+    """Process pool initializer: set Django up (spawned workers) and compile the template once."""
+    global _worker_template
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    _worker_template = get_template(TEMPLATES[fmt])
+
+
+def render_invoice(task):
+    """Render one invoice and write it atomically. `task` is (payload, path, fmt)."""
+    payload, path, fmt = task
+    content = _worker_template.render({'invoice': payload})
+    if fmt == 'pdf':
+        title = f"Invoice {payload['year']}-{payload['month']:02d} {payload['tenant']['full_name']}"
+        data = render_text_pdf(content, title=title)
+    else:
+        data = content.encode('utf-8')
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path, len(data)
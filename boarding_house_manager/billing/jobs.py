@@ -0,0 +1,188 @@
+# billing/jobs.py
+# A small database-backed job queue so that long-running billing commands can be
+# triggered from the admin and executed by the `billing_worker` command instead of
+# inside an HTTP request. No external broker is needed: the BillingJob table is the queue.
+import io
+import threading
+import time
+import traceback
+
+from django.core.management import call_command
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BillingJob
+
+# Options each job type accepts; anything else is dropped before the command is called.
+JOB_OPTIONS = {
+    'generate_rent_bills': ('month', 'year', 'due_days', 'force', 'property'),
+    'generate_fixed_water_bills': ('month', 'year', 'due_days', 'force', 'property'),
+    'generate_fixed_wifi_bills': ('month', 'year', 'due_days', 'force', 'property'),
+    'send_billing_reminders': ('upcoming_days', 'test_email', 'dry_run', 'property'),
+}
+
+RETRY_BACKOFF_SECONDS = 30
+CLAIM_CANDIDATES = 10
+# How often a running job reports that its worker is alive, output or not. Keep it well
+# below billing_worker's --stale_after.
+HEARTBEAT_SECONDS = 30
+
+
+def enqueue(job_type, options=None, run_after=None, max_attempts=3):
+    if job_type not in JOB_OPTIONS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    allowed = JOB_OPTIONS[job_type]
+    cleaned_options = {
+        key: value for key, value in (options or {}).items()
+        if key in allowed and value not in (None, '')
+    }
+    return BillingJob.objects.create(
+        job_type=job_type,
+        options=cleaned_options,
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claim_next_job(worker_id):
+    """Atomically mark the next due job as running for `worker_id` and return it (or None)."""
+    now = timezone.now()
+    due_jobs = BillingJob.objects.filter(
+        status=BillingJob.STATUS_QUEUED, run_after__lte=now
+    ).order_by('run_after', 'id')
+    connection = connections[due_jobs.db]
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=due_jobs.db):
+            job = due_jobs.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = BillingJob.STATUS_RUNNING
+            job.worker_id = worker_id
+            job.attempts += 1
+            job.started_at = job.heartbeat_at = now
+            job.finished_at = None
+            job.save(update_fields=['status', 'worker_id', 'attempts', 'started_at', 'heartbeat_at', 'finished_at'])
+            return job
+
+    # Backends without SKIP LOCKED (SQLite): claim with a conditional UPDATE so
+    # that only one worker can flip a given job from queued to running.
+    for job_id in due_jobs.values_list('id', flat=True)[:CLAIM_CANDIDATES]:
+        claimed = BillingJob.objects.filter(pk=job_id, status=BillingJob.STATUS_QUEUED).update(
+            status=BillingJob.STATUS_RUNNING,
+            worker_id=worker_id,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+            finished_at=None,
+        )
+        if claimed:
+            return BillingJob.objects.get(pk=job_id)
+    return None
+
+
+def owned_by_worker(job):
+    """The job's row while it is still running for the worker that claimed it; empty once it
+    was requeued as stale (and perhaps claimed again) in the meantime."""
+    return BillingJob.objects.filter(pk=job.pk, worker_id=job.worker_id, status=BillingJob.STATUS_RUNNING)
+
+
+def requeue_stale_jobs(stale_after_seconds):
+    """Put back jobs whose worker stopped reporting (e.g. the process was killed)."""
+    cutoff = timezone.now() - timezone.timedelta(seconds=stale_after_seconds)
+    return BillingJob.objects.filter(
+        status=BillingJob.STATUS_RUNNING, heartbeat_at__lt=cutoff
+    ).update(status=BillingJob.STATUS_QUEUED, worker_id='', run_after=timezone.now())
+
+
+class JobOutput:
+    """File-like object handed to the command as stdout/stderr; it periodically
+    saves what was written so far so that progress is visible in the admin."""
+
+    def __init__(self, job, flush_interval=1.0):
+        self.job = job
+        self.flush_interval = flush_interval
+        self._buffer = io.StringIO()
+        self._last_flush = 0.0
+
+    def write(self, text):
+        self._buffer.write(text)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        value = self._buffer.getvalue()
+        lines = [line for line in value.splitlines() if line.strip()]
+        owned_by_worker(self.job).update(
+            output=value,
+            progress=lines[-1][:255] if lines else '',
+            heartbeat_at=timezone.now(),
+        )
+        self._last_flush = time.monotonic()
+
+    def isatty(self):
+        return False
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+
+def beat_until(job, stop_event):
+    """Bump the job's heartbeat_at every HEARTBEAT_SECONDS until `stop_event` is set. Runs on
+    its own thread, so a command that is busy without writing output is not requeued."""
+    try:
+        while not stop_event.wait(HEARTBEAT_SECONDS):
+            try:
+                owned_by_worker(job).update(heartbeat_at=timezone.now())
+            except DatabaseError:
+                pass # E.g. SQLite is locked by the command's transaction; the next beat retries.
+    finally:
+        connections.close_all() # This thread's connection
+
+
+def finish_job(job, **fields):
+    """Record the outcome of a run, unless the job was taken from this worker meanwhile.
+    Returns whether it was recorded."""
+    if not owned_by_worker(job).update(**fields):
+        job.progress = "Requeued while running; the result of this run was dropped."
+        return False
+    for field, value in fields.items():
+        setattr(job, field, value)
+    return True
+
+
+def run_job(job):
+    output = JobOutput(job)
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=beat_until, args=(job, stop_heartbeat), name=f'billing-job-{job.pk}-heartbeat', daemon=True
+    )
+    heartbeat.start()
+    try:
+        try:
+            call_command(job.job_type, stdout=output, stderr=output, **job.options)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+    except Exception as e:
+        output.flush()
+        finished_at = timezone.now()
+        if job.attempts < job.max_attempts:
+            backoff = RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+            outcome = {
+                'status': BillingJob.STATUS_QUEUED,
+                'run_after': finished_at + timezone.timedelta(seconds=backoff),
+                'progress': f"Attempt {job.attempts} failed ({e}); retrying in {backoff}s."[:255],
+            }
+        else:
+            outcome = {
+                'status': BillingJob.STATUS_FAILED,
+                'progress': f"Failed after {job.attempts} attempt(s): {e}"[:255],
+            }
+        finish_job(job, last_error=traceback.format_exc(), finished_at=finished_at, **outcome)
+        return False
+
+    output.flush()
+    return finish_job(job, status=BillingJob.STATUS_SUCCEEDED, finished_at=timezone.now())
@@ -0,0 +1,163 @@
+# billing/journal.py
+# Append-only change journal for Bill and Payment.
+#
+# Single saves and deletes are captured by the signal handlers below; bulk writes are
+# captured by JournaledQuerySet. Inside `journal_batch()` entries are buffered and
+# inserted with one bulk_create when the block exits, which is how the admin records a
+# whole list_editable submission as one batch.
+import contextlib
+import contextvars
+import uuid
+
+from django.db.models import Model
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Bill, JournalEntry, Payment
+
+JOURNALED_MODELS = {Bill: 'bill', Payment: 'payment'}
+
+_current_batch = contextvars.ContextVar('billing_journal_batch', default=None)
+
+
+class _Batch:
+    def __init__(self, changed_by=''):
+        self.id = uuid.uuid4()
+        self.changed_by = changed_by
+        self.entries = []
+
+
+@contextlib.contextmanager
+def journal_batch(user=None):
+    """Buffer journal entries written in this block and insert them together on exit.
+    Nested blocks join the outer batch. If the block raises, its entries are dropped."""
+    if _current_batch.get() is not None:
+        yield _current_batch.get()
+        return
+    batch = _Batch(changed_by=user.get_username() if user is not None and user.is_authenticated else '')
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+        if batch.entries:
+            JournalEntry.objects.bulk_create(batch.entries, batch_size=500)
+    finally:
+        _current_batch.reset(token)
+
+
+def _write(entries):
+    batch = _current_batch.get()
+    if batch is not None:
+        for entry in entries:
+            entry.batch_id = batch.id
+            entry.changed_by = batch.changed_by
+        batch.entries.extend(entries)
+    elif len(entries) == 1:
+        entries[0].save()
+    elif entries:
+        batch_id = uuid.uuid4()
+        for entry in entries:
+            entry.batch_id = batch_id
+        JournalEntry.objects.bulk_create(entries, batch_size=500)
+
+
+def _values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def _entry(model, object_id, action, changes, recorded_at=None):
+    return JournalEntry(
+        model_name=JOURNALED_MODELS[model],
+        object_id=object_id,
+        action=action,
+        changes=changes,
+        recorded_at=recorded_at or timezone.now(),
+    )
+
+
+def record_bulk_create(model, objs):
+    now = timezone.now()
+    _write([_entry(model, obj.pk, 'create', _values(obj, model.journal_fields), now) for obj in objs if obj.pk])
+
+
+def record_bulk_update(model, ids, values):
+    """Journal a QuerySet.update()/bulk_update() as one batch. Plain values are recorded
+    as given; fields set from expressions (bulk_update's CASE, F()) are read back."""
+    attnames = {}
+    for name in values:
+        field = model._meta.get_field(name)
+        if field.attname in model.journal_fields:
+            attnames[name] = field.attname
+    if not attnames:
+        return
+
+    expression_fields = [name for name in attnames if isinstance(values[name], Combinable)]
+    plain_changes = {
+        attnames[name]: (values[name].pk if isinstance(values[name], Model) else values[name])
+        for name in attnames if name not in expression_fields
+    }
+    read_back = {}
+    if expression_fields:
+        read_fields = [attnames[name] for name in expression_fields]
+        for row in model._base_manager.filter(pk__in=ids).values('pk', *read_fields):
+            read_back[row.pop('pk')] = row
+
+    now = timezone.now()
+    _write([_entry(model, object_id, 'update', {**plain_changes, **read_back.get(object_id, {})}, now) for object_id in ids])
+
+
+def record_archive(model, ids):
+    """Archiving removes rows with raw deletes (no signals); note it explicitly. A later
+    restore re-inserts the rows with bulk_create and is journaled as a create."""
+    now = timezone.now()
+    _write([_entry(model, object_id, 'archive', {}, now) for object_id in ids])
+
+
+@receiver(post_save, sender=Bill)
+@receiver(post_save, sender=Payment)
+def journal_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw: # Fixture loading
+        return
+    current = _values(instance, sender.journal_fields)
+    loaded = getattr(instance, '_loaded_values', None)
+    if created or loaded is None:
+        # No snapshot to diff against: record every tracked field.
+        changes = current
+    else:
+        changes = {field: value for field, value in current.items() if field not in loaded or loaded[field] != value}
+        if not changes:
+            return
+    _write([_entry(sender, instance.pk, 'create' if created else 'update', changes)])
+    instance._loaded_values = {**(loaded or {}), **current}
+
+
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=Payment)
+def journal_deleted(sender, instance, **kwargs):
+    _write([_entry(sender, instance.pk, 'delete', {})])
+
+
+def bill_history(bill_id, as_of=None):
+    """State of a bill as of `as_of` (default: now), rebuilt from its journal entries.
+
+    Returns a dict of the journaled fields as stored in JSON (amounts and dates as
+    strings), plus 'archived': True when the bill had been moved to the archive, or
+    None if it did not exist at that time. Only the bill's own entries are read, via
+    the (model_name, object_id, recorded_at) index.
+    """
+    entries = JournalEntry.objects.filter(model_name='bill', object_id=bill_id)
+    if as_of is not None:
+        entries = entries.filter(recorded_at__lte=as_of)
+
+    state = None
+    for action, changes in entries.order_by('recorded_at', 'id').values_list('action', 'changes'):
+        if action == 'delete':
+            state = None
+        elif action == 'create':
+            state = dict(changes)
+        elif action == 'archive' and state is not None:
+            state['archived'] = True
+        elif state is not None:
+            state.update(changes)
+    return state
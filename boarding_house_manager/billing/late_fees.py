@@ -0,0 +1,153 @@
+# billing/late_fees.py
+# Late fee accrual. The fee owed on an overdue bill is a pure function of the bill
+# and the accrual date, so each run only charges the difference between that and
+# the fees already billed: running it twice on the same day adds nothing.
+#
+# accrue_late_fees() computes the fees of all overdue bills at once in integer cents
+# (billing.money); LateFeeRule.fee_for() is the same formula on one Decimal amount.
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import money
+from .models import ArchivedBill, Bill, Tenant
+from .outbox import record_bill_events
+
+ZERO = Decimal('0.00')
+CENTS = Decimal('0.01')
+LATE_FEE_BILL_TYPE = 'Late Fee'
+
+
+class LateFeeRule:
+    """Fee for a bill `days_late` days past due:
+    nothing within `grace_days`, then `flat_fee` plus `daily_rate` x bill amount
+    for every day past the grace period, never more than `cap` (if set)."""
+
+    def __init__(self, grace_days=0, flat_fee='0', daily_rate='0', cap=None):
+        self.grace_days = int(grace_days)
+        self.flat_fee = Decimal(str(flat_fee))
+        self.daily_rate = Decimal(str(daily_rate))
+        self.cap = Decimal(str(cap)) if cap not in (None, '') else None
+
+    def fee_for(self, amount, days_late):
+        if days_late <= self.grace_days:
+            return ZERO
+        fee = self.flat_fee + amount * self.daily_rate * (days_late - self.grace_days)
+        if self.cap is not None:
+            fee = min(fee, self.cap)
+        return fee.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+    def fees_for(self, amounts, days_late):
+        """fee_for() over arrays: `amounts` in cents and `days_late` as integers; returns
+        the fees in cents. The formula is evaluated exactly in units of 10**-places, fine
+        enough for every term, and rounded to cents once at the end."""
+        np = money.np
+        if np is None:
+            return [money.minor_units(self.fee_for(money.from_minor_units(amount), days))
+                    for amount, days in zip(amounts, days_late)]
+        rate, rate_places = money.rate_parts(self.daily_rate)
+        places = max(
+            money.CENT_PLACES + rate_places,
+            -self.flat_fee.as_tuple().exponent,
+            -self.cap.as_tuple().exponent if self.cap is not None else 0,
+        )
+        extra_days = np.maximum(np.asarray(days_late, dtype=np.int64) - self.grace_days, 0)
+        # cents x days x rate numerator is in units of 10**-(2 + rate_places); bring it to `places`.
+        fees = money.prorate(amounts, extra_days, 1)
+        fees = money.scale(fees, rate * 10 ** (places - money.CENT_PLACES - rate_places), places=0)
+        fees = np.where(extra_days > 0, fees + money.minor_units(self.flat_fee, places), 0)
+        if self.cap is not None:
+            fees = np.minimum(fees, money.minor_units(self.cap, places))
+        return money.round_div(fees, 10 ** (places - money.CENT_PLACES), ROUND_HALF_UP)
+
+
+def load_rules(raw_rules=None):
+    """Build {bill_type: LateFeeRule} from settings.BILLING_LATE_FEE_RULES. The 'default'
+    key applies to bill types without their own rule."""
+    if raw_rules is None:
+        raw_rules = getattr(settings, 'BILLING_LATE_FEE_RULES', {})
+    return {bill_type: LateFeeRule(**options) for bill_type, options in raw_rules.items()}
+
+
+def accrue_late_fees(as_of, rules=None, due_days=7, dry_run=False, batch_size=1000):
+    """Charge the late fees owed as of `as_of` on every overdue, unpaid bill.
+
+    One aggregate query reads every overdue bill with the fees already charged on it,
+    the fees are computed in bulk in integer cents, and new fee bills are written with
+    bulk_create, together with their bill.created events. Returns the list of fee bills
+    (unsaved when `dry_run`).
+    """
+    if rules is None:
+        rules = load_rules()
+    if not rules:
+        return []
+    default_rule = rules.get('default')
+    min_grace = min(rule.grace_days for rule in rules.values())
+    fee_due_date = as_of + datetime.timedelta(days=due_days)
+
+    # Fees moved to the archive (e.g. before their bill was restored) were charged too.
+    archived_fees = (
+        ArchivedBill.objects.filter(parent_bill_id=OuterRef('pk')).order_by()
+        .values('parent_bill_id').annotate(total=Sum('amount')).values('total')
+    )
+    with transaction.atomic(using=router.db_for_write(Bill)):
+        overdue = (
+            Bill.objects.filter(is_paid=False, due_date__lt=as_of - datetime.timedelta(days=min_grace))
+            .exclude(bill_type=LATE_FEE_BILL_TYPE)
+            .annotate(
+                fees_charged=Coalesce(
+                    Sum('late_fees__amount'), Value(ZERO), output_field=DecimalField(max_digits=10, decimal_places=2)
+                ),
+                fees_archived=Coalesce(
+                    Subquery(archived_fees), Value(ZERO), output_field=DecimalField(max_digits=10, decimal_places=2)
+                ),
+            )
+            .values_list('id', 'tenant_id', 'bill_type', 'amount', 'due_date', 'fees_charged', 'fees_archived')
+        )
+
+        rows = [row for row in overdue.iterator(chunk_size=5000) if rules.get(row[2], default_rule) is not None]
+
+        # Fees are computed per bill type, in cents, one array operation per type.
+        new_fees = [0] * len(rows)
+        rows_by_type = {}
+        for index, row in enumerate(rows):
+            rows_by_type.setdefault(row[2], []).append(index)
+        for bill_type, indices in rows_by_type.items():
+            rule = rules.get(bill_type, default_rule)
+            owed = rule.fees_for(
+                money.to_minor([rows[i][3] for i in indices]),
+                [(as_of - rows[i][4]).days for i in indices],
+            )
+            charged = money.to_minor([rows[i][5] + rows[i][6] for i in indices])
+            for index, owed_fee, charged_fee in zip(indices, owed, charged):
+                new_fees[index] = int(owed_fee) - int(charged_fee)
+
+        fee_bills = []
+        for (bill_id, tenant_id, bill_type, amount, due_date, fees_charged, fees_archived), new_fee in zip(rows, new_fees):
+            if new_fee <= 0:
+                continue
+            days_late = (as_of - due_date).days
+            fee_bills.append(Bill(
+                tenant_id=tenant_id,
+                bill_type=LATE_FEE_BILL_TYPE,
+                amount=money.from_minor_units(new_fee),
+                due_date=fee_due_date,
+                description=(
+                    f"Late fee on bill #{bill_id} ({bill_type}, due {due_date}): "
+                    f"{days_late} day(s) overdue as of {as_of}."
+                ),
+                is_paid=False,
+                parent_bill_id=bill_id,
+            ))
+
+        if not dry_run:
+            Bill.objects.bulk_create(fee_bills, batch_size=batch_size)
+            tenants = Tenant.objects.in_bulk({bill.tenant_id for bill in fee_bills})
+            for bill in fee_bills:
+                bill.tenant = tenants[bill.tenant_id]
+            record_bill_events('bill.created', fee_bills)
+    return fee_bills
@@ -0,0 +1,242 @@
+# billing/ledger.py
+# The tenant ledger: one LedgerEntry per bill (a debit), per payment made directly on a
+# bill and per lump-sum TenantPayment (credits), plus adjustments entered by hand.
+# Payments allocated from a lump sum have no entry of their own; the lump sum was
+# credited when it was received. Entries are written by the signal handlers below and,
+# for bulk writes, by JournaledQuerySet; they are upserted on (source, source_id), so
+# restoring archived bills rewrites the same entries. Archiving removes bills with raw
+# deletes and leaves their entries in place, so the ledger keeps the full history.
+#
+# Balances are computed by the database: running balances with a window function
+# (SUM(debit - credit) OVER (ORDER BY entry_date, id)) in the query that reads the
+# entries, and balances as of a date with one grouped SUM.
+import datetime
+from decimal import Decimal
+
+from django.db import router
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Bill, LedgerEntry, Payment, TenantPayment
+
+ZERO = Decimal('0.00')
+CENTS = Decimal('0.01')
+CHUNK_SIZE = 500
+PAGE_SIZE = 50
+UPDATE_FIELDS = ['tenant', 'entry_date', 'kind', 'debit', 'credit', 'description']
+# Fields of each source model that its entry is built from; other updates (e.g. is_paid) skip the ledger.
+LEDGER_FIELDS = {
+    Bill: {'tenant', 'tenant_id', 'bill_type', 'amount', 'due_date', 'date_created'},
+    Payment: {'tenant', 'tenant_id', 'bill', 'bill_id', 'amount_paid', 'payment_date', 'payment_method',
+              'tenant_payment', 'tenant_payment_id'},
+    TenantPayment: {'tenant', 'tenant_id', 'amount', 'payment_date', 'payment_method'},
+}
+AMOUNT = ExpressionWrapper(F('debit') - F('credit'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _sides(amount, debit):
+    """(debit, credit) for an amount on the given side; negative amounts go to the other side."""
+    if (amount >= 0) == debit:
+        return abs(amount), ZERO
+    return ZERO, abs(amount)
+
+
+def _bill_entry(bill):
+    debit, credit = _sides(bill.amount, debit=True)
+    return LedgerEntry(
+        tenant_id=bill.tenant_id, entry_date=timezone.localdate(bill.date_created),
+        kind=LedgerEntry.KIND_FEE if bill.bill_type == 'Late Fee' else LedgerEntry.KIND_CHARGE,
+        debit=debit, credit=credit, description=f"{bill.bill_type} bill #{bill.pk}, due {bill.due_date}",
+        source=LedgerEntry.SOURCE_BILL, source_id=bill.pk,
+    )
+
+
+def _payment_entry(payment):
+    if payment.tenant_payment_id:
+        return None # Allocated from a lump sum, which has its own entry
+    debit, credit = _sides(payment.amount_paid, debit=False)
+    method = f" ({payment.payment_method})" if payment.payment_method else ''
+    return LedgerEntry(
+        tenant_id=payment.tenant_id, entry_date=payment.payment_date, kind=LedgerEntry.KIND_PAYMENT,
+        debit=debit, credit=credit, description=f"Payment on bill #{payment.bill_id}{method}"[:255],
+        source=LedgerEntry.SOURCE_PAYMENT, source_id=payment.pk,
+    )
+
+
+def _tenant_payment_entry(tenant_payment):
+    debit, credit = _sides(tenant_payment.amount, debit=False)
+    method = f" ({tenant_payment.payment_method})" if tenant_payment.payment_method else ''
+    return LedgerEntry(
+        tenant_id=tenant_payment.tenant_id, entry_date=tenant_payment.payment_date, kind=LedgerEntry.KIND_CREDIT,
+        debit=debit, credit=credit, description=f"Payment received{method}"[:255],
+        source=LedgerEntry.SOURCE_TENANT_PAYMENT, source_id=tenant_payment.pk,
+    )
+
+
+SOURCES = {
+    Bill: (LedgerEntry.SOURCE_BILL, _bill_entry),
+    Payment: (LedgerEntry.SOURCE_PAYMENT, _payment_entry),
+    TenantPayment: (LedgerEntry.SOURCE_TENANT_PAYMENT, _tenant_payment_entry),
+}
+
+
+# --- Keeping the ledger in step -------------------------------------------------------
+
+def post(model, objs, using=None, created=False):
+    """Create or update the entries of saved Bill, Payment or TenantPayment objects.
+    Objects that no longer have an entry (a payment now allocated from a lump sum) lose
+    it, unless they were just `created` and can't have had one."""
+    source, build = SOURCES[model]
+    using = using or router.db_for_write(LedgerEntry)
+    entries, without_entry = [], []
+    for obj in objs:
+        entry = build(obj)
+        if entry is None:
+            without_entry.append(obj.pk)
+        else:
+            entries.append(entry)
+    LedgerEntry.objects.using(using).bulk_create(
+        entries, batch_size=CHUNK_SIZE, update_conflicts=True, unique_fields=['source', 'source_id'], update_fields=UPDATE_FIELDS,
+    )
+    if not created:
+        remove(model, without_entry, using)
+
+
+def sync(model, ids, using=None):
+    """Bring the entries of the objects with these ids in line with the database."""
+    using = using or router.db_for_write(LedgerEntry)
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        objs = list(model._base_manager.using(using).filter(pk__in=chunk))
+        post(model, objs, using)
+        remove(model, set(chunk) - {obj.pk for obj in objs}, using)
+
+
+def remove(model, ids, using=None):
+    using = using or router.db_for_write(LedgerEntry)
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        LedgerEntry.objects.using(using).filter(source=SOURCES[model][0], source_id__in=ids[start:start + CHUNK_SIZE]).delete()
+
+
+@receiver(post_save, sender=Bill)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=TenantPayment)
+def ledger_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw: # Fixture loading
+        return
+    if update_fields is not None and not LEDGER_FIELDS[sender] & set(update_fields):
+        return # e.g. Bill.is_paid, TenantPayment.unallocated_amount
+    post(sender, [instance], using=router.db_for_write(sender, instance=instance), created=created)
+
+
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=TenantPayment)
+def ledger_deleted(sender, instance, **kwargs):
+    remove(sender, [instance.pk], using=router.db_for_write(sender, instance=instance))
+
+
+# --- Balances -------------------------------------------------------------------------
+
+def running_balance(descending=False):
+    """Window expression: the tenant's balance after each entry, in (entry_date, id) order
+    (descending: the sum from each entry to the newest one)."""
+    order = [F('entry_date').desc(), F('id').desc()] if descending else [F('entry_date').asc(), F('id').asc()]
+    return Window(Sum(AMOUNT), partition_by=[F('tenant_id')], order_by=order)
+
+
+def statement(tenant_ids, start=None, end=None):
+    """Entries of the tenants between two dates (inclusive), oldest first, each annotated
+    with `balance`, the tenant's balance after it. One query; an opening balance for
+    `start` is added to every row by the database."""
+    entries = LedgerEntry.objects.filter(tenant_id__in=tenant_ids)
+    if end is not None:
+        entries = entries.filter(entry_date__lte=end)
+    if start is None:
+        return entries.annotate(balance=running_balance()).order_by('tenant_id', 'entry_date', 'id')
+    opening = _total(LedgerEntry.objects.filter(tenant_id=OuterRef('tenant_id'), entry_date__lt=start))
+    return (
+        entries.filter(entry_date__gte=start)
+        .annotate(balance=ExpressionWrapper(opening + running_balance(), output_field=AMOUNT.output_field))
+        .order_by('tenant_id', 'entry_date', 'id')
+    )
+
+
+def balances_as_of(as_of, tenant_ids=None):
+    """{tenant_id: balance} after every entry dated on or before `as_of`, in one grouped query.
+    Tenants without entries by then are left out."""
+    entries = LedgerEntry.objects.filter(entry_date__lte=as_of)
+    if tenant_ids is not None:
+        entries = entries.filter(tenant_id__in=tenant_ids)
+    rows = entries.values('tenant_id').annotate(balance=Sum(AMOUNT)).order_by()
+    # SQLite returns sums of DecimalFields without their scale; keep cents.
+    return {row['tenant_id']: Decimal(row['balance']).quantize(CENTS) for row in rows}
+
+
+def _total(entries):
+    """Subquery expression: debit - credit summed over `entries` (0 if there are none)."""
+    total = entries.order_by().values('tenant_id').annotate(total=Sum(AMOUNT)).values('total')
+    return Coalesce(Subquery(total, output_field=AMOUNT.output_field), Value(ZERO), output_field=AMOUNT.output_field)
+
+
+def _key_filter(cursor, before):
+    entry_date, entry_id = cursor
+    if before:
+        return Q(entry_date__lt=entry_date) | Q(entry_date=entry_date, id__lt=entry_id)
+    return Q(entry_date__gt=entry_date) | Q(entry_date=entry_date, id__gt=entry_id)
+
+
+def parse_cursor(value):
+    """(entry_date, id) of a cursor string 'YYYY-MM-DD.id', or None if it is invalid."""
+    date_text, _, id_text = (value or '').partition('.')
+    try:
+        return datetime.date.fromisoformat(date_text), int(id_text)
+    except ValueError:
+        return None
+
+
+def format_cursor(entry):
+    return f"{entry.entry_date.isoformat()}.{entry.pk}"
+
+
+def ledger_page(tenant_id, before=None, after=None, size=PAGE_SIZE):
+    """One page of a tenant's entries, newest first, each with its running `balance`.
+
+    Pages are found by keyset: `before` gives the entries older than a cursor (the last
+    row of the page being left), `after` those newer than one; both are (entry_date, id)
+    tuples. Returns (entries, has_older, has_newer). One query per page however deep it
+    is: the balance is the database's sum of everything on the far side of the cursor
+    plus a window sum over the page's side.
+    """
+    entries = LedgerEntry.objects.filter(tenant_id=tenant_id)
+    if after is None:
+        # Balance after an entry = (sum of all entries older than the cursor)
+        #   - (window sum from that entry up to the cursor) + the entry itself.
+        side = entries.filter(_key_filter(before, before=True)) if before else entries
+        rows = list(
+            side.annotate(balance=ExpressionWrapper(
+                _total(side.filter(tenant_id=OuterRef('tenant_id'))) - running_balance(descending=True) + AMOUNT,
+                output_field=AMOUNT.output_field,
+            )).order_by('-entry_date', '-id')[:size + 1]
+        )
+        has_older, has_newer = len(rows) > size, before is not None
+        rows = rows[:size]
+    else:
+        # Balance after an entry = (sum of all entries up to the cursor) + (window sum up to the entry).
+        side = entries.filter(_key_filter(after, before=False))
+        rows = list(
+            side.annotate(balance=ExpressionWrapper(
+                _total(entries.filter(~_key_filter(after, before=False), tenant_id=OuterRef('tenant_id'))) + running_balance(),
+                output_field=AMOUNT.output_field,
+            )).order_by('entry_date', 'id')[:size + 1]
+        )
+        has_older, has_newer = True, len(rows) > size
+        rows = rows[:size][::-1]
+    for row in rows:
+        row.balance = Decimal(row.balance).quantize(CENTS)
+    return rows, has_older, has_newer
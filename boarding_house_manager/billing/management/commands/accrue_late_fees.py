@@ -0,0 +1,61 @@
+# billing/management/commands/accrue_late_fees.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.late_fees import accrue_late_fees, load_rules
+from decimal import Decimal
+import time
+
+class Command(BaseCommand):
+    help = 'Charges late fees on overdue bills according to settings.BILLING_LATE_FEE_RULES. Safe to run more than once a day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', type=str, help='Accrue fees as of this date (YYYY-MM-DD). Defaults to today.'
+        )
+        parser.add_argument(
+            '--due_days', type=int, default=7, help='Number of days after the accrual date that fee bills are due.'
+        )
+        parser.add_argument(
+            '--batch_size', type=int, default=1000, help='Number of fee bills inserted per query.'
+        )
+        parser.add_argument(
+            '--dry_run', action='store_true', help='Show what would be charged without creating any bills.'
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                as_of = timezone.datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Date format for --date should be YYYY-MM-DD. You provided: {options['date']}")
+        else:
+            as_of = timezone.now().date()
+
+        rules = load_rules()
+        if not rules:
+            self.stdout.write(self.style.NOTICE("No late fee rules configured (settings.BILLING_LATE_FEE_RULES)."))
+            return
+
+        started = time.monotonic()
+        fee_bills = accrue_late_fees(
+            as_of, rules, due_days=options['due_days'], dry_run=options['dry_run'], batch_size=options['batch_size']
+        )
+        elapsed = time.monotonic() - started
+        total = sum((bill.amount for bill in fee_bills), Decimal('0.00'))
+
+        if options['dry_run']:
+            for bill in fee_bills[:50]:
+                self.stdout.write(f"  (Dry run) Tenant ID {bill.tenant_id}: {bill.amount} - {bill.description}")
+            if len(fee_bills) > 50:
+                self.stdout.write(f"  ... and {len(fee_bills) - 50} more.")
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: would create {len(fee_bills)} late fee bill(s) totalling {total} as of {as_of}."
+            ))
+            return
+
+        if fee_bills:
+            self.stdout.write(self.style.SUCCESS(
+                f"Created {len(fee_bills)} late fee bill(s) totalling {total} as of {as_of} in {elapsed:.2f}s."
+            ))
+        else:
+            self.stdout.write(self.style.NOTICE(f"No new late fees due as of {as_of}."))
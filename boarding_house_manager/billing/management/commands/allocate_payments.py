@@ -0,0 +1,63 @@
+# billing/management/commands/allocate_payments.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.allocation import allocate_month, allocate_payments
+from billing.models import Bill, TenantPayment
+import calendar
+
+class Command(BaseCommand):
+    help = "Allocates tenant lump-sum payments to their open bills (oldest first or by bill type priority)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month', type=int, help='Allocate payments received in this month (1-12). Defaults to the current month.'
+        )
+        parser.add_argument(
+            '--year', type=int, help='The year (YYYY) of --month. Defaults to the current year.'
+        )
+        parser.add_argument(
+            '--all', action='store_true', help='Allocate every payment that still has unallocated credit, regardless of date.'
+        )
+        parser.add_argument(
+            '--payment', type=int, action='append', dest='payment_ids', help='Allocate only this tenant payment ID (repeatable).'
+        )
+        parser.add_argument(
+            '--priority', type=str,
+            help='Comma-separated bill types to pay first, e.g. "Rent,Electricity". Defaults to settings.BILLING_ALLOCATION_PRIORITY (oldest first).'
+        )
+
+    def handle(self, *args, **options):
+        priority = None
+        if options['priority']:
+            priority = [bill_type.strip() for bill_type in options['priority'].split(',') if bill_type.strip()]
+            valid_types = {choice for choice, _ in Bill.BILL_TYPE_CHOICES}
+            unknown = set(priority) - valid_types
+            if unknown:
+                raise CommandError(f"Unknown bill type(s) in --priority: {', '.join(sorted(unknown))}")
+
+        if options['payment_ids']:
+            result = allocate_payments(options['payment_ids'], priority)
+            scope = f"{len(options['payment_ids'])} selected payment(s)"
+        elif options['all']:
+            ids = TenantPayment.objects.filter(unallocated_amount__gt=0).values_list('id', flat=True)
+            result = allocate_payments(list(ids), priority)
+            scope = "all payments with unallocated credit"
+        else:
+            now = timezone.now()
+            month = options['month'] if options['month'] else now.month
+            year = options['year'] if options['year'] else now.year
+            if not (1 <= month <= 12):
+                raise CommandError("Month must be between 1 and 12.")
+            result = allocate_month(year, month, priority)
+            scope = f"payments received in {calendar.month_name[month]} {year}"
+
+        if result['payments'] == 0:
+            self.stdout.write(self.style.NOTICE(f"Nothing to allocate for {scope}."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Allocated {result['amount_allocated']} from {result['payments']} payment(s) for {scope}: "
+            f"{result['allocations']} bill payment(s) recorded, {result['bills_paid']} bill(s) fully paid."
+        ))
+        if result['credit_remaining'] > 0:
+            self.stdout.write(self.style.WARNING(f"{result['credit_remaining']} remains as tenant credit."))
@@ -0,0 +1,82 @@
+# billing/management/commands/archive_settled_bills.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing.archive import archivable_bills, archive_settled_bills, restore_archived_bills
+from billing.models import ArchivedBill
+import datetime
+
+class Command(BaseCommand):
+    help = (
+        'Moves fully paid bills (and their payments) older than --older_than days into the archive tables, '
+        'or moves archived bills back with --restore.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older_than', type=int, default=365,
+            help='Archive paid bills whose due date is more than this many days ago.'
+        )
+        parser.add_argument(
+            '--chunk_size', type=int, default=1000, help='Number of bills moved per transaction.'
+        )
+        parser.add_argument(
+            '--dry_run', action='store_true', help='Only report how many bills would be archived or restored.'
+        )
+        parser.add_argument(
+            '--restore', action='store_true', help='Restore archived bills instead of archiving. Requires --tenant, --bill or --due_after.'
+        )
+        parser.add_argument(
+            '--tenant', type=int, action='append', dest='tenant_ids', help='Restore: only bills of this tenant ID (repeatable).'
+        )
+        parser.add_argument(
+            '--bill', type=int, action='append', dest='bill_ids', help='Restore: only this bill ID (repeatable).'
+        )
+        parser.add_argument(
+            '--due_after', type=str, help='Restore: only bills due on or after this date (YYYY-MM-DD).'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk_size must be at least 1.")
+        if options['restore']:
+            return self._restore(options)
+
+        if options['older_than'] < 0:
+            raise CommandError("--older_than cannot be negative.")
+        cutoff = timezone.now().date() - datetime.timedelta(days=options['older_than'])
+
+        if options['dry_run']:
+            count = archivable_bills(cutoff).count()
+            self.stdout.write(self.style.WARNING(f"Dry run: {count} paid bill(s) due before {cutoff} would be archived."))
+            return
+
+        def report(bills, payments):
+            self.stdout.write(f"  Archived {bills} bill(s), {payments} payment(s) so far...")
+
+        bills, payments = archive_settled_bills(cutoff, chunk_size=options['chunk_size'], progress=report)
+        if bills:
+            self.stdout.write(self.style.SUCCESS(f"Archived {bills} bill(s) and {payments} payment(s) due before {cutoff}."))
+        else:
+            self.stdout.write(self.style.NOTICE(f"No paid bills due before {cutoff} to archive."))
+
+    def _restore(self, options):
+        archived = ArchivedBill.objects.all()
+        if not (options['tenant_ids'] or options['bill_ids'] or options['due_after']):
+            raise CommandError("--restore needs at least one of --tenant, --bill or --due_after.")
+        if options['tenant_ids']:
+            archived = archived.filter(tenant_id__in=options['tenant_ids'])
+        if options['bill_ids']:
+            archived = archived.filter(pk__in=options['bill_ids'])
+        if options['due_after']:
+            try:
+                due_after = datetime.datetime.strptime(options['due_after'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"Date format for --due_after should be YYYY-MM-DD. You provided: {options['due_after']}")
+            archived = archived.filter(due_date__gte=due_after)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {archived.count()} archived bill(s) would be restored."))
+            return
+
+        bills, payments = restore_archived_bills(archived, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Restored {bills} bill(s) and {payments} payment(s) from the archive."))
@@ -0,0 +1,47 @@
+# billing/management/commands/bill_history.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from billing.journal import bill_history
+from billing.models import JournalEntry
+import datetime
+
+class Command(BaseCommand):
+    help = "Shows a bill's state as of a point in time, rebuilt from the change journal, and its change timeline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('bill_id', type=int, help='The ID of the bill.')
+        parser.add_argument(
+            '--as_of', type=str,
+            help='Date (YYYY-MM-DD, end of day) or ISO datetime to rebuild the bill at. Defaults to now.'
+        )
+
+    def handle(self, *args, **options):
+        bill_id = options['bill_id']
+        as_of = timezone.now()
+        if options['as_of']:
+            as_of = parse_datetime(options['as_of'])
+            if as_of is None:
+                day = parse_date(options['as_of'])
+                if day is None:
+                    raise CommandError(f"Could not parse --as_of: {options['as_of']}")
+                as_of = datetime.datetime.combine(day, datetime.time.max)
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+
+        entries = JournalEntry.objects.filter(model_name='bill', object_id=bill_id, recorded_at__lte=as_of)
+        if not entries.exists():
+            raise CommandError(f"No journal entries for bill #{bill_id} up to {as_of}.")
+
+        self.stdout.write(f"Timeline for bill #{bill_id}:")
+        for entry in entries.order_by('recorded_at', 'id'):
+            by = f" by {entry.changed_by}" if entry.changed_by else ""
+            self.stdout.write(f"  {entry.recorded_at:%Y-%m-%d %H:%M:%S} {entry.action}{by}: {entry.changes}")
+
+        state = bill_history(bill_id, as_of)
+        if state is None:
+            self.stdout.write(self.style.WARNING(f"Bill #{bill_id} did not exist as of {as_of}."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"State as of {as_of}:"))
+        for field, value in state.items():
+            self.stdout.write(f"  {field}: {value}")
@@ -0,0 +1,124 @@
+# billing/management/commands/bill_meter_readings.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from django.utils import timezone
+from billing.models import Tenant, Bill, ElectricityReading
+from billing import estimates, money
+from billing.outbox import record_bill_event
+from billing.sharding import add_property_argument, use_property
+from decimal import Decimal
+import datetime
+
+class Command(BaseCommand):
+    help = (
+        'Creates electricity bills from unbilled meter readings, such as those pushed by smart meters to '
+        '/api/meter-readings/. Each tenant is billed once, for their latest unbilled reading up to --through_date, '
+        'against their last billed reading; the readings in between are marked as covered by that bill.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--through_date', type=str, help='Bill readings up to this date (YYYY-MM-DD). Defaults to today.'
+        )
+        parser.add_argument(
+            '--due_days', type=int, default=15, help='Days after the reading date the bill is due.'
+        )
+        parser.add_argument('--dry_run', action='store_true', help='Show the bills without creating them.')
+        add_property_argument(parser)
+
+    def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.bill(current_property, options)
+
+    def bill(self, current_property, options):
+        if options['through_date']:
+            try:
+                through_date = datetime.date.fromisoformat(options['through_date'])
+            except ValueError:
+                raise CommandError(f"Date format for --through_date should be YYYY-MM-DD. You provided: {options['through_date']}")
+        else:
+            through_date = timezone.localdate()
+
+        unbilled = ElectricityReading.objects.filter(is_billed=False, reading_date__lte=through_date)
+        if current_property:
+            unbilled = unbilled.filter(tenant__property=current_property)
+        tenants = Tenant.objects.filter(pk__in=unbilled.values('tenant_id')).order_by('pk')
+
+        billed_count = 0
+        for tenant in tenants:
+            if self.bill_tenant(tenant, unbilled.filter(tenant=tenant), options):
+                billed_count += 1
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {billed_count} electricity bill(s) from meter readings up to {through_date}."))
+
+    def bill_tenant(self, tenant, unbilled, options):
+        last_billed_reading = ElectricityReading.objects.filter(
+            tenant=tenant, is_billed=True
+        ).order_by('-reading_date', '-created_at').first()
+        if last_billed_reading:
+            unbilled = unbilled.filter(reading_date__gt=last_billed_reading.reading_date)
+        reading = unbilled.order_by('-reading_date', '-created_at').first()
+        if reading is None:
+            return False # Only readings older than the last bill are left
+
+        previous_value = last_billed_reading.reading_value if last_billed_reading else Decimal('0.00')
+        consumption = reading.reading_value - previous_value
+        true_up = last_billed_reading is not None and last_billed_reading.is_estimate
+        if consumption < 0 and not true_up:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {tenant.full_name} (Tenant ID: {tenant.pk}): reading {reading.reading_value} on {reading.reading_date} "
+                f"is below the last billed reading {previous_value}. Check the meter."
+            ))
+            return False
+        if consumption < 0:
+            floor = estimates.true_up_floor(last_billed_reading)
+            if floor is not None and reading.reading_value < floor:
+                self.stdout.write(self.style.WARNING(
+                    f"Skipped {tenant.full_name} (Tenant ID: {tenant.pk}): reading {reading.reading_value} on {reading.reading_date} "
+                    f"is below the last actual reading {floor} the estimate of {last_billed_reading.reading_date} was based on. "
+                    f"Check the meter."
+                ))
+                return False
+        bill_amount = money.quantize(consumption * reading.unit_price) # Rounded half up to cents
+        if options['dry_run']:
+            outcome = f"credit for {-consumption} kWh (over-estimated)" if consumption < 0 else bill_amount
+            self.stdout.write(f"{tenant.full_name} (Tenant ID: {tenant.pk}): {consumption} kWh through {reading.reading_date}, {outcome}")
+            return True
+
+        # The reading, the bill and its outbox event are saved together or not at all.
+        with transaction.atomic(using=router.db_for_write(Bill)):
+            claimed = ElectricityReading.objects.filter(pk=reading.pk, is_billed=False).update(
+                previous_reading_value=last_billed_reading.reading_value if last_billed_reading else None,
+                consumption=consumption,
+                is_billed=True,
+            )
+            if not claimed:
+                return False # Billed by a concurrent run
+            unbilled.filter(reading_date__lte=reading.reading_date).update(is_billed=True) # Covered by this bill
+            if consumption < 0:
+                # Below an estimated reading, the estimate was too high: the difference is credited.
+                reading.refresh_from_db()
+                credit = estimates.credit_overestimate(tenant, reading, last_billed_reading)
+                self.stdout.write(
+                    f"Credited {tenant.full_name} (Tenant ID: {tenant.pk}) {credit.amount} for the estimated reading "
+                    f"of {last_billed_reading.reading_date}: Tenant payment ID {credit.pk}"
+                )
+                return True
+            bill = Bill.objects.create(
+                tenant=tenant,
+                bill_type='Electricity',
+                amount=bill_amount,
+                due_date=reading.reading_date + datetime.timedelta(days=options['due_days']),
+                description=(
+                    (estimates.true_up_description(last_billed_reading) if true_up else '') +
+                    f"Electricity charge for period ending {reading.reading_date}. "
+                    f"Current reading: {reading.reading_value} kWh, "
+                    f"Previous reading: {last_billed_reading.reading_value if last_billed_reading else 'N/A'} kWh. "
+                    f"Consumption: {consumption} kWh @ {reading.unit_price}/kWh."
+                ),
+                is_paid=False,
+            )
+            record_bill_event('bill.created', bill)
+        self.stdout.write(f"Billed {tenant.full_name} (Tenant ID: {tenant.pk}): Bill ID {bill.pk}, Amount {bill.amount}")
+        return True
@@ -0,0 +1,75 @@
+# billing/management/commands/bill_room_meters.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing import room_meters
+from billing.models import Room, Tenant
+from billing.sharding import add_property_argument, use_property
+import datetime
+
+class Command(BaseCommand):
+    help = (
+        "Splits the consumption on each room's shared electricity meter between the room's tenants and bills "
+        "their shares. Each room is billed once, for its latest unbilled reading up to --through_date, against its "
+        "last billed reading, following the room's meter split (equal, occupancy days or fixed shares)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--through_date', type=str, help='Bill readings up to this date (YYYY-MM-DD). Defaults to today.'
+        )
+        parser.add_argument(
+            '--due_days', type=int, default=room_meters.DEFAULT_DUE_DAYS, help='Days after the reading date the bills are due.'
+        )
+        parser.add_argument('--dry_run', action='store_true', help='Show the splits without creating bills.')
+        add_property_argument(parser)
+
+    def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.bill(current_property, options)
+
+    def bill(self, current_property, options):
+        if options['through_date']:
+            try:
+                through_date = datetime.date.fromisoformat(options['through_date'])
+            except ValueError:
+                raise CommandError(f"Date format for --through_date should be YYYY-MM-DD. You provided: {options['through_date']}")
+        else:
+            through_date = timezone.localdate()
+
+        rooms = Room.objects.filter(property=current_property) if current_property else Room.objects.all()
+        splits, rejected = room_meters.bill_room_readings(
+            through_date, rooms, due_days=options['due_days'], dry_run=options['dry_run']
+        )
+
+        names = dict(Tenant.objects.filter(
+            pk__in={allocation.tenant_id for split in splits for allocation in split.allocations}
+        ).values_list('pk', 'full_name'))
+        bill_count = 0
+        for split in splits:
+            label = f"Room {split.room.room_number} (Room ID: {split.room.pk})"
+            if split.previous_date is None:
+                self.stdout.write(f"{label}: first reading {split.reading.reading_value} kWh on {split.reading.reading_date} opens the meter.")
+                continue
+            if not split.allocations:
+                self.stdout.write(self.style.WARNING(
+                    f"{label}: {split.consumption} kWh from {split.period_start} to {split.reading.reading_date} "
+                    f"with no tenant in the room; not charged."
+                ))
+                continue
+            self.stdout.write(f"{label}: {split.consumption} kWh from {split.period_start} to {split.reading.reading_date}, {split.amount}")
+            for allocation in split.allocations:
+                bill_id = f", Bill ID {allocation.bill.pk}" if allocation.bill and allocation.bill.pk else ''
+                bill_count += allocation.bill is not None
+                self.stdout.write(
+                    f"  - {names.get(allocation.tenant_id)} (Tenant ID: {allocation.tenant_id}): "
+                    f"{allocation.consumption} kWh, Amount {allocation.amount}{bill_id}"
+                )
+        for split, reason in rejected:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped room {split.room.room_number} (Room ID: {split.room.pk}): {reason}. Check the meter."
+            ))
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {bill_count} electricity bill(s) from {len(splits)} room meter reading(s) up to {through_date}."
+        ))
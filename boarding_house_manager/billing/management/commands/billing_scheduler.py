@@ -0,0 +1,156 @@
+# billing/management/commands/billing_scheduler.py
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from billing.scheduling import CronSchedule, SchedulerStatus
+import os
+import signal
+import time
+import traceback
+
+class Command(BaseCommand):
+    help = (
+        'Runs the billing commands listed in settings.BILLING_SCHEDULE from one long-lived process, '
+        'so each run reuses the already loaded Django setup, templates and database connection.'
+    )
+
+    # Sleep in short slices so the status file heartbeat stays fresh and signals are handled quickly.
+    MAX_SLEEP_SECONDS = 30
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status_file', type=str,
+            help='Path of the JSON health/status file. Defaults to settings.BILLING_SCHEDULER_STATUS_FILE.'
+        )
+        parser.add_argument(
+            '--no_catch_up', action='store_true', help='Do not run entries whose scheduled time was missed while the scheduler was down.'
+        )
+        parser.add_argument(
+            '--once', action='store_true', help='Run missed and currently due entries, then exit.'
+        )
+        parser.add_argument(
+            '--list', action='store_true', help='Print the schedule with the next run times and exit.'
+        )
+
+    def handle(self, *args, **options):
+        entries = self._load_schedule()
+        status_path = options['status_file'] or getattr(
+            settings, 'BILLING_SCHEDULER_STATUS_FILE', settings.BASE_DIR / 'billing_scheduler_status.json'
+        )
+        status = SchedulerStatus(str(status_path))
+        now = timezone.localtime()
+
+        if options['list']:
+            for entry in entries:
+                self.stdout.write(
+                    f"{entry['name']:<24} {entry['schedule']:<16} {entry['command']:<28} next: {entry['cron'].next_after(now)}"
+                )
+            return
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        status.data['scheduler'] = {'pid': os.getpid(), 'started_at': now.isoformat(), 'heartbeat_at': now.isoformat()}
+        next_runs = {}
+        for entry in entries:
+            last_run_at = status.last_run_at(entry['name'])
+            missed_slot = entry['cron'].previous_before(now)
+            if (not options['no_catch_up'] and entry['catch_up'] and last_run_at
+                    and missed_slot and missed_slot > last_run_at):
+                # Several missed slots are coalesced into one catch-up run.
+                self.stdout.write(self.style.WARNING(f"Catching up missed run of '{entry['name']}' scheduled for {missed_slot}."))
+                next_runs[entry['name']] = missed_slot
+            elif last_run_at is None and missed_slot and missed_slot >= now.replace(second=0, microsecond=0):
+                next_runs[entry['name']] = missed_slot
+            else:
+                next_runs[entry['name']] = entry['cron'].next_after(now)
+            status.entry(entry['name']).update(
+                command=entry['command'], schedule=entry['schedule'], next_run_at=next_runs[entry['name']].isoformat()
+            )
+            if last_run_at is None:
+                # First time this entry is seen: remember "now" so that downtime from here on is caught up.
+                status.entry(entry['name'])['last_run_at'] = now.isoformat()
+        status.save()
+
+        self.stdout.write(self.style.SUCCESS(f"Billing scheduler started with {len(entries)} entr{'y' if len(entries) == 1 else 'ies'}."))
+        while not self._stopping:
+            now = timezone.localtime()
+            due = [entry for entry in entries if next_runs[entry['name']] <= now]
+            for entry in due:
+                if self._stopping:
+                    break
+                slot = next_runs[entry['name']]
+                self._run_entry(entry, slot, status)
+                next_runs[entry['name']] = entry['cron'].next_after(max(slot, timezone.localtime()))
+                status.entry(entry['name'])['next_run_at'] = next_runs[entry['name']].isoformat()
+                status.save()
+
+            if options['once']:
+                break
+
+            status.data['scheduler']['heartbeat_at'] = timezone.localtime().isoformat()
+            status.save()
+            seconds_until_next = (min(next_runs.values()) - timezone.localtime()).total_seconds()
+            self._sleep(min(max(seconds_until_next, 0), self.MAX_SLEEP_SECONDS))
+
+        status.data['scheduler']['stopped_at'] = timezone.localtime().isoformat()
+        status.save()
+        self.stdout.write(self.style.SUCCESS("Billing scheduler stopped."))
+
+    def _load_schedule(self):
+        raw_entries = getattr(settings, 'BILLING_SCHEDULE', [])
+        if not raw_entries:
+            raise CommandError("settings.BILLING_SCHEDULE is empty; nothing to schedule.")
+        entries = []
+        for raw in raw_entries:
+            try:
+                cron = CronSchedule(raw['schedule'])
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Invalid BILLING_SCHEDULE entry {raw!r}: {e}")
+            entries.append({
+                'name': raw.get('name', raw['command']),
+                'command': raw['command'],
+                'schedule': raw['schedule'],
+                'options': raw.get('options', {}),
+                'catch_up': raw.get('catch_up', True),
+                'cron': cron,
+            })
+        names = [entry['name'] for entry in entries]
+        if len(names) != len(set(names)):
+            raise CommandError("BILLING_SCHEDULE entry names must be unique.")
+        return entries
+
+    def _run_entry(self, entry, slot, status):
+        # Keep the open connection between runs unless the server dropped it.
+        for connection in connections.all(initialized_only=True):
+            if connection.connection is not None and not connection.is_usable():
+                connection.close()
+
+        record = status.entry(entry['name'])
+        started_at = timezone.localtime()
+        started = time.monotonic()
+        record['last_started_at'] = started_at.isoformat()
+        self.stdout.write(f"[{started_at:%Y-%m-%d %H:%M}] Running '{entry['name']}' ({entry['command']}) for slot {slot}")
+        try:
+            call_command(entry['command'], stdout=self.stdout, stderr=self.stderr, **entry['options'])
+        except Exception as e:
+            record['last_status'] = 'failed'
+            record['last_error'] = traceback.format_exc()
+            self.stderr.write(self.style.ERROR(f"'{entry['name']}' failed: {e}"))
+        else:
+            record['last_status'] = 'succeeded'
+            record['last_error'] = ''
+        record['last_run_at'] = slot.isoformat()
+        record['last_finished_at'] = timezone.localtime().isoformat()
+        record['last_duration_seconds'] = round(time.monotonic() - started, 3)
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _sleep(self, seconds):
+        deadline = time.monotonic() + seconds
+        while not self._stopping and time.monotonic() < deadline:
+            time.sleep(min(1.0, deadline - time.monotonic()))
@@ -0,0 +1,80 @@
+# billing/management/commands/billing_worker.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from concurrent.futures import ThreadPoolExecutor
+from billing.jobs import HEARTBEAT_SECONDS, claim_next_job, requeue_stale_jobs, run_job
+import os
+import socket
+import threading
+
+class Command(BaseCommand):
+    help = 'Runs queued billing jobs (bill generation, reminders) using a pool of worker threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=2, help='Number of jobs to run concurrently.'
+        )
+        parser.add_argument(
+            '--poll_interval', type=float, default=2.0, help='Seconds to wait before checking an empty queue again.'
+        )
+        parser.add_argument(
+            '--stale_after', type=int, default=600,
+            help=f'Requeue running jobs whose worker has not sent a heartbeat (every {HEARTBEAT_SECONDS}s) for this many seconds.'
+        )
+        parser.add_argument(
+            '--once', action='store_true', help='Exit once the queue is empty instead of waiting for new jobs.'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        run_once = options['once']
+
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options['stale_after'] <= HEARTBEAT_SECONDS:
+            raise CommandError(f"--stale_after must be longer than the {HEARTBEAT_SECONDS}s job heartbeat.")
+
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)."))
+
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        stop_event = threading.Event()
+
+        self.stdout.write(self.style.SUCCESS(f"Starting billing worker {worker_prefix} with {workers} thread(s)."))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='billing-worker') as executor:
+            futures = [
+                executor.submit(self._work_loop, f"{worker_prefix}:{index}", poll_interval, run_once, stop_event)
+                for index in range(workers)
+            ]
+            try:
+                processed = sum(future.result() for future in futures)
+            except KeyboardInterrupt:
+                stop_event.set()
+                self.stdout.write(self.style.WARNING("Stopping after the running jobs finish..."))
+                processed = sum(future.result() for future in futures)
+
+        self.stdout.write(self.style.SUCCESS(f"Billing worker stopped. Processed {processed} job(s)."))
+
+    def _work_loop(self, worker_id, poll_interval, run_once, stop_event):
+        processed = 0
+        try:
+            while not stop_event.is_set():
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if run_once:
+                        break
+                    stop_event.wait(poll_interval)
+                    continue
+
+                self.stdout.write(f"[{worker_id}] Running {job} (attempt {job.attempts}/{job.max_attempts})")
+                if run_job(job):
+                    self.stdout.write(self.style.SUCCESS(f"[{worker_id}] Job #{job.pk} succeeded."))
+                else:
+                    self.stderr.write(self.style.ERROR(f"[{worker_id}] Job #{job.pk} failed: {job.progress}"))
+                processed += 1
+        finally:
+            # Each thread has its own DB connection; close it when the thread is done.
+            connections.close_all()
+        return processed
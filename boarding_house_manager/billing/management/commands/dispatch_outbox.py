@@ -0,0 +1,73 @@
+# billing/management/commands/dispatch_outbox.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from billing.outbox import destinations, dispatch_batch, purge_delivered
+from billing.sharding import shard_aliases, use_shard
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Delivers queued bill and payment events from the outbox to the destinations in '
+        'settings.BILLING_OUTBOX_DESTINATIONS, in batches, retrying failed batches with backoff. '
+        'Run a single dispatcher so that each tenant\'s events arrive in order.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size', type=int, default=100, help='Maximum number of events sent in one request.'
+        )
+        parser.add_argument(
+            '--poll_interval', type=float, default=2.0, help='Seconds to wait when no event is due.'
+        )
+        parser.add_argument(
+            '--purge_after_days', type=int, default=7,
+            help='Delete delivered events older than this many days (0 keeps them).'
+        )
+        parser.add_argument(
+            '--once', action='store_true', help='Exit once no event is due instead of waiting for new ones.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch_size must be at least 1.")
+        configured = destinations()
+        if not configured:
+            raise CommandError("No destinations configured in settings.BILLING_OUTBOX_DESTINATIONS.")
+
+        self.stdout.write(self.style.SUCCESS(f"Dispatching outbox events to: {', '.join(configured)}."))
+        totals = {'sent': 0, 'failed': 0}
+        try:
+            while True:
+                sent = self._dispatch_all(configured, batch_size, options['purge_after_days'], totals)
+                if sent:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Stopping."))
+        finally:
+            connections.close_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox dispatcher stopped. Sent {totals['sent']} event(s); {totals['failed']} failed attempt(s) will be retried."
+        ))
+
+    def _dispatch_all(self, configured, batch_size, purge_after_days, totals):
+        """One pass over every property database and destination. Returns the number of events sent."""
+        sent_this_pass = 0
+        for alias in shard_aliases():
+            with use_shard(alias):
+                for name, config in configured.items():
+                    sent, failed = dispatch_batch(name, config, batch_size)
+                    if sent:
+                        self.stdout.write(f"[{alias}] {name}: sent {sent} event(s).")
+                    if failed:
+                        self.stderr.write(self.style.ERROR(f"[{alias}] {name}: delivery of {failed} event(s) failed; will retry."))
+                    sent_this_pass += sent
+                    totals['sent'] += sent
+                    totals['failed'] += failed
+                if purge_after_days and not sent_this_pass:
+                    purge_delivered(purge_after_days)
+        return sent_this_pass
@@ -0,0 +1,93 @@
+# billing/management/commands/estimate_electricity_readings.py
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from billing import estimates
+from billing.models import Tenant
+from billing.sharding import add_property_argument, use_property
+from decimal import Decimal, InvalidOperation
+import calendar
+import datetime
+
+class Command(BaseCommand):
+    help = (
+        "Estimates and bills the electricity readings missing for a month: every active tenant with a meter "
+        "but no reading dated in the month gets an estimated reading on its last day, from their average "
+        "daily use. The next actual reading is billed against the estimate, which trues it up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month', type=int, help='The month (1-12) to fill in. Defaults to the previous month.'
+        )
+        parser.add_argument(
+            '--year', type=int, help='The year (YYYY) of the month. Defaults to the year of the previous month.'
+        )
+        parser.add_argument(
+            '--unit_price', type=str,
+            help="Price per kWh for the estimates. Defaults to the price of each tenant's latest reading."
+        )
+        parser.add_argument(
+            '--lookback_days', type=int, default=estimates.DEFAULT_LOOKBACK_DAYS,
+            help='Days of actual readings the average daily use is taken from.'
+        )
+        parser.add_argument(
+            '--due_days', type=int, default=estimates.DEFAULT_DUE_DAYS, help='Days after the end of the month the bills are due.'
+        )
+        parser.add_argument('--dry_run', action='store_true', help='Show the estimates without saving them.')
+        add_property_argument(parser)
+
+    def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.estimate(current_property, options)
+
+    def estimate(self, current_property, options):
+        previous_month = timezone.localdate().replace(day=1) - datetime.timedelta(days=1)
+        month = options['month'] or previous_month.month
+        year = options['year'] or previous_month.year
+        if not (1 <= month <= 12):
+            raise CommandError("Month must be between 1 and 12.")
+        period_start = datetime.date(year, month, 1)
+        period_end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+        if period_end >= timezone.localdate():
+            raise CommandError(f"{calendar.month_name[month]} {year} has not ended yet; readings can only be estimated for past months.")
+        if options['lookback_days'] < 1:
+            raise CommandError("--lookback_days must be at least 1.")
+
+        unit_price = None
+        if options['unit_price']:
+            try:
+                unit_price = Decimal(options['unit_price'])
+                if unit_price < 0 or -unit_price.as_tuple().exponent > estimates.PRICE_PLACES:
+                    raise InvalidOperation
+            except InvalidOperation:
+                raise CommandError(
+                    f"--unit_price must be a non-negative amount with at most {estimates.PRICE_PLACES} decimals. "
+                    f"You provided: {options['unit_price']}"
+                )
+
+        tenants = Tenant.objects.filter(property=current_property) if current_property else Tenant.objects.all()
+        found = estimates.estimate_readings(
+            period_start, period_end, tenants, unit_price=unit_price,
+            lookback_days=options['lookback_days'], due_days=options['due_days'], dry_run=options['dry_run'],
+        )
+
+        names = dict(tenants.filter(pk__in=[estimate.tenant_id for estimate in found]).values_list('pk', 'full_name'))
+        billed = 0
+        for estimate in found:
+            label = f"{names.get(estimate.tenant_id)} (Tenant ID: {estimate.tenant_id})"
+            if estimate.bill is None:
+                self.stdout.write(self.style.WARNING(f"Skipped {label}: {estimate.skipped}."))
+                continue
+            billed += 1
+            bill_id = f"Bill ID {estimate.bill.pk}, " if estimate.bill.pk else ''
+            self.stdout.write(
+                f"{label}: last reading {estimate.last_value} kWh on {estimate.last_date}, "
+                f"{estimate.daily_use} kWh/day -> estimated {estimate.reading.reading_value} kWh, "
+                f"{estimate.reading.consumption} kWh billed, {bill_id}Amount {estimate.bill.amount}"
+            )
+
+        verb = 'Would estimate and bill' if options['dry_run'] else 'Estimated and billed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {billed} reading(s) missing for {calendar.month_name[month]} {year}; "
+            f"{len(found) - billed} tenant(s) skipped."
+        ))
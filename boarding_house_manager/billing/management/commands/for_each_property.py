@@ -0,0 +1,72 @@
+# billing/management/commands/for_each_property.py
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management import get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from billing.models import Property
+from billing.sharding import init_property_worker, run_property_command
+import argparse
+
+class Command(BaseCommand):
+    help = (
+        'Runs a billing command (one that accepts --property, e.g. generate_rent_bills or send_billing_reminders) '
+        'once per property, in parallel worker processes. Example: '
+        'manage.py for_each_property --processes 4 generate_rent_bills --month 5. '
+        'Options of for_each_property itself go before the command name.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=4, help='Maximum number of properties processed at the same time.'
+        )
+        parser.add_argument(
+            '--only', action='append', dest='codes', help='Only this property code (repeatable). Defaults to every property.'
+        )
+        parser.add_argument('command_name', help='The command to run for each property.')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help='Arguments passed on to the command.')
+
+    def handle(self, *args, **options):
+        command_name = options['command_name']
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+        if command_name not in get_commands():
+            raise CommandError(f"Unknown command: {command_name}")
+        command = load_command_class(get_commands()[command_name], command_name)
+        parser = command.create_parser('manage.py', command_name)
+        if not any(action.dest == 'property' for action in parser._actions):
+            raise CommandError(f"{command_name} does not accept --property.")
+
+        properties = Property.objects.all()
+        if options['codes']:
+            properties = properties.filter(code__in=options['codes'])
+        codes = list(properties.values_list('code', flat=True))
+        missing = set(options['codes'] or []) - set(codes)
+        if missing:
+            raise CommandError(f"Unknown property code(s): {', '.join(sorted(missing))}")
+        if not codes:
+            self.stdout.write(self.style.NOTICE("No properties to process."))
+            return
+
+        tasks = [(command_name, code, options['command_args']) for code in codes]
+        failed = []
+        for code, succeeded, output in self._run(tasks, processes):
+            style = self.style.SUCCESS if succeeded else self.style.ERROR
+            self.stdout.write(style(f"== {code}: {'done' if succeeded else 'failed'}"))
+            if output:
+                self.stdout.write(output.rstrip('\n'))
+            if not succeeded:
+                failed.append(code)
+
+        if failed:
+            raise CommandError(f"{command_name} failed for: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f"{command_name} completed for {len(codes)} propert{'y' if len(codes) == 1 else 'ies'}."))
+
+    def _run(self, tasks, processes):
+        if processes == 1 or len(tasks) == 1:
+            yield from map(run_property_command, tasks)
+            return
+        # Each worker opens its own connections; don't let forked children inherit ours.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(processes, len(tasks)), initializer=init_property_worker) as executor:
+            yield from executor.map(run_property_command, tasks)
@@ -1,7 +1,11 @@
 # billing/management/commands/generate_electricity_bill.py
 from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
 from django.utils import timezone
 from billing.models import Tenant, Bill, ElectricityReading
+from billing import estimates, money
+from billing.outbox import record_bill_event
+from billing.sharding import add_property_argument, use_property
 from decimal import Decimal
 
 class Command(BaseCommand):
@@ -12,8 +16,13 @@ class Command(BaseCommand):
         parser.add_argument('current_reading_value', type=Decimal, help='The current meter reading value (e.g., in kWh).')
         parser.add_argument('unit_price', type=Decimal, help='The price per unit (e.g., per kWh).')
         parser.add_argument('--reading_date', type=str, help='Date of the reading (YYYY-MM-DD). Defaults to today.', default=timezone.now().strftime('%Y-%m-%d'))
+        add_property_argument(parser)
 
     def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.generate(current_property, options)
+
+    def generate(self, current_property, options):
         tenant_id = options['tenant_id']
         current_reading_value = options['current_reading_value']
         unit_price = options['unit_price']
@@ -25,7 +34,8 @@ class Command(BaseCommand):
             raise CommandError(f"Date format for --reading_date should be YYYY-MM-DD. You provided: {reading_date_str}")
 
         try:
-            tenant = Tenant.objects.get(pk=tenant_id)
+            tenants = Tenant.objects.filter(property=current_property) if current_property else Tenant.objects.all()
+            tenant = tenants.get(pk=tenant_id)
         except Tenant.DoesNotExist:
             raise CommandError(f'Tenant with ID "{tenant_id}" does not exist.')
 
@@ -43,7 +53,16 @@ class Command(BaseCommand):
         previous_reading_value_for_calc = Decimal('0.00')
         if last_billed_reading:
             previous_reading_value_for_calc = last_billed_reading.reading_value
-            if current_reading_value < previous_reading_value_for_calc:
+            # Below an estimated reading, the estimate was too high: the difference is credited.
+            # Never below the last actual reading, which the estimates extended.
+            if current_reading_value < previous_reading_value_for_calc and last_billed_reading.is_estimate:
+                floor = estimates.true_up_floor(last_billed_reading)
+                if floor is not None and current_reading_value < floor:
+                    raise CommandError(
+                        f"Current reading ({current_reading_value}) cannot be less than the last actual reading "
+                        f"({floor}) the estimated reading of {last_billed_reading.reading_date} was based on."
+                    )
+            elif current_reading_value < previous_reading_value_for_calc:
                 raise CommandError(
                     f"Current reading ({current_reading_value}) cannot be less than the previous billed reading "
                     f"({previous_reading_value_for_calc}) from {last_billed_reading.reading_date}."
@@ -56,40 +75,53 @@ class Command(BaseCommand):
 
 
         consumption = current_reading_value - previous_reading_value_for_calc
-        if consumption < 0: # Should be caught above, but as a safeguard
+        true_up = last_billed_reading is not None and last_billed_reading.is_estimate
+        if consumption < 0 and not true_up: # Should be caught above, but as a safeguard
             raise CommandError(f"Calculated consumption ({consumption}) is negative. Check readings.")
 
-        bill_amount = consumption * unit_price
+        bill_amount = money.quantize(consumption * unit_price) # Rounded half up to cents
 
-        # Create the new ElectricityReading entry
-        new_reading = ElectricityReading.objects.create(
-            tenant=tenant,
-            reading_date=reading_date,
-            reading_value=current_reading_value,
-            previous_reading_value=previous_reading_value_for_calc if last_billed_reading else None,
-            consumption=consumption,
-            unit_price=unit_price,
-            is_billed=True # Mark as billed immediately as we are creating the bill
-        )
-
-        # Create the Bill entry
-        # Determine due date (e.g., 15 days from reading date)
-        due_date = reading_date + timezone.timedelta(days=15)
-        bill_description = (
-            f"Electricity charge for period ending {reading_date}. "
-            f"Current reading: {current_reading_value} kWh, "
-            f"Previous reading: {new_reading.previous_reading_value or 'N/A'} kWh. "
-            f"Consumption: {consumption} kWh @ {unit_price}/kWh."
-        )
-
-        bill = Bill.objects.create(
-            tenant=tenant,
-            bill_type='Electricity',
-            amount=bill_amount,
-            due_date=due_date,
-            description=bill_description,
-            is_paid=False
-        )
+        # The reading, the bill and its outbox event are saved together or not at all.
+        with transaction.atomic(using=router.db_for_write(Bill)):
+            # Create the new ElectricityReading entry
+            new_reading = ElectricityReading.objects.create(
+                tenant=tenant,
+                reading_date=reading_date,
+                reading_value=current_reading_value,
+                previous_reading_value=previous_reading_value_for_calc if last_billed_reading else None,
+                consumption=consumption,
+                unit_price=unit_price,
+                is_billed=True # Mark as billed immediately as we are creating the bill
+            )
+            if consumption < 0:
+                credit = estimates.credit_overestimate(tenant, new_reading, last_billed_reading)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Reading {current_reading_value} kWh for {tenant.full_name} (Tenant ID: {tenant_id}) is below the "
+                    f"estimated reading of {last_billed_reading.reading_date}; credited {credit.amount} "
+                    f"(Tenant payment ID: {credit.id}) instead of billing. Reading ID: {new_reading.id}"
+                ))
+                return
+
+            # Create the Bill entry
+            # Determine due date (e.g., 15 days from reading date)
+            due_date = reading_date + timezone.timedelta(days=15)
+            bill_description = (
+                (estimates.true_up_description(last_billed_reading) if true_up else '') +
+                f"Electricity charge for period ending {reading_date}. "
+                f"Current reading: {current_reading_value} kWh, "
+                f"Previous reading: {new_reading.previous_reading_value or 'N/A'} kWh. "
+                f"Consumption: {consumption} kWh @ {unit_price}/kWh."
+            )
+
+            bill = Bill.objects.create(
+                tenant=tenant,
+                bill_type='Electricity',
+                amount=bill_amount,
+                due_date=due_date,
+                description=bill_description,
+                is_paid=False
+            )
+            record_bill_event('bill.created', bill)
 
         self.stdout.write(self.style.SUCCESS(
             f"Successfully created electricity reading and bill for {tenant.full_name} (Tenant ID: {tenant_id}).\n"
@@ -2,7 +2,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from billing.models import Tenant, Bill
-from decimal import Decimal
+from billing.outbox import create_bill
+from billing.sharding import add_property_argument, use_property
 import calendar
 
 class Command(BaseCommand):
@@ -21,8 +22,13 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force', action='store_true', help='Force generation even if a bill for the period might exist (use with caution).'
         )
+        add_property_argument(parser)
 
     def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.generate(current_property, options)
+
+    def generate(self, current_property, options):
         now = timezone.now()
         month = options['month'] if options['month'] else now.month
         year = options['year'] if options['year'] else now.year
@@ -38,10 +44,10 @@ class Command(BaseCommand):
         month_name = calendar.month_name[month]
 
         active_tenants = Tenant.objects.filter(is_active=True)
-        tenants_to_bill = [
-            tenant for tenant in active_tenants
-            if tenant.fixed_wifi_charge is not None and tenant.fixed_wifi_charge > Decimal('0.00')
-        ]
+        if current_property:
+            active_tenants = active_tenants.filter(property=current_property)
+        # Only tenants with a positive charge; NULL charges are excluded by the comparison.
+        tenants_to_bill = list(active_tenants.filter(fixed_wifi_charge__gt=0))
 
         if not tenants_to_bill:
             self.stdout.write(self.style.NOTICE("No active tenants found with a fixed WiFi charge greater than zero."))
@@ -68,7 +74,7 @@ class Command(BaseCommand):
                     bills_skipped_count += 1
                     continue
 
-            bill = Bill.objects.create(
+            bill = create_bill(
                 tenant=tenant,
                 bill_type='WiFi',
                 amount=tenant.fixed_wifi_charge,
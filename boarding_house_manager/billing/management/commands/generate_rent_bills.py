@@ -2,7 +2,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from billing.models import Tenant, Bill, Room
-from decimal import Decimal
+from billing.outbox import create_bill
+from billing.sharding import add_property_argument, use_property
 import calendar
 
 class Command(BaseCommand):
@@ -21,8 +22,13 @@ class Command(BaseCommand):
         parser.add_argument(
             '--force', action='store_true', help='Force generation even if a rent bill for the period might exist (use with caution).'
         )
+        add_property_argument(parser)
 
     def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.generate(current_property, options)
+
+    def generate(self, current_property, options):
         now = timezone.now()
         month = options['month'] if options['month'] else now.month
         year = options['year'] if options['year'] else now.year
@@ -57,12 +63,11 @@ class Command(BaseCommand):
             lease_end_date__isnull=False,
             lease_end_date__lt=bill_generation_date
         )
+        if current_property:
+            active_tenants = active_tenants.filter(property=current_property)
 
         # Further filter: ensure room has base_rent > 0
-        tenants_to_bill = [
-            tenant for tenant in active_tenants
-            if tenant.room.base_rent is not None and tenant.room.base_rent > Decimal('0.00')
-        ]
+        tenants_to_bill = list(active_tenants.filter(room__base_rent__gt=0).select_related('room'))
 
 
         if not tenants_to_bill:
@@ -115,7 +120,7 @@ class Command(BaseCommand):
                     bills_skipped_count += 1
                     continue
 
-            bill = Bill.objects.create(
+            bill = create_bill(
                 tenant=tenant,
                 bill_type='Rent',
                 amount=rent_amount,
@@ -0,0 +1,59 @@
+# billing/management/commands/import_tenants.py
+from django.core.management.base import BaseCommand, CommandError
+from billing.models import Property
+from billing.sharding import use_property
+from billing.tenant_import import COLUMNS, ImportFileError, apply_import, plan_import, read_rows
+
+class Command(BaseCommand):
+    help = (
+        'Creates and updates the tenants of one property from a CSV or XLSX file, e.g. at semester turnover. '
+        f'Columns: {", ".join(COLUMNS)}. Rows update the tenant with their tenant_id or email, or create a new one. '
+        'The whole file is validated first (including double-booked rooms) and written in one transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='The .csv or .xlsx file.')
+        parser.add_argument(
+            '--property', type=str, help='Code of the property the tenants belong to. Required if there is more than one property.'
+        )
+        parser.add_argument('--dry_run', action='store_true', help='Show what would change without writing anything.')
+        parser.add_argument(
+            '--create_users', action='store_true',
+            help='Create a login (without a password) for each tenant that has none, named after the username column or the email.'
+        )
+        parser.add_argument(
+            '--skip_invalid', action='store_true', help='Write the valid rows even if other rows have errors.'
+        )
+
+    def handle(self, *args, **options):
+        code = options['property']
+        if not code:
+            codes = list(Property.objects.values_list('code', flat=True)[:2])
+            if len(codes) != 1:
+                raise CommandError("Specify the property with --property.")
+            code = codes[0]
+
+        try:
+            with open(options['path'], 'rb') as f:
+                records = read_rows(f, options['path'])
+        except OSError as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        except ImportFileError as e:
+            raise CommandError(str(e))
+
+        with use_property(code) as current_property:
+            plan = plan_import(records, current_property, create_users=options['create_users'])
+            for line in plan.report_lines():
+                self.stdout.write(line)
+            counts = plan.counts()
+            summary = f"{counts['create']} to create, {counts['update']} to update, {counts['unchanged']} unchanged, {counts['error']} with errors."
+            if options['dry_run']:
+                self.stdout.write(self.style.NOTICE(f"Dry run for {current_property}: {summary}"))
+                return
+            if counts['error'] and not options['skip_invalid']:
+                raise CommandError(f"Nothing was imported: {summary} Fix the rows or pass --skip_invalid.")
+            apply_import(plan)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported tenants of {current_property}: {counts['create']} created, {counts['update']} updated"
+            + (f", {counts['error']} row(s) skipped." if counts['error'] else ".")
+        ))
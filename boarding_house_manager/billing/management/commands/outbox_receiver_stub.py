@@ -0,0 +1,66 @@
+# billing/management/commands/outbox_receiver_stub.py
+from django.core.management.base import BaseCommand
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import random
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local HTTP receiver for outbox events, for trying out dispatch_outbox without the real '
+        'accounting system or mobile app. It prints each event, reports duplicates and out-of-order '
+        'events per tenant, and can fail a share of requests to exercise retries. Not for production use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on (localhost only).')
+        parser.add_argument(
+            '--fail_rate', type=float, default=0.0, help='Share of requests (0-1) answered with HTTP 503.'
+        )
+
+    def handle(self, *args, **options):
+        command = self
+        fail_rate = options['fail_rate']
+        seen_ids = set()
+        last_created = {} # tenant_id -> occurred_at of the last event received
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if random.random() < fail_rate:
+                    command.stdout.write(command.style.WARNING("Simulated failure: 503"))
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                try:
+                    events = json.loads(body)['events']
+                except (ValueError, KeyError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                for event in events:
+                    notes = []
+                    if event['id'] in seen_ids:
+                        notes.append('duplicate')
+                    if event['occurred_at'] < last_created.get(event['tenant_id'], ''):
+                        notes.append('OUT OF ORDER')
+                    seen_ids.add(event['id'])
+                    last_created[event['tenant_id']] = max(event['occurred_at'], last_created.get(event['tenant_id'], ''))
+                    command.stdout.write(
+                        f"{event['type']} bill #{event['bill_id']} tenant #{event['tenant_id']}"
+                        + (f" ({', '.join(notes)})" if notes else '')
+                    )
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass # Events are printed above instead of the access log
+
+        server = HTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(self.style.SUCCESS(f"Receiving outbox events on http://127.0.0.1:{options['port']}/"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS(f"Received {len(seen_ids)} distinct event(s)."))
@@ -0,0 +1,48 @@
+# billing/management/commands/rebuild_search_index.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from billing.models import SearchDocument
+from billing.search import MODEL_NAMES, has_fulltext_index, rebuild_index
+from billing.sharding import use_shard
+
+class Command(BaseCommand):
+    help = 'Rebuilds the admin full-text search documents for tenants, bills and payments (e.g. after loading fixtures).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models', choices=sorted(MODEL_NAMES.values()),
+            help='Only rebuild documents of this model (repeatable). Defaults to all.'
+        )
+        parser.add_argument(
+            '--database', type=str,
+            help='Property database to rebuild (default: the default database).'
+        )
+
+    def handle(self, *args, **options):
+        models = None
+        if options['models']:
+            by_name = {name: model for model, name in MODEL_NAMES.items()}
+            models = [by_name[name] for name in options['models']]
+        if options['database'] and options['database'] not in settings.DATABASES:
+            raise CommandError(f"Unknown database alias '{options['database']}'.")
+        with use_shard(options['database']):
+            self.rebuild(models)
+
+    def rebuild(self, models):
+        connection = connections[router.db_for_write(SearchDocument)]
+        if not has_fulltext_index(connection):
+            self.stdout.write(self.style.WARNING(
+                f"The {connection.vendor} database has no full-text index; documents are rebuilt but the admin "
+                "will keep using its regular search."
+            ))
+
+        def progress(model_name, done, total):
+            self.stdout.write(f"  {model_name}: {done}/{total}")
+
+        try:
+            counts = rebuild_index(models, progress=progress)
+        except Exception as e:
+            raise CommandError(f"Rebuilding the search index failed: {e}")
+        summary = ', '.join(f"{count} {name}(s)" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt: {summary}."))
@@ -0,0 +1,48 @@
+# billing/management/commands/reconcile_statement.py
+from django.core.management.base import BaseCommand, CommandError
+from billing.reconciliation import DATE_FORMATS, StatementFileError, read_statement, reconcile
+from billing.sharding import add_property_argument, use_property
+import os
+import time
+
+class Command(BaseCommand):
+    help = (
+        'Matches the incoming payments of a bank statement (CSV export) to open bills. Confident matches are '
+        'recorded as payments right away; the other lines wait for review under Bank statement lines in the admin. '
+        'Lines already imported from an earlier, overlapping export are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='The statement CSV, with a header row naming date, amount, payer and memo columns.')
+        parser.add_argument(
+            '--date_format', action='append', dest='date_formats',
+            help=f"strptime format of the statement's dates (repeatable). Defaults to: {', '.join(DATE_FORMATS)}."
+        )
+        parser.add_argument('--dry_run', action='store_true', help='Match the lines without saving anything.')
+        add_property_argument(parser)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                records, errors = read_statement(f, options['date_formats'] or DATE_FORMATS)
+        except OSError as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+        except StatementFileError as e:
+            raise CommandError(str(e))
+        for line, message in errors:
+            self.stdout.write(self.style.WARNING(f"Line {line} skipped: {message}"))
+
+        with use_property(options['property']):
+            statement, counts, duplicates = reconcile(
+                records, os.path.basename(options['path']), dry_run=options['dry_run']
+            )
+
+        summary = (
+            f"{counts['matched']} paid automatically, {counts['review']} to review, {counts['unmatched']} without a match, "
+            f"{counts['ignored']} outgoing ignored, {duplicates} already imported ({time.monotonic() - started:.1f}s)."
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.NOTICE(f"Dry run: {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {statement}: {summary}"))
@@ -0,0 +1,125 @@
+# billing/management/commands/render_invoices.py
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor
+from billing.invoices import (
+    init_render_worker, invoice_filename, load_invoice_payloads, payload_hash, render_invoice, template_fingerprint,
+)
+import calendar
+import json
+import os
+
+class Command(BaseCommand):
+    help = 'Renders printable monthly invoices (HTML or PDF), one per tenant, using a pool of worker processes.'
+
+    # How many results to collect before the manifest of rendered invoices is saved again.
+    MANIFEST_SAVE_EVERY = 200
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month', type=int, help='The month (1-12) whose bills are invoiced. Defaults to the current month.'
+        )
+        parser.add_argument(
+            '--year', type=int, help='The year (YYYY) whose bills are invoiced. Defaults to the current year.'
+        )
+        parser.add_argument(
+            '--format', choices=['html', 'pdf'], default='pdf', help='Output format.'
+        )
+        parser.add_argument(
+            '--output_dir', type=str, help='Directory for the invoices. Defaults to settings.BILLING_INVOICE_DIR.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1, help='Number of rendering processes.'
+        )
+        parser.add_argument(
+            '--tenant', type=int, action='append', dest='tenant_ids', help='Only render invoices for this tenant ID (repeatable).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Re-render invoices even if their content has not changed. Needed after editing a template that the '
+                 'invoice templates include through a variable, which change detection does not follow.'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        month = options['month'] if options['month'] else now.month
+        year = options['year'] if options['year'] else now.year
+        fmt = options['format']
+        workers = options['workers']
+
+        if not (1 <= month <= 12):
+            raise CommandError("Month must be between 1 and 12.")
+        if workers < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        base_dir = options['output_dir'] or getattr(settings, 'BILLING_INVOICE_DIR', settings.BASE_DIR / 'invoices')
+        output_dir = os.path.join(str(base_dir), f"{year}-{month:02d}")
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, 'manifest.json')
+        manifest = self._load_manifest(manifest_path)
+
+        payloads = load_invoice_payloads(year, month, options['tenant_ids'])
+        if not payloads:
+            self.stdout.write(self.style.NOTICE(f"No bills found for {calendar.month_name[month]} {year}."))
+            return
+
+        fingerprint = template_fingerprint(fmt)
+        tasks, hashes, skipped = [], {}, 0
+        for payload in payloads:
+            filename = invoice_filename(payload, fmt)
+            path = os.path.join(output_dir, filename)
+            digest = payload_hash(payload, fmt, fingerprint)
+            if not options['force'] and manifest.get(filename) == digest and os.path.exists(path):
+                skipped += 1
+                continue
+            hashes[path] = (filename, digest)
+            tasks.append((payload, path, fmt))
+
+        self.stdout.write(
+            f"{len(payloads)} tenant invoice(s) for {calendar.month_name[month]} {year}: "
+            f"{len(tasks)} to render, {skipped} unchanged."
+        )
+
+        rendered = 0
+        try:
+            for path, size in self._render(tasks, fmt, workers):
+                filename, digest = hashes[path]
+                manifest[filename] = digest
+                rendered += 1
+                if rendered % self.MANIFEST_SAVE_EVERY == 0:
+                    self._save_manifest(manifest_path, manifest)
+                    self.stdout.write(f"  Rendered {rendered}/{len(tasks)}...")
+        finally:
+            self._save_manifest(manifest_path, manifest)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} invoice(s) to {output_dir} ({skipped} unchanged skipped)."
+        ))
+
+    def _render(self, tasks, fmt, workers):
+        if not tasks:
+            return
+        if workers == 1 or len(tasks) == 1:
+            init_render_worker(fmt)
+            yield from map(render_invoice, tasks)
+            return
+        # Workers never touch the database; don't let forked children inherit an open connection.
+        connections.close_all()
+        chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker, initargs=(fmt,)) as executor:
+            yield from executor.map(render_invoice, tasks, chunksize=chunksize)
+
+    def _load_manifest(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, path, manifest):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
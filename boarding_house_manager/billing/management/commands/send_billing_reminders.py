@@ -1,13 +1,16 @@
-from django.core.management.base import BaseCommand
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
-from django.conf import settings
 from billing.models import Bill, Tenant # Assuming models are in ..models
+from billing.notifications import Dispatcher, NotificationError, build, load_channels
+from billing.sharding import add_property_argument, use_property
+from collections import Counter
 import datetime
 
 class Command(BaseCommand):
-    help = 'Sends upcoming due date and overdue bill reminders to tenants via email.'
+    help = (
+        "Sends upcoming due date and overdue bill reminders to tenants by email and/or SMS, following each "
+        "tenant's notification channel. Every message is recorded under Notification logs in the admin."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -15,83 +18,90 @@ class Command(BaseCommand):
             help='Number of days in advance to send upcoming due reminders.'
         )
         parser.add_argument(
-            '--test_email', type=str, help='Send all reminders to this email address for testing.'
+            '--test_email', type=str,
+            help='Send all email reminders to this email address for testing. No reminder goes to a tenant when '
+                 'a test recipient is given; without --test_phone, SMS reminders are sent by email here instead.'
         )
         parser.add_argument(
-            '--dry_run', action='store_true', help="Run the command without actually sending emails."
+            '--test_phone', type=str,
+            help='Send all SMS reminders to this phone number for testing. Without --test_email, email reminders '
+                 'are sent by SMS here instead.'
         )
+        parser.add_argument(
+            '--workers', type=int, help='Messages sent at the same time. Defaults to settings.BILLING_NOTIFICATION_WORKERS.'
+        )
+        parser.add_argument(
+            '--dry_run', action='store_true', help="Run the command without actually sending messages."
+        )
+        add_property_argument(parser)
 
     def handle(self, *args, **options):
+        with use_property(options['property']) as current_property:
+            self.send_reminders(current_property, options)
+
+    def send_reminders(self, current_property, options):
         today = timezone.now().date()
         upcoming_days = options['upcoming_days']
-        test_email_recipient = options['test_email']
         dry_run = options['dry_run']
+        recipients = {'email': options['test_email'], 'sms': options['test_phone']}
+        try:
+            channels = load_channels()
+        except (NotificationError, ImportError) as e:
+            raise CommandError(f"Could not set up the notification channels: {e}")
 
         upcoming_due_date = today + datetime.timedelta(days=upcoming_days)
-
-        # --- Upcoming Bill Reminders ---
-        upcoming_bills = Bill.objects.filter(
+        open_bills = Bill.objects.filter(
             is_paid=False,
-            due_date=upcoming_due_date,
             tenant__is_active=True, # Only active tenants
-            tenant__email__isnull=False # Ensure tenant has an email
-        ).exclude(tenant__email__exact='').select_related('tenant') # Optimize tenant query
+        ).exclude(tenant__notification_channel=Tenant.CHANNEL_NONE).select_related('tenant') # Optimize tenant query
+        if current_property:
+            open_bills = open_bills.filter(tenant__property=current_property)
 
+        # --- Upcoming Bill Reminders ---
+        upcoming_bills = open_bills.filter(due_date=upcoming_due_date)
         self.stdout.write(self.style.SUCCESS(f"Processing reminders for {today}:"))
-        self.stdout.write(f"Found {upcoming_bills.count()} bill(s) due in {upcoming_days} day(s) (on {upcoming_due_date}).")
-
-        sent_upcoming_count = 0
-        for bill in upcoming_bills:
-            tenant = bill.tenant
-            recipient_email = test_email_recipient if test_email_recipient else tenant.email
-
-            subject = render_to_string('billing/email/upcoming_due_reminder_subject.txt', {'bill': bill}).strip()
-            body = render_to_string('billing/email/upcoming_due_reminder_body.txt', {'bill': bill, 'tenant': tenant})
-
-            self.stdout.write(f"  - Upcoming: Bill ID {bill.id} for {tenant.full_name} ({recipient_email}), Due: {bill.due_date}")
-            if not dry_run:
-                try:
-                    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient_email])
-                    sent_upcoming_count += 1
-                    # Optionally, add a field to Bill like `last_upcoming_reminder_sent_at` and update it.
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(f"    Error sending upcoming reminder for Bill ID {bill.id}: {e}"))
-            else:
-                self.stdout.write(self.style.NOTICE(f"    (Dry run) Would send upcoming reminder for Bill ID {bill.id} to {recipient_email}"))
-
+        upcoming, unreachable = build('upcoming_due_reminder', upcoming_bills, channels, recipients)
+        self.stdout.write(f"Found {len(upcoming)} upcoming reminder(s) for bills due in {upcoming_days} day(s) (on {upcoming_due_date}).")
+        self.describe('Upcoming', upcoming, unreachable, dry_run)
 
         # --- Overdue Bill Reminders ---
-        overdue_bills = Bill.objects.filter(
-            is_paid=False,
-            due_date__lt=today, # Due date is in the past
-            tenant__is_active=True,
-            tenant__email__isnull=False
-        ).exclude(tenant__email__exact='').select_related('tenant') # Optimize tenant query
         # Note: This will send for ALL overdue bills daily without more advanced logic (e.g., `last_overdue_reminder_sent_at` field on Bill)
+        overdue_bills = open_bills.filter(due_date__lt=today) # Due date is in the past
+        overdue, unreachable = build('overdue_bill_reminder', overdue_bills, channels, recipients)
+        self.stdout.write(f"Found {len(overdue)} overdue reminder(s) as of {today}.")
+        self.describe('Overdue', overdue, unreachable, dry_run)
 
-        self.stdout.write(f"Found {overdue_bills.count()} overdue bill(s) as of {today}.")
-        sent_overdue_count = 0
-        for bill in overdue_bills:
-            tenant = bill.tenant
-            recipient_email = test_email_recipient if test_email_recipient else tenant.email
-
-            subject = render_to_string('billing/email/overdue_bill_reminder_subject.txt', {'bill': bill}).strip()
-            body = render_to_string('billing/email/overdue_bill_reminder_body.txt', {'bill': bill, 'tenant': tenant})
-
-            self.stdout.write(f"  - Overdue: Bill ID {bill.id} for {tenant.full_name} ({recipient_email}), Due: {bill.due_date}")
-            if not dry_run:
-                try:
-                    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient_email])
-                    sent_overdue_count += 1
-                    # Optionally, update `Bill.last_overdue_reminder_sent_at`
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(f"    Error sending overdue reminder for Bill ID {bill.id}: {e}"))
-            else:
-                self.stdout.write(self.style.NOTICE(f"    (Dry run) Would send overdue reminder for Bill ID {bill.id} to {recipient_email}"))
-
-
+        if dry_run:
+            self.stdout.write(self.style.WARNING("This was a dry run. No messages were actually sent."))
+            return
+
+        messages = upcoming + overdue
+        Dispatcher(channels, workers=options['workers']).send(messages)
+        sent = Counter((message.kind, message.channel) for message in messages if message.status == message.STATUS_SENT)
+        for message in messages:
+            if message.status == message.STATUS_FAILED:
+                self.stderr.write(self.style.ERROR(
+                    f"    Error sending {message.channel} reminder for Bill ID {message.bill_id} to {message.recipient}: {message.error}"
+                ))
+        upcoming_sent, overdue_sent = (
+            ', '.join(f"{sent[(kind, name)]} by {name}" for name in channels)
+            for kind in ('upcoming_due_reminder', 'overdue_bill_reminder')
+        )
         self.stdout.write(self.style.SUCCESS(
-            f"Reminder processing complete. Sent {sent_upcoming_count} upcoming reminders and {sent_overdue_count} overdue reminders."
+            f"Reminder processing complete. Sent upcoming reminders: {upcoming_sent}; overdue reminders: {overdue_sent}."
         ))
-        if dry_run:
-            self.stdout.write(self.style.WARNING("This was a dry run. No emails were actually sent."))
+
+    def describe(self, label, messages, unreachable, dry_run):
+        for message in messages:
+            self.stdout.write(
+                f"  - {label}: Bill ID {message.bill_id} for {message.tenant.full_name} "
+                f"({message.channel}: {message.recipient}), Due: {message.bill.due_date}"
+            )
+            if dry_run:
+                self.stdout.write(self.style.NOTICE(
+                    f"    (Dry run) Would send {label.lower()} reminder for Bill ID {message.bill_id} to {message.recipient}"
+                ))
+        for bill in unreachable:
+            self.stdout.write(self.style.WARNING(
+                f"  - {label}: Bill ID {bill.id} for {bill.tenant.full_name} skipped: no email address or phone number."
+            ))
@@ -0,0 +1,65 @@
+# billing/management/commands/sms_gateway_stub.py
+from django.core.management.base import BaseCommand
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import time
+import uuid
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local HTTP SMS gateway for trying out SMS reminders with billing.notifications.HttpSmsGateway '
+        '(url http://127.0.0.1:<port>/). It prints each message instead of sending it, and can delay or fail '
+        'a share of requests to exercise the send pool and the notification log. Not for production use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8766, help='Port to listen on (localhost only).')
+        parser.add_argument(
+            '--fail_rate', type=float, default=0.0, help='Share of requests (0-1) answered with HTTP 503.'
+        )
+        parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering each request.')
+
+    def handle(self, *args, **options):
+        command = self
+        fail_rate, delay = options['fail_rate'], options['delay']
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                time.sleep(delay)
+                if random.random() < fail_rate:
+                    command.stdout.write(command.style.WARNING("Simulated failure: 503"))
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                try:
+                    message = json.loads(body)
+                    to, text = message['to'], message['text']
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                message_id = uuid.uuid4().hex
+                received.append(message_id)
+                command.stdout.write(f"SMS to {to} ({len(text)} chars): {text}")
+                answer = json.dumps({'id': message_id}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+            def log_message(self, format, *args):
+                pass # Messages are printed above instead of the access log
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(self.style.SUCCESS(f"SMS gateway stub listening on http://127.0.0.1:{options['port']}/"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS(f"Received {len(received)} message(s)."))
@@ -0,0 +1,40 @@
+# billing/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .sharding import use_shard
+
+# Session key holding the database of the property picked in the admin (PropertyAdmin's "select" link).
+SESSION_PROPERTY_DATABASE = 'billing_property_database'
+SESSION_PROPERTY_NAME = 'billing_property_name'
+
+
+def _known_alias(alias):
+    return alias if alias in settings.DATABASES else None # None if removed from settings since it was picked
+
+
+class PropertyShardMiddleware:
+    """Route billing queries of each request to the database of the property selected in
+    the session. Without a selection requests use the default routing. Supports async
+    views (the meter reading endpoint) without switching threads."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        alias = request.session.get(SESSION_PROPERTY_DATABASE) if hasattr(request, 'session') else None
+        with use_shard(_known_alias(alias)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        alias = await request.session.aget(SESSION_PROPERTY_DATABASE) if hasattr(request, 'session') else None
+        with use_shard(_known_alias(alias)):
+            return await self.get_response(request)
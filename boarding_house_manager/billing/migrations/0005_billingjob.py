@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_tenant_fixed_wifi_charge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('generate_rent_bills', 'Generate rent bills'), ('generate_fixed_water_bills', 'Generate fixed water bills'), ('generate_fixed_wifi_bills', 'Generate fixed WiFi bills'), ('send_billing_reminders', 'Send billing reminders')], max_length=64)),
+                ('options', models.JSONField(blank=True, default=dict, help_text='Keyword options passed to the management command')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='The job will not be picked up before this time')),
+                ('worker_id', models.CharField(blank=True, max_length=255)),
+                ('progress', models.CharField(blank=True, help_text='Last line of output reported by the running job', max_length=255)),
+                ('output', models.TextField(blank=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='billing_bil_status_9bed74_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:23
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_billingjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unallocated_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Part of the payment not applied to any bill yet. Kept as credit for future bills.', max_digits=10)),
+                ('payment_date', models.DateField()),
+                ('payment_method', models.CharField(blank=True, help_text='e.g., Cash, Bank Transfer', max_length=255)),
+                ('notes', models.TextField(blank=True)),
+                ('date_recorded', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tenant_payments', to='billing.tenant')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='tenant_payment',
+            field=models.ForeignKey(blank=True, help_text='The lump-sum payment this amount was allocated from, if any.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='billing.tenantpayment'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_tenantpayment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='parent_bill',
+            field=models.ForeignKey(blank=True, help_text='For late fees: the overdue bill this fee was charged on.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='late_fees', to='billing.bill'),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='bill_type',
+            field=models.CharField(choices=[('Rent', 'Rent'), ('Electricity', 'Electricity'), ('Water', 'Water'), ('WiFi', 'WiFi'), ('Late Fee', 'Late Fee'), ('Other', 'Other')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:28
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+BILL_FIELDS = ('tenant_id', 'bill_type', 'amount', 'due_date', 'is_paid', 'description', 'parent_bill_id')
+PAYMENT_FIELDS = ('bill_id', 'tenant_id', 'amount_paid', 'payment_date', 'payment_method', 'notes', 'tenant_payment_id')
+
+
+def journal_existing_rows(apps, schema_editor):
+    """Start every existing bill's and payment's history with a snapshot of its current state."""
+    db_alias = schema_editor.connection.alias
+    JournalEntry = apps.get_model('billing', 'JournalEntry')
+    sources = [
+        ('bill', apps.get_model('billing', 'Bill'), BILL_FIELDS, 'date_created'),
+        ('payment', apps.get_model('billing', 'Payment'), PAYMENT_FIELDS, 'date_recorded'),
+    ]
+    for model_name, model, fields, timestamp_field in sources:
+        entries = [
+            JournalEntry(
+                model_name=model_name,
+                object_id=row['id'],
+                action='create',
+                changes={field: row[field] for field in fields},
+                recorded_at=row[timestamp_field],
+            )
+            for row in model.objects.using(db_alias).values('id', timestamp_field, *fields).iterator()
+        ]
+        JournalEntry.objects.using(db_alias).bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('archive', 'Archive')], max_length=10)),
+                ('changes', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('batch_id', models.UUIDField(blank=True, help_text='Entries written together (one admin save, one bulk update) share a batch', null=True)),
+                ('changed_by', models.CharField(blank=True, max_length=150)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'journal entries',
+                'ordering': ['recorded_at', 'id'],
+                'indexes': [models.Index(fields=['model_name', 'object_id', 'recorded_at'], name='billing_jou_model_n_9fa7e2_idx')],
+            },
+        ),
+        migrations.RunPython(journal_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:42
+
+from django.db import migrations, models
+
+# The full-text index lives outside the ORM. On SQLite it is an external-content FTS5
+# table kept in sync with billing_searchdocument by triggers; if billing_searchdocument
+# is ever altered (SQLite rebuilds the table), a later migration must recreate them.
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE billing_searchdocument_fts USING fts5("
+    "body, content='billing_searchdocument', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER billing_searchdocument_ai AFTER INSERT ON billing_searchdocument BEGIN "
+    "INSERT INTO billing_searchdocument_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER billing_searchdocument_ad AFTER DELETE ON billing_searchdocument BEGIN "
+    "INSERT INTO billing_searchdocument_fts(billing_searchdocument_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER billing_searchdocument_au AFTER UPDATE ON billing_searchdocument BEGIN "
+    "INSERT INTO billing_searchdocument_fts(billing_searchdocument_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO billing_searchdocument_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS billing_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS billing_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS billing_searchdocument_au",
+    "DROP TABLE IF EXISTS billing_searchdocument_fts",
+]
+POSTGRESQL_FTS = [
+    "CREATE INDEX billing_searchdocument_body_tsv ON billing_searchdocument USING GIN (to_tsvector('simple', body))",
+]
+POSTGRESQL_FTS_DROP = [
+    "DROP INDEX IF EXISTS billing_searchdocument_body_tsv",
+]
+
+# Frozen copy of billing.search.DOCUMENT_FIELDS and MODEL_CODES as of this migration.
+DOCUMENT_FIELDS = {
+    'tenant': ('Tenant', ('full_name', 'email', 'phone_number', 'room__room_number')),
+    'bill': ('Bill', ('bill_type', 'description', 'tenant__full_name', 'tenant__room__room_number')),
+    'payment': ('Payment', ('notes', 'payment_method', 'bill__description', 'tenant__full_name')),
+}
+MODEL_CODES = {'tenant': 1, 'bill': 2, 'payment': 3}
+
+
+def create_fulltext_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return # No FTS5 in this SQLite build: the admin keeps its regular search
+        statements = SQLITE_FTS
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRESQL_FTS
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRESQL_FTS_DROP}.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def index_existing_rows(apps, schema_editor):
+    SearchDocument = apps.get_model('billing', 'SearchDocument')
+    db_alias = schema_editor.connection.alias
+    for model_name, (class_name, fields) in DOCUMENT_FIELDS.items():
+        model = apps.get_model('billing', class_name)
+        documents = [
+            SearchDocument(
+                id=pk * 4 + MODEL_CODES[model_name], model_name=model_name, object_id=pk,
+                body=' '.join(str(value) for value in values if value not in (None, '')),
+            )
+            for pk, *values in model.objects.using(db_alias).values_list('pk', *fields).iterator()
+        ]
+        SearchDocument.objects.using(db_alias).bulk_create(documents, batch_size=500)
+
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_journalentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('model_name', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('body', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_existing_rows, migrations.RunPython.noop),
+    ]
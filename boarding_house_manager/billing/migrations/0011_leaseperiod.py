@@ -0,0 +1,40 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mirror_existing_leases(apps, schema_editor):
+    # Same rule as billing.availability.lease_values() as of this migration.
+    Tenant = apps.get_model('billing', 'Tenant')
+    LeasePeriod = apps.get_model('billing', 'LeasePeriod')
+    db_alias = schema_editor.connection.alias
+    tenants = Tenant.objects.using(db_alias).filter(room__isnull=False).exclude(is_active=False, lease_end_date__isnull=True)
+    LeasePeriod.objects.using(db_alias).bulk_create([
+        LeasePeriod(tenant_id=tenant.pk, room_id=tenant.room_id, start_date=tenant.lease_start_date, end_date=tenant.lease_end_date)
+        for tenant in tenants.iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0010_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeasePeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, help_text='Last day of the lease. Empty for open-ended leases.', null=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lease_periods', to='billing.room')),
+                ('tenant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='lease_period', to='billing.tenant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'start_date', 'end_date'], name='billing_lea_room_id_ff0d4f_idx')],
+            },
+        ),
+        migrations.RunPython(mirror_existing_leases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.2 on 2026-10-19 17:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_main_property(apps, schema_editor):
+    # Existing single-building data becomes the first property, on the default database.
+    Property = apps.get_model('billing', 'Property')
+    Room = apps.get_model('billing', 'Room')
+    Tenant = apps.get_model('billing', 'Tenant')
+    db_alias = schema_editor.connection.alias
+    main = Property.objects.using(db_alias).create(name='Main property', code='main', database=db_alias)
+    Room.objects.using(db_alias).update(property_id=main.pk)
+    Tenant.objects.using(db_alias).update(property_id=main.pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0011_leaseperiod'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Property',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('code', models.SlugField(help_text='Short identifier used by the --property command option.', unique=True)),
+                ('address', models.TextField(blank=True)),
+                ('database', models.CharField(default='default', help_text="Database alias (from settings.DATABASES) holding this property's rooms, tenants and bills.", max_length=100)),
+            ],
+            options={
+                'verbose_name_plural': 'properties',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='room_number',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='tenant',
+            name='user',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='property',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='rooms', to='billing.property'),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='property',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tenants', to='billing.property'),
+        ),
+        # Only on the catalog database: property shards are created empty, after this migration.
+        migrations.RunPython(create_main_property, migrations.RunPython.noop, hints={'model_name': 'property'}),
+        migrations.AlterField(
+            model_name='room',
+            name='property',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='rooms', to='billing.property'),
+        ),
+        migrations.AlterField(
+            model_name='tenant',
+            name='property',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='tenants', to='billing.property'),
+        ),
+        migrations.AddConstraint(
+            model_name='room',
+            constraint=models.UniqueConstraint(fields=('property', 'room_number'), name='billing_room_unique_number_per_property'),
+        ),
+    ]
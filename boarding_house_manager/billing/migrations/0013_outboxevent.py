@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:03
+
+import django.core.serializers.json
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0012_property'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='Sent with the event; receivers use it to drop duplicates')),
+                ('destination', models.CharField(help_text='Key of settings.BILLING_OUTBOX_DESTINATIONS', max_length=50)),
+                ('event_type', models.CharField(choices=[('bill.created', 'Bill created'), ('bill.paid', 'Bill paid'), ('bill.unpaid', 'Bill no longer paid')], max_length=30)),
+                ('tenant_id', models.BigIntegerField()),
+                ('bill_id', models.BigIntegerField()),
+                ('payload', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['destination', 'delivered_at', 'id'], name='billing_out_destina_aacb16_idx')],
+            },
+        ),
+    ]
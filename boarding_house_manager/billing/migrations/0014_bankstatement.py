@@ -0,0 +1,52 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:22
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_outboxevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('matched_count', models.PositiveIntegerField(default=0, help_text='Lines paid automatically at import')),
+                ('imported_by', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-imported_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BankStatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_number', models.PositiveIntegerField()),
+                ('transaction_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payer', models.CharField(blank=True, max_length=255)),
+                ('memo', models.TextField(blank=True)),
+                ('fingerprint', models.CharField(help_text='Identifies the line across overlapping statement exports', max_length=40, unique=True)),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('review', 'Needs review'), ('unmatched', 'No match'), ('ignored', 'Ignored')], default='review', max_length=20)),
+                ('score', models.PositiveSmallIntegerField(default=0, help_text='Confidence of the best candidate, 0-100')),
+                ('candidates', models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text="Best matching bills: [{'bill_id', 'tenant_id', 'score', 'reasons'}], best first")),
+                ('payment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statement_line', to='billing.payment')),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='billing.bankstatement')),
+            ],
+            options={
+                'ordering': ['statement', 'line_number'],
+                'indexes': [models.Index(fields=['status', 'statement'], name='billing_ban_status_01d705_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0014_bankstatement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='notification_channel',
+            field=models.CharField(choices=[('email', 'Email'), ('sms', 'SMS'), ('email_sms', 'Email and SMS'), ('none', 'No reminders')], default='email', help_text='How bill reminders reach the tenant. Without an address for it, SMS falls back to email and vice versa.', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='NotificationLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='e.g. upcoming_due_reminder, overdue_bill_reminder', max_length=30)),
+                ('channel', models.CharField(max_length=20)),
+                ('recipient', models.CharField(max_length=254)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('provider_message_id', models.CharField(blank=True, help_text='Id given by the SMS gateway or mail server, if any', max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('bill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='billing.bill')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='billing.tenant')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='billing_not_status_70087d_idx'), models.Index(fields=['bill', 'kind'], name='billing_not_bill_id_46e89a_idx')],
+            },
+        ),
+    ]
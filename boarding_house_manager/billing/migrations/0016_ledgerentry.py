@@ -0,0 +1,91 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:39
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.utils import timezone
+
+ZERO = Decimal('0.00')
+
+
+def _sides(amount, debit):
+    if (amount >= 0) == debit:
+        return abs(amount), ZERO
+    return ZERO, abs(amount)
+
+
+def populate_ledger(apps, schema_editor):
+    # Same rules as billing.ledger as of this migration; archived bills and payments are included.
+    LedgerEntry = apps.get_model('billing', 'LedgerEntry')
+    db_alias = schema_editor.connection.alias
+
+    def bill_entries(model):
+        for bill in apps.get_model('billing', model).objects.using(db_alias).iterator(chunk_size=2000):
+            debit, credit = _sides(bill.amount, debit=True)
+            yield LedgerEntry(
+                tenant_id=bill.tenant_id, entry_date=timezone.localdate(bill.date_created),
+                kind='fee' if bill.bill_type == 'Late Fee' else 'charge', debit=debit, credit=credit,
+                description=f"{bill.bill_type} bill #{bill.pk}, due {bill.due_date}", source='bill', source_id=bill.pk,
+            )
+
+    def payment_entries(model):
+        payments = apps.get_model('billing', model).objects.using(db_alias).filter(tenant_payment__isnull=True)
+        for payment in payments.iterator(chunk_size=2000):
+            debit, credit = _sides(payment.amount_paid, debit=False)
+            method = f" ({payment.payment_method})" if payment.payment_method else ''
+            yield LedgerEntry(
+                tenant_id=payment.tenant_id, entry_date=payment.payment_date, kind='payment', debit=debit, credit=credit,
+                description=f"Payment on bill #{payment.bill_id}{method}"[:255], source='payment', source_id=payment.pk,
+            )
+
+    def tenant_payment_entries():
+        for tenant_payment in apps.get_model('billing', 'TenantPayment').objects.using(db_alias).iterator(chunk_size=2000):
+            debit, credit = _sides(tenant_payment.amount, debit=False)
+            method = f" ({tenant_payment.payment_method})" if tenant_payment.payment_method else ''
+            yield LedgerEntry(
+                tenant_id=tenant_payment.tenant_id, entry_date=tenant_payment.payment_date, kind='credit',
+                debit=debit, credit=credit, description=f"Payment received{method}"[:255],
+                source='tenant_payment', source_id=tenant_payment.pk,
+            )
+
+    for entries in (bill_entries('Bill'), bill_entries('ArchivedBill'), payment_entries('Payment'),
+                    payment_entries('ArchivedPayment'), tenant_payment_entries()):
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= 2000:
+                LedgerEntry.objects.using(db_alias).bulk_create(batch, batch_size=500)
+                batch = []
+        LedgerEntry.objects.using(db_alias).bulk_create(batch, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0015_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_date', models.DateField(help_text='Bills count from the day they were created, payments from their payment date')),
+                ('kind', models.CharField(choices=[('charge', 'Charge'), ('fee', 'Late fee'), ('payment', 'Payment'), ('credit', 'Lump-sum payment'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('debit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('credit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(choices=[('bill', 'Bill'), ('payment', 'Payment'), ('tenant_payment', 'Tenant payment'), ('manual', 'Entered by hand')], default='manual', max_length=20)),
+                ('source_id', models.BigIntegerField(blank=True, help_text='Id of the bill or payment (hot or archived)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='billing.tenant')),
+            ],
+            options={
+                'verbose_name_plural': 'ledger entries',
+                'ordering': ['tenant', 'entry_date', 'id'],
+                'indexes': [models.Index(fields=['tenant', 'entry_date', 'id'], name='billing_led_tenant__6da043_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'source_id'), name='billing_ledger_unique_source')],
+            },
+        ),
+        migrations.RunPython(populate_ledger, migrations.RunPython.noop),
+    ]
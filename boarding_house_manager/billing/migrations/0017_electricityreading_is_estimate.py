@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0016_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electricityreading',
+            name='is_estimate',
+            field=models.BooleanField(default=False, help_text="Estimated from the tenant's average daily use for a period without a reading; trued up when the next actual reading is billed"),
+        ),
+    ]
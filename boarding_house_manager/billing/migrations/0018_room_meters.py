@@ -0,0 +1,58 @@
+# Generated by Django 5.2.2 on 2026-10-19 18:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0017_electricityreading_is_estimate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='meter_split',
+            field=models.CharField(choices=[('equal', 'Equally between the tenants'), ('days', 'By days each tenant lived in the room'), ('fixed', "By each tenant's fixed meter share")], default='days', help_text="How the room's shared electricity meter is split between its tenants (see Room meter readings).", max_length=10),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='meter_share',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Weight of this tenant in a room meter split by fixed shares, e.g. 60 and 40. Blank counts as 1.', null=True),
+        ),
+        migrations.CreateModel(
+            name='RoomMeterReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reading_date', models.DateField()),
+                ('reading_value', models.DecimalField(decimal_places=2, help_text='Current meter reading in kWh', max_digits=10)),
+                ('previous_reading_value', models.DecimalField(blank=True, decimal_places=2, help_text='Meter reading value from the last bill', max_digits=10, null=True)),
+                ('consumption', models.DecimalField(blank=True, decimal_places=2, help_text='Calculated consumption (current - previous)', max_digits=10, null=True)),
+                ('unit_price', models.DecimalField(decimal_places=3, help_text='Price per kWh at the time of reading', max_digits=6)),
+                ('is_billed', models.BooleanField(default=False, help_text='Has the consumption up to this reading been split and billed?')),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_readings', to='billing.room')),
+            ],
+            options={
+                'ordering': ['-reading_date', '-created_at'],
+                'unique_together': {('room', 'reading_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomMeterAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.PositiveIntegerField(help_text="The tenant's weight in the split: 1, occupancy days or fixed share")),
+                ('consumption', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('bill', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='meter_allocation', to='billing.bill')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meter_allocations', to='billing.tenant')),
+                ('reading', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='billing.roommeterreading')),
+            ],
+            options={
+                'unique_together': {('reading', 'tenant')},
+            },
+        ),
+    ]
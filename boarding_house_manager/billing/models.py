@@ -1,20 +1,138 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import F, Sum
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+import uuid
+
+class JournaledQuerySet(models.QuerySet):
+    """QuerySet for journaled models (Bill, Payment): bulk writes (bulk_create, update and
+    bulk_update, which is built on update) are recorded in the change journal as one batch,
+    the search documents and ledger entries they affect are refreshed and the tenants'
+    cached balances are invalidated."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        from .balances import invalidate_tenants
+        from .journal import record_bulk_create
+        from .ledger import post
+        from .search import index_objects
+        record_bulk_create(self.model, objs)
+        index_objects(self.model, [obj.pk for obj in objs if obj.pk])
+        post(self.model, [obj for obj in objs if obj.pk], using=self.db, created=True)
+        invalidate_tenants({obj.tenant_id for obj in objs})
+        return objs
+
+    def update(self, **kwargs):
+        from .balances import invalidate_tenants
+        from .journal import record_bulk_update
+        from .ledger import LEDGER_FIELDS, sync
+        from .search import reindex
+        rows = list(self.values_list('pk', 'tenant_id'))
+        updated = super().update(**kwargs)
+        if rows:
+            ids = [pk for pk, tenant_id in rows]
+            record_bulk_update(self.model, ids, kwargs)
+            reindex(self.model, ids, changed_fields=kwargs)
+            if LEDGER_FIELDS[self.model] & set(kwargs):
+                sync(self.model, ids, using=self.db)
+            tenant_ids = {tenant_id for pk, tenant_id in rows}
+            if 'tenant' in kwargs or 'tenant_id' in kwargs:
+                tenant_ids.update(self.model._base_manager.filter(pk__in=ids).values_list('tenant_id', flat=True))
+            invalidate_tenants(tenant_ids)
+        return updated
+    update.alters_data = True
+
+
+class ChangeTrackingMixin:
+    """Remembers the values loaded from the database so that saves can journal only what changed."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class Property(models.Model):
+    """A building. Lives in the catalog ('default') database only; its rooms, tenants and
+    bills live in the database named by `database` (see billing.sharding). Relations to
+    it are not enforced by the database, since they may cross databases."""
+    name = models.CharField(max_length=255)
+    code = models.SlugField(max_length=50, unique=True, help_text="Short identifier used by the --property command option.")
+    address = models.TextField(blank=True)
+    database = models.CharField(
+        max_length=100, default='default',
+        help_text="Database alias (from settings.DATABASES) holding this property's rooms, tenants and bills."
+    )
+
+    def clean(self):
+        if self.database not in settings.DATABASES:
+            raise ValidationError({'database': f"Unknown database alias '{self.database}'."})
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name_plural = 'properties'
+        ordering = ['name']
+
+def _check_property_database(instance):
+    # Rooms and tenants are stored in their property's database, not wherever the current request is routed.
+    if instance.property_id:
+        alias = router.db_for_write(type(instance), instance=instance)
+        if instance.property.database != alias:
+            raise ValidationError({'property': (
+                f"{instance.property} is stored in the '{instance.property.database}' database; "
+                "switch to that property first."
+            )})
 
 class Room(models.Model):
-    room_number = models.CharField(max_length=255, unique=True)
+    SPLIT_EQUAL = 'equal'
+    SPLIT_DAYS = 'days'
+    SPLIT_FIXED = 'fixed'
+    SPLIT_CHOICES = [
+        (SPLIT_EQUAL, 'Equally between the tenants'),
+        (SPLIT_DAYS, 'By days each tenant lived in the room'),
+        (SPLIT_FIXED, "By each tenant's fixed meter share"),
+    ]
+    property = models.ForeignKey(Property, on_delete=models.PROTECT, related_name='rooms', db_constraint=False)
+    room_number = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     base_rent = models.DecimalField(max_digits=10, decimal_places=2)
+    meter_split = models.CharField(
+        max_length=10, choices=SPLIT_CHOICES, default=SPLIT_DAYS,
+        help_text="How the room's shared electricity meter is split between its tenants (see Room meter readings)."
+    )
+
+    def clean(self):
+        _check_property_database(self)
 
     def __str__(self):
         return self.room_number
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['property', 'room_number'], name='billing_room_unique_number_per_property')]
+
 class Tenant(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
+    CHANNEL_EMAIL = 'email'
+    CHANNEL_SMS = 'sms'
+    CHANNEL_BOTH = 'email_sms'
+    CHANNEL_NONE = 'none'
+    CHANNEL_CHOICES = [
+        (CHANNEL_EMAIL, 'Email'),
+        (CHANNEL_SMS, 'SMS'),
+        (CHANNEL_BOTH, 'Email and SMS'),
+        (CHANNEL_NONE, 'No reminders'),
+    ]
+    # Users live in the catalog database; tenants may live in a property shard.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    property = models.ForeignKey(Property, on_delete=models.PROTECT, related_name='tenants', db_constraint=False)
     full_name = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
@@ -30,16 +148,30 @@ class Tenant(models.Model):
         max_digits=7, decimal_places=2, null=True, blank=True, default=None,
         help_text="Fixed monthly WiFi charge for this tenant. Leave blank or 0 if not applicable."
     )
+    notification_channel = models.CharField(
+        max_length=10, choices=CHANNEL_CHOICES, default=CHANNEL_EMAIL,
+        help_text="How bill reminders reach the tenant. Without an address for it, SMS falls back to email and vice versa."
+    )
+    meter_share = models.PositiveSmallIntegerField(
+        null=True, blank=True,
+        help_text="Weight of this tenant in a room meter split by fixed shares, e.g. 60 and 40. Blank counts as 1."
+    )
+
+    def clean(self):
+        _check_property_database(self)
+        if self.room_id and self.property_id and self.room.property_id != self.property_id:
+            raise ValidationError({'room': "The room belongs to another property."})
 
     def __str__(self):
         return self.full_name
 
-class Bill(models.Model):
+class Bill(ChangeTrackingMixin, models.Model):
     BILL_TYPE_CHOICES = [
         ('Rent', 'Rent'),
         ('Electricity', 'Electricity'),
         ('Water', 'Water'),
         ('WiFi', 'WiFi'),
+        ('Late Fee', 'Late Fee'),
         ('Other', 'Other'),
     ]
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
@@ -50,11 +182,39 @@ class Bill(models.Model):
     description = models.TextField(blank=True, help_text="Details for 'Other' bill type or specific notes")
     date_created = models.DateTimeField(auto_now_add=True)
     date_updated = models.DateTimeField(auto_now=True)
+    parent_bill = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='late_fees',
+        help_text="For late fees: the overdue bill this fee was charged on."
+    )
+
+    objects = JournaledQuerySet.as_manager()
+    journal_fields = ('tenant_id', 'bill_type', 'amount', 'due_date', 'is_paid', 'description', 'parent_bill_id')
 
     def __str__(self):
         return f"{self.get_bill_type_display()} Bill for {self.tenant.full_name} due on {self.due_date}"
 
-class Payment(models.Model):
+class TenantPayment(models.Model):
+    """A lump sum received from a tenant, spread over their open bills by billing.allocation."""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='tenant_payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    unallocated_amount = models.DecimalField(
+        max_digits=10, decimal_places=2, default=Decimal('0.00'),
+        help_text="Part of the payment not applied to any bill yet. Kept as credit for future bills."
+    )
+    payment_date = models.DateField()
+    payment_method = models.CharField(max_length=255, blank=True, help_text="e.g., Cash, Bank Transfer")
+    notes = models.TextField(blank=True)
+    date_recorded = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.unallocated_amount = self.amount # Nothing is allocated until the allocation engine runs
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Payment of {self.amount} from {self.tenant.full_name} on {self.payment_date}"
+
+class Payment(ChangeTrackingMixin, models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE)
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
@@ -62,10 +222,24 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=255, blank=True, help_text="e.g., Cash, Bank Transfer")
     notes = models.TextField(blank=True)
     date_recorded = models.DateTimeField(auto_now_add=True)
+    tenant_payment = models.ForeignKey(
+        TenantPayment, on_delete=models.CASCADE, null=True, blank=True, related_name='allocations',
+        help_text="The lump-sum payment this amount was allocated from, if any."
+    )
+
+    objects = JournaledQuerySet.as_manager()
+    journal_fields = ('bill_id', 'tenant_id', 'amount_paid', 'payment_date', 'payment_method', 'notes', 'tenant_payment_id')
 
     def __str__(self):
         return f"Payment of {self.amount_paid} for {self.bill}"
 
+def _save_bill_status(bill):
+    # The outbox event is written in the same transaction as the status change.
+    from .outbox import record_bill_event
+    with transaction.atomic(using=router.db_for_write(Bill, instance=bill)):
+        bill.save(update_fields=['is_paid', 'date_updated'])
+        record_bill_event('bill.paid' if bill.is_paid else 'bill.unpaid', bill)
+
 # Signal handlers for Payment model
 @receiver(post_save, sender=Payment)
 def payment_saved_or_updated(sender, instance, created, **kwargs):
@@ -88,10 +262,15 @@ def payment_saved_or_updated(sender, instance, created, **kwargs):
                 status_changed = True
 
         if status_changed:
-            related_bill.save(update_fields=['is_paid', 'date_updated'])
+            _save_bill_status(related_bill)
 
 @receiver(post_delete, sender=Payment)
 def payment_deleted(sender, instance, **kwargs):
+    if instance.tenant_payment_id:
+        # Undoing an allocation gives the amount back to the lump sum as credit.
+        TenantPayment.objects.filter(pk=instance.tenant_payment_id).update(
+            unallocated_amount=F('unallocated_amount') + instance.amount_paid
+        )
     if instance.bill:
         related_bill = instance.bill
         # Bill_model = apps.get_model('billing', 'Bill') # For string sender 'billing.Payment'
@@ -112,7 +291,7 @@ def payment_deleted(sender, instance, **kwargs):
                     status_changed = True
 
             if status_changed:
-                related_bill.save(update_fields=['is_paid', 'date_updated'])
+                _save_bill_status(related_bill)
         except Bill.DoesNotExist: # Changed from related_bill.DoesNotExist to Bill.DoesNotExist
             # The bill was deleted, nothing to do.
             pass
@@ -125,12 +304,356 @@ class ElectricityReading(models.Model):
     consumption = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Calculated consumption (current - previous)")
     unit_price = models.DecimalField(max_digits=6, decimal_places=3, help_text="Price per kWh at the time of reading")
     is_billed = models.BooleanField(default=False, help_text="Has a bill been generated for this reading period?")
+    is_estimate = models.BooleanField(
+        default=False,
+        help_text="Estimated from the tenant's average daily use for a period without a reading; "
+                  "trued up when the next actual reading is billed"
+    )
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Reading for {self.tenant} on {self.reading_date} - {self.reading_value} kWh"
+        estimate = " (estimated)" if self.is_estimate else ""
+        return f"Reading for {self.tenant} on {self.reading_date} - {self.reading_value} kWh{estimate}"
 
     class Meta:
         ordering = ['-reading_date', '-created_at']
         unique_together = [['tenant', 'reading_date']] # Assuming one reading per day per tenant is sufficient
+
+class RoomMeterReading(models.Model):
+    """A reading of the electricity meter a room's tenants share. billing.room_meters
+    splits the consumption since the room's last billed reading between them."""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='meter_readings')
+    reading_date = models.DateField()
+    reading_value = models.DecimalField(max_digits=10, decimal_places=2, help_text="Current meter reading in kWh")
+    previous_reading_value = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Meter reading value from the last bill")
+    consumption = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Calculated consumption (current - previous)")
+    unit_price = models.DecimalField(max_digits=6, decimal_places=3, help_text="Price per kWh at the time of reading")
+    is_billed = models.BooleanField(default=False, help_text="Has the consumption up to this reading been split and billed?")
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Meter reading for room {self.room} on {self.reading_date} - {self.reading_value} kWh"
+
+    class Meta:
+        ordering = ['-reading_date', '-created_at']
+        unique_together = [['room', 'reading_date']]
+
+class RoomMeterAllocation(models.Model):
+    """One tenant's share of a room meter reading and the bill charging it."""
+    reading = models.ForeignKey(RoomMeterReading, on_delete=models.CASCADE, related_name='allocations')
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='meter_allocations')
+    bill = models.OneToOneField(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='meter_allocation')
+    weight = models.PositiveIntegerField(help_text="The tenant's weight in the split: 1, occupancy days or fixed share")
+    consumption = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.tenant}: {self.consumption} kWh of {self.reading}"
+
+    class Meta:
+        unique_together = [['reading', 'tenant']]
+
+class BillingJob(models.Model):
+    JOB_TYPE_CHOICES = [
+        ('generate_rent_bills', 'Generate rent bills'),
+        ('generate_fixed_water_bills', 'Generate fixed water bills'),
+        ('generate_fixed_wifi_bills', 'Generate fixed WiFi bills'),
+        ('send_billing_reminders', 'Send billing reminders'),
+    ]
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    job_type = models.CharField(max_length=64, choices=JOB_TYPE_CHOICES)
+    options = models.JSONField(default=dict, blank=True, help_text="Keyword options passed to the management command")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, help_text="The job will not be picked up before this time")
+    worker_id = models.CharField(max_length=255, blank=True)
+    progress = models.CharField(max_length=255, blank=True, help_text="Last line of output reported by the running job")
+    output = models.TextField(blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_job_type_display()} job #{self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+# --- Archive of settled bills ---
+# Fully paid bills and their payments are moved here by `archive_settled_bills` so that
+# the hot Bill/Payment tables only hold recent activity. Archived rows keep their original
+# primary keys, which is what allows them to be restored unchanged.
+
+class ArchivedBill(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='archived_bills')
+    bill_type = models.CharField(max_length=20, choices=Bill.BILL_TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    due_date = models.DateField()
+    is_paid = models.BooleanField(default=True)
+    description = models.TextField(blank=True)
+    date_created = models.DateTimeField()
+    date_updated = models.DateTimeField()
+    parent_bill_id = models.BigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archived {self.get_bill_type_display()} Bill for {self.tenant.full_name} due on {self.due_date}"
+
+    class Meta:
+        ordering = ['-due_date']
+
+class ArchivedPayment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    bill = models.ForeignKey(ArchivedBill, on_delete=models.CASCADE, related_name='payments')
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='archived_payments')
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_date = models.DateField()
+    payment_method = models.CharField(max_length=255, blank=True)
+    notes = models.TextField(blank=True)
+    date_recorded = models.DateTimeField()
+    tenant_payment = models.ForeignKey(TenantPayment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archived payment of {self.amount_paid} for bill #{self.bill_id}"
+
+class JournalEntry(models.Model):
+    """Append-only record of a change to a Bill or Payment. `changes` holds only the
+    fields that changed (all tracked fields for a create), so replaying a bill's entries
+    in order rebuilds its state at any point in time."""
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('archive', 'Archive'),
+    ]
+    model_name = models.CharField(max_length=20) # 'bill' or 'payment'
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    batch_id = models.UUIDField(null=True, blank=True, help_text="Entries written together (one admin save, one bulk update) share a batch")
+    changed_by = models.CharField(max_length=150, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Journal entries are append-only and cannot be modified.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Journal entries are append-only and cannot be deleted.")
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model_name} #{self.object_id} at {self.recorded_at}"
+
+    class Meta:
+        ordering = ['recorded_at', 'id']
+        verbose_name_plural = 'journal entries'
+        indexes = [models.Index(fields=['model_name', 'object_id', 'recorded_at'])]
+
+class SearchDocument(models.Model):
+    """Denormalised search text for one Tenant, Bill or Payment, maintained by billing.search.
+    The full-text index over `body` (FTS5 on SQLite, a tsvector GIN index on PostgreSQL)
+    is created by migration 0010, outside the ORM. The primary key encodes the object
+    (see billing.search.document_id), so a full-text match yields object ids without a
+    join back to this table."""
+    id = models.BigIntegerField(primary_key=True)
+    model_name = models.CharField(max_length=20) # 'tenant', 'bill' or 'payment'
+    object_id = models.BigIntegerField()
+    body = models.TextField()
+
+    def __str__(self):
+        return f"Search document for {self.model_name} #{self.object_id}"
+
+class LeasePeriod(models.Model):
+    """A tenant's lease on a room, mirrored from Tenant by billing.availability and indexed
+    by (room, start_date, end_date) so availability is read from one ordered range scan."""
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, related_name='lease_period')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='lease_periods')
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True, help_text="Last day of the lease. Empty for open-ended leases.")
+
+    def __str__(self):
+        return f"{self.tenant} in room {self.room} from {self.start_date} to {self.end_date or 'open end'}"
+
+    class Meta:
+        indexes = [models.Index(fields=['room', 'start_date', 'end_date'])]
+
+class OutboxEvent(models.Model):
+    """A bill or payment event waiting to be delivered to one external destination (see
+    billing.outbox). Rows are written in the same transaction as the change they describe
+    and delivered afterwards by `dispatch_outbox`, so a slow or unreachable receiver never
+    holds up billing. Ids only; no foreign keys, so events outlive archived or deleted bills."""
+    EVENT_TYPE_CHOICES = [
+        ('bill.created', 'Bill created'),
+        ('bill.paid', 'Bill paid'),
+        ('bill.unpaid', 'Bill no longer paid'),
+    ]
+    event_id = models.UUIDField(default=uuid.uuid4, editable=False, help_text="Sent with the event; receivers use it to drop duplicates")
+    destination = models.CharField(max_length=50, help_text="Key of settings.BILLING_OUTBOX_DESTINATIONS")
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPE_CHOICES)
+    tenant_id = models.BigIntegerField()
+    bill_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_event_type_display()} for bill #{self.bill_id} to {self.destination}"
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['destination', 'delivered_at', 'id'])]
+
+class BankStatement(models.Model):
+    """An imported bank statement file. Its lines are matched to open bills by
+    billing.reconciliation; lines it could not match confidently wait for review."""
+    filename = models.CharField(max_length=255)
+    imported_at = models.DateTimeField(auto_now_add=True)
+    # Users live in the catalog database; statements may live in a property shard.
+    imported_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
+    line_count = models.PositiveIntegerField(default=0)
+    matched_count = models.PositiveIntegerField(default=0, help_text="Lines paid automatically at import")
+
+    def __str__(self):
+        return f"{self.filename} ({self.imported_at:%Y-%m-%d})"
+
+    class Meta:
+        ordering = ['-imported_at']
+
+class BankStatementLine(models.Model):
+    STATUS_MATCHED = 'matched'
+    STATUS_REVIEW = 'review'
+    STATUS_UNMATCHED = 'unmatched'
+    STATUS_IGNORED = 'ignored'
+    STATUS_CHOICES = [
+        (STATUS_MATCHED, 'Matched'),
+        (STATUS_REVIEW, 'Needs review'),
+        (STATUS_UNMATCHED, 'No match'),
+        (STATUS_IGNORED, 'Ignored'),
+    ]
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name='lines')
+    line_number = models.PositiveIntegerField()
+    transaction_date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payer = models.CharField(max_length=255, blank=True)
+    memo = models.TextField(blank=True)
+    fingerprint = models.CharField(max_length=40, unique=True, help_text="Identifies the line across overlapping statement exports")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_REVIEW)
+    score = models.PositiveSmallIntegerField(default=0, help_text="Confidence of the best candidate, 0-100")
+    candidates = models.JSONField(
+        default=list, blank=True, encoder=DjangoJSONEncoder,
+        help_text="Best matching bills: [{'bill_id', 'tenant_id', 'score', 'reasons'}], best first"
+    )
+    payment = models.OneToOneField('Payment', on_delete=models.SET_NULL, null=True, blank=True, related_name='statement_line')
+
+    def __str__(self):
+        return f"Line {self.line_number} of {self.statement}: {self.amount} from {self.payer or 'unknown'}"
+
+    class Meta:
+        ordering = ['statement', 'line_number']
+        indexes = [models.Index(fields=['status', 'statement'])]
+
+class NotificationLog(models.Model):
+    """One message sent (or attempted) to a tenant by billing.notifications."""
+    STATUS_QUEUED = 'queued'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='notifications')
+    bill = models.ForeignKey(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    kind = models.CharField(max_length=30, help_text="e.g. upcoming_due_reminder, overdue_bill_reminder")
+    channel = models.CharField(max_length=20)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    provider_message_id = models.CharField(max_length=100, blank=True, help_text="Id given by the SMS gateway or mail server, if any")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} via {self.channel} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at']), models.Index(fields=['bill', 'kind'])]
+
+class LedgerEntry(models.Model):
+    """A debit (what the tenant owes more) or credit (what they owe less) on a tenant's
+    account. Entries mirror bills, payments and lump-sum payments (see billing.ledger) and
+    refer to them by source and id only, so they outlive archiving; adjustments are
+    entered by hand. A tenant's balance is the sum of debit - credit."""
+    KIND_CHARGE = 'charge'
+    KIND_FEE = 'fee'
+    KIND_PAYMENT = 'payment'
+    KIND_CREDIT = 'credit'
+    KIND_ADJUSTMENT = 'adjustment'
+    KIND_CHOICES = [
+        (KIND_CHARGE, 'Charge'),
+        (KIND_FEE, 'Late fee'),
+        (KIND_PAYMENT, 'Payment'),
+        (KIND_CREDIT, 'Lump-sum payment'),
+        (KIND_ADJUSTMENT, 'Adjustment'),
+    ]
+    SOURCE_BILL = 'bill'
+    SOURCE_PAYMENT = 'payment'
+    SOURCE_TENANT_PAYMENT = 'tenant_payment'
+    SOURCE_MANUAL = 'manual'
+    SOURCE_CHOICES = [
+        (SOURCE_BILL, 'Bill'),
+        (SOURCE_PAYMENT, 'Payment'),
+        (SOURCE_TENANT_PAYMENT, 'Tenant payment'),
+        (SOURCE_MANUAL, 'Entered by hand'),
+    ]
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='ledger_entries')
+    entry_date = models.DateField(help_text="Bills count from the day they were created, payments from their payment date")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    debit = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    credit = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    description = models.CharField(max_length=255, blank=True)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_MANUAL)
+    source_id = models.BigIntegerField(null=True, blank=True, help_text="Id of the bill or payment (hot or archived)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def clean(self):
+        if (self.debit or 0) < 0 or (self.credit or 0) < 0:
+            raise ValidationError("Debit and credit can't be negative.")
+        if bool(self.debit) == bool(self.credit):
+            raise ValidationError("Enter either a debit (the tenant owes more) or a credit (the tenant owes less).")
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.debit or self.credit} for {self.tenant} on {self.entry_date}"
+
+    class Meta:
+        verbose_name_plural = 'ledger entries'
+        ordering = ['tenant', 'entry_date', 'id']
+        constraints = [
+            # Adjustments have no source_id; NULLs never conflict.
+            models.UniqueConstraint(fields=['source', 'source_id'], name='billing_ledger_unique_source'),
+        ]
+        indexes = [models.Index(fields=['tenant', 'entry_date', 'id'])]
@@ -0,0 +1,179 @@
+# billing/money.py
+# Money arithmetic in integer minor units. Bulk computations (fee accrual, proration,
+# reconciliation, analytics) convert their Decimal amounts to integers once, work on
+# NumPy int64 arrays, and convert back to Decimal only when saving. Every operation that
+# can produce fractions of a unit takes an explicit rounding mode (the decimal module's
+# constants), and results are identical to computing exactly with Decimal and then
+# quantizing with that mode.
+#
+# Intermediate products that could exceed int64 are computed on Python integers
+# instead (an object array), which is slower but still exact. Without NumPy the same
+# functions fall back to plain lists.
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, ROUND_HALF_UP, ROUND_UP, Decimal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CENT_PLACES = 2
+ROUNDING_MODES = (ROUND_HALF_UP, ROUND_HALF_EVEN, ROUND_DOWN, ROUND_UP)
+_INT64_LIMIT = 2 ** 62 # Headroom below 2**63 for the rounding adjustments
+
+
+def minor_units(value, places=CENT_PLACES):
+    """`value` (Decimal, int or numeric string) as an integer number of 10**-places units.
+    Raises ValueError if it has more decimal places than that."""
+    scaled = Decimal(value).scaleb(places)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"{value} has more than {places} decimal place(s).")
+    return int(scaled)
+
+
+def from_minor_units(value, places=CENT_PLACES):
+    """Decimal with exactly `places` decimal places for an integer count of minor units."""
+    return Decimal(int(value)).scaleb(-places)
+
+
+def quantize(value, places=CENT_PLACES, rounding=ROUND_HALF_UP):
+    """A single Decimal rounded to `places`; the scalar counterpart of the array functions."""
+    return Decimal(value).quantize(Decimal(1).scaleb(-places), rounding=rounding)
+
+
+def to_minor(values, places=CENT_PLACES):
+    """Minor units of each value, as an int64 array (a list without NumPy). None counts as zero."""
+    units = [0 if value is None else minor_units(value, places) for value in values]
+    if np is None:
+        return units
+    return _array(units)
+
+
+def from_minor(values, places=CENT_PLACES):
+    """List of Decimals for an array of minor units; the way back at the persistence boundary."""
+    return [from_minor_units(value, places) for value in values]
+
+
+def rate_parts(rate):
+    """(numerator, places) with rate == numerator * 10**-places exactly, e.g. '0.005' -> (5, 3)."""
+    sign, digits, exponent = Decimal(rate).as_tuple()
+    places = max(-exponent, 0)
+    return minor_units(rate, places), places
+
+
+def _array(units):
+    """int64 array, or an object array of Python ints if a value is out of int64 range."""
+    if any(abs(unit) >= _INT64_LIMIT for unit in units):
+        return np.array(units, dtype=object)
+    return np.array(units, dtype=np.int64)
+
+
+def _widen(arrays, bound):
+    """The arrays as int64, or as Python-int object arrays when `bound`, the largest
+    magnitude an intermediate result can reach, does not fit in int64."""
+    if bound < _INT64_LIMIT:
+        return [array if array.dtype == object else array.astype(np.int64) for array in arrays]
+    return [array.astype(object) for array in arrays]
+
+
+def _max_abs(array):
+    if np is None:
+        return max((abs(value) for value in array), default=0)
+    return int(np.max(np.abs(array))) if len(array) else 0
+
+
+def _round_div_scalar(numerator, denominator, rounding):
+    negative = (numerator < 0) != (denominator < 0)
+    quotient, remainder = divmod(abs(numerator), abs(denominator))
+    denominator = abs(denominator)
+    if rounding == ROUND_HALF_UP:
+        quotient += 2 * remainder >= denominator
+    elif rounding == ROUND_HALF_EVEN:
+        quotient += 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2 == 1)
+    elif rounding == ROUND_UP:
+        quotient += remainder > 0
+    elif rounding != ROUND_DOWN:
+        raise ValueError(f"Unsupported rounding mode: {rounding}")
+    return -quotient if negative else quotient
+
+
+def round_div(numerators, denominator, rounding=ROUND_HALF_UP):
+    """numerators / denominator (a positive int) rounded to integers with `rounding`,
+    the way Decimal.quantize rounds: ROUND_HALF_UP and ROUND_UP go away from zero."""
+    if denominator <= 0:
+        raise ValueError("The denominator must be positive.")
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Unsupported rounding mode: {rounding}")
+    if np is None:
+        return [_round_div_scalar(numerator, denominator, rounding) for numerator in numerators]
+    numerators = np.asarray(numerators)
+    negative = numerators < 0
+    magnitude = np.where(negative, -numerators, numerators)
+    quotient, remainder = magnitude // denominator, magnitude % denominator
+    if rounding == ROUND_HALF_UP:
+        quotient = quotient + (2 * remainder >= denominator)
+    elif rounding == ROUND_HALF_EVEN:
+        quotient = quotient + ((2 * remainder > denominator) | ((2 * remainder == denominator) & (quotient % 2 == 1)))
+    elif rounding == ROUND_UP:
+        quotient = quotient + (remainder > 0)
+    return np.where(negative, -quotient, quotient)
+
+
+def multiply(a, a_places, b, b_places, places=CENT_PLACES, rounding=ROUND_HALF_UP):
+    """Element-wise a * b rounded to `places`, where a and b are minor units with
+    a_places and b_places decimals (e.g. kWh with 2 and a unit price with 3)."""
+    shift = a_places + b_places - places
+    if np is None:
+        products = [x * y for x, y in zip(a, b)]
+    else:
+        a, b = _widen([np.asarray(a), np.asarray(b)], _max_abs(a) * _max_abs(b))
+        products = a * b
+    if shift <= 0:
+        return [value * 10 ** -shift for value in products] if np is None else products * 10 ** -shift
+    return round_div(products, 10 ** shift, rounding)
+
+
+def scale(amounts, factor, places=CENT_PLACES, rounding=ROUND_HALF_UP):
+    """Each amount (minor units with `places` decimals) times a Decimal `factor`, rounded back to `places`."""
+    numerator, factor_places = rate_parts(factor)
+    if np is None:
+        return round_div([amount * numerator for amount in amounts], 10 ** factor_places, rounding)
+    (amounts,) = _widen([np.asarray(amounts)], _max_abs(amounts) * abs(numerator))
+    return round_div(amounts * numerator, 10 ** factor_places, rounding)
+
+
+def prorate(amounts, numerators, denominator, rounding=ROUND_HALF_UP):
+    """amount * numerator / denominator for each amount, e.g. rent for 12 of 30 days."""
+    if np is None:
+        return round_div([amount * n for amount, n in zip(amounts, numerators)], denominator, rounding)
+    amounts, numerators = _widen([np.asarray(amounts), np.asarray(numerators)], _max_abs(amounts) * _max_abs(numerators))
+    return round_div(amounts * numerators, denominator, rounding)
+
+
+def allocate(total, weights):
+    """Split `total` minor units in proportion to non-negative integer `weights`, so that the
+    shares add up to exactly `total`: each share is rounded down, and the units left over go
+    one each to the largest remainders (ties to the earlier weight)."""
+    weights = list(weights)
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise ValueError("At least one weight must be positive.")
+    if any(weight < 0 for weight in weights):
+        raise ValueError("Weights must not be negative.")
+    sign = -1 if total < 0 else 1
+    products = [abs(total) * weight for weight in weights]
+    shares = [product // weight_sum for product in products]
+    remainders = [product % weight_sum for product in products]
+    leftover = abs(total) - sum(shares)
+    for index in sorted(range(len(weights)), key=lambda i: -remainders[i])[:leftover]:
+        shares[index] += 1
+    return [sign * share for share in shares]
+
+
+def total(amounts):
+    """Exact sum of minor units, as a Python int."""
+    if np is None or not len(amounts):
+        return int(sum(amounts))
+    array = np.asarray(amounts)
+    if array.dtype != object and _max_abs(array) * len(array) >= _INT64_LIMIT:
+        array = array.astype(object)
+    return int(array.sum())
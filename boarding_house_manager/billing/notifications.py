@@ -0,0 +1,297 @@
+# billing/notifications.py
+# Messages to tenants (bill reminders from `manage.py send_billing_reminders`) over
+# pluggable channels. settings.BILLING_NOTIFICATION_CHANNELS maps a channel name to its
+# class: 'email' renders the billing/email/ templates and sends through Django's mail
+# backend; 'sms' renders billing/sms/ and hands the text to the gateway configured in
+# settings.BILLING_SMS_GATEWAY (FileSmsGateway appends to a local file, HttpSmsGateway
+# POSTs to an HTTP gateway such as `manage.py sms_gateway_stub`). Tenant.notification_channel
+# picks the channels per tenant.
+#
+# Every message is logged as a NotificationLog row before it is sent. Dispatcher then
+# sends the messages from a pool of worker threads, each channel held to its rate limit
+# (settings.BILLING_NOTIFICATION_RATE_LIMITS, messages per second) so a slow SMTP server
+# or gateway doesn't hold up the rest, and records the outcome of every message. Only the
+# calling thread touches the database.
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import NotificationLog, Tenant
+
+DEFAULT_CHANNELS = {
+    'email': 'billing.notifications.EmailChannel',
+    'sms': 'billing.notifications.SmsChannel',
+}
+DEFAULT_WORKERS = 8
+DEFAULT_RATE_LIMITS = {'email': 10.0, 'sms': 1.0}
+SMS_MAX_LENGTH = 459 # Three concatenated GSM segments
+STATUS_BATCH_SIZE = 200 # Outcomes saved per bulk update
+
+# Channels for each Tenant.notification_channel, in order of preference.
+PREFERENCES = {
+    Tenant.CHANNEL_EMAIL: ('email',),
+    Tenant.CHANNEL_SMS: ('sms',),
+    Tenant.CHANNEL_BOTH: ('email', 'sms'),
+    Tenant.CHANNEL_NONE: (),
+}
+FALLBACKS = {'email': 'sms', 'sms': 'email'}
+
+
+class NotificationError(Exception):
+    """A channel or gateway could not deliver a message."""
+
+
+# --- Channels -------------------------------------------------------------------------
+
+class Channel:
+    """Base class of channel plugins. Channels are shared by the worker threads."""
+    name = None
+
+    def address(self, tenant):
+        """The tenant's address on this channel, or '' if there is none."""
+        raise NotImplementedError
+
+    def render(self, kind, context):
+        """(subject, body) of a `kind` message."""
+        raise NotImplementedError
+
+    def send(self, recipient, subject, body):
+        """Deliver one message and return the provider's message id ('' if none).
+        Raises on failure."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class EmailChannel(Channel):
+    name = 'email'
+
+    def __init__(self):
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def address(self, tenant):
+        return tenant.email
+
+    def render(self, kind, context):
+        subject = render_to_string(f'billing/email/{kind}_subject.txt', context).strip()
+        return subject, render_to_string(f'billing/email/{kind}_body.txt', context)
+
+    def _connection(self):
+        # One mail connection per worker thread, kept open for the whole dispatch.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = get_connection()
+            connection.open()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def send(self, recipient, subject, body):
+        message = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient], connection=self._connection())
+        if not message.send():
+            raise NotificationError("The mail backend did not accept the message.")
+        return ''
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+
+class SmsChannel(Channel):
+    name = 'sms'
+
+    def __init__(self, gateway=None):
+        self.gateway = gateway or load_gateway()
+
+    def address(self, tenant):
+        return ''.join(c for c in tenant.phone_number if c.isdigit() or c == '+')
+
+    def render(self, kind, context):
+        text = ' '.join(render_to_string(f'billing/sms/{kind}.txt', context).split())
+        return '', text[:SMS_MAX_LENGTH]
+
+    def send(self, recipient, subject, body):
+        return self.gateway.send(recipient, body)
+
+
+# --- SMS gateways ---------------------------------------------------------------------
+
+class SmsGateway:
+    def send(self, to, text):
+        """Submit one SMS and return the gateway's message id. Raises NotificationError."""
+        raise NotImplementedError
+
+
+class FileSmsGateway(SmsGateway):
+    """Appends each SMS as a JSON line to `path` instead of sending it; for development."""
+
+    def __init__(self, path, sender=''):
+        self.path = path
+        self.sender = sender
+        self._lock = threading.Lock()
+
+    def send(self, to, text):
+        message_id = uuid.uuid4().hex
+        line = json.dumps({'id': message_id, 'from': self.sender, 'to': to, 'text': text, 'at': timezone.now().isoformat()})
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        return message_id
+
+
+class HttpSmsGateway(SmsGateway):
+    """POSTs {"from", "to", "text"} as JSON to `url`; a 2xx answer may name the message "id"."""
+
+    def __init__(self, url, headers=None, timeout=10, sender=''):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.sender = sender
+
+    def send(self, to, text):
+        body = json.dumps({'from': self.sender, 'to': to, 'text': text}).encode()
+        request = urllib.request.Request(
+            self.url, data=body, method='POST', headers={'Content-Type': 'application/json', **self.headers}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                answer = response.read()
+        except urllib.error.HTTPError as e:
+            raise NotificationError(f"HTTP {e.code} from the SMS gateway")
+        except (urllib.error.URLError, OSError) as e:
+            raise NotificationError(f"SMS gateway unreachable: {getattr(e, 'reason', e)}")
+        try:
+            return str(json.loads(answer).get('id', ''))[:100]
+        except (ValueError, AttributeError):
+            return ''
+
+
+def load_gateway():
+    """The SMS gateway of settings.BILLING_SMS_GATEWAY: {'backend': dotted path, **its arguments}."""
+    config = dict(getattr(settings, 'BILLING_SMS_GATEWAY', None) or {})
+    backend = config.pop('backend', None)
+    if not backend:
+        raise NotificationError("settings.BILLING_SMS_GATEWAY is not configured.")
+    return import_string(backend)(**config)
+
+
+def load_channels():
+    """{name: channel instance} of settings.BILLING_NOTIFICATION_CHANNELS."""
+    configured = getattr(settings, 'BILLING_NOTIFICATION_CHANNELS', DEFAULT_CHANNELS)
+    return {name: import_string(path)() for name, path in configured.items()}
+
+
+# --- Building and sending -------------------------------------------------------------
+
+def channels_for(tenant, channels, recipients=None):
+    """[(channel name, address)] to reach `tenant` on, following its notification_channel.
+    A preferred channel the tenant has no address for falls back to the other one.
+    `recipients` ({channel name: address}) replaces every tenant's address, for testing;
+    once any is given, channels without one are skipped so no real tenant is messaged."""
+    testing = any((recipients or {}).values())
+    found = []
+    for name in PREFERENCES.get(tenant.notification_channel, ('email',)):
+        for candidate in (name, FALLBACKS.get(name)):
+            channel = channels.get(candidate)
+            address = channel and (recipients.get(candidate) if testing else channel.address(tenant))
+            if address:
+                if candidate not in dict(found):
+                    found.append((candidate, address))
+                break
+    return found
+
+
+def build(kind, bills, channels, recipients=None):
+    """Unsaved NotificationLog rows for a `kind` message about each bill (tenant loaded),
+    and the bills whose tenant can't be reached on any channel."""
+    messages, unreachable = [], []
+    for bill in bills:
+        targets = channels_for(bill.tenant, channels, recipients)
+        if not targets and bill.tenant.notification_channel != Tenant.CHANNEL_NONE:
+            unreachable.append(bill)
+        context = {'bill': bill, 'tenant': bill.tenant}
+        for name, address in targets:
+            subject, body = channels[name].render(kind, context)
+            messages.append(NotificationLog(
+                tenant=bill.tenant, bill=bill, kind=kind, channel=name, recipient=address[:254],
+                subject=subject[:255], body=body,
+            ))
+    return messages, unreachable
+
+
+class RateLimiter:
+    """Spaces calls from any number of threads `1 / rate` seconds apart (no limit if rate is falsy)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Dispatcher:
+    def __init__(self, channels, workers=None, rate_limits=None):
+        self.channels = channels
+        self.workers = workers or getattr(settings, 'BILLING_NOTIFICATION_WORKERS', DEFAULT_WORKERS)
+        rate_limits = {**DEFAULT_RATE_LIMITS, **(rate_limits or getattr(settings, 'BILLING_NOTIFICATION_RATE_LIMITS', {}))}
+        self.limiters = {name: RateLimiter(rate_limits.get(name)) for name in channels}
+
+    def _deliver(self, message):
+        self.limiters[message.channel].wait()
+        try:
+            message.provider_message_id = self.channels[message.channel].send(
+                message.recipient, message.subject, message.body
+            ) or ''
+        except Exception as e: # Any failure is the message's outcome, not the run's
+            message.status, message.error = NotificationLog.STATUS_FAILED, str(e) or e.__class__.__name__
+        else:
+            message.status, message.sent_at = NotificationLog.STATUS_SENT, timezone.now()
+        return message
+
+    def _save_outcomes(self, messages):
+        NotificationLog.objects.bulk_update(messages, ['status', 'provider_message_id', 'error', 'sent_at'], batch_size=500)
+
+    def send(self, messages):
+        """Log `messages` as queued, send them concurrently and record each outcome.
+        Returns {status: count}."""
+        NotificationLog.objects.bulk_create(messages, batch_size=500)
+        counts = Counter({NotificationLog.STATUS_SENT: 0, NotificationLog.STATUS_FAILED: 0})
+        done = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='notify') as pool:
+                for future in as_completed([pool.submit(self._deliver, message) for message in messages]):
+                    message = future.result()
+                    counts[message.status] += 1
+                    done.append(message)
+                    if len(done) >= STATUS_BATCH_SIZE:
+                        self._save_outcomes(done)
+                        done = []
+        finally:
+            if done:
+                self._save_outcomes(done)
+            for channel in self.channels.values():
+                channel.close()
+        return dict(counts)
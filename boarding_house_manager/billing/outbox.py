@@ -0,0 +1,154 @@
+# billing/outbox.py
+# Transactional outbox for bill and payment events. Billing code calls record_bill_event()
+# (or create_bill()) inside the transaction that makes the change, which writes one
+# OutboxEvent row per destination in settings.BILLING_OUTBOX_DESTINATIONS. The
+# `dispatch_outbox` command delivers the rows afterwards in batches over HTTP, so network
+# latency and receiver outages stay out of the billing transaction.
+#
+# Delivery is at least once: a batch is marked delivered only after the receiver answered
+# 2xx, and a failed batch is retried as a whole with exponential backoff, so receivers
+# must drop duplicates by event id. Events of one tenant reach a destination in the
+# order they were written: while a tenant's oldest pending event waits for its retry,
+# none of that tenant's later events are sent. Run one dispatcher at a time.
+import http.client
+import json
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import Bill, OutboxEvent
+
+RETRY_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+# Pending events read per batch, as a multiple of the batch size; leaves room to skip
+# events of tenants that are waiting for a retry.
+SCAN_FACTOR = 5
+
+
+def destinations():
+    """{name: {'url': ..., 'headers': {...}, 'timeout': seconds}} from settings."""
+    configured = getattr(settings, 'BILLING_OUTBOX_DESTINATIONS', {})
+    return {
+        name: {'url': config['url'], 'headers': config.get('headers', {}), 'timeout': config.get('timeout', 10)}
+        for name, config in configured.items()
+    }
+
+
+def bill_payload(bill):
+    return {
+        'bill_id': bill.pk,
+        'tenant_id': bill.tenant_id,
+        'property_id': bill.tenant.property_id,
+        'bill_type': bill.bill_type,
+        'amount': bill.amount,
+        'due_date': bill.due_date,
+        'is_paid': bill.is_paid,
+        'description': bill.description,
+    }
+
+
+def record_bill_event(event_type, bill):
+    """Queue `event_type` for `bill` to every destination. Call it inside the transaction
+    that changes the bill; the event is then committed (or rolled back) with the change."""
+    return record_bill_events(event_type, [bill])
+
+
+def record_bill_events(event_type, bills):
+    """record_bill_event for many bills, with one insert. Bills should have their tenant loaded."""
+    names = destinations()
+    if not names:
+        return []
+    now = timezone.now()
+    events = []
+    for bill in bills:
+        # Round-trip through JSON now so the stored payload matches what will be sent.
+        payload = json.loads(json.dumps(bill_payload(bill), cls=DjangoJSONEncoder))
+        events.extend(
+            OutboxEvent(
+                destination=name, event_type=event_type, tenant_id=bill.tenant_id, bill_id=bill.pk,
+                payload=payload, created_at=now, next_attempt_at=now,
+            )
+            for name in names
+        )
+    return OutboxEvent.objects.bulk_create(events, batch_size=500)
+
+
+def create_bill(**fields):
+    """Bill.objects.create(**fields) and its 'bill.created' event, in one transaction."""
+    with transaction.atomic(using=router.db_for_write(Bill)):
+        bill = Bill.objects.create(**fields)
+        record_bill_event('bill.created', bill)
+    return bill
+
+
+def next_batch(destination, batch_size, now=None):
+    """The next events to send to `destination`, oldest first, skipping every tenant whose
+    oldest pending event is not due yet (so per-tenant order holds across retries)."""
+    now = now or timezone.now()
+    pending = OutboxEvent.objects.filter(destination=destination, delivered_at__isnull=True).order_by('id')
+    batch = []
+    waiting_tenants = set()
+    for event in pending[:batch_size * SCAN_FACTOR]:
+        if event.tenant_id in waiting_tenants:
+            continue
+        if event.next_attempt_at > now:
+            waiting_tenants.add(event.tenant_id)
+            continue
+        batch.append(event)
+        if len(batch) == batch_size:
+            break
+    return batch
+
+
+def event_message(event):
+    return {
+        'id': str(event.event_id),
+        'type': event.event_type,
+        'occurred_at': event.created_at.isoformat(),
+        'tenant_id': event.tenant_id,
+        'bill_id': event.bill_id,
+        'data': event.payload,
+    }
+
+
+def post_events(config, events):
+    """POST a batch to a destination. Raises on anything but a 2xx answer."""
+    body = json.dumps({'events': [event_message(event) for event in events]}, cls=DjangoJSONEncoder).encode()
+    request = urllib.request.Request(
+        config['url'], data=body, method='POST',
+        headers={'Content-Type': 'application/json', **config['headers']},
+    )
+    with urllib.request.urlopen(request, timeout=config['timeout']) as response:
+        response.read()
+
+
+def dispatch_batch(destination, config, batch_size):
+    """Send one batch to `destination`. Returns (sent, failed) event counts; (0, 0) when
+    nothing is due."""
+    events = next_batch(destination, batch_size)
+    if not events:
+        return 0, 0
+    ids = [event.pk for event in events]
+    try:
+        post_events(config, events)
+    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            backoff = min(RETRY_BACKOFF_SECONDS * (2 ** (event.attempts - 1)), MAX_BACKOFF_SECONDS)
+            event.next_attempt_at = now + timezone.timedelta(seconds=backoff)
+            event.last_error = f"{type(e).__name__}: {e}"[:1000]
+        OutboxEvent.objects.bulk_update(events, ['attempts', 'next_attempt_at', 'last_error'])
+        return 0, len(events)
+    OutboxEvent.objects.filter(pk__in=ids).update(delivered_at=timezone.now(), last_error='')
+    return len(events), 0
+
+
+def purge_delivered(older_than_days):
+    cutoff = timezone.now() - timezone.timedelta(days=older_than_days)
+    deleted, _ = OutboxEvent.objects.filter(delivered_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,61 @@
+# billing/pdf.py
+# Minimal pure-Python PDF writer for plain-text documents (invoices, statements).
+# It only knows one built-in font, which keeps it dependency-free and fast enough
+# to run inside worker processes.
+
+PAGE_WIDTH = 595 # A4 in points
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT
+
+
+def _escape(text):
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def _page_stream(lines):
+    parts = [f"BT /F1 {FONT_SIZE} Tf {LINE_HEIGHT} TL {MARGIN} {PAGE_HEIGHT - MARGIN} Td"]
+    for line in lines:
+        parts.append(f"({_escape(line.expandtabs(4))}) Tj T*")
+    parts.append("ET")
+    return "\n".join(parts).encode('latin-1')
+
+
+def render_text_pdf(text, title=''):
+    """Return the bytes of a PDF that lays `text` out line by line in Courier."""
+    lines = text.splitlines() or ['']
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+
+    # Object numbers: 1 catalog, 2 page tree, 3 font, 4 info, then (page, content) pairs.
+    objects = {
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+        4: f"<< /Title ({_escape(title)}) /Producer (billing.pdf) >>".encode('latin-1'),
+    }
+    page_refs = []
+    for index, page_lines in enumerate(pages):
+        page_obj, content_obj = 5 + index * 2, 6 + index * 2
+        stream = _page_stream(page_lines)
+        objects[content_obj] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        objects[page_obj] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_obj} 0 R >>"
+        ).encode('latin-1')
+        page_refs.append(f"{page_obj} 0 R")
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(pages)} >>".encode('latin-1')
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref_offset = len(output)
+    size = max(objects) + 1
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for number in range(1, size):
+        output += b"%010d 00000 n \n" % offsets[number]
+    output += b"trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset)
+    return bytes(output)
@@ -0,0 +1,328 @@
+# billing/reconciliation.py
+# Matches bank statement lines to open bills (`manage.py reconcile_statement` and the
+# bank statement upload in the admin). All open bills of the database are loaded once
+# into hash indexes: by outstanding amount in cents, by the tokens of their tenant's
+# name, by the tenant's phone number and by bill id. Each statement line then looks up
+# its candidates in those indexes and scores them, in one pass over the statement:
+#
+#   bill reference in the memo ("Bill 123", "INV-123", "#123")   +50
+#   amount equals what is outstanding on the bill                 +40  (the bill's full amount: +30)
+#   payer/memo contain the tenant's full name                      +40  (half of its words: +20)
+#   memo contains the tenant's phone number                        +40
+#
+# A line whose best candidate reaches AUTO_MATCH_SCORE, beats every other tenant's
+# candidates by MIN_MARGIN and doesn't pay more than is outstanding becomes a Payment
+# right away; between a tenant's equally good bills the oldest due is paid, as the
+# allocation engine does. Other lines are stored with their best candidates and wait
+# for review in the admin. Lines are fingerprinted, so importing overlapping statement
+# exports never pays a line twice.
+import csv
+import datetime
+import hashlib
+import io
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import router, transaction
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import money
+from .models import BankStatement, BankStatementLine, Bill, Payment, Tenant
+from .outbox import record_bill_events
+
+AUTO_MATCH_SCORE = 80
+MIN_MARGIN = 15
+REVIEW_SCORE = 30
+MAX_CANDIDATES = 5
+AMOUNT_ONLY_LIMIT = 20 # Amount-only candidates are listed when no more bills than this share the amount
+COMMON_TOKEN_LIMIT = 500 # Name words shared by more tenants than this are too common to look up
+PHONE_DIGITS = 7 # Phone numbers are compared on their last digits
+PAYMENT_METHOD = 'Bank transfer'
+
+# Statement CSV header names accepted for each field (lower case, spaces as underscores).
+HEADER_ALIASES = {
+    'date': ('date', 'transaction_date', 'value_date', 'booking_date', 'posting_date'),
+    'amount': ('amount', 'credit', 'paid_in', 'deposit'),
+    'payer': ('payer', 'name', 'payer_name', 'counterparty', 'from'),
+    'memo': ('memo', 'description', 'details', 'narrative', 'reference', 'remittance_information'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%Y')
+
+REFERENCE_PATTERN = re.compile(r'\b(?:bill|inv(?:oice)?)\s*(?:no\.?|number)?\s*[#:.\-]?\s*(\d{1,12})\b|#(\d{1,12})\b', re.IGNORECASE)
+DIGITS_PATTERN = re.compile(r'\+?\d[\d\s\-]{5,}\d')
+
+
+class StatementFileError(ValueError):
+    """The statement file can't be read (format, encoding, header)."""
+
+
+def tokens(text):
+    """Lower-case ASCII words of two or more letters, accents removed."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return re.findall(r'[a-z]{2,}', text)
+
+
+def phone_key(text):
+    digits = re.sub(r'\D', '', text or '')
+    return digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else None
+
+
+def _parse_date(value, date_formats):
+    for date_format in date_formats:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"'{value}' is not a date ({', '.join(date_formats)}).")
+
+
+def _parse_amount(value):
+    text = value.replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        amount = Decimal(text.strip('()').lstrip('$€£'))
+        money.minor_units(amount)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"'{value}' is not an amount.")
+    return -amount if negative else amount
+
+
+def read_statement(file, date_formats=DATE_FORMATS):
+    """Statement lines of a bank CSV export as (records, errors). Each record is a dict
+    with line, date, amount, payer, memo and fingerprint; errors are (line, message)."""
+    try:
+        text = file.read()
+        text = text.decode('utf-8-sig') if isinstance(text, bytes) else text
+    except UnicodeDecodeError:
+        raise StatementFileError("Statement files must be UTF-8 encoded CSV.")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(io.StringIO(text), dialect)
+    header = [name.strip().lower().replace(' ', '_') for name in next(rows, [])]
+    columns = {field: [i for i, name in enumerate(header) if name in aliases] for field, aliases in HEADER_ALIASES.items()}
+    if not columns['date'] or not columns['amount']:
+        raise StatementFileError(
+            f"The statement needs a date and an amount column; found: {', '.join(header) or 'no header'}."
+        )
+
+    records, errors, seen = [], [], Counter()
+    for line, row in enumerate(rows, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        cells = {field: [row[i].strip() for i in indexes if i < len(row) and row[i].strip()] for field, indexes in columns.items()}
+        try:
+            # The first non-empty date/amount column counts (e.g. 'Credit' when 'Amount' is blank).
+            date = _parse_date(next(iter(cells['date']), ''), date_formats)
+            amount = _parse_amount(next(iter(cells['amount']), ''))
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        payer, memo = ' '.join(cells['payer']), ' '.join(cells['memo'])
+        key = f"{date}|{amount}|{payer}|{memo}"
+        seen[key] += 1 # Identical lines in one export are different transactions
+        fingerprint = hashlib.sha1(f"{key}|{seen[key]}".encode()).hexdigest()
+        records.append({'line': line, 'date': date, 'amount': amount, 'payer': payer, 'memo': memo, 'fingerprint': fingerprint})
+    return records, errors
+
+
+class OpenBillIndex:
+    """The open bills of the current database, indexed for matching statement lines."""
+
+    def __init__(self):
+        rows = Bill.objects.filter(is_paid=False).annotate(
+            already_paid=Coalesce(Sum('payment__amount_paid'), Value(Decimal('0.00')), output_field=DecimalField(max_digits=10, decimal_places=2))
+        ).values_list('pk', 'tenant_id', 'amount', 'already_paid', 'due_date')
+        self.bills = {} # bill id -> [tenant id, amount cents, outstanding cents, due date]
+        self.by_outstanding = defaultdict(set)
+        self.by_amount = defaultdict(set)
+        self.tenant_bills = defaultdict(list)
+        for pk, tenant_id, amount, already_paid, due_date in rows.iterator(chunk_size=5000):
+            outstanding = money.minor_units(amount - already_paid)
+            if outstanding <= 0:
+                continue
+            self.bills[pk] = [tenant_id, money.minor_units(amount), outstanding, due_date]
+            self.by_outstanding[outstanding].add(pk)
+            self.by_amount[money.minor_units(amount)].add(pk)
+            self.tenant_bills[tenant_id].append(pk)
+
+        self.tenant_names = {}
+        self.tenant_tokens = {}
+        self.by_token = defaultdict(set)
+        self.by_phone = defaultdict(set)
+        tenants = Tenant.objects.filter(pk__in=Bill.objects.filter(is_paid=False).values('tenant_id'))
+        for pk, full_name, phone_number in tenants.values_list('pk', 'full_name', 'phone_number').iterator(chunk_size=5000):
+            self.tenant_names[pk] = full_name
+            self.tenant_tokens[pk] = set(tokens(full_name))
+            for token in self.tenant_tokens[pk]:
+                self.by_token[token].add(pk)
+            if phone_key(phone_number):
+                self.by_phone[phone_key(phone_number)].add(pk)
+
+    def _tenant_evidence(self, record):
+        """{tenant id: (points, reasons)} from the payer name, memo and phone numbers."""
+        line_tokens = set(tokens(f"{record['payer']} {record['memo']}"))
+        hits = Counter()
+        for token in line_tokens:
+            tenant_ids = self.by_token.get(token, ())
+            if len(tenant_ids) <= COMMON_TOKEN_LIMIT:
+                hits.update(tenant_ids)
+        evidence = {}
+        for tenant_id, count in hits.items():
+            share = count / len(self.tenant_tokens[tenant_id])
+            if share >= 1:
+                evidence[tenant_id] = (40, ['name'])
+            elif share >= 0.5:
+                evidence[tenant_id] = (20, ['part of name'])
+        for digits in DIGITS_PATTERN.findall(record['memo']):
+            for tenant_id in self.by_phone.get(phone_key(digits), ()):
+                points, reasons = evidence.get(tenant_id, (0, []))
+                evidence[tenant_id] = (points + 40, reasons + ['phone'])
+        return evidence
+
+    def candidates(self, record):
+        """Scored candidate bills for a statement record, best first:
+        [{'bill_id', 'tenant_id', 'score', 'reasons'}]."""
+        cents = money.minor_units(record['amount'])
+        references = {int(a or b) for a, b in REFERENCE_PATTERN.findall(record['memo'])} & self.bills.keys()
+        evidence = self._tenant_evidence(record)
+
+        bill_ids = set(references)
+        for tenant_id in evidence:
+            bill_ids.update(self.tenant_bills.get(tenant_id, ()))
+        for bucket in (self.by_outstanding.get(cents, ()), self.by_amount.get(cents, ())):
+            if len(bucket) <= AMOUNT_ONLY_LIMIT:
+                bill_ids.update(bucket)
+
+        scored = []
+        for bill_id in bill_ids:
+            tenant_id, amount, outstanding, due_date = self.bills[bill_id]
+            if outstanding <= 0:
+                continue
+            score, reasons = evidence.get(tenant_id, (0, []))
+            reasons = list(reasons)
+            if bill_id in references:
+                score += 50
+                reasons.append('bill reference')
+            if cents == outstanding:
+                score += 40
+                reasons.append('amount')
+            elif cents == amount:
+                score += 30
+                reasons.append('bill amount')
+            elif cents > outstanding:
+                reasons.append('pays more than outstanding')
+            if score:
+                scored.append((min(score, 100), due_date, bill_id, tenant_id, reasons))
+        scored.sort(key=lambda candidate: (-candidate[0], candidate[1], candidate[2]))
+        return [
+            {'bill_id': bill_id, 'tenant_id': tenant_id, 'tenant': self.tenant_names.get(tenant_id, ''), 'score': score, 'reasons': reasons}
+            for score, due_date, bill_id, tenant_id, reasons in scored
+        ]
+
+    def pay(self, bill_id, cents):
+        """Record that `cents` of the bill were paid; returns True if it is now fully paid."""
+        bill = self.bills[bill_id]
+        self.by_outstanding[bill[2]].discard(bill_id)
+        bill[2] -= cents
+        if bill[2] > 0:
+            self.by_outstanding[bill[2]].add(bill_id)
+            return False
+        self.by_amount[bill[1]].discard(bill_id)
+        return True
+
+    def match(self, record):
+        """(status, score, candidates, bill id to pay or None) for one statement record."""
+        if record['amount'] <= 0:
+            return BankStatementLine.STATUS_IGNORED, 0, [], None # Outgoing money is not rent
+        candidates = self.candidates(record)
+        if not candidates or candidates[0]['score'] < REVIEW_SCORE:
+            return BankStatementLine.STATUS_UNMATCHED, candidates[0]['score'] if candidates else 0, candidates[:MAX_CANDIDATES], None
+        best = candidates[0]
+        runner_up = next((c['score'] for c in candidates[1:] if c['tenant_id'] != best['tenant_id']), 0)
+        overpays = money.minor_units(record['amount']) > self.bills[best['bill_id']][2]
+        if best['score'] >= AUTO_MATCH_SCORE and best['score'] - runner_up >= MIN_MARGIN and not overpays:
+            return BankStatementLine.STATUS_MATCHED, best['score'], candidates[:MAX_CANDIDATES], best['bill_id']
+        return BankStatementLine.STATUS_REVIEW, best['score'], candidates[:MAX_CANDIDATES], None
+
+
+def _payment_notes(statement_name, record):
+    details = ' / '.join(part for part in (record['payer'], record['memo']) if part)
+    return f"Bank statement {statement_name}, line {record['line']}: {details}"[:1000]
+
+
+def reconcile(records, filename, user=None, dry_run=False):
+    """Match statement `records` (from read_statement) against the open bills of the current
+    database. Unless `dry_run`, saves the statement, its lines and the automatic payments
+    in one transaction. Returns (statement or None, {status: count}, duplicate line count)."""
+    fingerprints = [record['fingerprint'] for record in records]
+    known = set()
+    for start in range(0, len(fingerprints), 500):
+        known.update(BankStatementLine.objects.filter(fingerprint__in=fingerprints[start:start + 500]).values_list('fingerprint', flat=True))
+    records = [record for record in records if record['fingerprint'] not in known]
+
+    index = OpenBillIndex()
+    lines, payments, paid_bill_ids = [], [], []
+    counts = Counter({status: 0 for status, _ in BankStatementLine.STATUS_CHOICES})
+    for record in records:
+        status, score, candidates, bill_id = index.match(record)
+        counts[status] += 1
+        payment = None
+        if bill_id is not None:
+            if index.pay(bill_id, money.minor_units(record['amount'])):
+                paid_bill_ids.append(bill_id)
+            payment = Payment(
+                bill_id=bill_id, tenant_id=index.bills[bill_id][0], amount_paid=record['amount'],
+                payment_date=record['date'], payment_method=PAYMENT_METHOD, notes=_payment_notes(filename, record),
+            )
+            payments.append(payment)
+        lines.append((record, status, score, candidates, payment))
+    if dry_run:
+        return None, dict(counts), len(known)
+
+    with transaction.atomic(using=router.db_for_write(Payment)):
+        statement = BankStatement.objects.create(
+            filename=filename, imported_by=user, line_count=len(lines), matched_count=len(payments),
+        )
+        Payment.objects.bulk_create(payments, batch_size=500) # Journaled, indexed; balances invalidated
+        BankStatementLine.objects.bulk_create([
+            BankStatementLine(
+                statement=statement, line_number=record['line'], transaction_date=record['date'], amount=record['amount'],
+                payer=record['payer'][:255], memo=record['memo'], fingerprint=record['fingerprint'],
+                status=status, score=score, candidates=candidates, payment=payment,
+            )
+            for record, status, score, candidates, payment in lines
+        ], batch_size=500)
+        _mark_paid(paid_bill_ids)
+    return statement, dict(counts), len(known)
+
+
+def _mark_paid(bill_ids):
+    # bulk_create sends no post_save, so do what the Payment signal handler does.
+    for start in range(0, len(bill_ids), 500):
+        chunk = bill_ids[start:start + 500]
+        Bill.objects.filter(pk__in=chunk).update(is_paid=True, date_updated=timezone.now())
+        record_bill_events('bill.paid', Bill.objects.filter(pk__in=chunk).select_related('tenant'))
+
+
+def confirm_line(line, bill):
+    """Pay `bill` with a reviewed statement line. The Payment is saved normally, so its
+    signal handlers mark the bill paid when it is covered."""
+    if line.payment_id:
+        raise ValueError(f"{line} has already been paid as payment #{line.payment_id}.")
+    if line.status == BankStatementLine.STATUS_MATCHED:
+        raise ValueError(f"{line} has already been paid; its payment was archived.")
+    with transaction.atomic(using=router.db_for_write(Payment)):
+        line.payment = Payment.objects.create(
+            bill=bill, tenant_id=bill.tenant_id, amount_paid=line.amount, payment_date=line.transaction_date,
+            payment_method=PAYMENT_METHOD,
+            notes=_payment_notes(line.statement.filename, {'line': line.line_number, 'payer': line.payer, 'memo': line.memo}),
+        )
+        line.status = BankStatementLine.STATUS_MATCHED
+        line.save(update_fields=['payment', 'status'])
+    return line.payment
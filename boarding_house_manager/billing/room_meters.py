@@ -0,0 +1,225 @@
+# billing/room_meters.py
+# Shared room meters. Most rooms have one electricity meter for two to four tenants; its
+# readings are RoomMeterReadings, and `manage.py bill_room_meters` splits the consumption
+# since a room's last billed reading between the tenants who lived there in that period,
+# following Room.meter_split:
+#   equal - the same share for every tenant in the room at any time in the period
+#   days  - in proportion to the days of the period each tenant's lease covers, so a tenant
+#           moving in or out mid-period pays for their own days only
+#   fixed - in proportion to Tenant.meter_share (blank counts as 1)
+# Who lived in a room, and when, comes from the LeasePeriod rows (billing.availability).
+# kWh and amounts are split in integer units with money.allocate, so the tenants' shares
+# add up exactly to the room's consumption and charge. The first reading of a room only
+# opens its meter; consumption in a period without tenants is not charged to anyone.
+#
+# All rooms are handled in one pass: one query each for the readings to bill, the rooms'
+# last billed readings and the leases, then bulk inserts of the bills and allocations.
+import datetime
+
+from django.db import router, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from . import money
+from .models import Bill, LeasePeriod, Room, RoomMeterAllocation, RoomMeterReading, Tenant
+from .outbox import record_bill_events
+
+KWH_PLACES = 2
+PRICE_PLACES = 3
+DEFAULT_DUE_DAYS = 15
+
+
+class RoomSplit:
+    """The split of one room meter reading: consumption since `previous_date` and each tenant's share."""
+
+    def __init__(self, room, reading, previous_date, previous_value, covered_ids):
+        self.room = room
+        self.reading = reading
+        self.previous_date = previous_date   # None for the first reading of the room
+        self.previous_value = previous_value
+        self.covered_ids = covered_ids       # Older unbilled readings the split covers
+        self.consumption = None
+        self.amount = None
+        self.allocations = []
+
+    @property
+    def period_start(self):
+        return self.previous_date + datetime.timedelta(days=1)
+
+    @property
+    def days(self):
+        return (self.reading.reading_date - self.previous_date).days
+
+
+def plan(through_date, rooms=None):
+    """RoomSplits (not computed yet) for the latest unbilled reading up to `through_date`
+    of each room, against the room's last billed reading."""
+    if rooms is None:
+        rooms = Room.objects.all()
+    unbilled = list(
+        RoomMeterReading.objects.filter(room__in=rooms, is_billed=False, reading_date__lte=through_date)
+        .select_related('room').order_by('room_id', '-reading_date', '-created_at')
+    )
+    latest_billed = RoomMeterReading.objects.filter(room_id=OuterRef('room_id'), is_billed=True).order_by('-reading_date', '-created_at')
+    last_billed = {
+        row['room_id']: (row['last_date'], row['last_value'])
+        for row in RoomMeterReading.objects.filter(room_id__in={reading.room_id for reading in unbilled}, is_billed=True)
+        .values('room_id')
+        .annotate(last_date=Max('reading_date'), last_value=Subquery(latest_billed.values('reading_value')[:1]))
+        .order_by()
+    }
+    splits = {}
+    for reading in unbilled:
+        previous_date, previous_value = last_billed.get(reading.room_id, (None, None))
+        if previous_date is not None and reading.reading_date <= previous_date:
+            continue # Older than the last bill
+        split = splits.get(reading.room_id)
+        if split is None:
+            splits[reading.room_id] = RoomSplit(reading.room, reading, previous_date, previous_value, [])
+        else:
+            split.covered_ids.append(reading.pk)
+    return list(splits.values())
+
+
+def occupancy(splits):
+    """{room_id: [(tenant_id, days, meter_share)]} of the tenants whose lease overlaps each
+    split's period, with the days of overlap. One query; overlaps computed on arrays."""
+    splits = [split for split in splits if split.previous_date is not None]
+    if not splits:
+        return {}
+    periods = {split.room.pk: (split.period_start, split.reading.reading_date) for split in splits}
+    leases = list(
+        LeasePeriod.objects.filter(
+            room_id__in=list(periods), start_date__lte=max(end for start, end in periods.values()),
+        ).exclude(end_date__lt=min(start for start, end in periods.values()))
+        .order_by('room_id', 'start_date', 'tenant_id')
+        .values_list('room_id', 'tenant_id', 'start_date', 'end_date', 'tenant__meter_share')
+    )
+    if not leases:
+        return {}
+    lease_starts = [lease[2].toordinal() for lease in leases]
+    lease_ends = [(lease[3] or datetime.date.max).toordinal() for lease in leases]
+    period_starts = [periods[lease[0]][0].toordinal() for lease in leases]
+    period_ends = [periods[lease[0]][1].toordinal() for lease in leases]
+
+    np = money.np
+    if np is None:
+        days = [max(0, min(end, lease_end) - max(start, lease_start) + 1)
+                for start, end, lease_start, lease_end in zip(period_starts, period_ends, lease_starts, lease_ends)]
+    else:
+        days = np.maximum(
+            np.minimum(np.asarray(period_ends), np.asarray(lease_ends))
+            - np.maximum(np.asarray(period_starts), np.asarray(lease_starts)) + 1,
+            0,
+        )
+    occupants = {}
+    for (room_id, tenant_id, start, end, share), overlap in zip(leases, days):
+        if overlap > 0:
+            occupants.setdefault(room_id, []).append((tenant_id, int(overlap), share))
+    return occupants
+
+
+def weight(split_mode, days, share):
+    if split_mode == Room.SPLIT_EQUAL:
+        return 1
+    if split_mode == Room.SPLIT_FIXED:
+        return 1 if share is None else share
+    return days
+
+
+def compute(splits):
+    """Fill in each split's consumption, charge and allocations (unsaved). Splits whose
+    reading went below the previous one are returned separately as (split, reason)."""
+    ready = [split for split in splits if split.previous_date is not None]
+    rejected = []
+    consumption = [
+        money.minor_units(split.reading.reading_value, KWH_PLACES) - money.minor_units(split.previous_value, KWH_PLACES)
+        for split in ready
+    ]
+    prices = money.to_minor([split.reading.unit_price for split in ready], PRICE_PLACES)
+    amounts = money.multiply(consumption, KWH_PLACES, prices, PRICE_PLACES) if ready else []
+    occupants = occupancy(ready)
+
+    computed = []
+    for split, kwh, amount in zip(ready, consumption, amounts):
+        if kwh < 0:
+            rejected.append((split, f"reading {split.reading.reading_value} is below the last billed reading {split.previous_value}"))
+            continue
+        split.consumption = money.from_minor_units(kwh, KWH_PLACES)
+        split.amount = money.from_minor_units(amount)
+        tenants = occupants.get(split.room.pk, [])
+        weights = [weight(split.room.meter_split, days, share) for tenant_id, days, share in tenants]
+        if sum(weights) > 0:
+            kwh_shares = money.allocate(int(kwh), weights)
+            amount_shares = money.allocate(int(amount), weights)
+            split.allocations = [
+                RoomMeterAllocation(
+                    tenant_id=tenant_id, weight=tenant_weight,
+                    consumption=money.from_minor_units(kwh_share, KWH_PLACES), amount=money.from_minor_units(amount_share),
+                )
+                for (tenant_id, days, share), tenant_weight, kwh_share, amount_share
+                in zip(tenants, weights, kwh_shares, amount_shares)
+            ]
+        computed.append(split)
+    openings = [split for split in splits if split.previous_date is None]
+    return computed + openings, rejected
+
+
+def _bill(split, allocation, due_days):
+    reading = split.reading
+    basis = {
+        Room.SPLIT_EQUAL: "an equal share",
+        Room.SPLIT_DAYS: f"{allocation.weight} of {split.days} day(s) in the room",
+        Room.SPLIT_FIXED: f"a fixed share of {allocation.weight}",
+    }[split.room.meter_split]
+    return Bill(
+        tenant_id=allocation.tenant_id,
+        bill_type='Electricity',
+        amount=allocation.amount,
+        due_date=reading.reading_date + datetime.timedelta(days=due_days),
+        description=(
+            f"Electricity charge for room {split.room.room_number} (shared meter), {split.period_start} to {reading.reading_date}. "
+            f"Current reading: {reading.reading_value} kWh, Previous reading: {split.previous_value} kWh. "
+            f"Your share: {allocation.consumption} of {split.consumption} kWh ({basis}) @ {reading.unit_price}/kWh."
+        ),
+        is_paid=False,
+    )
+
+
+def bill_room_readings(through_date, rooms=None, due_days=DEFAULT_DUE_DAYS, dry_run=False):
+    """Split and bill every room's latest unbilled meter reading up to `through_date`.
+
+    Returns (splits, rejected): the splits with their allocations, whose `bill` is set
+    for the tenants charged (unsaved when `dry_run`), and (split, reason) pairs for the
+    readings that couldn't be billed. Everything is written in one transaction.
+    """
+    with transaction.atomic(using=router.db_for_write(Bill)):
+        splits, rejected = compute(plan(through_date, rooms))
+        for split in splits:
+            for allocation in split.allocations:
+                if allocation.amount > 0:
+                    allocation.bill = _bill(split, allocation, due_days)
+        if dry_run or not splits:
+            return splits, rejected
+
+        readings = [split.reading for split in splits]
+        for split in splits:
+            split.reading.previous_reading_value = split.previous_value
+            split.reading.consumption = split.consumption
+            split.reading.is_billed = True # A room's first reading is billed as its opening reading
+        RoomMeterReading.objects.bulk_update(readings, ['previous_reading_value', 'consumption', 'is_billed'], batch_size=500)
+        covered = [pk for split in splits for pk in split.covered_ids]
+        for start in range(0, len(covered), 500):
+            RoomMeterReading.objects.filter(pk__in=covered[start:start + 500]).update(is_billed=True)
+
+        allocations = []
+        for split in splits:
+            for allocation in split.allocations:
+                allocation.reading = split.reading
+                allocations.append(allocation)
+        bills = Bill.objects.bulk_create([allocation.bill for allocation in allocations if allocation.bill], batch_size=500)
+        RoomMeterAllocation.objects.bulk_create(allocations, batch_size=500)
+        tenants = Tenant.objects.in_bulk({bill.tenant_id for bill in bills})
+        for bill in bills:
+            bill.tenant = tenants[bill.tenant_id]
+        record_bill_events('bill.created', bills)
+    return splits, rejected
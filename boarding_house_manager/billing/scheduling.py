@@ -0,0 +1,123 @@
+# billing/scheduling.py
+# Cron-style schedule parsing and the persistent status file used by the
+# `billing_scheduler` command.
+import datetime
+import json
+import os
+import tempfile
+
+
+class CronSchedule:
+    """A standard five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports `*`, lists (`1,15`), ranges (`1-5`) and steps (`*/15`, `0-30/10`).
+    Day-of-week uses 0-6 with 0 (or 7) meaning Sunday. As in cron, when both
+    day-of-month and day-of-week are restricted a day matching either one runs.
+    """
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+    MAX_SEARCH_DAYS = 366 * 5
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields, got {len(fields)}: {expression!r}")
+        parsed = [self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {0 if day == 7 else day for day in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+        self._sorted_hours = sorted(self.hours)
+        self._sorted_minutes = sorted(self.minutes)
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_str = part.split('/', 1)
+                step = int(step_str)
+                if step < 1:
+                    raise ValueError(f"Invalid step in cron field {field!r}")
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field {field!r} is out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        cron_weekday = (day.weekday() + 1) % 7 # Python: Monday=0, cron: Sunday=0
+        day_ok = day.day in self.days
+        weekday_ok = cron_weekday in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment):
+        """First scheduled time strictly after `moment` (a datetime, naive or aware)."""
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        day = start.date()
+        for _ in range(self.MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in self._sorted_hours:
+                    for minute in self._sorted_minutes:
+                        candidate = start.replace(year=day.year, month=day.month, day=day.day, hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += datetime.timedelta(days=1)
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def previous_before(self, moment):
+        """Latest scheduled time at or before `moment`, or None if none in the search window."""
+        end = moment.replace(second=0, microsecond=0)
+        day = end.date()
+        for _ in range(self.MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in reversed(self._sorted_hours):
+                    for minute in reversed(self._sorted_minutes):
+                        candidate = end.replace(year=day.year, month=day.month, day=day.day, hour=hour, minute=minute)
+                        if candidate <= end:
+                            return candidate
+            day -= datetime.timedelta(days=1)
+        return None
+
+
+class SchedulerStatus:
+    """JSON status/health file: when each entry last ran, how long it took and
+    when it runs next. Written atomically so monitoring never reads a partial file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {'scheduler': {}, 'entries': {}}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError):
+                pass # Corrupt or unreadable; start fresh
+        self.data.setdefault('scheduler', {})
+        self.data.setdefault('entries', {})
+
+    def entry(self, name):
+        return self.data['entries'].setdefault(name, {})
+
+    def last_run_at(self, name):
+        value = self.entry(name).get('last_run_at')
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.scheduler-status-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.data, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
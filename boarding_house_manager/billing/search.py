@@ -0,0 +1,196 @@
+# billing/search.py
+# Full-text search for the admin. Every Tenant, Bill and Payment has one SearchDocument
+# holding the text the admin used to search with multi-join icontains scans (tenant
+# name, room number, description, ...). The documents are indexed with FTS5 on SQLite
+# and a tsvector GIN index on PostgreSQL (see migration 0010), so a search is one index
+# lookup instead of a scan over the joined tables.
+#
+# Documents are kept in sync by the signal handlers below for single saves and deletes,
+# by JournaledQuerySet for bulk writes, and by billing.archive for archived rows.
+import re
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Bill, Payment, Room, SearchDocument, Tenant
+
+FTS_TABLE = 'billing_searchdocument_fts'
+
+# The text indexed for each model: the fields its admin searched before.
+DOCUMENT_FIELDS = {
+    Tenant: ('full_name', 'email', 'phone_number', 'room__room_number'),
+    Bill: ('bill_type', 'description', 'tenant__full_name', 'tenant__room__room_number'),
+    Payment: ('notes', 'payment_method', 'bill__description', 'tenant__full_name'),
+}
+MODEL_NAMES = {Tenant: 'tenant', Bill: 'bill', Payment: 'payment'}
+
+# SearchDocument.id is object_id * CODE_STRIDE + the model's code, so the FTS5 rowid alone
+# says which object matched. Joining every match back to billing_searchdocument to read
+# model_name/object_id was the slow part of a search on large tables.
+MODEL_CODES = {Tenant: 1, Bill: 2, Payment: 3}
+CODE_STRIDE = 4
+
+# A search for a bare number also matches this field exactly (the old 'id' / 'bill__id' search fields).
+ID_FIELDS = {Bill: 'pk', Payment: 'bill_id'}
+
+# Documents that embed another model's fields, and the lookup from them to it.
+DEPENDENTS = {
+    Room: ((Tenant, 'room'), (Bill, 'tenant__room')),
+    Tenant: ((Bill, 'tenant'), (Payment, 'tenant')),
+    Bill: ((Payment, 'bill'),),
+}
+
+CHUNK_SIZE = 500
+
+_fulltext_ready = {}
+
+
+def _local_fields(model):
+    """Fields of `model` itself whose change affects its own or a dependent's document."""
+    fields = {path.split('__')[0] for path in DOCUMENT_FIELDS.get(model, ())}
+    for dependent, lookup in DEPENDENTS.get(model, ()):
+        prefix = lookup.split('__')
+        for path in DOCUMENT_FIELDS[dependent]:
+            parts = path.split('__')
+            if parts[:len(prefix)] == prefix and len(parts) > len(prefix):
+                fields.add(parts[len(prefix)])
+    return fields
+
+
+def document_id(model, object_id):
+    return object_id * CODE_STRIDE + MODEL_CODES[model]
+
+
+def _document_body(values):
+    return ' '.join(str(value) for value in values if value not in (None, ''))
+
+
+def index_objects(model, ids):
+    """(Re)build the search documents of the given objects; ids that no longer exist are dropped."""
+    model_name = MODEL_NAMES[model]
+    fields = DOCUMENT_FIELDS[model]
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        documents = [
+            SearchDocument(id=document_id(model, pk), model_name=model_name, object_id=pk, body=_document_body(values))
+            for pk, *values in model._base_manager.filter(pk__in=chunk).values_list('pk', *fields)
+        ]
+        found = {document.object_id for document in documents}
+        with transaction.atomic(using=router.db_for_write(SearchDocument)):
+            remove_documents(model, [pk for pk in chunk if pk not in found])
+            SearchDocument.objects.bulk_create(
+                documents, update_conflicts=True, unique_fields=['id'], update_fields=['body'],
+            )
+
+
+def reindex(model, ids, changed_fields=None):
+    """Refresh the documents of `ids` and of every document that embeds them. With
+    `changed_fields`, nothing happens unless one of them is part of some document."""
+    if changed_fields is not None and not _local_fields(model) & set(changed_fields):
+        return
+    ids = list(ids)
+    if model in DOCUMENT_FIELDS:
+        index_objects(model, ids)
+    for dependent, lookup in DEPENDENTS.get(model, ()):
+        for start in range(0, len(ids), CHUNK_SIZE):
+            dependent_ids = dependent._base_manager.filter(
+                **{f"{lookup}__in": ids[start:start + CHUNK_SIZE]}
+            ).values_list('pk', flat=True)
+            index_objects(dependent, dependent_ids)
+
+
+def remove_documents(model, ids):
+    document_ids = [document_id(model, pk) for pk in ids]
+    for start in range(0, len(document_ids), CHUNK_SIZE):
+        SearchDocument.objects.filter(id__in=document_ids[start:start + CHUNK_SIZE]).delete()
+
+
+def rebuild_index(models=None, progress=None):
+    """Rebuild every document of the given models (default: all). Returns {model_name: count}."""
+    counts = {}
+    for model in models or DOCUMENT_FIELDS:
+        model_name = MODEL_NAMES[model]
+        SearchDocument.objects.filter(model_name=model_name).delete()
+        ids = list(model._base_manager.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(ids), CHUNK_SIZE * 10):
+            index_objects(model, ids[start:start + CHUNK_SIZE * 10])
+            if progress:
+                progress(model_name, min(start + CHUNK_SIZE * 10, len(ids)), len(ids))
+        counts[model_name] = len(ids)
+    return counts
+
+
+def has_fulltext_index(connection):
+    """Whether migration 0010 could create a full-text index on this database."""
+    if connection.alias not in _fulltext_ready:
+        if connection.vendor == 'sqlite':
+            _fulltext_ready[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+        else:
+            _fulltext_ready[connection.alias] = connection.vendor == 'postgresql'
+    return _fulltext_ready[connection.alias]
+
+
+def _match_sql(vendor, model, terms):
+    """Subquery returning the ids of `model_name` objects whose document contains every
+    term as a word prefix ("ana 10" matches "Ana Cruz, room 101")."""
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        return (
+            f"SELECT rowid / {CODE_STRIDE} FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid %% {CODE_STRIDE} = %s",
+            (query, MODEL_CODES[model]),
+        )
+    query = ' & '.join(f"{term}:*" for term in terms)
+    return (
+        "SELECT object_id FROM billing_searchdocument "
+        "WHERE model_name = %s AND to_tsvector('simple', body) @@ to_tsquery('simple', %s)",
+        (MODEL_NAMES[model], query),
+    )
+
+
+def search_queryset(queryset, search_term):
+    """Filter `queryset` to the objects matching `search_term`, using the full-text index.
+
+    Terms match word prefixes, not arbitrary substrings like the admin's icontains
+    search_fields. Returns None when the model is not indexed or the database has no
+    full-text index, so callers can fall back to the admin's regular search.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if model not in MODEL_NAMES or not has_fulltext_index(connection):
+        return None
+    terms = re.findall(r'[^\W_]+', search_term.lower())
+    if not terms:
+        return queryset
+
+    sql, params = _match_sql(connection.vendor, model, terms)
+    condition = Q(pk__in=RawSQL(sql, params))
+    id_field = ID_FIELDS.get(model)
+    if id_field and len(terms) == 1 and terms[0].isdigit():
+        condition |= Q(**{id_field: int(terms[0])})
+    return queryset.filter(condition)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=Tenant)
+@receiver(post_save, sender=Bill)
+@receiver(post_save, sender=Payment)
+def index_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw: # Fixture loading; run rebuild_search_index afterwards
+        return
+    if created: # Nothing embeds a new object yet
+        if sender in DOCUMENT_FIELDS:
+            index_objects(sender, [instance.pk])
+        return
+    reindex(sender, [instance.pk], changed_fields=update_fields)
+
+
+@receiver(post_delete, sender=Tenant)
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=Payment)
+def unindex_deleted(sender, instance, **kwargs):
+    remove_documents(sender, [instance.pk])
@@ -0,0 +1,151 @@
+# billing/sharding.py
+# Per-property databases. The 'default' database is the catalog: it holds the Property
+# rows, billing jobs and everything outside the billing app (users, sessions, admin
+# log). Each property's rooms, tenants, bills and derived tables (journal, search,
+# archive, ...) live in the database named by Property.database; several properties may
+# share one.
+#
+# Code selects a property's database with `use_property()` / `use_shard()`. Inside that
+# block PropertyShardRouter sends every billing query there, so the signal handlers and
+# bulk helpers follow without being told. Outside any block billing models use the
+# database of the instance at hand, or 'default', which is the single-building setup.
+import contextlib
+import contextvars
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_current_shard = contextvars.ContextVar('billing_shard', default=None)
+
+# Billing models that only exist in the catalog database.
+CATALOG_MODELS = {'property', 'billingjob'}
+
+
+class PropertyShardRouter:
+    """Database router for the property shards; add it to settings.DATABASE_ROUTERS."""
+
+    def _route(self, model, **hints):
+        if model._meta.app_label != 'billing' or model._meta.model_name in CATALOG_MODELS:
+            return DEFAULT_DB_ALIAS
+        shard = _current_shard.get()
+        if shard is not None:
+            return shard
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return DEFAULT_DB_ALIAS
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Relations to catalog rows (users, properties) may cross databases; the foreign
+        # keys pointing at them are declared with db_constraint=False.
+        for obj in (obj1, obj2):
+            if obj._meta.app_label != 'billing' or obj._meta.model_name in CATALOG_MODELS:
+                return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'billing' and model_name in CATALOG_MODELS and db != DEFAULT_DB_ALIAS:
+            return False
+        return None
+
+
+def current_shard():
+    """Alias billing queries are currently routed to by `use_shard()`, or None."""
+    return _current_shard.get()
+
+
+@contextlib.contextmanager
+def use_shard(alias):
+    """Route billing queries to `alias` inside the block. None leaves routing unchanged."""
+    if alias is None:
+        yield
+        return
+    if alias not in settings.DATABASES:
+        raise ValueError(f"Unknown database alias '{alias}'.")
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def get_property(code):
+    from .models import Property
+    try:
+        return Property.objects.get(code=code)
+    except Property.DoesNotExist:
+        raise CommandError(f"Property '{code}' does not exist.")
+
+
+@contextlib.contextmanager
+def use_property(code):
+    """Route billing queries to the database of the property with this code, and yield
+    the Property (None, with routing unchanged, if `code` is empty)."""
+    if not code:
+        yield None
+        return
+    current_property = get_property(code)
+    with use_shard(current_property.database):
+        yield current_property
+
+
+def add_property_argument(parser):
+    parser.add_argument(
+        '--property', type=str,
+        help="Only this property (its code). Runs against the property's database. Defaults to all tenants on the default database."
+    )
+
+
+def shard_aliases():
+    """Every database that holds property data, catalog first."""
+    from .models import Property
+    aliases = set(Property.objects.values_list('database', flat=True)) | {DEFAULT_DB_ALIAS}
+    return sorted(aliases, key=lambda alias: (alias != DEFAULT_DB_ALIAS, alias))
+
+
+def fan_out(func, aliases=None, max_workers=4):
+    """Run `func(alias)` against each shard (default: all) in parallel threads, with billing
+    queries routed to that shard. Returns {alias: result}; merging is up to the caller."""
+    aliases = list(aliases if aliases is not None else shard_aliases())
+
+    def run(alias):
+        try:
+            with use_shard(alias):
+                return alias, func(alias)
+        finally:
+            connections.close_all() # This thread's connections
+
+    if len(aliases) == 1: # Nothing to parallelise; stay on this thread's connection
+        with use_shard(aliases[0]):
+            return {aliases[0]: func(aliases[0])}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(aliases))) as executor:
+        return dict(executor.map(run, aliases))
+
+
+def init_property_worker():
+    """Process pool initializer for run_property_command (spawned workers need Django set up)."""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def run_property_command(task):
+    """Run one management command for one property in a worker process. `task` is
+    (command_name, property_code, args); returns (property_code, succeeded, output)."""
+    from django.core.management import call_command
+    command_name, code, args = task
+    output = io.StringIO()
+    try:
+        call_command(command_name, *args, property=code, stdout=output, stderr=output)
+        return code, True, output.getvalue()
+    except Exception as e:
+        return code, False, f"{output.getvalue()}{type(e).__name__}: {e}\n"
+    finally:
+        connections.close_all()
@@ -0,0 +1,205 @@
+# billing/snapshot.py
+# Columnar snapshot export for analysts (`manage.py export_snapshot`), so that ad-hoc
+# analysis runs on files instead of queries against the live database. Each table is
+# written as part files of per-column arrays: Parquet when pyarrow is installed,
+# otherwise compressed NPZ or CSV. billing.snapshot_reader loads them back as NumPy arrays.
+#
+# Bills, payments and readings are exported incrementally: a high-water mark of
+# (timestamp, id) is kept per table in the manifest and each run appends only rows past
+# it as a new part. Bills use date_updated, so an edited bill is exported again and the
+# reader keeps its newest copy. Payments and readings only have a creation time; edits
+# to them, and deletions or archiving of any row, need a --full export to show up.
+# Bulk updates that don't set date_updated are not picked up either. Tenants and rooms
+# have no timestamps and are rewritten on every run.
+#
+# Rows are read in keyset-ordered pages with .iterator(), so the export never holds one
+# long read open against the generators' writes.
+import csv
+import datetime
+import json
+import os
+
+from django.db import models
+from django.utils import timezone
+
+from .models import Bill, ElectricityReading, Payment, Room, Tenant
+from .snapshot_reader import MANIFEST, NULL_ID, np, pq, read_manifest
+
+# table name -> (model, high-water timestamp field or None for a full rewrite)
+SNAPSHOT_TABLES = {
+    'bill': (Bill, 'date_updated'),
+    'payment': (Payment, 'date_recorded'),
+    'electricity_reading': (ElectricityReading, 'created_at'),
+    'tenant': (Tenant, None),
+    'room': (Room, None),
+}
+FORMAT_EXTENSIONS = {'parquet': 'parquet', 'npz': 'npz', 'csv': 'csv'}
+PAGE_SIZE = 5000
+ROWS_PER_PART = 200_000
+
+
+def default_format():
+    return 'parquet' if pq is not None else 'npz'
+
+
+def _column_dtype(field):
+    if isinstance(field, (models.ForeignKey, models.AutoField, models.IntegerField)):
+        return 'int64'
+    if isinstance(field, (models.DecimalField, models.FloatField)):
+        return 'float64'
+    if isinstance(field, models.BooleanField):
+        return 'bool'
+    if isinstance(field, models.DateTimeField):
+        return 'datetime64[us]'
+    if isinstance(field, models.DateField):
+        return 'datetime64[D]'
+    return 'str'
+
+
+def table_columns(model):
+    """{attname: dtype} of the model's concrete fields (JSON and binary fields are skipped)."""
+    return {
+        field.attname: _column_dtype(field)
+        for field in model._meta.concrete_fields
+        if not isinstance(field, (models.JSONField, models.BinaryField))
+    }
+
+
+def _to_array(values, dtype):
+    if dtype == 'int64':
+        return np.array([NULL_ID if value is None else value for value in values], dtype=np.int64)
+    if dtype == 'float64':
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    if dtype == 'bool':
+        return np.array(values, dtype=np.bool_)
+    if dtype == 'datetime64[us]':
+        # Aware datetimes are stored as naive UTC.
+        return np.array(
+            [None if value is None else value.astimezone(datetime.timezone.utc).replace(tzinfo=None) for value in values],
+            dtype='datetime64[us]',
+        )
+    if dtype == 'datetime64[D]':
+        return np.array(values, dtype='datetime64[D]')
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+
+def _write_part(path, file_format, columns):
+    if file_format == 'npz':
+        np.savez_compressed(path, **columns)
+    elif file_format == 'parquet':
+        import pyarrow
+        pq.write_table(pyarrow.table(columns), path, compression='zstd')
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            rows = zip(*(array.astype(np.int8) if array.dtype == np.bool_ else array for array in columns.values()))
+            writer.writerows(rows)
+
+
+def _pages(queryset, fields, timestamp_field, high_water):
+    """Rows of `queryset` after `high_water` ((timestamp, id) or None), in (timestamp, id)
+    order, one short query per page."""
+    order = (timestamp_field, 'id') if timestamp_field else ('id',)
+    position = high_water
+    while True:
+        page = queryset
+        if position is not None:
+            if timestamp_field:
+                timestamp, last_id = position
+                page = page.filter(
+                    models.Q(**{f"{timestamp_field}__gt": timestamp})
+                    | models.Q(**{timestamp_field: timestamp, 'id__gt': last_id})
+                )
+            else:
+                page = page.filter(id__gt=position[1])
+        rows = list(page.order_by(*order).values_list(*fields)[:PAGE_SIZE].iterator(chunk_size=PAGE_SIZE))
+        if not rows:
+            return
+        yield rows
+        last = dict(zip(fields, rows[-1]))
+        position = (last[timestamp_field] if timestamp_field else None, last['id'])
+
+
+def export_table(path, table, file_format, state, full=False):
+    """Append the rows of `table` changed since the last export to `path`/`table`.
+    `state` is the table's manifest entry (updated in place). Returns (rows written, part
+    files no longer in the manifest, to delete once the new manifest is saved)."""
+    model, timestamp_field = SNAPSHOT_TABLES[table]
+    dtypes = table_columns(model)
+    fields = list(dtypes)
+    table_dir = os.path.join(path, table)
+    os.makedirs(table_dir, exist_ok=True)
+
+    incremental = timestamp_field is not None and not full and state.get('columns') == dtypes
+    obsolete = []
+    if not incremental:
+        obsolete = [os.path.join(table_dir, part) for part in state.get('parts', [])]
+        state.update(parts=[], high_water=None, rows=0)
+    high_water = None
+    if incremental and state.get('high_water'):
+        timestamp, last_id = state['high_water']
+        high_water = (datetime.datetime.fromisoformat(timestamp), last_id)
+
+    written = 0
+    buffer = []
+
+    def flush():
+        nonlocal buffer
+        if not buffer:
+            return
+        columns = {name: _to_array(values, dtypes[name]) for name, values in zip(fields, zip(*buffer))}
+        part = f"part-{state.get('next_part', 1):05d}.{FORMAT_EXTENSIONS[file_format]}"
+        _write_part(os.path.join(table_dir, part), file_format, columns)
+        state['parts'].append(part)
+        state['next_part'] = state.get('next_part', 1) + 1
+        buffer = []
+
+    for rows in _pages(model._base_manager.all(), fields, timestamp_field, high_water):
+        buffer.extend(rows)
+        written += len(rows)
+        last = dict(zip(fields, rows[-1]))
+        if timestamp_field:
+            state['high_water'] = (last[timestamp_field].isoformat(), last['id'])
+        if len(buffer) >= ROWS_PER_PART:
+            flush()
+    flush()
+
+    state.update(columns=dtypes, incremental=timestamp_field is not None, rows=state.get('rows', 0) + written)
+    if written or not incremental:
+        state['version'] = state.get('version', 0) + 1 # Tells the reader to rebuild its cache
+    return written, obsolete
+
+
+def export_snapshot(path, file_format=None, tables=None, full=False, progress=None):
+    """Export `tables` (default: all) of the current database to `path`. Returns {table: rows written}."""
+    if np is None:
+        raise ImportError("Snapshot export requires NumPy.")
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path) or {'tables': {}}
+    file_format = file_format or manifest.get('format') or default_format()
+    if file_format == 'parquet' and pq is None:
+        raise ImportError("The Parquet format requires pyarrow.")
+    if manifest.get('format') not in (None, file_format):
+        if tables:
+            raise ValueError(f"This snapshot is in {manifest['format']} format; export all tables to switch formats.")
+        full = True # Parts of one table must share a format
+
+    counts = {}
+    obsolete = []
+    for table in tables or SNAPSHOT_TABLES:
+        state = manifest['tables'].setdefault(table, {})
+        counts[table], table_obsolete = export_table(path, table, file_format, state, full=full)
+        obsolete.extend(table_obsolete)
+        if progress:
+            progress(table, counts[table], state['rows'])
+
+    manifest.update(format=file_format, exported_at=timezone.now().isoformat())
+    tmp_path = os.path.join(path, f"{MANIFEST}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST)) # The manifest is only ever replaced whole
+    for part_path in obsolete:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return counts
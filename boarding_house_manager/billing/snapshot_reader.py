@@ -0,0 +1,132 @@
+# billing/snapshot_reader.py
+# Reads the analytics snapshots written by `manage.py export_snapshot` into NumPy arrays.
+# This module needs only NumPy (and pyarrow for Parquet snapshots); it does not import
+# Django, so analysts can use it from a notebook without the project settings:
+#
+#     from billing.snapshot_reader import SnapshotReader
+#     bills = SnapshotReader('snapshots/default').load('bill')
+#     unpaid = bills['amount'][~bills['is_paid']].sum()
+#
+# A snapshot table is a series of part files, each appended by one export run. load()
+# merges them (keeping the newest version of rows exported more than once), writes the
+# result once to a per-column .npy cache next to the parts, and returns the columns as
+# read-only memory-mapped arrays, so later loads of an unchanged snapshot cost no parsing.
+import csv
+import json
+import os
+import shutil
+
+try:
+    import numpy as np
+except ImportError: # pragma: no cover - the exporter reports this
+    np = None
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+MANIFEST = 'manifest.json'
+CACHE_DIR = '_cache'
+NULL_ID = -1 # Stored for empty foreign keys; ids are positive
+
+
+def read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def _read_csv(part_path, dtypes):
+    with open(part_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        values = list(zip(*reader)) or [()] * len(header)
+    columns = {}
+    for name, column in zip(header, values):
+        dtype = np.dtype(dtypes[name])
+        if dtype == np.bool_:
+            columns[name] = np.array(column, dtype=np.int8).astype(np.bool_)
+        else:
+            columns[name] = np.array(column, dtype=str).astype(dtype) if column else np.empty(0, dtype=dtype)
+    return columns
+
+
+def read_part(part_path, file_format, dtypes):
+    """{column: array} of one part file."""
+    if file_format == 'npz':
+        with np.load(part_path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    if file_format == 'csv':
+        return _read_csv(part_path, dtypes)
+    if file_format == 'parquet':
+        if pq is None:
+            raise ImportError("Reading Parquet snapshots requires pyarrow.")
+        table = pq.read_table(part_path, memory_map=True)
+        columns = {}
+        for name in table.column_names:
+            dtype = np.dtype(dtypes[name])
+            array = table.column(name).to_numpy(zero_copy_only=False)
+            columns[name] = array.astype(dtype) if array.dtype != dtype else array
+        return columns
+    raise ValueError(f"Unknown snapshot format '{file_format}'.")
+
+
+class SnapshotReader:
+    """Snapshot of one database, as written by export_snapshot to `path`."""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.manifest = read_manifest(self.path)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No snapshot in {self.path} (missing {MANIFEST}).")
+
+    def tables(self):
+        return sorted(self.manifest['tables'])
+
+    def _table_dir(self, table):
+        return os.path.join(self.path, table)
+
+    def _cache_dir(self, table):
+        info = self.manifest['tables'][table]
+        return os.path.join(self._table_dir(table), CACHE_DIR, str(info['version']))
+
+    def _build_cache(self, table, cache_dir):
+        info = self.manifest['tables'][table]
+        dtypes = info['columns']
+        parts = [read_part(os.path.join(self._table_dir(table), part), self.manifest['format'], dtypes) for part in info['parts']]
+        columns = {}
+        for name, dtype in dtypes.items():
+            arrays = [part[name] for part in parts]
+            columns[name] = np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+        if len(parts) > 1 and info['incremental']:
+            # Rows changed since an earlier export were appended again; keep the last copy.
+            ids = columns['id']
+            _, last_from_end = np.unique(ids[::-1], return_index=True)
+            keep = np.sort(len(ids) - 1 - last_from_end)
+            columns = {name: array[keep] for name, array in columns.items()}
+
+        parent = os.path.dirname(cache_dir)
+        shutil.rmtree(parent, ignore_errors=True) # Caches of older versions
+        tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, array in columns.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(tmp_dir, cache_dir)
+
+    def load(self, table, columns=None):
+        """{column: read-only memory-mapped array} of `table`, optionally only `columns`.
+
+        Dates are datetime64[D], timestamps datetime64[us] in UTC, amounts float64 (NaN
+        when empty), empty foreign keys NULL_ID, text fixed-width unicode.
+        """
+        if table not in self.manifest['tables']:
+            raise KeyError(f"Table '{table}' is not in this snapshot; available: {', '.join(self.tables())}.")
+        names = columns or list(self.manifest['tables'][table]['columns'])
+        cache_dir = self._cache_dir(table)
+        if not os.path.isdir(cache_dir):
+            self._build_cache(table, cache_dir)
+        return {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r') for name in names}
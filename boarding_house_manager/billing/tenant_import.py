@@ -0,0 +1,375 @@
+# billing/tenant_import.py
+# Bulk tenant onboarding and lease updates from a CSV or XLSX file, for semester
+# turnover (`manage.py import_tenants` and the "Import tenants" admin page). One file
+# is for one property. Each row creates a tenant, or updates the one matched by its
+# tenant_id or, failing that, its email.
+#
+# The whole file is validated before anything is written: values, room numbers (resolved
+# from one room lookup map), duplicate rows, and leases overlapping in the same room,
+# checked against the property's tenants as they will be after the import. The result is
+# an ImportPlan, which doubles as the dry-run diff report. Applying it writes all tenants
+# with bulk_create/bulk_update in one transaction, then brings the LeasePeriod rows and
+# search documents up to date, since bulk writes send no post_save.
+#
+# Columns missing from the file leave existing tenants unchanged; a blank cell clears an
+# optional field. XLSX files need openpyxl.
+import csv
+import datetime
+import io
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.utils.text import slugify
+
+from . import money
+from .availability import LEASE_FIELDS, OPEN_END, lease_values, sync_lease_periods
+from .models import Room, Tenant
+from .search import index_objects, reindex
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Column -> Tenant field. 'tenant_id' and 'username' only identify; 'room_number' sets room.
+COLUMNS = (
+    'tenant_id', 'full_name', 'email', 'phone_number', 'room_number', 'lease_start_date', 'lease_end_date',
+    'is_active', 'fixed_water_charge', 'fixed_wifi_charge', 'notification_channel', 'username',
+)
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'active'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'inactive'}
+
+
+class ImportFileError(ValueError):
+    """The file itself can't be read (format, encoding, header)."""
+
+
+def read_rows(file, filename):
+    """[(line number, {column: str value})] of a CSV or XLSX file; header names are
+    matched case-insensitively with spaces as underscores."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.xlsx':
+        if openpyxl is None:
+            raise ImportFileError("Reading XLSX files requires openpyxl; save the sheet as CSV instead.")
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = ([_cell_text(cell) for cell in row] for row in workbook.active.iter_rows(values_only=True))
+    elif extension == '.csv':
+        try:
+            text = file.read()
+            text = text.decode('utf-8-sig') if isinstance(text, bytes) else text
+        except UnicodeDecodeError:
+            raise ImportFileError("CSV files must be UTF-8 encoded.")
+        rows = csv.reader(io.StringIO(text))
+    else:
+        raise ImportFileError("Upload a .csv or .xlsx file.")
+
+    header = [name.strip().lower().replace(' ', '_') for name in next(rows, [])]
+    unknown = [name for name in header if name and name not in COLUMNS]
+    if unknown:
+        raise ImportFileError(f"Unknown column(s): {', '.join(unknown)}. Expected: {', '.join(COLUMNS)}.")
+    if 'full_name' not in header and 'tenant_id' not in header:
+        raise ImportFileError("The file needs a full_name or tenant_id column.")
+    records = []
+    for line, row in enumerate(rows, start=2):
+        if not any(value.strip() for value in row):
+            continue
+        records.append((line, {name: value.strip() for name, value in zip(header, row) if name}))
+    return records
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class ImportRow:
+    """One line of the file: the tenant it creates or updates and what changes."""
+
+    def __init__(self, line, values):
+        self.line = line
+        self.values = values
+        self.tenant = None
+        self.action = None # 'create', 'update' or 'unchanged'
+        self.changes = {} # field -> (old, new)
+        self.username = None # Login to create for the tenant
+        self.errors = []
+
+    @property
+    def label(self):
+        return self.values.get('full_name') or (self.tenant.full_name if self.tenant else f"line {self.line}")
+
+
+class ImportPlan:
+    """Validated rows of a tenant file and the changes they would make to `current_property`."""
+
+    def __init__(self, current_property, rows, room_numbers):
+        self.property = current_property
+        self.rows = rows
+        self.room_numbers = room_numbers # room id -> room number, for the report
+
+    @property
+    def errors(self):
+        return [(row.line, error) for row in self.rows for error in row.errors]
+
+    def counts(self):
+        counts = {'create': 0, 'update': 0, 'unchanged': 0, 'error': 0}
+        for row in self.rows:
+            counts['error' if row.errors else row.action] += 1
+        return counts
+
+    def valid_rows(self):
+        return [row for row in self.rows if not row.errors]
+
+    def report(self):
+        """The dry-run diff, one dict per row: line, label, action ('error' for rows with
+        errors), username, changes [(field, old, new)] for display, errors."""
+        for row in self.rows:
+            changes = []
+            for field, (old, new) in row.changes.items():
+                if field == 'room_id':
+                    field, old, new = 'room', self.room_numbers.get(old), self.room_numbers.get(new)
+                changes.append((field, _display(old), _display(new)))
+            yield {
+                'line': row.line, 'label': row.label, 'action': 'error' if row.errors else row.action,
+                'username': row.username, 'changes': changes, 'errors': row.errors,
+            }
+
+    def report_lines(self):
+        """report() as text: one line per row, then one per changed field."""
+        for entry in self.report():
+            if entry['errors']:
+                yield f"line {entry['line']}: ERROR {entry['label']}: {'; '.join(entry['errors'])}"
+                continue
+            yield f"line {entry['line']}: {entry['action']} {entry['label']}" + (
+                f" (login '{entry['username']}')" if entry['username'] else ''
+            )
+            for field, old, new in entry['changes']:
+                yield f"    {field}: {old} -> {new}"
+
+
+def _display(value):
+    return '-' if value in (None, '') else str(value)
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError(f"'{value}' is not a date (YYYY-MM-DD).")
+
+
+def _parse_charge(value):
+    try:
+        amount = Decimal(value)
+        money.minor_units(amount)
+    except (InvalidOperation, ValueError):
+        raise ValidationError(f"'{value}' is not an amount with at most 2 decimal places.")
+    if amount < 0 or amount >= Decimal('100000'):
+        raise ValidationError(f"'{value}' is out of range.")
+    return amount
+
+
+def _parse_bool(value):
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValidationError(f"'{value}' is not yes/no.")
+
+
+def _parse_values(row, rooms):
+    """{Tenant field: value} for the columns present in the row; blank optional cells give None/''."""
+    parsed = {}
+    for column, value in row.values.items():
+        try:
+            if column in ('tenant_id', 'username'):
+                continue
+            if column == 'room_number':
+                if value and value not in rooms:
+                    raise ValidationError(f"Room '{value}' does not exist in this property.")
+                parsed['room_id'] = rooms[value].pk if value else None
+            elif column in ('full_name', 'lease_start_date', 'is_active'):
+                if value: # Required on the model; blank keeps the current value
+                    parsed[column] = {'lease_start_date': _parse_date, 'is_active': _parse_bool}.get(column, str)(value)
+            elif column == 'lease_end_date':
+                parsed[column] = _parse_date(value) if value else None
+            elif column in ('fixed_water_charge', 'fixed_wifi_charge'):
+                parsed[column] = _parse_charge(value) if value else None
+            elif column == 'notification_channel':
+                channels = dict(Tenant.CHANNEL_CHOICES)
+                if value and value.lower() not in channels:
+                    raise ValidationError(f"'{value}' is not one of {', '.join(channels)}.")
+                parsed[column] = value.lower() or Tenant.CHANNEL_EMAIL
+            elif column == 'email':
+                if value:
+                    validate_email(value)
+                parsed[column] = value.lower()
+            else:
+                parsed[column] = value
+            field = Tenant._meta.get_field('room' if column == 'room_number' else column)
+            if getattr(field, 'max_length', None) and len(value) > field.max_length:
+                raise ValidationError(f"Longer than {field.max_length} characters.")
+        except ValidationError as e:
+            row.errors.append(f"{column}: {' '.join(e.messages)}")
+    return parsed
+
+
+def _match_tenant(row, by_id, by_email):
+    tenant_id, email = row.values.get('tenant_id'), row.values.get('email', '').lower()
+    if tenant_id:
+        if not tenant_id.isdigit() or int(tenant_id) not in by_id:
+            row.errors.append(f"tenant_id: No tenant {tenant_id} in this property.")
+            return None
+        return by_id[int(tenant_id)]
+    return by_email.get(email) if email else None
+
+
+def _username(row, tenant):
+    return row.values.get('username') or tenant.email or slugify(tenant.full_name) or f"tenant-{row.line}"
+
+
+def plan_import(records, current_property, create_users=False):
+    """Validate `records` (from read_rows) against the tenants and rooms of `current_property`,
+    which must be routed to its database. Nothing is written."""
+    rooms = {room.room_number: room for room in Room.objects.filter(property=current_property)}
+    existing = list(Tenant.objects.filter(property=current_property))
+    by_id = {tenant.pk: tenant for tenant in existing}
+    by_email = {}
+    for tenant in existing:
+        if tenant.email:
+            by_email.setdefault(tenant.email.lower(), tenant)
+
+    rows, seen = [], {}
+    for line, values in records:
+        row = ImportRow(line, values)
+        rows.append(row)
+        parsed = _parse_values(row, rooms)
+        current = _match_tenant(row, by_id, by_email)
+        if row.errors:
+            continue
+        if current is None:
+            missing = [column for column in ('full_name', 'lease_start_date') if column not in parsed]
+            if missing:
+                row.errors.append(f"New tenants need {' and '.join(missing)}.")
+                continue
+            row.tenant = Tenant(property=current_property, **parsed)
+            row.action = 'create'
+            row.changes = {field: (None, value) for field, value in parsed.items() if value not in (None, '')}
+        else:
+            key = current.pk
+            if key in seen:
+                row.errors.append(f"Same tenant as line {seen[key]}.")
+                continue
+            seen[key] = line
+            row.tenant = Tenant(**{f.attname: getattr(current, f.attname) for f in Tenant._meta.concrete_fields})
+            row.tenant._state.adding, row.tenant._state.db = False, current._state.db
+            row.changes = {
+                field: (getattr(current, field), value) for field, value in parsed.items() if getattr(current, field) != value
+            }
+            for field, (old, new) in row.changes.items():
+                setattr(row.tenant, field, new)
+            row.action = 'update' if row.changes else 'unchanged'
+        if row.tenant.lease_end_date and row.tenant.lease_end_date < row.tenant.lease_start_date:
+            row.errors.append("lease_end_date is before lease_start_date.")
+        if create_users and row.tenant.user_id is None:
+            row.username = _username(row, row.tenant)[:150]
+        if row.action == 'create' and row.tenant.email:
+            email_key = ('email', row.tenant.email)
+            if email_key in seen:
+                row.errors.append(f"Same email as line {seen[email_key]}.")
+            seen[email_key] = line
+
+    room_numbers = {room.pk: number for number, room in rooms.items()}
+    _check_usernames(rows)
+    _check_room_overlaps(rows, existing, room_numbers)
+    return ImportPlan(current_property, rows, room_numbers)
+
+
+def _check_usernames(rows):
+    wanted = [row for row in rows if row.username and not row.errors]
+    taken = set(User.objects.filter(username__in=[row.username for row in wanted]).values_list('username', flat=True))
+    lines = {}
+    for row in wanted:
+        if row.username in taken:
+            row.errors.append(f"username: A login named '{row.username}' already exists.")
+        elif row.username in lines:
+            row.errors.append(f"username: '{row.username}' is also used on line {lines[row.username]}.")
+        lines.setdefault(row.username, row.line)
+
+
+def _check_room_overlaps(rows, existing, room_numbers):
+    """Flag rows whose lease overlaps another lease of the same room, once the file is applied."""
+    leases = {tenant.pk: (tenant, None) for tenant in existing}
+    for row in rows:
+        if row.errors or row.tenant is None:
+            continue
+        if row.action == 'create':
+            leases[('line', row.line)] = (row.tenant, row)
+        elif LEASE_FIELDS & set(row.changes): # Leases the file leaves alone don't fail on older conflicts
+            leases[row.tenant.pk] = (row.tenant, row)
+    by_room = {}
+    for tenant, row in leases.values():
+        values = lease_values(tenant)
+        if values is not None:
+            room_id, start, end = values
+            by_room.setdefault(room_id, []).append((start, end or OPEN_END, tenant, row))
+
+    for room_id, intervals in by_room.items():
+        intervals.sort(key=lambda interval: interval[:2])
+        latest = None # The interval reaching furthest so far
+        for interval in intervals:
+            start, end, tenant, row = interval
+            if latest is not None and start <= latest[1]:
+                other = latest
+                for own, theirs in ((row, other), (other[3], interval)):
+                    if own is not None:
+                        _, other_end, other_tenant, other_row = theirs
+                        where = f" (line {other_row.line})" if other_row else ''
+                        own.errors.append(
+                            f"Room {room_numbers.get(room_id, room_id)} is double-booked: the lease overlaps "
+                            f"{other_tenant.full_name}{where}, {theirs[0]} to {'open end' if other_end == OPEN_END else other_end}."
+                        )
+            if latest is None or end > latest[1]:
+                latest = interval
+
+
+def apply_import(plan):
+    """Write the valid rows of `plan` in one transaction. Returns the plan's counts."""
+    rows = [row for row in plan.valid_rows() if row.action != 'unchanged' or row.username]
+    to_create = [row.tenant for row in rows if row.action == 'create']
+    to_update = [row for row in rows if row.action != 'create']
+    update_fields = sorted({field for row in to_update for field in row.changes})
+    with_users = [row for row in rows if row.username]
+
+    # Logins live in the catalog database; both transactions roll back together on errors.
+    with transaction.atomic(using=DEFAULT_DB_ALIAS), transaction.atomic(using=router.db_for_write(Tenant)):
+        if with_users:
+            users = [User(username=row.username, email=row.tenant.email) for row in with_users]
+            for user in users:
+                user.set_unusable_password() # Set with the password reset flow
+            User.objects.bulk_create(users)
+            for row, user in zip(with_users, users):
+                row.tenant.user_id = user.pk
+            if any(row.action != 'create' for row in with_users):
+                update_fields = sorted(set(update_fields) | {'user_id'})
+        Tenant.objects.bulk_create(to_create, batch_size=500)
+        if update_fields:
+            Tenant.objects.bulk_update([row.tenant for row in to_update], update_fields, batch_size=500)
+
+        sync_lease_periods([row.tenant for row in rows if row.action == 'create' or LEASE_FIELDS & set(row.changes)])
+        index_objects(Tenant, [tenant.pk for tenant in to_create])
+        if to_update: # Search documents name fields like save(update_fields=...) does: 'room', not 'room_id'
+            changed_fields = [field.removesuffix('_id') for field in update_fields]
+            reindex(Tenant, [row.tenant.pk for row in to_update], changed_fields=changed_fields)
+    return plan.counts()
@@ -1,3 +1,1415 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+import urllib.error
+from unittest import mock
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, ROUND_HALF_UP, ROUND_UP, Decimal, localcontext
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    balances, estimates, forecast, ingest, invoices, jobs, ledger, money, notifications, outbox, room_meters, search, snapshot,
+)
+from .archive import archive_settled_bills, bills_with_archive, restore_archived_bills
+from .availability import AvailabilityIndex, RoomIntervals, sync_lease_period
+from .allocation import allocate_payments
+from .forms import EnqueueBillingJobForm
+from .invoices import load_invoice_payloads
+from .journal import bill_history
+from .late_fees import LateFeeRule, accrue_late_fees
+from .pdf import render_text_pdf
+from .reconciliation import confirm_line, read_statement, reconcile
+from .scheduling import CronSchedule
+from .sharding import use_property
+from .snapshot_reader import SnapshotReader
+from .tenant_import import apply_import, plan_import, read_rows
+from .models import (
+    ArchivedBill, BankStatementLine, Bill, BillingJob, ElectricityReading, JournalEntry, LeasePeriod, LedgerEntry,
+    NotificationLog, OutboxEvent, Payment, Property, Room, RoomMeterAllocation, RoomMeterReading, SearchDocument,
+    Tenant, TenantPayment,
+)
+
+
+ROUNDINGS = (ROUND_HALF_UP, ROUND_HALF_EVEN, ROUND_DOWN, ROUND_UP)
+
+
+def random_amount(rng, places=2, digits=8):
+    """A random Decimal with `places` decimals, ties (…5 in the last place) included often."""
+    units = rng.randrange(-10 ** digits, 10 ** digits)
+    if rng.random() < 0.3:
+        units = units // 10 * 10 + 5
+    return Decimal(units).scaleb(-places)
+
+
+@override_settings(BILLING_BALANCE_CACHE='default')
+class BillingTestCase(TestCase):
+    """Keeps the balance versions written on every bill and payment change in the
+    local-memory cache rather than the shared 'billing' cache."""
+
+
+class BillingJobTests(BillingTestCase):
+    def test_enqueue_keeps_only_the_options_of_the_job_type(self):
+        job = jobs.enqueue('generate_rent_bills', {'month': 5, 'due_days': None, 'force': '', 'upcoming_days': 3})
+        self.assertEqual((job.status, job.options, job.attempts), (BillingJob.STATUS_QUEUED, {'month': 5}, 0))
+        with self.assertRaises(ValueError):
+            jobs.enqueue('flush')
+
+    def test_claim_takes_due_jobs_oldest_first_and_only_once(self):
+        now = timezone.now()
+        jobs.enqueue('generate_rent_bills', run_after=now + datetime.timedelta(hours=1))
+        second = jobs.enqueue('generate_rent_bills', run_after=now - datetime.timedelta(minutes=1))
+        first = jobs.enqueue('generate_fixed_water_bills', run_after=now - datetime.timedelta(minutes=5))
+
+        job = jobs.claim_next_job('worker-1')
+        self.assertEqual((job.pk, job.status, job.worker_id, job.attempts), (first.pk, BillingJob.STATUS_RUNNING, 'worker-1', 1))
+        self.assertEqual(jobs.claim_next_job('worker-2').pk, second.pk)
+        self.assertIsNone(jobs.claim_next_job('worker-3')) # The last one is not due yet
+
+    def test_failed_runs_are_retried_with_growing_backoff(self):
+        jobs.enqueue('generate_rent_bills', max_attempts=3)
+        backoffs = []
+        with mock.patch('billing.jobs.call_command', side_effect=RuntimeError('database is locked')):
+            for attempt in range(3):
+                job = jobs.claim_next_job('worker-1')
+                self.assertFalse(jobs.run_job(job))
+                job.refresh_from_db()
+                backoffs.append((job.status, (job.run_after - job.finished_at).total_seconds()))
+                BillingJob.objects.filter(pk=job.pk).update(run_after=timezone.now()) # Don't wait for the retry
+
+        self.assertEqual(backoffs[:2], [(BillingJob.STATUS_QUEUED, 30.0), (BillingJob.STATUS_QUEUED, 60.0)])
+        self.assertEqual(backoffs[2][0], BillingJob.STATUS_FAILED)
+        self.assertEqual(job.progress, 'Failed after 3 attempt(s): database is locked')
+        self.assertIn('RuntimeError: database is locked', job.last_error)
+        self.assertIsNone(jobs.claim_next_job('worker-1'))
+
+    def test_run_job_records_the_command_output(self):
+        building = Property.objects.create(name='Test', code='test')
+        room = Room.objects.create(property=building, room_number='101', base_rent=Decimal('500.00'))
+        Tenant.objects.create(property=building, full_name='Ana', room=room, lease_start_date=datetime.date(2024, 1, 1))
+        jobs.enqueue('generate_rent_bills', {'month': 3, 'year': 2024})
+
+        job = jobs.claim_next_job('worker-1')
+        self.assertTrue(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, BillingJob.STATUS_SUCCEEDED)
+        self.assertIn('Created rent bill for Ana', job.output)
+        self.assertEqual(job.progress, 'Successfully created 1 rent bill(s).')
+        self.assertEqual(Bill.objects.get().due_date, datetime.date(2024, 3, 5))
+
+    def test_a_run_does_not_overwrite_a_job_requeued_meanwhile(self):
+        for failure in (None, RuntimeError('database is locked')):
+            jobs.enqueue('generate_rent_bills')
+            job = jobs.claim_next_job('worker-1')
+
+            def taken_over(*args, **options):
+                # The worker looked dead, so the job went back to the queue and another worker took it.
+                BillingJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(hours=1))
+                jobs.requeue_stale_jobs(600)
+                jobs.claim_next_job('worker-2')
+                options['stdout'].write('Created rent bill for Ana\n')
+                if failure:
+                    raise failure
+
+            with mock.patch('billing.jobs.call_command', side_effect=taken_over):
+                self.assertFalse(jobs.run_job(job))
+            job.refresh_from_db()
+            self.assertEqual(
+                (job.status, job.worker_id, job.output, job.last_error), (BillingJob.STATUS_RUNNING, 'worker-2', '', '')
+            )
+
+    def test_due_days_must_be_at_least_one(self):
+        form = EnqueueBillingJobForm(data={'job_type': 'generate_rent_bills', 'due_days': 0, 'max_attempts': 3})
+        self.assertFalse(form.is_valid())
+        self.assertIn('due_days', form.errors)
+
+
+class BillingJobHeartbeatTests(TransactionTestCase):
+    # The heartbeat is written from its own thread, outside a test transaction.
+
+    def test_a_quiet_command_keeps_its_job_alive(self):
+        jobs.enqueue('generate_rent_bills')
+        job = jobs.claim_next_job('worker-1')
+        heartbeats = []
+
+        def quiet_command(*args, **options):
+            time.sleep(0.5) # Writes nothing, so only the heartbeat thread touches the job
+            heartbeats.append(BillingJob.objects.get(pk=job.pk).heartbeat_at)
+
+        with mock.patch.object(jobs, 'HEARTBEAT_SECONDS', 0.1), mock.patch('billing.jobs.call_command', side_effect=quiet_command):
+            self.assertTrue(jobs.run_job(job))
+        self.assertGreater(heartbeats[0], job.heartbeat_at)
+
+
+class CronScheduleTests(SimpleTestCase):
+    def test_parsing(self):
+        cron = CronSchedule('*/15 6-8 1,15 * 7')
+        self.assertEqual(sorted(cron.minutes), [0, 15, 30, 45])
+        self.assertEqual(sorted(cron.hours), [6, 7, 8])
+        self.assertEqual(cron.weekdays, {0}) # 7 is Sunday too
+        self.assertEqual(sorted(CronSchedule('5/20 0 * * *').minutes), [5, 25, 45])
+        for expression in ('* * * *', '60 * * * *', '* * 0 * *', '5-1 * * * *', '*/0 * * * *', 'a * * * *'):
+            with self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+    def test_next_and_previous_runs(self):
+        cron = CronSchedule('30 6 * * *')
+        moment = datetime.datetime(2024, 3, 1, 6, 30, 15)
+        self.assertEqual(cron.next_after(moment), datetime.datetime(2024, 3, 2, 6, 30)) # Strictly after
+        self.assertEqual(cron.previous_before(moment), datetime.datetime(2024, 3, 1, 6, 30)) # At or before
+        self.assertEqual(cron.next_after(datetime.datetime(2024, 12, 31, 23, 59)), datetime.datetime(2025, 1, 1, 6, 30))
+
+        # Restricting both day fields runs on either: the 1st, and Mondays (2024-03-04).
+        either = CronSchedule('0 0 1 * 1')
+        self.assertEqual(either.next_after(datetime.datetime(2024, 3, 1)), datetime.datetime(2024, 3, 4))
+        self.assertEqual(either.previous_before(datetime.datetime(2024, 3, 3)), datetime.datetime(2024, 3, 1))
+        self.assertEqual(CronSchedule('0 0 29 2 *').next_after(datetime.datetime(2024, 3, 1)), datetime.datetime(2028, 2, 29))
+        with self.assertRaises(ValueError):
+            CronSchedule('0 0 31 2 *').next_after(datetime.datetime(2024, 1, 1))
+
+
+class BillingSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        handle, self.status_file = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.status_file)
+
+    def run_scheduler(self, last_run_at, *args):
+        with open(self.status_file, 'w') as f:
+            json.dump({'entries': {'checks': {'last_run_at': last_run_at.isoformat()}}}, f)
+        out = io.StringIO()
+        schedule = [{'name': 'checks', 'command': 'check', 'schedule': '0 6 * * *'}]
+        with override_settings(BILLING_SCHEDULE=schedule):
+            call_command('billing_scheduler', '--once', *args, status_file=self.status_file, stdout=out, stderr=io.StringIO())
+        with open(self.status_file) as f:
+            return out.getvalue(), json.load(f)['entries']['checks']
+
+    def test_missed_runs_are_caught_up_once(self):
+        now = timezone.localtime()
+        slot = CronSchedule('0 6 * * *').previous_before(now)
+        out, record = self.run_scheduler(now - datetime.timedelta(days=3))
+        self.assertIn(f"Catching up missed run of 'checks' scheduled for {slot}", out)
+        self.assertIn('System check identified no issues', out) # The command writes to the scheduler's stdout
+        self.assertEqual(out.count('Running '), 1) # Three missed slots, one run
+        self.assertEqual((record['last_status'], record['last_run_at']), ('succeeded', slot.isoformat()))
+        self.assertEqual(record['next_run_at'], CronSchedule('0 6 * * *').next_after(now).isoformat())
+
+        out, record = self.run_scheduler(now - datetime.timedelta(days=3), '--no_catch_up')
+        self.assertNotIn('Running ', out)
+
+
+class InvoiceTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        room = Room.objects.create(property=building, room_number='101', base_rent=Decimal('500.00'))
+        self.ana = Tenant.objects.create(property=building, full_name='Ana Cruz', email='ana@example.com', room=room, lease_start_date=datetime.date(2024, 1, 1))
+        self.ben = Tenant.objects.create(property=building, full_name='Ben', lease_start_date=datetime.date(2024, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.ana, bill_type='Rent', amount=Decimal('500.00'), due_date=datetime.date(2024, 3, 5))
+        Bill.objects.create(tenant=self.ana, bill_type='Water', amount=Decimal('40.00'), due_date=datetime.date(2024, 3, 20))
+        Bill.objects.create(tenant=self.ben, bill_type='WiFi', amount=Decimal('30.00'), due_date=datetime.date(2024, 3, 10))
+        Bill.objects.create(tenant=self.ben, bill_type='WiFi', amount=Decimal('30.00'), due_date=datetime.date(2024, 4, 10))
+        Payment.objects.create(bill=self.rent, tenant=self.ana, amount_paid=Decimal('200.00'), payment_date=datetime.date(2024, 3, 1))
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def render(self, *args):
+        out = io.StringIO()
+        call_command(
+            'render_invoices', '--month=3', '--year=2024', '--workers=1', f'--output_dir={self.output_dir}', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_payloads_are_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            ana, ben = load_invoice_payloads(2024, 3)
+        self.assertEqual(ana['tenant']['room_number'], '101')
+        self.assertEqual(
+            [(bill['bill_type'], bill['amount_paid']) for bill in ana['bills']], [('Rent', Decimal('200.00')), ('Water', Decimal('0.00'))]
+        )
+        self.assertEqual((ana['total_amount'], ana['total_paid'], ana['balance_due']), (Decimal('540.00'), Decimal('200.00'), Decimal('340.00')))
+        self.assertEqual((ben['tenant']['room_number'], len(ben['bills'])), ('', 1)) # April's bill is not on it
+        self.assertEqual([payload['tenant']['id'] for payload in load_invoice_payloads(2024, 3, [self.ben.pk])], [self.ben.pk])
+
+    def test_unchanged_invoices_are_skipped_unless_forced(self):
+        self.assertIn('2 to render, 0 unchanged', self.render('--format=html'))
+        with open(os.path.join(self.output_dir, '2024-03', f'invoice-202403-tenant{self.ana.pk}.html')) as f:
+            self.assertIn('Ana Cruz', f.read())
+        self.assertIn('0 to render, 2 unchanged', self.render('--format=html'))
+        self.assertIn('2 to render, 0 unchanged', self.render('--format=html', '--force'))
+
+        Payment.objects.create(bill=self.rent, tenant=self.ana, amount_paid=Decimal('300.00'), payment_date=datetime.date(2024, 3, 2))
+        self.assertIn('1 to render, 1 unchanged', self.render('--format=html'))
+        self.assertIn('2 to render, 0 unchanged', self.render('--format=pdf'))
+
+    def test_fingerprint_covers_extended_and_included_templates(self):
+        template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, template_dir)
+
+        def write(name, source):
+            path = os.path.join(template_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(source)
+
+        write('billing/invoice/invoice.txt', '{% extends "invoice_base.txt" %}{% block body %}{% include "invoice_lines.txt" %}{% endblock %}')
+        write('invoice_base.txt', 'Statement: {% block body %}{% endblock %}')
+        write('invoice_lines.txt', '{% for bill in invoice.bills %}{{ bill.bill_type }} {% endfor %}')
+        engine = {
+            'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [template_dir],
+            'OPTIONS': {'loaders': ['django.template.loaders.filesystem.Loader']}, # Not cached: the files change below
+        }
+        with override_settings(TEMPLATES=[engine]):
+            fingerprints = [invoices.template_fingerprint('pdf')]
+            for name, source in (('invoice_base.txt', 'Invoice: {% block body %}{% endblock %}'), ('invoice_lines.txt', 'No lines')):
+                write(name, source)
+                fingerprints.append(invoices.template_fingerprint('pdf'))
+            self.assertEqual(len(set(fingerprints)), 3)
+            self.assertEqual(invoices.template_fingerprint('pdf'), fingerprints[-1])
+
+    def test_pdf_is_well_formed(self):
+        lines = [f"Line {number} (paid)" for number in range(80)] # Two pages
+        data = render_text_pdf('\n'.join(lines), title='Invoice 2024-03')
+        self.assertTrue(data.startswith(b'%PDF-1.4\n'))
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 2', data)
+        self.assertIn(b'(Line 0 \\(paid\\)) Tj', data)
+
+        xref_offset = int(data.rsplit(b'startxref\n', 1)[1].split()[0])
+        xref = data[xref_offset:].split(b'\n')
+        self.assertEqual(xref[0], b'xref')
+        size = int(xref[1].split()[1])
+        self.assertIn(b'/Size %d ' % size, data)
+        for number, entry in enumerate(xref[3:size + 2], start=1):
+            self.assertTrue(data[int(entry[:10]):].startswith(b'%d 0 obj\n' % number), number)
+        streams = list(re.finditer(rb'<< /Length (\d+) >>\nstream\n', data))
+        self.assertEqual(len(streams), 2)
+        for match in streams:
+            self.assertTrue(data[match.end() + int(match.group(1)):].startswith(b'\nendstream'))
+
+
+class AllocationTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        self.bills = [
+            Bill.objects.create(tenant=self.tenant, bill_type=bill_type, amount=Decimal(amount), due_date=datetime.date(2024, 1, day))
+            for bill_type, amount, day in (('Water', '40.00', 20), ('Rent', '500.00', 5), ('Electricity', '80.00', 10))
+        ]
+
+    def pay(self, amount):
+        tenant_payment = TenantPayment.objects.create(tenant=self.tenant, amount=Decimal(amount), payment_date=datetime.date(2024, 2, 1))
+        return tenant_payment, allocate_payments([tenant_payment.pk])
+
+    def test_oldest_due_date_first_with_partial_allocation(self):
+        tenant_payment, summary = self.pay('550.00')
+        self.assertEqual((summary['allocations'], summary['bills_paid'], summary['credit_remaining']), (2, 1, Decimal('0.00')))
+        water, rent, electricity = self.bills
+        self.assertEqual(
+            list(tenant_payment.allocations.order_by('id').values_list('bill_id', 'amount_paid')),
+            [(rent.pk, Decimal('500.00')), (electricity.pk, Decimal('50.00'))],
+        )
+        self.assertEqual(list(Bill.objects.filter(is_paid=True).values_list('pk', flat=True)), [rent.pk])
+
+        # The next lump sum picks up where the last one stopped; the rest is kept as credit.
+        tenant_payment, summary = self.pay('100.00')
+        self.assertEqual(summary['credit_remaining'], Decimal('30.00'))
+        self.assertFalse(Bill.objects.filter(is_paid=False).exists())
+
+    def test_priority_comes_before_due_date(self):
+        tenant_payment = TenantPayment.objects.create(tenant=self.tenant, amount=Decimal('100.00'), payment_date=datetime.date(2024, 2, 1))
+        allocate_payments([tenant_payment.pk], priority=['Water', 'Electricity'])
+        water, rent, electricity = self.bills
+        self.assertEqual(
+            list(tenant_payment.allocations.order_by('id').values_list('bill_id', 'amount_paid')),
+            [(water.pk, Decimal('40.00')), (electricity.pk, Decimal('60.00'))],
+        )
+
+    def test_undoing_an_allocation_returns_the_credit(self):
+        tenant_payment, _ = self.pay('100.00')
+        water, rent, electricity = self.bills
+        tenant_payment.allocations.get(bill=rent).delete()
+        rent.refresh_from_db()
+        tenant_payment.refresh_from_db()
+        self.assertFalse(rent.is_paid)
+        self.assertEqual(tenant_payment.unallocated_amount, Decimal('100.00'))
+        allocate_payments([tenant_payment.pk], priority=['Water', 'Electricity'])
+        self.assertEqual(
+            sorted(tenant_payment.allocations.values_list('bill_id', 'amount_paid')),
+            sorted([(water.pk, Decimal('40.00')), (electricity.pk, Decimal('60.00'))]),
+        )
+
+
+class AccrueLateFeesTests(BillingTestCase):
+    def test_reruns_charge_only_the_difference_up_to_the_cap(self):
+        building = Property.objects.create(name='Test', code='test')
+        tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        bill = Bill.objects.create(tenant=tenant, bill_type='Rent', amount=Decimal('1000.00'), due_date=datetime.date(2024, 3, 1))
+        rules = {'Rent': LateFeeRule(flat_fee='10.00', daily_rate='0.01', cap='50.00')}
+
+        def accrue(day, **options):
+            return [fee.amount for fee in accrue_late_fees(datetime.date(2024, 3, day), rules=rules, **options)]
+
+        self.assertEqual(accrue(3, dry_run=True), [Decimal('30.00')])
+        self.assertFalse(bill.late_fees.exists())
+        self.assertEqual(accrue(3), [Decimal('30.00')]) # 10.00 + 2 days x 10.00
+        self.assertEqual(accrue(3), [])
+        self.assertEqual(accrue(4), [Decimal('10.00')])
+        Bill.objects.filter(parent_bill=bill).update(is_paid=True) # Paid fees still count as charged
+        self.assertEqual(accrue(10), [Decimal('10.00')]) # 100.00 owed, capped at 50.00
+        self.assertEqual(accrue(20), [])
+        self.assertEqual(bill.late_fees.aggregate(total=Sum('amount'))['total'], Decimal('50.00'))
+        self.assertEqual(accrue_late_fees(datetime.date(2024, 3, 20), rules={'Water': LateFeeRule(flat_fee='5')}), [])
+
+    def test_bulk_accrual_matches_fee_for(self):
+        building = Property.objects.create(name='Test', code='test')
+        room = Room.objects.create(property=building, room_number='1', base_rent=Decimal('500.00'))
+        tenant = Tenant.objects.create(property=building, room=room, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        as_of = datetime.date(2024, 3, 1)
+        rule = LateFeeRule(grace_days=5, flat_fee='10.00', daily_rate='0.0035', cap='75.00')
+        amounts = [Decimal('333.33'), Decimal('1234.57'), Decimal('10.01')]
+        for days_late, amount in zip((3, 20, 40), amounts):
+            Bill.objects.create(tenant=tenant, bill_type='Rent', amount=amount, due_date=as_of - datetime.timedelta(days=days_late))
+
+        fees = accrue_late_fees(as_of, rules={'default': rule})
+        by_parent = {fee.parent_bill_id: fee.amount for fee in fees}
+        for bill in Bill.objects.filter(bill_type='Rent'):
+            expected = rule.fee_for(bill.amount, (as_of - bill.due_date).days)
+            self.assertEqual(by_parent.get(bill.pk, Decimal('0.00')), expected)
+
+        self.assertEqual(accrue_late_fees(as_of, rules={'default': rule}), []) # Nothing more is owed the same day
+
+
+class ArchiveTests(BillingTestCase):
+    RULES = {'default': LateFeeRule(flat_fee='100.00', daily_rate='0.005', cap='1000.00')}
+
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2023, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.tenant, bill_type='Rent', amount=Decimal('1000.00'), due_date=datetime.date(2024, 1, 1))
+        self.fee = accrue_late_fees(datetime.date(2024, 1, 20), rules=self.RULES)[0] # 100.00 + 19 days x 5.00
+        self.pay(self.fee)
+
+    def pay(self, bill):
+        return Payment.objects.create(bill=bill, tenant=self.tenant, amount_paid=bill.amount, payment_date=datetime.date(2024, 2, 1))
+
+    def test_settled_bills_move_to_the_archive_with_their_fees(self):
+        self.assertEqual(self.fee.amount, Decimal('195.00'))
+        water = Bill.objects.create(tenant=self.tenant, bill_type='Water', amount=Decimal('40.00'), due_date=datetime.date(2024, 6, 1))
+        self.pay(self.rent)
+        self.assertEqual(archive_settled_bills(datetime.date(2025, 1, 1)), (2, 2))
+        self.assertEqual(list(Bill.objects.values_list('pk', flat=True)), [water.pk]) # Unpaid
+        self.assertEqual(set(ArchivedBill.objects.values_list('id', 'parent_bill_id')), {(self.rent.pk, None), (self.fee.pk, self.rent.pk)})
+        self.assertEqual(
+            sorted((row['id'], row['is_archived']) for row in bills_with_archive(tenant_id=self.tenant.pk)),
+            [(self.rent.pk, True), (self.fee.pk, True), (water.pk, False)],
+        )
+
+    def test_restore_brings_back_parents_with_their_dates(self):
+        self.pay(self.rent)
+        created = Bill.objects.get(pk=self.rent.pk).date_created
+        archive_settled_bills(datetime.date(2025, 1, 1))
+        self.assertEqual(restore_archived_bills(ArchivedBill.objects.filter(bill_type='Late Fee')), (2, 2))
+        self.assertFalse(ArchivedBill.objects.exists())
+        self.assertEqual(Bill.objects.get(pk=self.rent.pk).date_created, created)
+        self.assertEqual(Bill.objects.get(pk=self.fee.pk).parent_bill_id, self.rent.pk)
+
+    def test_paid_fees_stay_while_their_bill_is_open(self):
+        self.assertEqual(archive_settled_bills(datetime.date(2025, 1, 1)), (0, 0))
+        self.assertEqual(accrue_late_fees(datetime.date(2024, 1, 20), rules=self.RULES), [])
+
+    def test_archived_fees_still_count_once_their_bill_reopens(self):
+        payment = self.pay(self.rent)
+        archive_settled_bills(datetime.date(2025, 1, 1))
+        self.assertEqual(restore_archived_bills(ArchivedBill.objects.filter(pk=self.rent.pk)), (1, 1)) # Without its fee
+        Payment.objects.get(pk=payment.pk).delete()
+        self.assertEqual([fee.amount for fee in accrue_late_fees(datetime.date(2024, 1, 30), rules=self.RULES)], [Decimal('50.00')])
+
+
+class JournalTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.tenant, bill_type='Rent', amount=Decimal('500.00'), due_date=datetime.date(2024, 3, 5))
+        self.water = Bill.objects.create(tenant=self.tenant, bill_type='Water', amount=Decimal('40.00'), due_date=datetime.date(2024, 3, 20))
+
+    def updates(self):
+        return [(entry.object_id, entry.changes) for entry in JournalEntry.objects.filter(action='update').order_by('id')]
+
+    def test_saves_record_only_the_changed_fields(self):
+        created = JournalEntry.objects.get(model_name='bill', object_id=self.rent.pk)
+        self.assertEqual((created.action, created.changes['amount'], created.changes['due_date']), ('create', '500.00', '2024-03-05'))
+        bill = Bill.objects.get(pk=self.rent.pk)
+        bill.amount = Decimal('450.00')
+        bill.save()
+        bill.save() # Nothing changed since
+        self.assertEqual(self.updates(), [(self.rent.pk, {'amount': '450.00'})])
+
+    def test_bulk_updates_are_one_batch_each(self):
+        Bill.objects.filter(tenant=self.tenant).update(is_paid=True)
+        rent, water = Bill.objects.order_by('pk')
+        rent.amount, water.amount = Decimal('510.00'), Decimal('45.00')
+        Bill.objects.bulk_update([rent, water], ['amount'])
+        self.assertEqual(self.updates(), [
+            (rent.pk, {'is_paid': True}), (water.pk, {'is_paid': True}), (rent.pk, {'amount': '510.00'}), (water.pk, {'amount': '45.00'}),
+        ])
+        batches = list(JournalEntry.objects.filter(action='update').order_by('id').values_list('batch_id', flat=True))
+        self.assertIsNotNone(batches[0])
+        self.assertEqual((batches[0] == batches[1], batches[2] == batches[3], batches[1] == batches[2]), (True, True, False))
+
+    def test_admin_list_edits_are_one_batch_by_the_user(self):
+        self.client.force_login(User.objects.create_superuser('clerk', 'clerk@example.com', 'secret'))
+        data = {'form-TOTAL_FORMS': '2', 'form-INITIAL_FORMS': '2', '_save': 'Save'}
+        for index, (bill, amount) in enumerate(((self.rent, '520.00'), (self.water, '40.00'))):
+            data.update({
+                f'form-{index}-id': bill.pk, f'form-{index}-amount': amount,
+                f'form-{index}-due_date': bill.due_date.isoformat(), f'form-{index}-is_paid': 'on',
+            })
+        response = self.client.post(reverse('admin:billing_bill_changelist'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(self.updates()), [(self.rent.pk, {'amount': '520.00', 'is_paid': True}), (self.water.pk, {'is_paid': True})])
+        batches = set(JournalEntry.objects.filter(action='update').values_list('changed_by', 'batch_id'))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches.pop()[0], 'clerk')
+
+    def test_deletes_and_archiving_are_recorded(self):
+        payment = Payment.objects.create(bill=self.rent, tenant=self.tenant, amount_paid=Decimal('500.00'), payment_date=datetime.date(2024, 3, 1))
+        self.assertEqual(archive_settled_bills(datetime.date(2025, 1, 1)), (1, 1))
+        water_id = self.water.pk
+        self.water.delete()
+        self.assertEqual(
+            list(JournalEntry.objects.filter(action__in=['archive', 'delete']).values_list('model_name', 'object_id', 'action')),
+            [('payment', payment.pk, 'archive'), ('bill', self.rent.pk, 'archive'), ('bill', water_id, 'delete')],
+        )
+        self.assertTrue(bill_history(self.rent.pk)['archived'])
+        self.assertIsNone(bill_history(water_id))
+
+    def test_history_rebuilds_an_earlier_state(self):
+        before_changes = timezone.now()
+        bill = Bill.objects.get(pk=self.rent.pk)
+        bill.amount = Decimal('450.00')
+        bill.save()
+        Payment.objects.create(bill=bill, tenant=self.tenant, amount_paid=Decimal('450.00'), payment_date=datetime.date(2024, 3, 1))
+
+        state = bill_history(self.rent.pk, as_of=before_changes)
+        self.assertEqual((state['amount'], state['is_paid'], state['bill_type']), ('500.00', False, 'Rent'))
+        state = bill_history(self.rent.pk)
+        self.assertEqual((state['amount'], state['is_paid']), ('450.00', True))
+        self.assertIsNone(bill_history(self.rent.pk, as_of=before_changes - datetime.timedelta(days=1)))
+
+        out = io.StringIO()
+        call_command('bill_history', str(self.rent.pk), as_of=before_changes.isoformat(), stdout=out)
+        self.assertIn('amount: 500.00', out.getvalue())
+        self.assertNotIn('update', out.getvalue())
+
+    def test_entries_cannot_be_changed(self):
+        entry = JournalEntry.objects.first()
+        entry.changes = {}
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            entry.delete()
+        self.assertNotEqual(JournalEntry.objects.get(pk=entry.pk).changes, {})
+
+
+class SearchTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.room = Room.objects.create(property=building, room_number='B12', base_rent=Decimal('500.00'))
+        self.ana = Tenant.objects.create(property=building, full_name='Ana Cruz', email='ana@example.com', room=self.room, lease_start_date=datetime.date(2024, 1, 1))
+        self.ben = Tenant.objects.create(property=building, full_name='Ben Reyes', lease_start_date=datetime.date(2024, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.ana, bill_type='Rent', amount=Decimal('500.00'), due_date=datetime.date(2024, 3, 5))
+        self.wifi = Bill.objects.create(tenant=self.ben, bill_type='WiFi', amount=Decimal('30.00'), due_date=datetime.date(2024, 3, 10))
+
+    def search(self, model, term):
+        return set(search.search_queryset(model.objects.all(), term).values_list('pk', flat=True))
+
+    def indexed(self, term):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH %s", [term])
+            return {rowid for rowid, in cursor.fetchall()}
+
+    def test_triggers_keep_the_index_in_step(self):
+        self.assertEqual(self.indexed('cruz'), {search.document_id(Tenant, self.ana.pk), search.document_id(Bill, self.rent.pk)})
+        self.ben.full_name = 'Ben Santos'
+        self.ben.save()
+        self.assertEqual(self.indexed('reyes'), set())
+        self.assertEqual(self.indexed('santos'), {search.document_id(Tenant, self.ben.pk), search.document_id(Bill, self.wifi.pk)})
+        self.wifi.delete()
+        self.assertEqual(self.indexed('santos'), {search.document_id(Tenant, self.ben.pk)})
+
+    def test_renames_reindex_the_documents_that_embed_them(self):
+        self.assertEqual(self.search(Bill, 'b12'), {self.rent.pk})
+        self.room.room_number = 'C7'
+        self.room.save()
+        self.assertEqual(self.search(Tenant, 'c7'), {self.ana.pk})
+        self.assertEqual(self.search(Bill, 'c7'), {self.rent.pk})
+        self.assertEqual(self.search(Bill, 'b12'), set())
+        self.ana.full_name = 'Ana Santos'
+        self.ana.save()
+        self.assertEqual(self.search(Bill, 'santos rent'), {self.rent.pk})
+
+    def test_terms_match_word_prefixes_and_bare_numbers_match_ids(self):
+        # Every term must start a word; the icontains search this replaces also matched inside words.
+        self.assertEqual(self.search(Tenant, 'an cr'), {self.ana.pk})
+        self.assertEqual(self.search(Tenant, 'ruz'), set())
+        self.assertEqual(self.search(Tenant, 'ana reyes'), set())
+        self.assertEqual(self.search(Bill, str(self.wifi.pk)), {self.wifi.pk})
+        payment = Payment.objects.create(bill=self.wifi, tenant=self.ben, amount_paid=Decimal('30.00'), payment_date=datetime.date(2024, 3, 9))
+        self.assertEqual(self.search(Payment, str(self.wifi.pk)), {payment.pk})
+
+    def test_admin_search_and_autocomplete_use_the_index(self):
+        self.client.force_login(User.objects.create_superuser('clerk', 'clerk@example.com', 'secret'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:autocomplete'), {'app_label': 'billing', 'model_name': 'bill', 'field_name': 'tenant', 'term': 'cru'}
+            )
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Ana Cruz'])
+        self.assertTrue(any(search.FTS_TABLE in query['sql'] for query in queries.captured_queries))
+        self.assertNotContains(self.client.get(reverse('admin:billing_tenant_changelist'), {'q': 'ruz'}), 'Ana Cruz')
+
+    def test_without_an_index_the_admin_falls_back_to_its_search_fields(self):
+        self.client.force_login(User.objects.create_superuser('clerk', 'clerk@example.com', 'secret'))
+        with mock.patch('billing.search.has_fulltext_index', return_value=False):
+            self.assertIsNone(search.search_queryset(Tenant.objects.all(), 'ruz'))
+            self.assertContains(self.client.get(reverse('admin:billing_tenant_changelist'), {'q': 'ruz'}), 'Ana Cruz')
+
+
+class AvailabilityTests(BillingTestCase):
+    def test_interval_boundaries(self):
+        day = lambda month, day: datetime.date(2024, month, day)
+        # Back-to-back leases merge; so does a lease starting on the day the previous one ends.
+        intervals = RoomIntervals([
+            (day(1, 1), day(1, 31)), (day(1, 31), day(2, 5)), (day(2, 6), day(2, 10)), (day(3, 1), None),
+        ])
+        self.assertEqual(intervals.starts, [day(1, 1), day(3, 1)])
+        self.assertFalse(intervals.is_free(day(2, 10), day(2, 10))) # End dates are inclusive
+        self.assertTrue(intervals.is_free(day(2, 11), day(2, 29)))
+        self.assertFalse(intervals.is_free(day(2, 29), day(3, 1)))
+        self.assertFalse(intervals.is_free(datetime.date(2030, 1, 1), datetime.date(2030, 1, 1))) # Open-ended
+        self.assertTrue(intervals.is_free(datetime.date(2023, 12, 1), datetime.date(2023, 12, 31)))
+
+        self.assertEqual(intervals.occupied(day(1, 15), day(3, 5)), [(day(1, 15), day(2, 10)), (day(3, 1), day(3, 5))])
+        self.assertEqual(intervals.free(day(1, 15), day(3, 31)), [(day(2, 11), day(2, 29))])
+        self.assertEqual(intervals.free(datetime.date(2023, 12, 30), day(1, 2)), [(datetime.date(2023, 12, 30), datetime.date(2023, 12, 31))])
+        self.assertEqual(intervals.next_vacancy(day(1, 15)), day(2, 11))
+        self.assertEqual(intervals.next_vacancy(day(2, 11)), day(2, 11))
+        self.assertIsNone(intervals.next_vacancy(day(3, 1)))
+
+    def test_lease_periods_follow_tenants(self):
+        building = Property.objects.create(name='Test', code='test')
+        rooms = [Room.objects.create(property=building, room_number=number, base_rent=Decimal('300.00')) for number in ('1', '2')]
+        ana = Tenant.objects.create(property=building, full_name='Ana', room=rooms[0], lease_start_date=datetime.date(2024, 1, 1))
+        ben = Tenant.objects.create(property=building, full_name='Ben', room=rooms[1], lease_start_date=datetime.date(2024, 1, 1),
+                                    lease_end_date=datetime.date(2024, 6, 30))
+        index = AvailabilityIndex(since=datetime.date(2024, 7, 1))
+        self.assertEqual(index.free_rooms(datetime.date(2024, 7, 1), datetime.date(2024, 7, 31)), [rooms[1]])
+        with self.assertRaises(ValueError):
+            index.is_free(rooms[1].pk, datetime.date(2024, 6, 30), datetime.date(2024, 7, 31))
+
+        ana.lease_end_date = datetime.date(2024, 7, 31)
+        ana.save()
+        ben.room = None
+        ben.save()
+        self.assertEqual(
+            list(LeasePeriod.objects.values_list('tenant_id', 'room_id', 'end_date')), [(ana.pk, rooms[0].pk, datetime.date(2024, 7, 31))]
+        )
+        index = AvailabilityIndex(since=datetime.date(2024, 7, 1))
+        self.assertEqual(index.next_vacancy(rooms[0].pk, datetime.date(2024, 7, 1)), datetime.date(2024, 8, 1))
+
+        # Bulk updates skip post_save; sync_lease_period catches up. An inactive tenant with no end date has left.
+        Tenant.objects.filter(pk=ana.pk).update(is_active=False, lease_end_date=None)
+        self.assertTrue(LeasePeriod.objects.exists())
+        sync_lease_period(Tenant.objects.get(pk=ana.pk))
+        self.assertFalse(LeasePeriod.objects.exists())
+
+
+class BalanceTests(BillingTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.today = timezone.localdate()
+        self.building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=self.building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.tenant, bill_type='Rent', amount=Decimal('500.00'), due_date=self.today - datetime.timedelta(days=10))
+        water = Bill.objects.create(tenant=self.tenant, bill_type='Water', amount=Decimal('40.00'), due_date=self.today + datetime.timedelta(days=5))
+        electricity = Bill.objects.create(tenant=self.tenant, bill_type='Electricity', amount=Decimal('80.00'), due_date=self.today)
+        self.pay(electricity, '80.00', days_ago=2)
+        self.payment = self.pay(water, '15.00', days_ago=1)
+
+    def pay(self, bill, amount, days_ago):
+        payment_date = self.today - datetime.timedelta(days=days_ago)
+        return Payment.objects.create(bill=bill, tenant=self.tenant, amount_paid=Decimal(amount), payment_date=payment_date)
+
+    def test_summaries(self):
+        ben = Tenant.objects.create(property=self.building, full_name='Ben', lease_start_date=datetime.date(2024, 1, 1))
+        summaries = balances.get_balance_summaries([self.tenant.pk, ben.pk])
+        summary = summaries[self.tenant.pk]
+        self.assertEqual(summary['outstanding'], Decimal('525.00'))
+        self.assertEqual(summary['outstanding_by_type'], {'Rent': Decimal('500.00'), 'Water': Decimal('25.00')})
+        self.assertEqual((summary['oldest_unpaid_due_date'], summary['oldest_overdue_date']), (self.rent.due_date, self.rent.due_date))
+        self.assertEqual((summary['last_payment_date'], summary['last_payment_amount']), (self.payment.payment_date, Decimal('15.00')))
+        self.assertEqual((summaries[ben.pk]['outstanding'], summaries[ben.pk]['last_payment_date']), (Decimal('0.00'), None))
+        with self.assertNumQueries(0):
+            self.assertEqual(balances.get_balance_summaries([self.tenant.pk, ben.pk]), summaries)
+
+    def test_writes_bump_the_version(self):
+        key = balances.VERSION_KEY.format('default', self.tenant.pk)
+        versions = []
+
+        def outstanding():
+            versions.append(caches['default'].get(key))
+            return balances.get_balance_summary(self.tenant.pk)['outstanding']
+
+        self.assertEqual(outstanding(), Decimal('525.00'))
+        self.rent.amount = Decimal('450.00')
+        self.rent.save() # post_save
+        self.assertEqual(outstanding(), Decimal('475.00'))
+        Bill.objects.filter(pk=self.rent.pk).update(amount=Decimal('400.00')) # QuerySet.update, no signals
+        self.assertEqual(outstanding(), Decimal('425.00'))
+        self.payment.delete() # post_delete
+        self.assertEqual(outstanding(), Decimal('440.00'))
+        self.assertEqual(len(set(versions)), 4)
+
+    def test_tenant_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(User.objects.create_superuser('clerk', 'clerk@example.com', 'secret'))
+
+        def count_queries():
+            caches['default'].clear() # Nothing cached: every summary is computed
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:billing_tenant_changelist'))
+            self.assertContains(response, '525.00')
+            return len(queries)
+
+        room = Room.objects.create(property=self.building, room_number='A', base_rent=Decimal('500.00'))
+        Tenant.objects.filter(pk=self.tenant.pk).update(room=room) # Rooms are shown on the list
+        few = count_queries()
+        for number in range(5):
+            room = Room.objects.create(property=self.building, room_number=str(number), base_rent=Decimal('300.00'))
+            tenant = Tenant.objects.create(
+                property=self.building, room=room, full_name=f'Tenant {number}', lease_start_date=datetime.date(2024, 1, 1)
+            )
+            bill = Bill.objects.create(tenant=tenant, bill_type='Rent', amount=Decimal('300.00'), due_date=self.today)
+            Payment.objects.create(bill=bill, tenant=tenant, amount_paid=Decimal('100.00'), payment_date=self.today)
+        self.assertEqual(count_queries(), few)
+
+
+@override_settings(BILLING_BALANCE_CACHE='default')
+class ShardingTests(TransactionTestCase):
+    """The annex lives on the second database. A TransactionTestCase because fan_out() reads
+    each shard from its own thread, which only sees committed rows."""
+    databases = {'default', 'property_b'}
+
+    def setUp(self):
+        self.north = Property.objects.create(name='North', code='north')
+        self.annex = Property.objects.create(name='Annex', code='annex', database='property_b')
+        self.tenants = {}
+        for building, rent in ((self.north, '500.00'), (self.annex, '300.00')):
+            with use_property(building.code):
+                room = Room.objects.create(property=building, room_number='1', base_rent=Decimal(rent))
+                self.tenants[building.code] = Tenant.objects.create(
+                    property=building, room=room, full_name=f'{building.name} tenant', lease_start_date=datetime.date(2024, 1, 1)
+                )
+
+    def rent_bills(self, alias):
+        return sorted(Bill.objects.using(alias).filter(bill_type='Rent').values_list('amount', flat=True))
+
+    def test_property_rows_are_stored_in_its_database(self):
+        with use_property('annex'):
+            bill = Bill.objects.create(tenant=self.tenants['annex'], bill_type='Water', amount=Decimal('40.00'), due_date=datetime.date(2024, 3, 5))
+            Payment.objects.create(bill=bill, tenant=self.tenants['annex'], amount_paid=Decimal('40.00'), payment_date=datetime.date(2024, 3, 1))
+        self.assertEqual(bill._state.db, 'property_b')
+        self.assertTrue(Bill.objects.using('property_b').get(pk=bill.pk).is_paid)
+        self.assertEqual(list(Room.objects.using('default').values_list('property__code', flat=True)), ['north'])
+        self.assertEqual(Tenant.objects.using('property_b').get().property, self.annex)
+        with self.assertRaises(ValidationError): # Not routed to the annex's database
+            Room(property=self.annex, room_number='2', base_rent=Decimal('300.00')).full_clean()
+
+    def test_property_option_limits_a_command_to_that_property(self):
+        call_command('generate_rent_bills', month=3, year=2024, property='annex', stdout=io.StringIO())
+        self.assertEqual((self.rent_bills('default'), self.rent_bills('property_b')), ([], [Decimal('300.00')]))
+
+    def test_for_each_property_runs_the_command_on_every_shard(self):
+        out = io.StringIO()
+        call_command('for_each_property', 'generate_rent_bills', '--month=3', '--year=2024', processes=1, only=['north', 'annex'], stdout=out)
+        self.assertIn('generate_rent_bills completed for 2 properties.', out.getvalue())
+        self.assertEqual((self.rent_bills('default'), self.rent_bills('property_b')), ([Decimal('500.00')], [Decimal('300.00')]))
+
+    def test_reports_merge_every_shard(self):
+        today = timezone.localdate()
+        for code, amount, paid in (('north', '500.00', '200.00'), ('annex', '300.00', '50.00')):
+            with use_property(code):
+                tenant = self.tenants[code]
+                bill = Bill.objects.create(tenant=tenant, bill_type='Rent', amount=Decimal(amount), due_date=today)
+                Payment.objects.create(bill=bill, tenant=tenant, amount_paid=Decimal(paid), payment_date=today)
+        with use_property('annex'):
+            Tenant.objects.create(property=self.annex, full_name='Annex tenant 2', lease_start_date=datetime.date(2024, 1, 1))
+            Room.objects.create(property=self.annex, room_number='2', base_rent=Decimal('300.00'))
+        self.client.force_login(User.objects.create_superuser('clerk', 'clerk@example.com', 'secret'))
+
+        summary = self.client.get(reverse('admin:billing_financial_summary')).context
+        self.assertEqual((summary['total_unpaid_all_time'], summary['total_paid_this_month']), (Decimal('800.00'), Decimal('250.00')))
+        self.assertEqual(
+            [(row['property'], row['unpaid'], row['paid_this_month']) for row in summary['property_rows']],
+            [(self.annex, Decimal('300.00'), Decimal('50.00')), (self.north, Decimal('500.00'), Decimal('200.00'))]
+        )
+        occupancy = self.client.get(reverse('admin:billing_occupancy_report')).context
+        self.assertEqual((occupancy['total_rooms'], occupancy['occupied_rooms_count']), (3, 2))
+        self.assertEqual(
+            [(row['property'], row['rooms'], row['occupied']) for row in occupancy['property_rows']],
+            [(self.annex, 2, 1), (self.north, 1, 1)]
+        )
+
+
+class OutboxDeliveryTests(BillingTestCase):
+    CONFIG = {'url': 'http://receiver.invalid/events', 'headers': {}, 'timeout': 1}
+
+    def event(self, tenant_id, **fields):
+        return OutboxEvent.objects.create(destination='app', event_type='bill.created', tenant_id=tenant_id, bill_id=1, **fields)
+
+    def dispatch(self, **post):
+        with mock.patch('billing.outbox.post_events', **post) as post_events:
+            result = outbox.dispatch_batch('app', self.CONFIG, batch_size=10)
+        return result, post_events
+
+    def test_failed_batches_back_off_exponentially_up_to_the_cap(self):
+        first, capped = self.event(1), self.event(2, attempts=7) # 30s * 2**7 is past the hour
+        before = timezone.now()
+        result, _ = self.dispatch(side_effect=urllib.error.URLError('connection refused'))
+        self.assertEqual(result, (0, 2))
+        first.refresh_from_db()
+        capped.refresh_from_db()
+        self.assertEqual((first.attempts, capped.attempts), (1, 8))
+        self.assertAlmostEqual((first.next_attempt_at - before).total_seconds(), outbox.RETRY_BACKOFF_SECONDS, delta=5)
+        self.assertAlmostEqual((capped.next_attempt_at - before).total_seconds(), outbox.MAX_BACKOFF_SECONDS, delta=5)
+        self.assertIn('connection refused', capped.last_error)
+
+    def test_later_events_of_a_waiting_tenant_are_held_back(self):
+        self.event(1, attempts=1, next_attempt_at=timezone.now() + datetime.timedelta(minutes=5))
+        held = self.event(1)
+        other = self.event(2)
+        result, post_events = self.dispatch()
+        self.assertEqual(result, (1, 0))
+        self.assertEqual(post_events.call_args.args[1], [other])
+        held.refresh_from_db()
+        self.assertIsNone(held.delivered_at)
+
+    def test_events_are_delivered_only_after_a_2xx_answer(self):
+        event = self.event(1)
+        unavailable = urllib.error.HTTPError(self.CONFIG['url'], 503, 'Service Unavailable', {}, None)
+        self.assertEqual(self.dispatch(side_effect=unavailable)[0], (0, 1))
+        event.refresh_from_db()
+        self.assertIsNone(event.delivered_at)
+        self.assertIn('503', event.last_error)
+
+        OutboxEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.dispatch()[0], (1, 0))
+        event.refresh_from_db()
+        self.assertIsNotNone(event.delivered_at)
+        self.assertEqual(event.last_error, '')
+
+    def test_purge_deletes_only_old_delivered_events(self):
+        now = timezone.now()
+        self.event(1, delivered_at=now - datetime.timedelta(days=40))
+        recent = self.event(1, delivered_at=now - datetime.timedelta(days=1))
+        pending = self.event(2, created_at=now - datetime.timedelta(days=60))
+        self.assertEqual(outbox.purge_delivered(older_than_days=30), 1)
+        self.assertEqual(set(OutboxEvent.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+@override_settings(BILLING_OUTBOX_DESTINATIONS={'ledger': {'url': 'http://ledger.invalid/events'}})
+class OutboxEventTests(BillingTestCase):
+    def test_bulk_writers_record_events(self):
+        building = Property.objects.create(name='Test', code='test')
+        tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        rent = Bill.objects.create(tenant=tenant, bill_type='Rent', amount=Decimal('500.00'), due_date=datetime.date(2024, 1, 5))
+        OutboxEvent.objects.all().delete()
+
+        fees = accrue_late_fees(datetime.date(2024, 1, 10), rules={'default': LateFeeRule(flat_fee='25.00')})
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.event_type, event.bill_id, event.payload['property_id']), ('bill.created', fees[0].pk, building.pk))
+
+        lump_sum = TenantPayment.objects.create(tenant=tenant, amount=Decimal('525.00'), payment_date=datetime.date(2024, 1, 12))
+        allocate_payments([lump_sum.pk])
+        paid = OutboxEvent.objects.filter(event_type='bill.paid')
+        self.assertEqual(sorted(paid.values_list('bill_id', flat=True)), [rent.pk, fees[0].pk])
+        self.assertTrue(all(event.payload['is_paid'] for event in paid))
+
+
+@unittest.skipIf(snapshot.np is None, "Snapshots need NumPy")
+class SnapshotTests(BillingTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+
+    def bill(self, amount):
+        return Bill.objects.create(tenant=self.tenant, bill_type='Rent', amount=Decimal(amount), due_date=datetime.date(2024, 1, 5))
+
+    def export(self):
+        return snapshot.export_snapshot(self.path, file_format='npz', tables=['bill', 'tenant'])
+
+    def test_incremental_export_keeps_the_newest_copy(self):
+        bills = [self.bill(amount) for amount in ('100.00', '200.00', '300.00')]
+        self.assertEqual(self.export(), {'bill': 3, 'tenant': 1})
+        self.assertEqual(self.export(), {'bill': 0, 'tenant': 1}) # Tenants have no timestamp and are rewritten
+
+        bills[0].amount = Decimal('150.00')
+        bills[0].save()
+        self.assertEqual(self.export()['bill'], 1)
+        loaded = SnapshotReader(self.path).load('bill', ['id', 'amount'])
+        self.assertEqual(dict(zip(loaded['id'].tolist(), loaded['amount'].tolist())), {bills[0].pk: 150.0, bills[1].pk: 200.0, bills[2].pk: 300.0})
+        self.assertEqual(len(SnapshotReader(self.path).load('tenant')['id']), 1)
+
+    def test_pages_break_timestamp_ties_by_id(self):
+        bills = [self.bill('100.00') for _ in range(5)]
+        moment = timezone.now()
+        Bill.objects.update(date_updated=moment)
+        with mock.patch.object(snapshot, 'PAGE_SIZE', 2):
+            self.assertEqual(self.export()['bill'], 5)
+            late = self.bill('100.00')
+            Bill.objects.filter(pk=late.pk).update(date_updated=moment) # Same timestamp, higher id
+            self.assertEqual(self.export()['bill'], 1)
+        loaded = SnapshotReader(self.path).load('bill', ['id'])
+        self.assertEqual(sorted(loaded['id'].tolist()), [bill.pk for bill in bills + [late]])
+
+
+class MoneyPropertyTests(SimpleTestCase):
+    """The minor-unit functions must give exactly what Decimal arithmetic followed by
+    quantize gives, for every rounding mode, on many random inputs (fixed seeds)."""
+
+    CASES = 2000
+
+    def setUp(self):
+        self.rng = random.Random(39)
+
+    def test_round_trip(self):
+        amounts = [random_amount(self.rng) for _ in range(self.CASES)]
+        self.assertEqual(money.from_minor(money.to_minor(amounts)), amounts)
+
+    def test_to_minor_rejects_extra_places(self):
+        with self.assertRaises(ValueError):
+            money.to_minor([Decimal('1.005')])
+
+    def test_round_div_matches_decimal(self):
+        for rounding in ROUNDINGS:
+            denominator = self.rng.choice([10, 100, 1000, 7, 30, 31, 365])
+            numerators = [self.rng.randrange(-10 ** 12, 10 ** 12) for _ in range(self.CASES)]
+            if denominator % 2 == 0: # Exact ties for a third of the cases
+                numerators = [n - n % denominator + denominator // 2 if i % 3 == 0 else n for i, n in enumerate(numerators)]
+            expected = []
+            with localcontext() as context:
+                context.prec = 50
+                for numerator in numerators:
+                    expected.append(int((Decimal(numerator) / denominator).quantize(Decimal(1), rounding=rounding)))
+            self.assertEqual([int(value) for value in money.round_div(numerators, denominator, rounding)], expected, rounding)
+
+    def test_multiply_matches_decimal(self):
+        for rounding in ROUNDINGS:
+            consumption = [random_amount(self.rng, 2, 6) for _ in range(self.CASES)]
+            prices = [random_amount(self.rng, 3, 5) for _ in range(self.CASES)]
+            result = money.multiply(money.to_minor(consumption, 2), 2, money.to_minor(prices, 3), 3, rounding=rounding)
+            expected = [money.quantize(c * p, rounding=rounding) for c, p in zip(consumption, prices)]
+            self.assertEqual(money.from_minor(result), expected, rounding)
+
+    def test_scale_matches_decimal(self):
+        for rounding in ROUNDINGS:
+            factor = random_amount(self.rng, self.rng.randrange(0, 6), 4)
+            amounts = [random_amount(self.rng) for _ in range(self.CASES)]
+            expected = [money.quantize(amount * factor, rounding=rounding) for amount in amounts]
+            self.assertEqual(money.from_minor(money.scale(money.to_minor(amounts), factor, rounding=rounding)), expected)
+
+    def test_prorate_matches_decimal(self):
+        amounts = [random_amount(self.rng) for _ in range(self.CASES)]
+        days = [self.rng.randrange(0, 32) for _ in range(self.CASES)]
+        result = money.from_minor(money.prorate(money.to_minor(amounts), days, 30))
+        with localcontext() as context:
+            context.prec = 50
+            expected = [money.quantize(amount * day / 30) for amount, day in zip(amounts, days)]
+        self.assertEqual(result, expected)
+
+    def test_large_values_stay_exact(self):
+        # Products beyond int64 switch to Python integers instead of overflowing.
+        amounts = [Decimal('99999999.99'), Decimal('-12345678.91')]
+        factor = Decimal('123456789.123456')
+        expected = [money.quantize(amount * factor) for amount in amounts]
+        self.assertEqual(money.from_minor(money.scale(money.to_minor(amounts), factor)), expected)
+
+    @unittest.skipIf(money.np is None, "NumPy is not installed")
+    def test_arrays_are_int64(self):
+        self.assertEqual(money.to_minor([Decimal('1.23')]).dtype, money.np.int64)
+
+    def test_allocate_adds_up(self):
+        for _ in range(500):
+            total = self.rng.randrange(-10 ** 7, 10 ** 7)
+            weights = [self.rng.randrange(0, 1000) for _ in range(self.rng.randrange(1, 8))]
+            if not any(weights):
+                weights[0] = 1
+            shares = money.allocate(total, weights)
+            self.assertEqual(sum(shares), total)
+            for share, weight in zip(shares, weights):
+                self.assertLessEqual(abs(share * sum(weights) - total * weight), sum(weights))
+
+    def test_late_fees_match_decimal(self):
+        for _ in range(50):
+            rule = LateFeeRule(
+                grace_days=self.rng.randrange(0, 10),
+                flat_fee=random_amount(self.rng, 2, 4).copy_abs(),
+                daily_rate=random_amount(self.rng, self.rng.randrange(1, 6), 3).copy_abs(),
+                cap=random_amount(self.rng, 2, 6).copy_abs() if self.rng.random() < 0.5 else None,
+            )
+            amounts = [random_amount(self.rng, 2, 7).copy_abs() for _ in range(200)]
+            days = [self.rng.randrange(0, 400) for _ in range(200)]
+            expected = [rule.fee_for(amount, day) for amount, day in zip(amounts, days)]
+            self.assertEqual(money.from_minor(rule.fees_for(money.to_minor(amounts), days)), expected)
+
+
+@override_settings(BILLING_BALANCE_CACHE='default', BILLING_METER_TOKENS={'meter-token': None}, BILLING_METER_UNIT_PRICE='0.150')
+class MeterReadingIngestTests(TransactionTestCase):
+    # Buffered readings are written from a worker thread, outside a test transaction.
+
+    def setUp(self):
+        ingest._tenants.clear()
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+
+    def push(self, readings, token='meter-token'):
+        return self.client.post(
+            '/api/meter-readings/', json.dumps({'readings': readings}), content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    def test_readings_are_buffered_deduplicated_and_billed(self):
+        self.assertEqual(self.push([], token='wrong').status_code, 401)
+        response = self.push([
+            {'tenant_id': self.tenant.pk, 'reading_date': '2024-05-01', 'reading_value': 100},
+            {'tenant_id': self.tenant.pk, 'reading_date': '2024-05-01', 'reading_value': 999}, # Resent day: first one kept
+            {'tenant_id': self.tenant.pk, 'reading_date': '2024-05-31', 'reading_value': '180.5'},
+            {'tenant_id': self.tenant.pk + 1, 'reading_date': '2024-05-31', 'reading_value': 1},
+        ])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'accepted': 3, 'rejected': [{'index': 3, 'error': f"Unknown tenant {self.tenant.pk + 1}."}]})
+        async_to_sync(ingest.reading_buffer.aflush)()
+        self.assertEqual(
+            list(ElectricityReading.objects.order_by('reading_date').values_list('reading_value', 'is_billed')),
+            [(Decimal('100.00'), False), (Decimal('180.50'), False)],
+        )
+
+        call_command('bill_meter_readings', through_date='2024-06-01', stdout=io.StringIO())
+        bill = Bill.objects.get(bill_type='Electricity')
+        self.assertEqual(bill.amount, Decimal('27.08')) # 180.5 kWh x 0.150, rounded half up
+        self.assertFalse(ElectricityReading.objects.filter(is_billed=False).exists())
+
+
+class TenantImportTests(BillingTestCase):
+    def setUp(self):
+        self.building = Property.objects.create(name='Test', code='test')
+        self.room = Room.objects.create(property=self.building, room_number='101', base_rent=Decimal('500.00'))
+        self.leaving = Tenant.objects.create(
+            property=self.building, room=self.room, full_name='Ana', email='ana@example.com', lease_start_date=datetime.date(2024, 1, 1)
+        )
+
+    def plan(self, text):
+        return plan_import(read_rows(io.BytesIO(text.encode()), 'tenants.csv'), self.building)
+
+    def test_turnover_in_one_file(self):
+        plan = self.plan(
+            "full_name,email,room_number,lease_start_date,lease_end_date,fixed_water_charge\n"
+            "Ana,ana@example.com,101,2024-01-01,2024-08-31,\n"
+            "Ben,ben@example.com,101,2024-09-01,,12.50\n"
+        )
+        self.assertEqual(plan.errors, [])
+        self.assertEqual(plan.counts(), {'create': 1, 'update': 1, 'unchanged': 0, 'error': 0})
+        apply_import(plan)
+
+        ben = Tenant.objects.get(email='ben@example.com')
+        self.assertEqual((ben.room, ben.fixed_water_charge), (self.room, Decimal('12.50')))
+        self.assertEqual(
+            sorted(LeasePeriod.objects.values_list('tenant_id', 'end_date')),
+            [(self.leaving.pk, datetime.date(2024, 8, 31)), (ben.pk, None)],
+        )
+        self.assertTrue(SearchDocument.objects.filter(object_id=ben.pk, model_name='tenant', body__contains='Ben').exists())
+
+    def test_double_booking_and_bad_values_are_reported(self):
+        plan = self.plan(
+            "full_name,room_number,lease_start_date,fixed_wifi_charge\n"
+            "Ben,101,2024-06-01,\n"
+            "Cy,999,2024-13-01,1.005\n"
+        )
+        errors = dict(plan.errors)
+        self.assertIn('double-booked', errors[2])
+        self.assertEqual(len([line for line, _ in plan.errors if line == 3]), 3)
+        self.assertEqual(Tenant.objects.count(), 1)
+
+
+@override_settings(BILLING_OUTBOX_DESTINATIONS={'ledger': {'url': 'http://ledger.invalid/events'}})
+class ReconciliationTests(BillingTestCase):
+    STATEMENT = (
+        "Date;Amount;Payer;Memo\n"
+        "2024-06-03;500.00;ANA SILVA;Bill {ana_bill} rent June\n"
+        "2024-06-04;75.50;Ben Okafor;electricity\n"
+        "2024-06-05;500.00;Cash deposit;\n"
+        "2024-06-05;-20.00;Bank;fee\n"
+    )
+
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        start = datetime.date(2024, 1, 1)
+        self.ana = Tenant.objects.create(property=building, full_name='Ana Silva', phone_number='0917 555 1234', lease_start_date=start)
+        self.ben = Tenant.objects.create(property=building, full_name='Ben Okafor', lease_start_date=start)
+        self.cy = Tenant.objects.create(property=building, full_name='Cy Young', lease_start_date=start)
+        due = datetime.date(2024, 6, 5)
+        self.ana_bill = Bill.objects.create(tenant=self.ana, bill_type='Rent', amount=Decimal('500.00'), due_date=due)
+        self.ben_bill = Bill.objects.create(tenant=self.ben, bill_type='Electricity', amount=Decimal('75.50'), due_date=due)
+        Bill.objects.create(tenant=self.cy, bill_type='Rent', amount=Decimal('500.00'), due_date=due)
+
+    def read(self):
+        return read_statement(io.BytesIO(self.STATEMENT.format(ana_bill=self.ana_bill.pk).encode()))
+
+    def test_confident_lines_are_paid_and_the_rest_wait_for_review(self):
+        records, errors = self.read()
+        self.assertEqual(errors, [])
+        statement, counts, duplicates = reconcile(records, 'june.csv')
+        self.assertEqual(counts, {'matched': 2, 'review': 1, 'unmatched': 0, 'ignored': 1})
+
+        self.ana_bill.refresh_from_db()
+        self.ben_bill.refresh_from_db()
+        self.assertTrue(self.ana_bill.is_paid and self.ben_bill.is_paid)
+        self.assertEqual(Payment.objects.filter(payment_method='Bank transfer').count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='bill.paid', bill_id=self.ana_bill.pk).count(), 1)
+
+        # Only Cy's bill is still open for the anonymous deposit, but amount alone isn't enough.
+        line = BankStatementLine.objects.get(status=BankStatementLine.STATUS_REVIEW)
+        self.assertEqual(line.candidates[0]['tenant_id'], self.cy.pk)
+        payment = confirm_line(line, Bill.objects.get(tenant=self.cy))
+        self.assertTrue(payment.bill.is_paid)
+        with self.assertRaises(ValueError):
+            confirm_line(line, payment.bill)
+
+    def test_paid_lines_can_be_archived(self):
+        reconcile(self.read()[0], 'june.csv')
+        self.assertEqual(archive_settled_bills(datetime.date(2025, 1, 1)), (2, 2))
+        line = BankStatementLine.objects.get(memo__startswith='Bill')
+        self.assertEqual((line.status, line.payment_id), (BankStatementLine.STATUS_MATCHED, None))
+        with self.assertRaises(ValueError):
+            confirm_line(line, Bill.objects.get(tenant=self.cy))
+
+    def test_overlapping_statements_are_not_paid_twice(self):
+        reconcile(self.read()[0], 'june.csv')
+        statement, counts, duplicates = reconcile(self.read()[0], 'june-again.csv')
+        self.assertEqual((duplicates, sum(counts.values())), (4, 0))
+        self.assertEqual(Payment.objects.count(), 2)
+
+
+class BrokenGateway(notifications.SmsGateway):
+    def send(self, to, text):
+        raise notifications.NotificationError("gateway down")
+
+
+class NotificationTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        overdue = datetime.date.today() - datetime.timedelta(days=2)
+        tenants = [
+            ('Ana', 'ana@example.com', '', Tenant.CHANNEL_EMAIL),
+            ('Ben', 'ben@example.com', '0917 555 1234', Tenant.CHANNEL_BOTH),
+            ('Cy', 'cy@example.com', '', Tenant.CHANNEL_SMS), # No phone: falls back to email
+            ('Di', '', '+63 918 000 0000', Tenant.CHANNEL_EMAIL), # No email: falls back to SMS
+            ('Ed', 'ed@example.com', '0917 000 0000', Tenant.CHANNEL_NONE),
+        ]
+        for name, email, phone, channel in tenants:
+            tenant = Tenant.objects.create(
+                property=building, full_name=name, email=email, phone_number=phone, notification_channel=channel,
+                lease_start_date=datetime.date(2024, 1, 1),
+            )
+            Bill.objects.create(tenant=tenant, bill_type='Rent', amount=Decimal('500.00'), due_date=overdue)
+        handle, self.sms_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.sms_file)
+
+    def test_reminders_follow_each_tenants_channel(self):
+        gateway = {'backend': 'billing.notifications.FileSmsGateway', 'path': self.sms_file}
+        with override_settings(BILLING_SMS_GATEWAY=gateway, BILLING_NOTIFICATION_RATE_LIMITS={'email': 0, 'sms': 0}):
+            call_command('send_billing_reminders', stdout=io.StringIO())
+
+        sent = sorted(NotificationLog.objects.values_list('tenant__full_name', 'channel', 'recipient', 'status'))
+        self.assertEqual(sent, [
+            ('Ana', 'email', 'ana@example.com', 'sent'),
+            ('Ben', 'email', 'ben@example.com', 'sent'),
+            ('Ben', 'sms', '09175551234', 'sent'),
+            ('Cy', 'email', 'cy@example.com', 'sent'),
+            ('Di', 'sms', '+639180000000', 'sent'),
+        ])
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['ana@example.com', 'ben@example.com', 'cy@example.com'])
+        with open(self.sms_file) as f:
+            texts = [json.loads(line) for line in f]
+        self.assertEqual(sorted(text['to'] for text in texts), ['+639180000000', '09175551234'])
+        self.assertIn('overdue', texts[0]['text'])
+
+    def test_test_recipients_replace_every_tenant(self):
+        gateway = {'backend': 'billing.notifications.FileSmsGateway', 'path': self.sms_file}
+        with override_settings(BILLING_SMS_GATEWAY=gateway, BILLING_NOTIFICATION_RATE_LIMITS={'email': 0, 'sms': 0}):
+            call_command('send_billing_reminders', test_email='qa@example.com', stdout=io.StringIO())
+        self.assertEqual(set(NotificationLog.objects.values_list('channel', 'recipient')), {('email', 'qa@example.com')})
+        self.assertEqual(NotificationLog.objects.count(), 4) # Ben once; Di's SMS comes by email
+        self.assertEqual(os.path.getsize(self.sms_file), 0)
+
+    def test_failed_messages_are_logged(self):
+        channels = {
+            'email': notifications.EmailChannel(),
+            'sms': notifications.SmsChannel(gateway=BrokenGateway()),
+        }
+        messages, unreachable = notifications.build(
+            'overdue_bill_reminder', Bill.objects.select_related('tenant'), channels
+        )
+        counts = notifications.Dispatcher(channels, workers=3, rate_limits={'sms': 0}).send(messages)
+        self.assertEqual(counts, {'sent': 3, 'failed': 2})
+        self.assertEqual(
+            set(NotificationLog.objects.filter(status='failed').values_list('channel', 'error')), {('sms', 'gateway down')}
+        )
+
+    def test_bills_with_reminders_can_be_archived(self):
+        gateway = {'backend': 'billing.notifications.FileSmsGateway', 'path': self.sms_file}
+        with override_settings(BILLING_SMS_GATEWAY=gateway, BILLING_NOTIFICATION_RATE_LIMITS={'email': 0, 'sms': 0}):
+            call_command('send_billing_reminders', stdout=io.StringIO())
+        self.assertEqual(NotificationLog.objects.filter(bill__isnull=False).count(), 5)
+        for bill in Bill.objects.all():
+            Payment.objects.create(bill=bill, tenant=bill.tenant, amount_paid=bill.amount, payment_date=bill.due_date)
+        self.assertEqual(archive_settled_bills(datetime.date.today()), (5, 5))
+        self.assertEqual(NotificationLog.objects.filter(bill__isnull=True).count(), 5) # The log is kept
+
+
+class LedgerTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.tenant = Tenant.objects.create(property=building, full_name='Ana', lease_start_date=datetime.date(2024, 1, 1))
+        self.rent = Bill.objects.create(tenant=self.tenant, bill_type='Rent', amount=Decimal('500.00'), due_date=datetime.date(2024, 1, 5))
+        self.water = Bill.objects.create(tenant=self.tenant, bill_type='Water', amount=Decimal('40.00'), due_date=datetime.date(2024, 1, 5))
+
+    def entries(self):
+        return list(LedgerEntry.objects.order_by('id').values_list('kind', 'debit', 'credit'))
+
+    def test_entries_follow_bills_and_payments(self):
+        Payment.objects.create(bill=self.rent, tenant=self.tenant, amount_paid=Decimal('500.00'), payment_date=datetime.date(2024, 1, 3))
+        lump_sum = TenantPayment.objects.create(tenant=self.tenant, amount=Decimal('60.00'), payment_date=datetime.date(2024, 1, 4))
+        allocate_payments([lump_sum.pk]) # Pays the water bill; the lump sum was credited already
+        self.assertEqual(self.entries(), [
+            ('charge', Decimal('500.00'), Decimal('0.00')),
+            ('charge', Decimal('40.00'), Decimal('0.00')),
+            ('payment', Decimal('0.00'), Decimal('500.00')),
+            ('credit', Decimal('0.00'), Decimal('60.00')),
+        ])
+
+        Bill.objects.filter(pk=self.water.pk).update(amount=Decimal('45.00')) # Bulk updates are synced
+        archive_settled_bills(datetime.date(2025, 1, 1)) # Archived bills keep their entries
+        self.assertEqual(Bill.objects.count(), 0)
+        self.assertEqual(ledger.balances_as_of(datetime.date.today(), [self.tenant.pk]), {self.tenant.pk: Decimal('-15.00')})
+
+        lump_sum.delete()
+        self.assertEqual(LedgerEntry.objects.filter(kind='credit').count(), 0)
+
+    def test_keyset_pages_carry_the_running_balance(self):
+        for day in range(1, 8):
+            Payment.objects.create(bill=self.rent, tenant=self.tenant, amount_paid=Decimal('10.00'), payment_date=datetime.date(2024, 2, day))
+        statement = list(ledger.statement([self.tenant.pk])) # Payments dated before the bills were created come first
+        self.assertEqual([entry.balance for entry in statement][::4], [Decimal('-10.00'), Decimal('-50.00'), Decimal('470.00')])
+        expected = {entry.pk: entry.balance for entry in statement}
+
+        pages, before = [], None
+        while True:
+            rows, has_older, has_newer = ledger.ledger_page(self.tenant.pk, before=before, size=4)
+            pages.append(rows)
+            if not has_older:
+                break
+            before = (rows[-1].entry_date, rows[-1].pk)
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertEqual({row.pk: row.balance for page in pages for row in page}, expected)
+
+        newer, _, has_newer = ledger.ledger_page(self.tenant.pk, after=(pages[-1][0].entry_date, pages[-1][0].pk), size=4)
+        self.assertEqual([row.pk for row in newer], [row.pk for row in pages[1]])
+        self.assertEqual([row.balance for row in newer], [row.balance for row in pages[1]])
+        self.assertTrue(has_newer)
+
+
+class EstimatedReadingTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.tenants = [
+            Tenant.objects.create(property=building, full_name=name, lease_start_date=datetime.date(2023, 1, 1))
+            for name in ('Ana', 'Ben', 'Carla', 'Dio')
+        ]
+        readings = {
+            'Ana': [('2024-01-01', '100.00'), ('2024-01-31', '400.00')], # 10 kWh/day, no reading in February
+            'Ben': [('2024-01-31', '50.00')], # Not enough history
+            'Carla': [('2024-01-01', '0.00'), ('2024-02-10', '80.00')], # Read in February
+            'Dio': [('2024-01-11', '20.00'), ('2024-01-31', '70.00')], # 2.5 kWh/day
+        }
+        for tenant in self.tenants:
+            for reading_date, value in readings[tenant.full_name]:
+                ElectricityReading.objects.create(
+                    tenant=tenant, reading_date=datetime.date.fromisoformat(reading_date), reading_value=Decimal(value),
+                    unit_price=Decimal('0.150'), is_billed=True,
+                )
+
+    def test_gaps_are_estimated_and_trued_up(self):
+        ana, ben, carla, dio = self.tenants
+        found = estimates.estimate_readings(datetime.date(2024, 2, 1), datetime.date(2024, 2, 29))
+        self.assertEqual([estimate.tenant_id for estimate in found], [ana.pk, ben.pk, dio.pk])
+        self.assertTrue(found[1].skipped)
+        estimated = ElectricityReading.objects.filter(is_estimate=True).order_by('tenant_id')
+        self.assertEqual(
+            [(reading.tenant_id, reading.reading_value, reading.consumption) for reading in estimated],
+            [(ana.pk, Decimal('690.00'), Decimal('290.00')), (dio.pk, Decimal('142.50'), Decimal('72.50'))],
+        )
+        self.assertEqual(Bill.objects.get(tenant=ana).amount, Decimal('43.50'))
+        self.assertEqual(Bill.objects.get(tenant=dio).amount, Decimal('10.88')) # 10.875, half up
+
+        # Ana used less than estimated, but never less than her last actual reading.
+        with self.assertRaises(CommandError):
+            call_command('generate_electricity_bill', ana.pk, '399.00', '0.200', reading_date='2024-03-10', stdout=io.StringIO())
+        # The 40 kWh over-estimated are credited at the estimate's price against her open estimate bill.
+        call_command('generate_electricity_bill', ana.pk, '650.00', '0.200', reading_date='2024-03-10', stdout=io.StringIO())
+        credit = TenantPayment.objects.get(tenant=ana)
+        self.assertEqual((credit.amount, credit.unallocated_amount), (Decimal('6.00'), Decimal('0.00')))
+        self.assertEqual(Bill.objects.filter(tenant=ana).count(), 1)
+
+        # A meter can't push a reading for the day of an estimate.
+        ingest._tenants.clear()
+        accepted, rejected = async_to_sync(ingest.accept_readings)([
+            {'tenant_id': dio.pk, 'reading_date': '2024-02-29', 'reading_value': 150, 'unit_price': '0.150'},
+        ], None)
+        self.assertEqual(accepted, 0)
+        self.assertIn('estimated reading', rejected[0]['error'])
+
+        # Dio used more: the next bill charges the difference. A faulty reading below his last actual one is skipped.
+        faulty = ElectricityReading.objects.create(
+            tenant=dio, reading_date=datetime.date(2024, 3, 5), reading_value=Decimal('60.00'), unit_price=Decimal('0.150'),
+        )
+        call_command('bill_meter_readings', through_date='2024-03-05', stdout=io.StringIO())
+        self.assertFalse(ElectricityReading.objects.get(pk=faulty.pk).is_billed)
+        faulty.delete()
+        ElectricityReading.objects.create(
+            tenant=dio, reading_date=datetime.date(2024, 3, 10), reading_value=Decimal('160.00'), unit_price=Decimal('0.150'),
+        )
+        call_command('bill_meter_readings', through_date='2024-03-31', stdout=io.StringIO())
+        true_up = Bill.objects.filter(tenant=dio).latest('id')
+        self.assertEqual(true_up.amount, Decimal('2.63')) # 17.50 kWh
+        self.assertTrue(true_up.description.startswith('True-up of the estimated reading of 2024-02-29'))
+
+        # Estimating the same month again only finds the tenant that was skipped.
+        gaps = estimates.find_gaps(datetime.date(2024, 2, 1), datetime.date(2024, 2, 29))
+        self.assertEqual([estimate.tenant_id for estimate in gaps], [ben.pk])
+
+
+class RoomMeterTests(BillingTestCase):
+    def setUp(self):
+        building = Property.objects.create(name='Test', code='test')
+        self.rooms = [
+            Room.objects.create(property=building, room_number=number, base_rent=Decimal('300.00'), meter_split=split)
+            for number, split in (('1', Room.SPLIT_DAYS), ('2', Room.SPLIT_FIXED), ('3', Room.SPLIT_EQUAL))
+        ]
+        tenants = [ # name, room, lease start, lease end, meter share
+            ('Ana', 0, '2023-01-01', None, None), ('Ben', 0, '2023-01-01', '2024-02-14', None),
+            ('Carla', 0, '2024-02-20', None, None), ('Dio', 1, '2023-01-01', None, 60), ('Eve', 1, '2023-01-01', None, 40),
+        ]
+        self.tenants = {
+            name: Tenant.objects.create(
+                property=building, full_name=name, room=self.rooms[room], meter_share=share,
+                lease_start_date=datetime.date.fromisoformat(start), lease_end_date=end and datetime.date.fromisoformat(end),
+            )
+            for name, room, start, end, share in tenants
+        }
+        for room, opening, current in ((self.rooms[0], '1000.00', '1300.00'), (self.rooms[1], '50.00', '150.00')):
+            RoomMeterReading.objects.create(room=room, reading_date=datetime.date(2024, 1, 31), reading_value=Decimal(opening),
+                                            unit_price=Decimal('0.150'), is_billed=True)
+            RoomMeterReading.objects.create(room=room, reading_date=datetime.date(2024, 2, 29), reading_value=Decimal(current),
+                                            unit_price=Decimal('0.150'))
+        RoomMeterReading.objects.create(room=self.rooms[2], reading_date=datetime.date(2024, 2, 29), reading_value=Decimal('10.00'),
+                                        unit_price=Decimal('0.150'))
+
+    def test_consumption_is_split_between_co_tenants(self):
+        splits, rejected = room_meters.bill_room_readings(datetime.date(2024, 3, 1))
+        self.assertEqual(rejected, [])
+        shares = {
+            bill.tenant.full_name: bill.amount
+            for bill in Bill.objects.select_related('tenant').filter(bill_type='Electricity')
+        }
+        # Room 1: 300 kWh, 45.00 by 29, 14 and 10 days in the room; the cent left over goes to the largest remainder.
+        # Room 2: 100 kWh, 15.00 by fixed shares of 60 and 40. Room 3's first reading only opens its meter.
+        self.assertEqual(shares, {
+            'Ana': Decimal('24.62'), 'Ben': Decimal('11.89'), 'Carla': Decimal('8.49'), 'Dio': Decimal('9.00'), 'Eve': Decimal('6.00'),
+        })
+        split = next(split for split in splits if split.room == self.rooms[0])
+        self.assertEqual(sum(allocation.consumption for allocation in split.allocations), Decimal('300.00'))
+        self.assertEqual([allocation.weight for allocation in split.allocations], [29, 14, 10])
+        self.assertFalse(RoomMeterReading.objects.filter(is_billed=False).exists())
+        self.assertEqual(RoomMeterAllocation.objects.filter(bill__isnull=False).count(), 5)
+
+        # Nothing is left to bill.
+        self.assertEqual(room_meters.bill_room_readings(datetime.date(2024, 3, 1)), ([], []))
+
+    def test_paid_shares_can_be_archived(self):
+        room_meters.bill_room_readings(datetime.date(2024, 3, 1))
+        for bill in Bill.objects.all():
+            Payment.objects.create(bill=bill, tenant=bill.tenant, amount_paid=bill.amount, payment_date=datetime.date(2024, 3, 10))
+        self.assertEqual(archive_settled_bills(datetime.date(2025, 1, 1)), (5, 5))
+        self.assertEqual(RoomMeterAllocation.objects.filter(bill__isnull=True).count(), 5) # The split is kept
+
+
+class ForecastTests(BillingTestCase):
+    def test_projection(self):
+        start = datetime.date(2025, 1, 1)
+        inputs = {
+            'tenants': [ # id, property, room, base rent, lease start, lease end, water, WiFi
+                (1, 1, 10, Decimal('300.00'), datetime.date(2020, 1, 1), None, Decimal('10.00'), Decimal('5.00')),
+                (2, 1, 11, Decimal('200.00'), datetime.date(2020, 1, 1), datetime.date(2025, 1, 31), None, None),
+            ],
+            'rooms': [(10, 1, Decimal('300.00')), (11, 1, Decimal('200.00')), (12, 1, Decimal('100.00'))],
+            'electricity': {1: Decimal('180.00')}, # 30.00 a month
+            'late_rates': {1: (1, 4)}, # Tenant 2 and the re-let rooms get the average, 25%
+        }
+        if money.np is None:
+            with self.assertRaises(forecast.ForecastError):
+                forecast.project(inputs, start, forecast.Scenario(months=3))
+            return
+        result = forecast.project(inputs, start, forecast.Scenario(months=3, occupancy_rate=50, rent_change=10))
+        totals = result['properties'][1]
+        # Room 11 is vacant from February, room 12 throughout; both let half the time at +10% rent.
+        self.assertEqual(totals['relet'], [Decimal('55.00'), Decimal('165.00'), Decimal('165.00')])
+        self.assertEqual(totals['billed'], [Decimal('650.00'), Decimal('540.00'), Decimal('540.00')])
+        # A quarter of each month's bills is collected the month after.
+        self.assertEqual(totals['expected'], [Decimal('650.00'), Decimal('567.50'), Decimal('540.00')])
+        self.assertEqual(forecast.project(inputs, start, forecast.Scenario(months=1))['occupancy_rate'], Decimal('66.7'))
+
+    @override_settings(BILLING_FORECAST_CACHE='default')
+    @unittest.skipIf(money.np is None, "The forecast needs NumPy")
+    def test_forecasts_are_cached_per_scenario(self):
+        building = Property.objects.create(name='Test', code='test')
+        room = Room.objects.create(property=building, room_number='1', base_rent=Decimal('300.00'))
+        Tenant.objects.create(property=building, full_name='Ana', room=room, lease_start_date=datetime.date(2020, 1, 1))
+        scenario = forecast.Scenario(months=2)
+        first = forecast.forecast(scenario)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(forecast.forecast(forecast.Scenario(months=2)), first)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(forecast.forecast(forecast.Scenario(months=2, rent_change=10))['properties'][building.pk]['rent'],
+                         [Decimal('330.00')] * 2)
@@ -1,51 +1,442 @@
 # billing/views.py
-from django.shortcuts import render
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
-from .models import Bill, Tenant, Room, Payment # Ensure Payment is imported
+from .models import Bill, Tenant, Room, Payment, BillingJob, Property # Ensure Payment is imported
+from .forms import BankStatementUploadForm, CashFlowForecastForm, EnqueueBillingJobForm, RoomAvailabilityForm, TenantImportForm
+from .jobs import enqueue
+from .ingest import MAX_READINGS_PER_REQUEST, ReadingError, accept_readings, authenticate
+from .availability import AvailabilityIndex
+from .archive import BILL_FIELDS, PAYMENT_FIELDS, bills_with_archive, payments_with_archive
+from .forecast import COMPONENTS as FORECAST_COMPONENTS, ForecastError, Scenario, forecast
+from .middleware import SESSION_PROPERTY_DATABASE, SESSION_PROPERTY_NAME
+from .ledger import balances_as_of, format_cursor, ledger_page, parse_cursor
+from .reconciliation import StatementFileError, read_statement, reconcile
+from .sharding import fan_out, use_shard
+from .tenant_import import COLUMNS as TENANT_IMPORT_COLUMNS, ImportFileError, apply_import, plan_import, read_rows
 from decimal import Decimal
+import datetime
+import json
+
+def _merge_by_property(results, fields):
+    """Merge per-shard {property_id: {field: value}} dicts into one row per property, with
+    its name from the catalog, ordered by name."""
+    merged = {}
+    for per_property in results.values():
+        for property_id, values in per_property.items():
+            row = merged.setdefault(property_id, dict.fromkeys(fields, 0))
+            for field in fields:
+                row[field] += values.get(field, 0)
+    properties = Property.objects.in_bulk(merged.keys())
+    rows = [
+        {'property': properties.get(property_id), **values}
+        for property_id, values in merged.items()
+    ]
+    return sorted(rows, key=lambda row: row['property'].name if row['property'] else '')
+
+def _financial_totals(alias, month_start, include_history):
+    """{property_id: {'unpaid': ..., 'paid_this_month': ...}} for the current shard."""
+    totals = {}
+    # Only paid bills are archived, so unpaid totals never need the archive.
+    unpaid = Bill.objects.filter(is_paid=False).values('tenant__property_id').annotate(total=Sum('amount')).order_by()
+    for row in unpaid:
+        totals.setdefault(row['tenant__property_id'], {})['unpaid'] = row['total']
+
+    if include_history:
+        paid_by_tenant = {}
+        for row in payments_with_archive(payment_date__gte=month_start):
+            paid_by_tenant[row['tenant_id']] = paid_by_tenant.get(row['tenant_id'], Decimal('0.00')) + row['amount_paid']
+        tenant_properties = dict(Tenant.objects.filter(pk__in=paid_by_tenant.keys()).values_list('pk', 'property_id'))
+        paid = {}
+        for tenant_id, amount in paid_by_tenant.items():
+            property_id = tenant_properties.get(tenant_id)
+            paid[property_id] = paid.get(property_id, Decimal('0.00')) + amount
+    else:
+        paid = dict(
+            Payment.objects.filter(payment_date__gte=month_start)
+            .values_list('tenant__property_id').annotate(total=Sum('amount_paid')).order_by()
+        )
+    for property_id, amount in paid.items():
+        totals.setdefault(property_id, {})['paid_this_month'] = amount
+    return totals
 
 @staff_member_required
 def financial_summary_report(request):
     today = timezone.now().date()
     current_month_start = today.replace(day=1)
 
-    total_unpaid = Bill.objects.filter(is_paid=False).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    include_history = request.GET.get('history') == '1'
 
-    paid_this_month_qs = Payment.objects.filter(payment_date__gte=current_month_start)
-    total_paid_this_month = paid_this_month_qs.aggregate(total=Sum('amount_paid'))['total'] or Decimal('0.00')
+    # Each property database is summed on its own thread; the totals are merged here.
+    results = fan_out(lambda alias: _financial_totals(alias, current_month_start, include_history))
+    property_rows = _merge_by_property(results, ('unpaid', 'paid_this_month'))
 
     context = {
         'title': 'Financial Summary Report',
-        'total_unpaid_all_time': total_unpaid,
-        'total_paid_this_month': total_paid_this_month,
+        'total_unpaid_all_time': sum((row['unpaid'] for row in property_rows), Decimal('0.00')),
+        'total_paid_this_month': sum((row['paid_this_month'] for row in property_rows), Decimal('0.00')),
+        'property_rows': property_rows,
         'current_month_name': current_month_start.strftime("%B %Y"),
+        'include_history': include_history,
         'has_permission': request.user.has_perm('billing.view_bill') and request.user.has_perm('billing.view_payment'),
         'app_label': 'billing', # For breadcrumbs if needed by base template
     }
     return render(request, 'admin/billing/reports/financial_summary.html', context)
 
+def _occupancy_counts(alias):
+    """{property_id: {'rooms': ..., 'occupied': ...}} for the current shard."""
+    counts = {}
+    for property_id, rooms in Room.objects.values_list('property_id').annotate(count=Count('id')).order_by():
+        counts.setdefault(property_id, {})['rooms'] = rooms
+    occupied = (
+        Tenant.objects.filter(is_active=True, room__isnull=False)
+        .values_list('room__property_id').annotate(count=Count('room_id', distinct=True)).order_by()
+    )
+    for property_id, rooms in occupied:
+        counts.setdefault(property_id, {})['occupied'] = rooms
+    return counts
+
+def _occupancy_rate(occupied, total):
+    return f"{(occupied / total * 100) if total > 0 else 0:.2f}%"
+
 @staff_member_required
 def occupancy_report(request):
-    total_rooms = Room.objects.count()
-
-    active_tenant_room_ids = Tenant.objects.filter(
-        is_active=True,
-        room__isnull=False
-    ).values_list('room_id', flat=True).distinct()
-    occupied_rooms_count = len(active_tenant_room_ids)
+    property_rows = _merge_by_property(fan_out(_occupancy_counts), ('rooms', 'occupied'))
+    for row in property_rows:
+        row['vacant'] = row['rooms'] - row['occupied']
+        row['occupancy_rate'] = _occupancy_rate(row['occupied'], row['rooms'])
 
-    vacant_rooms_count = Room.objects.exclude(id__in=active_tenant_room_ids).count()
-    occupancy_rate = (occupied_rooms_count / total_rooms * 100) if total_rooms > 0 else 0
+    total_rooms = sum(row['rooms'] for row in property_rows)
+    occupied_rooms_count = sum(row['occupied'] for row in property_rows)
 
     context = {
         'title': 'Occupancy Report',
         'total_rooms': total_rooms,
         'occupied_rooms_count': occupied_rooms_count,
-        'vacant_rooms_count': vacant_rooms_count,
-        'occupancy_rate': f"{occupancy_rate:.2f}%",
+        'vacant_rooms_count': total_rooms - occupied_rooms_count,
+        'occupancy_rate': _occupancy_rate(occupied_rooms_count, total_rooms),
+        'property_rows': property_rows,
         'has_permission': request.user.has_perm('billing.view_room') and request.user.has_perm('billing.view_tenant'),
         'app_label': 'billing', # For breadcrumbs
     }
     return render(request, 'admin/billing/reports/occupancy_report.html', context)
+
+def _weighted_rate(results, field, weight):
+    """The rates of several databases' forecasts averaged over their rooms or tenants."""
+    total = sum(result[weight] for result in results)
+    if not total:
+        return Decimal('0.0')
+    return (sum(result[field] * result[weight] for result in results) / total).quantize(Decimal('0.1'))
+
+def _forecast_form(request):
+    data = request.GET.copy()
+    for name, field in CashFlowForecastForm.base_fields.items():
+        if field.initial is not None:
+            data.setdefault(name, field.initial)
+    return CashFlowForecastForm(data)
+
+@staff_member_required
+def cashflow_forecast_report(request):
+    form = _forecast_form(request)
+    month_rows, property_rows, error = [], [], None
+    occupancy_rate = late_rate = None
+    if form.is_valid():
+        scenario = Scenario(**form.cleaned_data)
+        refresh = request.GET.get('refresh') == '1'
+        try:
+            # Each property database is projected (or read from the cache) on its own thread.
+            results = fan_out(lambda alias: forecast(scenario, refresh=refresh))
+        except ForecastError as e:
+            error = str(e)
+        else:
+            fields = FORECAST_COMPONENTS + ('billed', 'expected')
+            months = next(iter(results.values()))['months']
+            month_rows = [{'month': month, **dict.fromkeys(fields, Decimal('0.00'))} for month in months]
+            for result in results.values():
+                for per_property in result['properties'].values():
+                    for index, row in enumerate(month_rows):
+                        for field in fields:
+                            row[field] += per_property[field][index]
+            property_rows = _merge_by_property(
+                {alias: {property_id: {field: sum(values[field], Decimal('0.00')) for field in ('billed', 'expected')}
+                         for property_id, values in result['properties'].items()}
+                 for alias, result in results.items()},
+                ('billed', 'expected'),
+            )
+            occupancy_rate = _weighted_rate(results.values(), 'occupancy_rate', 'rooms')
+            late_rate = _weighted_rate(results.values(), 'late_rate', 'tenants')
+
+    context = {
+        'title': 'Cash-Flow Forecast',
+        'form': form,
+        'error': error,
+        'month_rows': month_rows,
+        'totals': {
+            field: sum((row[field] for row in month_rows), Decimal('0.00'))
+            for field in FORECAST_COMPONENTS + ('billed', 'expected')
+        },
+        'property_rows': property_rows,
+        'occupancy_rate': occupancy_rate,
+        'late_rate': late_rate,
+        'has_permission': request.user.has_perm('billing.view_bill') and request.user.has_perm('billing.view_tenant'),
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/reports/cashflow_forecast.html', context)
+
+@staff_member_required
+def select_property(request, property_id):
+    """Make the admin work on one property's database for the rest of the session; 0 goes
+    back to the default database."""
+    if property_id == 0:
+        request.session.pop(SESSION_PROPERTY_DATABASE, None)
+        request.session.pop(SESSION_PROPERTY_NAME, None)
+        messages.success(request, "Showing the default database.")
+    else:
+        selected = get_object_or_404(Property, pk=property_id)
+        request.session[SESSION_PROPERTY_DATABASE] = selected.database
+        request.session[SESSION_PROPERTY_NAME] = selected.name
+        messages.success(request, f"Now working on {selected.name} (database '{selected.database}').")
+    return redirect('admin:app_list', app_label='billing')
+
+def _availability_form(request):
+    today = timezone.localdate()
+    data = request.GET.copy()
+    data.setdefault('start_date', today.isoformat())
+    data.setdefault('end_date', (today + datetime.timedelta(days=30)).isoformat())
+    return RoomAvailabilityForm(data)
+
+@staff_member_required
+def room_availability(request):
+    form = _availability_form(request)
+    rows = []
+    if form.is_valid():
+        start_date, end_date = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+        rows = AvailabilityIndex(since=start_date).summary(start_date, end_date)
+
+    context = {
+        'title': 'Room Availability',
+        'form': form,
+        'rows': rows,
+        'free_count': sum(1 for row in rows if row['is_free']),
+        'has_permission': request.user.has_perm('billing.view_room') and request.user.has_perm('billing.view_tenant'),
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/reports/room_availability.html', context)
+
+@staff_member_required
+def room_availability_api(request):
+    if not (request.user.has_perm('billing.view_room') and request.user.has_perm('billing.view_tenant')):
+        raise PermissionDenied
+    form = _availability_form(request)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    start_date, end_date = form.cleaned_data['start_date'], form.cleaned_data['end_date']
+
+    def ranges(pairs):
+        return [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in pairs]
+
+    rooms = []
+    for row in AvailabilityIndex(since=start_date).summary(start_date, end_date):
+        rooms.append({
+            'id': row['room'].pk,
+            'room_number': row['room'].room_number,
+            'is_free': row['is_free'],
+            'occupied': ranges(row['occupied']),
+            'free': ranges(row['free']),
+            'next_vacancy': row['next_vacancy'].isoformat() if row['next_vacancy'] else None,
+        })
+    return JsonResponse({'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(), 'rooms': rooms})
+
+@staff_member_required
+def enqueue_billing_job(request):
+    if not request.user.has_perm('billing.add_billingjob'):
+        raise PermissionDenied
+    if request.method == 'POST':
+        form = EnqueueBillingJobForm(request.POST)
+        if form.is_valid():
+            options = dict(form.cleaned_data)
+            job_type = options.pop('job_type')
+            max_attempts = options.pop('max_attempts')
+            job = enqueue(job_type, options, max_attempts=max_attempts)
+            messages.success(request, f"Queued {job}. Run `manage.py billing_worker` to process the queue.")
+            return redirect('admin:billing_billingjob_changelist')
+    else:
+        form = EnqueueBillingJobForm()
+
+    context = {
+        'title': 'Queue Billing Job',
+        'form': form,
+        'recent_jobs': BillingJob.objects.all()[:10],
+        'has_permission': request.user.has_perm('billing.add_billingjob'),
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/jobs/enqueue_job.html', context)
+
+@staff_member_required
+def tenant_statement(request, tenant_id):
+    tenant = get_object_or_404(Tenant.objects.select_related('room'), pk=tenant_id)
+    include_history = request.GET.get('history') == '1'
+
+    if include_history:
+        bills = list(bills_with_archive(tenant_id=tenant.pk).order_by('-due_date', '-id'))
+        payments = list(payments_with_archive(tenant_id=tenant.pk).order_by('-payment_date', '-id'))
+    else:
+        bills = list(Bill.objects.filter(tenant=tenant).values(*BILL_FIELDS).order_by('-due_date', '-id'))
+        payments = list(Payment.objects.filter(tenant=tenant).values(*PAYMENT_FIELDS).order_by('-payment_date', '-id'))
+
+    total_billed = sum((bill['amount'] for bill in bills), Decimal('0.00'))
+    total_paid = sum((payment['amount_paid'] for payment in payments), Decimal('0.00'))
+
+    context = {
+        'title': f'Statement for {tenant.full_name}',
+        'tenant': tenant,
+        'bills': bills,
+        'payments': payments,
+        'total_billed': total_billed,
+        'total_paid': total_paid,
+        'balance': total_billed - total_paid,
+        'include_history': include_history,
+        'has_permission': request.user.has_perm('billing.view_bill') and request.user.has_perm('billing.view_payment'),
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/reports/tenant_statement.html', context)
+
+@staff_member_required
+def tenant_ledger(request, tenant_id):
+    if not request.user.has_perm('billing.view_ledgerentry'):
+        raise PermissionDenied
+    tenant = get_object_or_404(Tenant, pk=tenant_id)
+    entries, has_older, has_newer = ledger_page(
+        tenant.pk, before=parse_cursor(request.GET.get('before')), after=parse_cursor(request.GET.get('after'))
+    )
+    try:
+        as_of = datetime.date.fromisoformat(request.GET['as_of'])
+    except (KeyError, ValueError):
+        as_of = None
+
+    context = {
+        'title': f'Ledger for {tenant.full_name}',
+        'tenant': tenant,
+        'entries': entries,
+        'older_cursor': format_cursor(entries[-1]) if entries and has_older else None,
+        'newer_cursor': format_cursor(entries[0]) if entries and has_newer else None,
+        'as_of': as_of,
+        'balance_as_of': balances_as_of(as_of, [tenant.pk]).get(tenant.pk, Decimal('0.00')) if as_of else None,
+        'has_permission': True,
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/reports/tenant_ledger.html', context)
+
+@staff_member_required
+def import_tenants(request):
+    if not (request.user.has_perm('billing.add_tenant') and request.user.has_perm('billing.change_tenant')):
+        raise PermissionDenied
+    plan = None
+    if request.method == 'POST':
+        form = TenantImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            current_property = form.cleaned_data['property']
+            try:
+                records = read_rows(form.cleaned_data['file'], form.cleaned_data['file'].name)
+            except ImportFileError as e:
+                form.add_error('file', str(e))
+            else:
+                with use_shard(current_property.database):
+                    plan = plan_import(records, current_property, create_users=form.cleaned_data['create_users'])
+                    counts = plan.counts()
+                    if form.cleaned_data['dry_run']:
+                        messages.info(request, "Dry run: nothing was written. Untick \"Dry run\" and upload the file again to import it.")
+                    elif counts['error'] and not form.cleaned_data['skip_invalid']:
+                        messages.error(request, "Nothing was imported because some rows have errors.")
+                    else:
+                        apply_import(plan)
+                        messages.success(
+                            request, f"Imported tenants of {current_property}: {counts['create']} created, {counts['update']} updated."
+                        )
+                        return redirect('admin:billing_tenant_changelist')
+    else:
+        form = TenantImportForm()
+
+    context = {
+        'title': 'Import Tenants',
+        'form': form,
+        'report': list(plan.report()) if plan else None,
+        'counts': plan.counts() if plan else None,
+        'columns': TENANT_IMPORT_COLUMNS,
+        'has_permission': True,
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/tenants/import_tenants.html', context)
+
+@staff_member_required
+def upload_bank_statement(request):
+    if not request.user.has_perm('billing.add_payment'):
+        raise PermissionDenied
+    counts = None
+    if request.method == 'POST':
+        form = BankStatementUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            current_property = form.cleaned_data['property']
+            try:
+                records, errors = read_statement(form.cleaned_data['file'])
+            except StatementFileError as e:
+                form.add_error('file', str(e))
+            else:
+                for line, message in errors[:20]:
+                    messages.warning(request, f"Line {line} skipped: {message}")
+                with use_shard(current_property.database):
+                    statement, counts, duplicates = reconcile(
+                        records, form.cleaned_data['file'].name, user=request.user, dry_run=form.cleaned_data['dry_run']
+                    )
+                summary = (
+                    f"{counts['matched']} paid automatically, {counts['review']} to review, "
+                    f"{counts['unmatched']} without a match, {duplicates} already imported."
+                )
+                if form.cleaned_data['dry_run']:
+                    messages.info(request, f"Dry run: {summary} Untick \"Dry run\" and upload the file again to record the payments.")
+                else:
+                    messages.success(request, f"Imported {statement} into {current_property}: {summary}")
+                    changelist = reverse('admin:billing_bankstatementline_changelist')
+                    return redirect(f"{changelist}?statement__id__exact={statement.pk}&status__exact=review")
+    else:
+        form = BankStatementUploadForm()
+
+    context = {
+        'title': 'Upload Bank Statement',
+        'form': form,
+        'counts': counts,
+        'has_permission': True,
+        'app_label': 'billing',
+    }
+    return render(request, 'admin/billing/reconciliation/upload_statement.html', context)
+
+@csrf_exempt
+@require_POST
+async def ingest_meter_readings(request):
+    """Readings pushed by smart meters: {"readings": [{"tenant_id", "reading_date",
+    "reading_value", "unit_price" (optional)}, ...]} with a token from
+    settings.BILLING_METER_TOKENS. Valid readings are buffered and written in bulk
+    (billing.ingest); the response lists the rejected ones by index."""
+    code = authenticate(request.headers.get('Authorization'))
+    if code is False:
+        return JsonResponse({'error': 'Invalid or missing meter token.'}, status=401)
+    try:
+        items = json.loads(request.body, parse_float=Decimal)['readings']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with a "readings" list.'}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({'error': '"readings" must be a list.'}, status=400)
+    if len(items) > MAX_READINGS_PER_REQUEST:
+        return JsonResponse({'error': f'At most {MAX_READINGS_PER_REQUEST} readings per request.'}, status=413)
+    try:
+        accepted, rejected = await accept_readings(items, code)
+    except ReadingError as e:
+        return JsonResponse({'error': str(e)}, status=403)
+    return JsonResponse({'accepted': accepted, 'rejected': rejected}, status=202)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'billing.middleware.PropertyShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +82,25 @@ DATABASES = {
     }
 }
 
+# 'default' is the catalog (properties, users, billing jobs) and also holds the data of
+# every property whose Property.database is 'default'. To put a property on its own
+# database, add an alias, run `manage.py migrate --database <alias>` and set the
+# property's database to it, e.g. with SQLite locally:
+#
+# DATABASES['property_b'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': BASE_DIR / 'db_property_b.sqlite3',
+# }
+
+# The test suite routes a property to a second database, so `manage.py test` always has one.
+if sys.argv[1:2] == ['test']:
+    DATABASES.setdefault('property_b', {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_property_b.sqlite3',
+    })
+
+DATABASE_ROUTERS = ['billing.sharding.PropertyShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,7 +143,94 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'billing' holds the per-tenant balance summaries (billing.balances). It is file based so the
+# web process, the billing worker and the scheduler share it; use Redis or Memcached in production.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'billing': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'billing_cache',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
 # Email settings for development
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@yourboardinghouse.com'
 ADMIN_EMAIL = 'admin@yourboardinghouse.com'
+
+# Channels bill reminders are sent on (billing.notifications); each tenant's notification_channel picks
+# email, SMS or both. Messages are sent by BILLING_NOTIFICATION_WORKERS threads, at most
+# BILLING_NOTIFICATION_RATE_LIMITS messages per second per channel.
+BILLING_NOTIFICATION_CHANNELS = {
+    'email': 'billing.notifications.EmailChannel',
+    'sms': 'billing.notifications.SmsChannel',
+}
+BILLING_NOTIFICATION_WORKERS = 8
+BILLING_NOTIFICATION_RATE_LIMITS = {'email': 10, 'sms': 1}
+# SMS gateway: 'backend' plus its arguments. FileSmsGateway only appends the messages to a file; for a real
+# gateway use billing.notifications.HttpSmsGateway with 'url', 'headers', 'timeout' and 'sender'
+# (`manage.py sms_gateway_stub` is a local test gateway on http://127.0.0.1:8766/).
+BILLING_SMS_GATEWAY = {
+    'backend': 'billing.notifications.FileSmsGateway',
+    'path': BASE_DIR / 'sms_outbox.jsonl',
+}
+
+# Schedule for `manage.py billing_scheduler` (cron syntax: minute hour day-of-month month day-of-week,
+# in TIME_ZONE). 'options' are passed to the command; set 'catch_up': False to skip missed runs.
+BILLING_SCHEDULE = [
+    {'name': 'rent_bills', 'command': 'generate_rent_bills', 'schedule': '0 6 1 * *'},
+    {'name': 'water_bills', 'command': 'generate_fixed_water_bills', 'schedule': '5 6 1 * *'},
+    {'name': 'wifi_bills', 'command': 'generate_fixed_wifi_bills', 'schedule': '10 6 1 * *'},
+    {'name': 'billing_reminders', 'command': 'send_billing_reminders', 'schedule': '0 8 * * *'},
+    # {'name': 'meter_bills', 'command': 'bill_meter_readings', 'schedule': '0 7 1 * *'}, # With smart meters
+]
+BILLING_SCHEDULER_STATUS_FILE = BASE_DIR / 'billing_scheduler_status.json'
+
+# Order in which tenant lump-sum payments are applied to open bills, e.g. ['Rent', 'Electricity', 'Water', 'WiFi'].
+# None applies them to the oldest due bills first.
+BILLING_ALLOCATION_PRIORITY = None
+
+# Late fee rules for `manage.py accrue_late_fees`, keyed by bill type; 'default' covers types not listed.
+# Fee = flat_fee + daily_rate x bill amount per day overdue beyond grace_days, capped at cap (None = no cap).
+# Remove a bill type (and 'default') to never charge fees on it.
+BILLING_LATE_FEE_RULES = {
+    'Rent': {'grace_days': 5, 'flat_fee': '100.00', 'daily_rate': '0.005', 'cap': '1000.00'},
+    'default': {'grace_days': 7, 'flat_fee': '0.00', 'daily_rate': '0.01', 'cap': '200.00'},
+}
+
+# Cache alias for tenant balance summaries, and how many summaries each process keeps in memory in front of it.
+BILLING_BALANCE_CACHE = 'billing'
+BILLING_BALANCE_LRU_SIZE = 2048
+
+# Cache alias and lifetime (seconds) of cash-flow forecasts, kept per property database and scenario.
+BILLING_FORECAST_CACHE = 'billing'
+BILLING_FORECAST_CACHE_TIMEOUT = 60 * 60
+
+# Receivers of bill events ('bill.created', 'bill.paid', 'bill.unpaid') sent by `manage.py dispatch_outbox`.
+# Each entry: {'url': ..., 'headers': {...} (optional), 'timeout': seconds (optional, default 10)}.
+# Events are only queued for destinations listed here. `manage.py outbox_receiver_stub` is a local test receiver.
+BILLING_OUTBOX_DESTINATIONS = {
+    # 'accounting': {'url': 'https://accounting.example.com/hooks/billing', 'headers': {'Authorization': 'Bearer ...'}},
+    # 'mobile_app': {'url': 'http://127.0.0.1:8765/'},
+}
+
+# Where `manage.py export_snapshot` writes the columnar analytics snapshot (one subdirectory per database).
+BILLING_SNAPSHOT_DIR = BASE_DIR / 'snapshots'
+
+# Smart meter readings pushed to /api/meter-readings/ (billing.ingest). Tokens map to the code of the property
+# whose tenants they may send readings for (None: any tenant on the default database). Meters send
+# 'Authorization: Bearer <token>'. Readings without a unit_price get BILLING_METER_UNIT_PRICE (None: required).
+# Readings are buffered per process and written every BILLING_METER_FLUSH_SIZE readings or
+# BILLING_METER_FLUSH_INTERVAL seconds; bill them with `manage.py bill_meter_readings`.
+BILLING_METER_TOKENS = {
+    # 'change-me-long-random-token': 'main-building',
+}
+BILLING_METER_UNIT_PRICE = None
+BILLING_METER_FLUSH_SIZE = 2000
+BILLING_METER_FLUSH_INTERVAL = 1.0
@@ -16,7 +16,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from billing.views import ingest_meter_readings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/meter-readings/', ingest_meter_readings, name='ingest_meter_readings'),
 ]